@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Benchmark Comparison
+===============================================
+Compares two run_benchmarks.py result files (e.g. main vs a branch) per
+scenario: p50/p95/p99 latency and throughput, as relative change. Exits 1
+when any shared scenario's p95 got slower, or its throughput lower, by more
+than the threshold — runs with different settings are refused unless
+--force is given.
+
+Usage:
+    python benchmarks/compare.py BASE.json HEAD.json [--threshold 0.10] [--force]
+"""
+
+import argparse
+import json
+import sys
+
+# (label, path into a scenario result, True if higher is better)
+METRICS = (
+    ("p50", ("latency_ms", "p50"), False),
+    ("p95", ("latency_ms", "p95"), False),
+    ("p99", ("latency_ms", "p99"), False),
+    ("ops/s", ("throughput_per_s",), True),
+)
+# Regressions beyond the threshold in these fail the comparison; p50/p99 are informational.
+GATED = {"p95", "ops/s"}
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _value(result: dict, keys: tuple) -> float:
+    for key in keys:
+        result = result[key]
+    return float(result)
+
+
+def change(base: float, head: float) -> float:
+    """Relative change head vs base (0.1 = 10% higher); 0 when base is 0."""
+    return (head - base) / base if base else 0.0
+
+
+def compare(base: dict, head: dict, threshold: float) -> tuple[list[list[str]], list[str]]:
+    """Table rows and the list of regressions beyond ``threshold``."""
+    rows, regressions = [], []
+    for name in base["scenarios"]:
+        if name not in head["scenarios"]:
+            continue
+        b, h = base["scenarios"][name], head["scenarios"][name]
+        row = [name]
+        for label, keys, higher_is_better in METRICS:
+            delta = change(_value(b, keys), _value(h, keys))
+            worse = -delta if higher_is_better else delta
+            flag = ""
+            if worse > threshold:
+                flag = " !"
+                if label in GATED:
+                    regressions.append(f"{name} {label} {delta:+.1%}")
+            row.append(f"{_value(h, keys):.1f} ({delta:+.1%}){flag}")
+        if h["errors"] > b["errors"]:
+            regressions.append(f"{name} errors {b['errors']} -> {h['errors']}")
+        rows.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base", help="Baseline results JSON")
+    parser.add_argument("head", help="Candidate results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative regression that fails the comparison (default 0.10 = 10%%)")
+    parser.add_argument("--force", action="store_true", help="Compare even if the run settings differ")
+    args = parser.parse_args()
+
+    base, head = _load(args.base), _load(args.head)
+    base_settings = {k: v for k, v in base["meta"]["settings"].items() if k != "scenarios"}
+    head_settings = {k: v for k, v in head["meta"]["settings"].items() if k != "scenarios"}
+    if base_settings != head_settings and not args.force:
+        differing = sorted(k for k in base_settings.keys() | head_settings.keys()
+                           if base_settings.get(k) != head_settings.get(k))
+        print(f"[ERROR] Runs used different settings ({', '.join(differing)}); rerun or pass --force",
+              file=sys.stderr)
+        sys.exit(2)
+
+    print(f"base {(base['meta']['commit'] or '?')[:12]}  vs  head {(head['meta']['commit'] or '?')[:12]}"
+          f"  (threshold {args.threshold:.0%})\n")
+    rows, regressions = compare(base, head, args.threshold)
+    header = ["scenario"] + [label for label, _, _ in METRICS]
+    widths = [max(len(r[i]) for r in [header] + rows) + 2 for i in range(len(header))]
+    for row in [header] + rows:
+        print("".join(cell.ljust(w) for cell, w in zip(row, widths)))
+
+    if regressions:
+        print("\nRegressions:")
+        for r in regressions:
+            print(f"  - {r}")
+        sys.exit(1)
+    print("\nNo regressions beyond threshold.")
+
+
+if __name__ == "__main__":
+    main()
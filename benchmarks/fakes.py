@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Benchmark Stand-ins
+==============================================
+Deterministic, offline replacements for everything the benchmarks would
+otherwise reach over the network:
+
+  - FakeLLM: llm_providers._CALLERS entries that sleep a seeded latency
+    (mean ± jitter), report Gemini-style token usage and answer JSON every
+    prompt type accepts (abstract, deep passes, synthesis, consensus).
+  - FakeWeb: requests.get/post and paper_fetcher's httpx client, answering
+    HF search, hysts, arXiv, Semantic Scholar, embeddings, PDFs and HTML.
+  - FakeGitHub: the contents and commits API over an in-memory repo,
+    for github_storage's httpx.AsyncClient.
+  - synthetic_pdf(): a multi-page paper with the section headings the
+    extractor looks for (needs PyMuPDF, like extract_text itself).
+
+Everything is seeded, so two runs with the same settings see the same
+papers, answers and latency draws (up to thread scheduling).
+"""
+
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Optional
+
+import httpx
+import requests
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+_VOCABULARY = (
+    "attention retrieval alignment distillation sparsity quantization reasoning planning "
+    "tokenization diffusion contrastive reinforcement curriculum pruning routing memory "
+    "calibration robustness interpretability benchmark scaling compression agents tools "
+    "multimodal speech vision graph transformer mixture experts latent policy reward"
+).split()
+
+CONCEPTS = [f"{a} {b}" for a, b in zip(_VOCABULARY, _VOCABULARY[7:] + _VOCABULARY[:7])]
+METHODS = [f"{w} training" for w in _VOCABULARY[:20]]
+
+
+def _rng(*parts) -> random.Random:
+    """A Random seeded from ``parts`` (crc32, not hash(): stable across processes)."""
+    return random.Random(zlib.crc32("|".join(str(p) for p in parts).encode()))
+
+
+def paper_text(arxiv_id: str, words: int = 120) -> str:
+    rng = _rng("text", arxiv_id)
+    return " ".join(rng.choice(_VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def paper_record(arxiv_id: str) -> dict:
+    """A paper as the sources describe it: bare arXiv id, title, authors, abstract."""
+    rng = _rng("paper", arxiv_id)
+    return {
+        "arxiv_id": arxiv_id,
+        "title": f"{rng.choice(CONCEPTS).title()} for {rng.choice(CONCEPTS).title()} ({arxiv_id})",
+        "authors": [f"Author {rng.randrange(500)}" for _ in range(rng.randint(2, 6))],
+        "abstract": paper_text(arxiv_id),
+        "date": "2026-01-15",
+    }
+
+
+def corpus_ids(query: str, count: int, offset: int = 0) -> list[str]:
+    """The arXiv ids a search for ``query`` returns: stable per query, distinct per offset."""
+    base = zlib.crc32(query.encode()) % 9000
+    return [f"2601.{(base + offset + i) % 100000:05d}" for i in range(count)]
+
+
+class _Latency:
+    """Seeded draws of max(0, N(mean, jitter)) milliseconds, safe to share across threads."""
+
+    def __init__(self, mean_ms: float, jitter_ms: float, seed: int):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def seconds(self) -> float:
+        if self.mean_ms <= 0 and self.jitter_ms <= 0:
+            return 0.0
+        with self._lock:
+            ms = self._rng.gauss(self.mean_ms, self.jitter_ms)
+        return max(0.0, ms) / 1000
+
+    def sleep(self) -> None:
+        delay = self.seconds()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self) -> None:
+        delay = self.seconds()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# ---------------------------------------------------------------------------
+# LLM Providers
+# ---------------------------------------------------------------------------
+
+class FakeLLM:
+    """_CALLERS stand-ins: seeded latency, reported usage, one JSON shape for every prompt."""
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 10, seed: int = 1):
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def answer(self, prompt: str) -> str:
+        rng = _rng("answer", prompt[-2000:])
+        return json.dumps({
+            "summary": paper_text(str(rng.random()), 60),
+            "key_insights": [paper_text(str(rng.random()), 12) for _ in range(3)],
+            "key_contributions": [paper_text(str(rng.random()), 12) for _ in range(3)],
+            "methodology": paper_text(str(rng.random()), 30),
+            "methodology_detail": paper_text(str(rng.random()), 40),
+            "research_gaps": [paper_text(str(rng.random()), 10) for _ in range(2)],
+            "limitations": [paper_text(str(rng.random()), 10) for _ in range(2)],
+            "future_work": [paper_text(str(rng.random()), 10) for _ in range(2)],
+            "relevance_tags": rng.sample(_VOCABULARY, 3),
+            "concepts": rng.sample(CONCEPTS, 5),
+            "methods": rng.sample(METHODS, 3),
+            "strength_score": rng.randint(4, 9),
+        })
+
+    def caller(self, provider_id: str):
+        from llm_providers import _note_usage
+
+        def _call(api_key, prompt, model):
+            self.latency.sleep()
+            with self._lock:
+                self.calls += 1
+            raw = self.answer(str(prompt))
+            _note_usage({"usageMetadata": {"promptTokenCount": len(prompt) // 4,
+                                           "candidatesTokenCount": len(raw) // 4}})
+            return raw
+        return _call
+
+    def install(self, lp) -> None:
+        """Replace every provider caller."""
+        for provider_id in list(lp._CALLERS):
+            lp._CALLERS[provider_id] = self.caller(provider_id)
+
+
+# ---------------------------------------------------------------------------
+# Paper Sources, Embeddings, PDFs
+# ---------------------------------------------------------------------------
+
+def synthetic_pdf(arxiv_id: str, pages: int = 8) -> Optional[bytes]:
+    """A paper-shaped PDF (abstract, method, results, conclusion sections), or None without PyMuPDF."""
+    if fitz is None:
+        return None
+    record = paper_record(arxiv_id)
+    headings = ["Abstract", "1 Introduction", "2 Related Work", "3 Method", "4 Experiments",
+                "5 Results", "6 Discussion", "7 Conclusion"]
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        lines = [record["title"]] if number == 0 else []
+        heading = headings[number % len(headings)]
+        lines += ["", heading, ""]
+        body = paper_text(f"{arxiv_id}:{number}", 420).split()
+        lines += [" ".join(body[i:i + 14]) for i in range(0, len(body), 14)]
+        page.insert_text((56, 56), "\n".join(lines), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def synthetic_html(arxiv_id: str) -> str:
+    record = paper_record(arxiv_id)
+    sections = "".join(
+        f"<section><h2>{h}</h2><p>{paper_text(f'{arxiv_id}:{h}', 400)}</p></section>"
+        for h in ("Abstract", "1 Introduction", "3 Method", "5 Results", "7 Conclusion")
+    )
+    return f"<html><body><h1>{record['title']}</h1>{sections}</body></html>"
+
+
+def _embedding(text: str, dims: int = 64) -> list[float]:
+    rng = _rng("embed", text[:500])
+    return [rng.uniform(-1, 1) for _ in range(dims)]
+
+
+def _response(url: str, status: int = 200, payload=None, text: Optional[str] = None) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp.url = url
+    resp.encoding = "utf-8"
+    body = text if text is not None else json.dumps(payload)
+    resp._content = body.encode()
+    resp.headers["Content-Type"] = "application/json" if text is None else "application/xml"
+    return resp
+
+
+def _atom(arxiv_ids: list[str]) -> str:
+    entries = "".join(
+        f"<entry><title>{r['title']}</title><summary>{r['abstract']}</summary>"
+        f"<published>{r['date']}T00:00:00Z</published>"
+        + "".join(f"<author><name>{a}</name></author>" for a in r["authors"])
+        + "</entry>"
+        for r in map(paper_record, arxiv_ids)
+    )
+    return f'<feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>'
+
+
+class FakeWeb:
+    """
+    requests.get/post and paper_fetcher's httpx client, answered from the
+    synthetic corpus after a seeded delay. PDFs are synthetic_pdf(); arXiv
+    HTML is served only when PyMuPDF is missing (``html`` overrides), so deep
+    analysis normally takes the download + extract path.
+    """
+
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 5, seed: int = 2, html: Optional[bool] = None):
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.html = fitz is None if html is None else html
+        self.requests = 0
+        self._saved = None
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        self.latency.sleep()
+        self.requests += 1
+        params = params or {}
+        if "datasets-server.huggingface.co" in url:
+            ids = corpus_ids(params.get("query", ""), int(params.get("length", 10)), int(params.get("offset", 0)))
+            return _response(url, payload={"rows": [{"row": paper_record(i)} for i in ids]})
+        if "huggingface.co/api/papers/search" in url:
+            ids = corpus_ids(params.get("query", ""), int(params.get("limit", 10)))
+            return _response(url, payload=[
+                {"id": r["arxiv_id"], "title": r["title"], "summary": r["abstract"],
+                 "authors": [{"name": a} for a in r["authors"]]}
+                for r in map(paper_record, ids)
+            ])
+        if "export.arxiv.org/api/query" in url:
+            return _response(url, text=_atom(str(params.get("id_list", "")).split(",")))
+        if "api.semanticscholar.org" in url:
+            ids = corpus_ids(params.get("query", ""), int(params.get("limit", 10)))
+            return _response(url, payload={"data": [
+                {"paperId": i, "title": r["title"], "abstract": r["abstract"], "year": 2026,
+                 "externalIds": {"ArXiv": i}, "authors": [{"name": a} for a in r["authors"]]}
+                for i, r in zip(ids, map(paper_record, ids))
+            ]})
+        return _response(url, status=404, payload={"error": "not found"})
+
+    def post(self, url: str, json=None, **kwargs) -> requests.Response:
+        self.latency.sleep()
+        self.requests += 1
+        body = json or {}
+        if ":batchEmbedContents" in url:
+            texts = [r["content"]["parts"][0]["text"] for r in body.get("requests", [])]
+            return _response(url, payload={"embeddings": [{"values": _embedding(t)} for t in texts]})
+        if url.endswith("/embeddings"):
+            return _response(url, payload={"data": [
+                {"index": i, "embedding": _embedding(t)} for i, t in enumerate(body.get("input", []))
+            ]})
+        return _response(url, status=404, payload={"error": "not found"})
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.latency.sleep()
+        self.requests += 1
+        path = request.url.path
+        if request.url.host == "arxiv.org" and path.startswith("/pdf/"):
+            data = synthetic_pdf(path[len("/pdf/"):])
+            if data is not None:
+                return httpx.Response(200, content=data, headers={"Content-Type": "application/pdf"})
+        if request.url.host == "arxiv.org" and path.startswith("/html/") and self.html:
+            return httpx.Response(200, text=synthetic_html(path[len("/html/"):]))
+        return httpx.Response(404, text="Not Found")
+
+    def install(self, paper_fetcher) -> None:
+        transport = httpx.MockTransport(self._handle)
+        self._saved = (requests.get, requests.post, paper_fetcher._httpx)
+        requests.get, requests.post = self.get, self.post
+        paper_fetcher._httpx = SimpleNamespace(Client=lambda **kw: httpx.Client(transport=transport, **kw))
+
+    def restore(self, paper_fetcher) -> None:
+        if self._saved:
+            requests.get, requests.post, paper_fetcher._httpx = self._saved
+            self._saved = None
+
+
+# ---------------------------------------------------------------------------
+# GitHub
+# ---------------------------------------------------------------------------
+
+class FakeGitHub:
+    """An in-memory repo behind the contents and commits API, with a seeded delay per call."""
+
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 5, seed: int = 3, owner_repo: str = "bench/library"):
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.prefix = f"/repos/{owner_repo}/"
+        self.files: dict[str, str] = {}
+        self.head = "c0"
+        self.requests = 0
+
+    def seed_library(self, papers: int, prefix: str = ".macp") -> None:
+        """A library of ``papers`` papers, one analysis each and a note per ten papers, plus its manifest."""
+        manifest = {"version": "2.0", "papers": {}, "analyses": {}}
+        for n in range(papers):
+            record = paper_record(f"2602.{n:05d}")
+            arxiv_id = f"arxiv:{record['arxiv_id']}"
+            manifest["papers"][arxiv_id] = {"title": record["title"][:80], "status": "saved"}
+            self.files[f"{prefix}/papers/{arxiv_id.replace(':', '_')}.json"] = json.dumps({
+                "id": arxiv_id, "title": record["title"], "authors": record["authors"],
+                "abstract": record["abstract"],
+            })
+            self.files[f"{prefix}/analyses/{arxiv_id.replace(':', '_')}.json"] = json.dumps({
+                "paper": {"id": arxiv_id},
+                "analysis": {"summary": paper_text(f"summary:{n}", 50), "key_insights": ["x"],
+                             "strength_score": 6, "provenance": {"provider": "gemini"}},
+            })
+            if n % 10 == 0:
+                self.files[f"{prefix}/notes/note_{n}.md"] = (
+                    f"# Research Note #{n}\n\n**Tags:** bench\n**Created:** now\n\n{paper_text(f'note:{n}', 40)}"
+                )
+        self.files[f"{prefix}/manifest.json"] = json.dumps(manifest)
+        self.head = f"c{len(self.files)}"
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        await self.latency.asleep()
+        self.requests += 1
+        path = request.url.path.split(self.prefix, 1)[-1]
+        headers = {"x-ratelimit-remaining": "4999", "x-ratelimit-reset": str(int(time.time()) + 3600)}
+        if path == "commits/HEAD":
+            return httpx.Response(200, json={"sha": self.head}, headers=headers)
+        if path.startswith("contents/"):
+            target = path[len("contents/"):]
+            if request.method == "PUT":
+                self.files[target] = base64.b64decode(json.loads(request.content)["content"]).decode()
+                return httpx.Response(201, json={"content": {"sha": "blob"}}, headers=headers)
+            if target in self.files:
+                encoded = base64.b64encode(self.files[target].encode()).decode()
+                return httpx.Response(200, json={"content": encoded, "sha": "blob"}, headers=headers)
+            children = sorted({p[len(target) + 1:].split("/")[0] for p in self.files if p.startswith(target + "/")})
+            if children:
+                return httpx.Response(200, json=[{"name": c} for c in children], headers=headers)
+        return httpx.Response(404, json={"message": "Not Found"}, headers=headers)
+
+    def install(self, github_storage) -> None:
+        transport = httpx.MockTransport(self.handler)
+        self._saved = github_storage.httpx
+        github_storage.httpx = SimpleNamespace(
+            AsyncClient=lambda **kw: httpx.AsyncClient(transport=transport, **kw),
+            TimeoutException=httpx.TimeoutException,
+            ConnectError=httpx.ConnectError,
+        )
+
+    def restore(self, github_storage) -> None:
+        github_storage.httpx = self._saved
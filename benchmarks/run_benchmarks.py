@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Benchmarks
+=====================================
+Throughput and latency percentiles (p50/p95/p99) for the hot paths, fully
+offline: LLM providers, paper sources, embeddings, PDFs and GitHub are the
+seeded stand-ins in fakes.py, so results depend on this code and the
+configured fake latencies only.
+
+Scenarios: search (/search), analyze (/analyze), analyze_deep
+(/api/mcp/analyze-deep: PDF download + extract + 4 LLM passes + graph),
+consensus (/api/mcp/consensus), graph (/api/mcp/graph), hydrate
+(GitHubStorageService.hydrate_from_github) and recall (macp recall).
+
+Results are written as JSON (default benchmarks/results/<commit>.json) with
+the commit and settings they were measured at; compare two runs with
+compare.py.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--scenarios search,analyze] [--ops 50]
+        [--concurrency 4] [--warmup 3] [--library-size 200]
+        [--llm-latency-ms 50] [--llm-jitter-ms 10]
+        [--http-latency-ms 20] [--http-jitter-ms 5] [--seed 1] [--out FILE]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.dirname(_HERE)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The q-th percentile (0-100) of ``values``, linearly interpolated between ranks."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies_ms: list[float], errors: list[str], wall_s: float, concurrency: int) -> dict:
+    done = len(latencies_ms)
+    return {
+        "ops": done + len(errors),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "concurrency": concurrency,
+        "wall_s": round(wall_s, 3),
+        "throughput_per_s": round(done / wall_s, 2) if wall_s else 0.0,
+        "latency_ms": {
+            "min": round(min(latencies_ms), 2) if done else 0.0,
+            "mean": round(sum(latencies_ms) / done, 2) if done else 0.0,
+            "p50": round(percentile(latencies_ms, 50), 2),
+            "p95": round(percentile(latencies_ms, 95), 2),
+            "p99": round(percentile(latencies_ms, 99), 2),
+            "max": round(max(latencies_ms), 2) if done else 0.0,
+        },
+    }
+
+
+async def measure(operation, ops: int, warmup: int, concurrency: int) -> dict:
+    """Run ``operation(n)`` for warmup + ops distinct n, at most ``concurrency`` at a time; time the last ops."""
+    for n in range(warmup):
+        with contextlib.suppress(Exception):
+            await operation(n)
+
+    latencies: list[float] = []
+    errors: list[str] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def _one(n: int) -> None:
+        async with slots:
+            started = time.perf_counter()
+            try:
+                await operation(n)
+            except Exception as e:  # noqa: BLE001 — recorded, the run goes on
+                errors.append(f"{type(e).__name__}: {e}"[:300])
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(warmup + n) for n in range(ops)))
+    return summarize(latencies, errors, time.perf_counter() - started, concurrency)
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=_ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run_metadata(args: argparse.Namespace, scenarios: list[str]) -> dict:
+    commit = _git("rev-parse", "HEAD")
+    return {
+        "commit": commit or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")) if commit else None,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            "scenarios": scenarios, "ops": args.ops, "warmup": args.warmup, "concurrency": args.concurrency,
+            "library_size": args.library_size, "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms, "http_latency_ms": args.http_latency_ms,
+            "http_jitter_ms": args.http_jitter_ms, "seed": args.seed,
+        },
+    }
+
+
+async def run(args: argparse.Namespace, scenarios: list[str], workdir: str) -> dict:
+    from scenarios import SERIAL, Bench
+
+    bench = Bench(workdir, ops=args.warmup + args.ops, library_size=args.library_size,
+                  llm_ms=args.llm_latency_ms, llm_jitter_ms=args.llm_jitter_ms,
+                  http_ms=args.http_latency_ms, http_jitter_ms=args.http_jitter_ms, seed=args.seed)
+    results = {}
+    # Application logs and audit lines would drown the report; keep them out of the terminal.
+    with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+        bench.setup()
+        try:
+            for name in scenarios:
+                concurrency = 1 if name in SERIAL else args.concurrency
+                results[name] = await measure(getattr(bench, name), args.ops, args.warmup, concurrency)
+        finally:
+            await bench.close()
+    return results
+
+
+def _report(results: dict) -> None:
+    print(f"{'scenario':<14}{'ops':>6}{'err':>5}{'conc':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        lat = r["latency_ms"]
+        print(f"{name:<14}{r['ops']:>6}{r['errors']:>5}{r['concurrency']:>6}{r['throughput_per_s']:>10.2f}"
+              f"{lat['p50']:>10.1f}{lat['p95']:>10.1f}{lat['p99']:>10.1f}")
+        for sample in r["error_samples"]:
+            print(f"  [WARN] {sample}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput/latency benchmarks for MACP hot paths")
+    parser.add_argument("--scenarios", default="all", help="Comma-separated scenarios, or 'all'")
+    parser.add_argument("--ops", type=int, default=50, help="Measured operations per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="Unmeasured operations before each scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Operations in flight (hydrate/recall run 1)")
+    parser.add_argument("--library-size", type=int, default=200,
+                        help="Papers in the graph, the GitHub repo to hydrate and the recall knowledge base")
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--llm-jitter-ms", type=float, default=10)
+    parser.add_argument("--http-latency-ms", type=float, default=20,
+                        help="Paper sources, embeddings, PDF downloads and GitHub")
+    parser.add_argument("--http-jitter-ms", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None, help="Results file (default benchmarks/results/<commit>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="macp_bench_")
+    # The backend reads these on import (scenarios.py): a throwaway library.
+    os.environ["MACP_DIR"] = workdir
+    os.environ["MACP_DATABASE_URL"] = f"sqlite:///{workdir}/bench.db"
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret-not-used-for-real-auth")
+    os.environ["TRACING_ENABLED"] = "false"
+    sys.path.insert(0, _HERE)
+    logging.disable(logging.WARNING)
+
+    from scenarios import SCENARIOS
+
+    scenarios = list(SCENARIOS) if args.scenarios == "all" else [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios {unknown}; choose from {', '.join(SCENARIOS)}")
+
+    meta = run_metadata(args, scenarios)
+    results = asyncio.run(run(args, scenarios, workdir))
+
+    out = args.out
+    if out is None:
+        tag = (meta["commit"] or "nocommit")[:12] + ("-dirty" if meta["dirty"] else "")
+        out = os.path.join(_HERE, "results", f"{tag}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": meta, "scenarios": results}, f, indent=2)
+
+    _report(results)
+    print(f"\nResults written to {out}")
+    sys.exit(1 if any(r["errors"] for r in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
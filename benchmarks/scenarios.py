@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Benchmark Scenarios
+==============================================
+Seeds a throwaway library and exposes one async operation per benchmarked
+path. HTTP scenarios go through the full FastAPI app (every middleware,
+rate limiting switched off) over httpx's ASGI transport; hydrate and recall
+call GitHubStorageService / macp_cli directly.
+
+Import only after run_benchmarks.py has pointed MACP_DIR and
+MACP_DATABASE_URL at a temp directory: the backend reads them on import.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from argparse import Namespace
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(_ROOT, "phase3_prototype", "backend"))
+sys.path.insert(0, os.path.join(_ROOT, "tools"))
+
+import httpx  # noqa: E402
+
+import github_storage  # noqa: E402
+import llm_providers as lp  # noqa: E402
+import main  # noqa: E402
+import paper_fetcher  # noqa: E402
+import webmcp  # noqa: E402
+from database import Analysis, Paper, SessionLocal, User, init_db, upsert_paper  # noqa: E402
+from github_auth import encrypt_token  # noqa: E402
+from middleware import get_current_user, require_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+
+from fakes import CONCEPTS, FakeGitHub, FakeLLM, FakeWeb, paper_record, paper_text  # noqa: E402
+
+SCENARIOS = ("search", "analyze", "analyze_deep", "consensus", "graph", "hydrate", "recall")
+# Scenarios that share per-user state and run one operation at a time.
+SERIAL = {"hydrate", "recall"}
+CONSENSUS_PROVIDERS = ("gemini", "openai", "anthropic")
+
+
+class ScenarioError(Exception):
+    """An operation answered, but not successfully (HTTP error or an MCP isError result)."""
+
+
+def _paper_dict(arxiv_id: str, status: str = "saved") -> dict:
+    record = paper_record(arxiv_id)
+    return paper_fetcher.normalize_paper(
+        arxiv_id=arxiv_id, title=record["title"], authors=record["authors"],
+        abstract=record["abstract"], discovered_by="benchmark",
+    ) | {"status": status}
+
+
+class Bench:
+    """The seeded library, fakes and clients every scenario runs against."""
+
+    def __init__(self, workdir: str, ops: int, library_size: int, llm_ms: float, llm_jitter_ms: float,
+                 http_ms: float, http_jitter_ms: float, seed: int):
+        self.workdir = workdir
+        self.ops = ops
+        self.library_size = library_size
+        self.llm = FakeLLM(llm_ms, llm_jitter_ms, seed)
+        self.web = FakeWeb(http_ms, http_jitter_ms, seed + 1)
+        self.github = FakeGitHub(http_ms, http_jitter_ms, seed + 2)
+        self.client: httpx.AsyncClient | None = None
+
+    # --- Setup ------------------------------------------------------------
+
+    def setup(self) -> None:
+        init_db()
+        tempfile.tempdir = self.workdir  # download_pdf() caches PDFs here
+        limiter.enabled = False
+        self.llm.install(lp)
+        self.web.install(paper_fetcher)
+        self.github.install(github_storage)
+        self.github.seed_library(self.library_size)
+        lp.reset_provider_guards()
+        os.environ.setdefault("GEMINI_API_KEY", "bench-key")
+
+        db = SessionLocal()
+        try:
+            reader = User(github_id=990001, github_login="bench-reader")
+            owner = User(github_id=990002, github_login="bench-owner", connected_repo="bench/library",
+                         github_access_token=encrypt_token("bench-token"))
+            db.add_all([reader, owner])
+            db.commit()
+            for user in (reader, owner):
+                db.refresh(user)
+                db.expunge(user)
+            self.reader, self.owner = reader, owner
+
+            self.abstract_ids = self._seed_papers(db, "9901", self.ops)
+            self.deep_ids = self._seed_papers(db, "9902", self.ops)
+            self.consensus_ids = self._seed_papers(db, "9903", self.ops)
+            self._seed_consensus_analyses(db)
+            self._seed_graph(db)
+        finally:
+            db.close()
+        self._seed_recall()
+
+        app = main.app
+        app.dependency_overrides[get_current_user] = lambda: self.reader
+        app.dependency_overrides[require_user] = lambda: self.reader
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                        timeout=None)
+
+    def _seed_papers(self, db, prefix: str, count: int) -> list[str]:
+        ids = [f"{prefix}.{n:05d}" for n in range(count)]
+        for arxiv_id in ids:
+            upsert_paper(db, _paper_dict(arxiv_id), user_id=self.reader.id)
+        return ids
+
+    def _seed_consensus_analyses(self, db) -> None:
+        """Three providers' abstract analyses per consensus paper, as if /analyze had run for each."""
+        papers = db.query(Paper).filter(Paper.arxiv_id.in_([f"arxiv:{i}" for i in self.consensus_ids]))
+        for paper in papers:
+            for provider in CONSENSUS_PROVIDERS:
+                answer = json.loads(self.llm.answer(f"{provider}:{paper.arxiv_id}"))
+                db.add(Analysis(
+                    paper_id=paper.id, user_id=self.reader.id, provider=provider,
+                    summary=answer["summary"], key_insights=json.dumps(answer["key_insights"]),
+                    methodology=answer["methodology"], research_gaps=json.dumps(answer["research_gaps"]),
+                    relevance_tags=json.dumps(answer["relevance_tags"]), score=answer["strength_score"],
+                    provenance=json.dumps({"provider": provider, "type": "abstract"}),
+                ))
+        db.commit()
+
+    def _seed_graph(self, db) -> None:
+        """The reader's knowledge graph: library_size deep-analysed papers through _populate_graph."""
+        for arxiv_id in self._seed_papers(db, "9904", self.library_size):
+            paper = db.query(Paper).filter(Paper.arxiv_id == f"arxiv:{arxiv_id}").first()
+            answer = json.loads(self.llm.answer(arxiv_id))
+            analysis = {"section_analyses": [{"pass": "results", "data": {
+                "concepts": answer["concepts"], "methods": answer["methods"]}}]}
+            webmcp._populate_graph(db, paper, analysis, self.reader.id)
+
+    def _seed_recall(self) -> None:
+        """A CLI knowledge base (.macp/ under the workdir) of library_size papers and sessions."""
+        macp = os.path.join(self.workdir, ".macp")
+        os.makedirs(macp, exist_ok=True)
+        papers = []
+        for n in range(self.library_size):
+            paper = _paper_dict(f"2603.{n:05d}", status="analyzed")
+            paper["insights"] = [paper_text(f"insight:{n}:{k}", 20) for k in range(3)]
+            papers.append(paper)
+        sessions = [{
+            "session_id": f"LS-{n:04d}", "date": "2026-01-15", "papers": [papers[n]["id"]],
+            "summary": paper_text(f"session:{n}", 40), "key_insight": paper_text(f"key:{n}", 15),
+            "tags": [CONCEPTS[n % len(CONCEPTS)]],
+            "analysis": {"methodology": paper_text(f"method:{n}", 20), "research_gaps": ["scaling"]},
+        } for n in range(self.library_size)]
+        files = {
+            "research_papers.json": {"papers": papers},
+            "learning_log.json": {"learning_sessions": sessions},
+            "citations.json": {"citations": [{"citation_id": f"C-{n}", "cited_in": "bench project",
+                                              "context": paper_text(f"cite:{n}", 20)}
+                                             for n in range(self.library_size // 4)]},
+            "handoffs.json": {"handoffs": []},
+        }
+        for name, data in files.items():
+            with open(os.path.join(macp, name), "w") as f:
+                json.dump(data, f)
+
+    # --- Operations -------------------------------------------------------
+
+    async def _post(self, path: str, body: dict, mcp: bool = False) -> None:
+        r = await self.client.post(path, json=body)
+        self._check(r, mcp)
+
+    @staticmethod
+    def _check(r: httpx.Response, mcp: bool) -> None:
+        if r.status_code != 200:
+            raise ScenarioError(f"HTTP {r.status_code}: {r.text[:200]}")
+        if mcp and r.json().get("isError"):
+            raise ScenarioError(r.json()["content"][0]["text"][:200])
+
+    async def search(self, n: int) -> None:
+        await self._post("/search", {"query": f"bench topic {n % 20}", "limit": 10, "source": "hysts"})
+
+    async def analyze(self, n: int) -> None:
+        await self._post("/analyze", {"paper_id": self.abstract_ids[n], "provider": "gemini",
+                                      "api_key": "bench-key", "hedge": False})
+
+    async def analyze_deep(self, n: int) -> None:
+        await self._post("/api/mcp/analyze-deep", {"paper_id": self.deep_ids[n], "provider": "gemini",
+                                                   "api_key": "bench-key"}, mcp=True)
+
+    async def consensus(self, n: int) -> None:
+        await self._post("/api/mcp/consensus", {"paper_id": self.consensus_ids[n], "provider": "gemini",
+                                                "api_key": "bench-key"}, mcp=True)
+
+    async def graph(self, n: int) -> None:
+        self._check(await self.client.get("/api/mcp/graph"), mcp=True)
+
+    async def hydrate(self, n: int) -> None:
+        stats = await github_storage.GitHubStorageService(self.owner).hydrate_from_github()
+        if stats.get("errors") or stats.get("papers") != self.library_size:
+            raise ScenarioError(f"hydration stats {stats}")
+
+    async def recall(self, n: int) -> None:
+        import macp_cli
+
+        cwd = os.getcwd()
+        os.chdir(self.workdir)  # macp_cli reads .macp/ relative to the working directory
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                macp_cli.cmd_recall(Namespace(question=CONCEPTS[n % len(CONCEPTS)], limit=5))
+        finally:
+            os.chdir(cwd)
+        if "Total matches" not in out.getvalue():
+            raise ScenarioError("recall found nothing")
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
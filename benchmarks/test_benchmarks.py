@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Smoke tests for the benchmark suite: a tiny zero-latency run of every
+scenario succeeds and writes a well-formed results file, compare.py flags
+regressions, and the percentile helper interpolates between ranks.
+
+The run is a subprocess with its own temp library, so it does not touch the
+database other tests share. Fully offline.
+
+Run:  python benchmarks/test_benchmarks.py
+Or:   pytest benchmarks/test_benchmarks.py
+"""
+
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _HERE)
+
+import compare  # noqa: E402
+from run_benchmarks import percentile  # noqa: E402
+
+
+def _run(out: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, os.path.join(_HERE, "run_benchmarks.py"), "--ops", "3", "--warmup", "0",
+         "--concurrency", "2", "--library-size", "12", "--llm-latency-ms", "0", "--llm-jitter-ms", "0",
+         "--http-latency-ms", "0", "--http-jitter-ms", "0", "--out", out],
+        capture_output=True, text=True, timeout=300,
+    )
+
+
+def test_every_scenario_runs_clean():
+    out = os.path.join(tempfile.mkdtemp(prefix="macp_bench_test_"), "run.json")
+    proc = _run(out)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    with open(out) as f:
+        results = json.load(f)
+    assert set(results["scenarios"]) == {"search", "analyze", "analyze_deep", "consensus", "graph",
+                                         "hydrate", "recall"}
+    for name, r in results["scenarios"].items():
+        assert r["ops"] == 3 and r["errors"] == 0, (name, r)
+        lat = r["latency_ms"]
+        assert 0 < lat["min"] <= lat["p50"] <= lat["p95"] <= lat["p99"] <= lat["max"], (name, lat)
+        assert r["throughput_per_s"] > 0
+    assert results["meta"]["settings"]["library_size"] == 12
+    assert results["scenarios"]["hydrate"]["concurrency"] == 1
+
+
+def test_compare_flags_p95_and_throughput_regressions():
+    base = {"meta": {"commit": "a", "settings": {}}, "scenarios": {"graph": {
+        "errors": 0, "throughput_per_s": 100.0,
+        "latency_ms": {"p50": 10.0, "p95": 20.0, "p99": 30.0}}}}
+    head = copy.deepcopy(base)
+    head["scenarios"]["graph"]["latency_ms"]["p50"] = 15.0  # informational only
+    _, regressions = compare.compare(base, head, 0.10)
+    assert regressions == []
+
+    head["scenarios"]["graph"]["latency_ms"]["p95"] = 25.0
+    head["scenarios"]["graph"]["throughput_per_s"] = 80.0
+    _, regressions = compare.compare(base, head, 0.10)
+    assert regressions == ["graph p95 +25.0%", "graph ops/s -20.0%"]
+
+
+def test_percentile_interpolates():
+    assert percentile([], 50) == 0.0
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 95) == 4.8
+    assert percentile([7.0], 99) == 7.0
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
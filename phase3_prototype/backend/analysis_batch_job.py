@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Provider Batch Analysis Job
+======================================================
+Library-wide abstract analysis through provider batch APIs, meant to run
+nightly. Batch requests cost about half as much as synchronous calls and do
+not count against the per-minute rate limits, at the price of latency (up to
+BATCH_COMPLETION_WINDOW), so this is for bulk ingest, not for users waiting
+on a result.
+
+Each run:
+
+1. Polls every batch in analysis_batches that is still open. Ended batches
+   are downloaded and their analyses stored with one bulk INSERT per paper
+   owner, then written to GitHub with one manifest update per owner.
+2. Submits every paper with an abstract and no analysis — and not already
+   in an open batch — as new batches of at most BATCH_MAX_REQUESTS requests.
+
+Usage:
+    python analysis_batch_job.py [--provider openai|groq|anthropic]
+                                 [--limit 1000] [--no-submit] [--no-github]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import ANALYSIS_BATCH_PROVIDER, TOOLS_DIR  # noqa: E402
+
+sys.path.insert(0, os.path.abspath(TOOLS_DIR))
+from analysis_store import save_analyses, sync_analyses  # noqa: E402
+from database import Analysis, AnalysisBatch, Paper, SessionLocal, User, init_db, log_audit  # noqa: E402
+from github_storage import get_storage_service  # noqa: E402
+from llm_providers import (  # noqa: E402
+    BATCH_APIS,
+    BATCH_MAX_REQUESTS,
+    analysis_batch_results,
+    poll_analysis_batch,
+    submit_analysis_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _custom_id(paper_pk: int) -> str:
+    return f"paper-{paper_pk}"
+
+
+def find_unbatched_papers(db, limit: Optional[int] = None) -> list[Paper]:
+    """Papers with an abstract and no analysis that no open batch covers, oldest first."""
+    queued = set()
+    for (papers,) in db.query(AnalysisBatch.papers).filter(AnalysisBatch.status == "submitted"):
+        queued.update(json.loads(papers or "{}").values())
+    query = db.query(Paper).filter(
+        Paper.stale.isnot(True),
+        Paper.abstract.isnot(None),
+        Paper.abstract != "",
+        ~Paper.analyses.any(Analysis.stale.isnot(True)),
+    ).order_by(Paper.id)
+    papers = [p for p in query if p.id not in queued]
+    return papers[:limit] if limit else papers
+
+
+async def _ingest(db, batch: AnalysisBatch, polled: dict, stats: dict, github: bool) -> None:
+    """Store an ended batch's analyses, per paper owner, and mark the batch ingested."""
+    paper_pks = json.loads(batch.papers or "{}")
+    papers = {p.id: p for p in db.query(Paper).filter(Paper.id.in_(paper_pks.values()))} if paper_pks else {}
+    by_owner: dict[Optional[int], list[tuple[dict, str, dict]]] = {}
+    results = await asyncio.to_thread(list, analysis_batch_results(batch.provider, {**polled, "model": batch.model}))
+    for result in results:
+        paper = papers.get(paper_pks.get(result["custom_id"]))
+        if result["analysis"] is None or paper is None:
+            stats["failed_requests"] += 1
+            logger.warning("Batch %s: %s failed: %s", batch.batch_id, result["custom_id"], result["error"])
+            continue
+        by_owner.setdefault(paper.user_id, []).append(({"pk": paper.id}, batch.provider, result["analysis"]))
+
+    for user_id, finished in by_owner.items():
+        saved = save_analyses(user_id, finished)
+        stats["analyzed"] += len(saved)
+        if not (github and user_id):
+            continue
+        storage = get_storage_service(db.query(User).filter(User.id == user_id).first())
+        if storage:
+            written = await sync_analyses(storage, saved, f"Batch analysis ({batch.provider}): {len(saved)} papers")
+            stats["github_written"] += written
+            stats["github_failed"] += len(saved) - written
+
+    batch.status = "ingested"
+    batch.counts = json.dumps(polled["counts"])
+    batch.completed_at = datetime.now(timezone.utc)
+    db.commit()
+    stats["ingested_batches"] += 1
+
+
+async def run_analysis_batches(
+    provider: str = ANALYSIS_BATCH_PROVIDER,
+    limit: Optional[int] = None,
+    submit: bool = True,
+    github: bool = True,
+) -> dict:
+    """Ingest finished batches, then submit the rest of the library. Returns counters for the run."""
+    stats = {"open_batches": 0, "in_progress": 0, "ingested_batches": 0, "failed_batches": 0,
+             "analyzed": 0, "failed_requests": 0, "submitted_batches": 0, "submitted_papers": 0,
+             "github_written": 0, "github_failed": 0}
+    db = SessionLocal()
+    try:
+        open_batches = db.query(AnalysisBatch).filter(AnalysisBatch.status == "submitted").order_by(AnalysisBatch.id).all()
+        for batch in open_batches:
+            stats["open_batches"] += 1
+            polled = await asyncio.to_thread(poll_analysis_batch, batch.provider, batch.batch_id)
+            if polled is None or polled["status"] == "in_progress":
+                stats["in_progress"] += 1
+                if polled:
+                    batch.counts = json.dumps(polled["counts"])
+                    db.commit()
+            elif polled["status"] == "failed":
+                # Its papers are picked up again by the next submission.
+                batch.status = "failed"
+                batch.counts = json.dumps(polled["counts"])
+                batch.completed_at = datetime.now(timezone.utc)
+                db.commit()
+                stats["failed_batches"] += 1
+            else:
+                try:
+                    await _ingest(db, batch, polled, stats, github)
+                except requests.RequestException as e:
+                    # Nothing is stored until every result is downloaded; retried next run.
+                    logger.warning("Batch %s: results download failed: %s", batch.batch_id, e)
+                    stats["in_progress"] += 1
+
+        if not submit:
+            return stats
+        if provider not in BATCH_APIS:
+            raise ValueError(f"{provider} has no batch API; use one of {', '.join(BATCH_APIS)}")
+
+        papers = find_unbatched_papers(db, limit)
+        for start in range(0, len(papers), BATCH_MAX_REQUESTS):
+            chunk = papers[start:start + BATCH_MAX_REQUESTS]
+            requests_ = [{
+                "custom_id": _custom_id(p.id), "title": p.title,
+                "authors": json.loads(p.authors) if p.authors else [], "abstract": p.abstract,
+            } for p in chunk]
+            submitted = await asyncio.to_thread(submit_analysis_batch, requests_, provider)
+            if not submitted:
+                break  # the rest waits for the next run
+            db.add(AnalysisBatch(
+                provider=provider,
+                batch_id=submitted["batch_id"],
+                model=submitted["model"],
+                papers=json.dumps({_custom_id(p.id): p.id for p in chunk}),
+                counts=json.dumps(submitted["counts"]),
+            ))
+            db.commit()
+            stats["submitted_batches"] += 1
+            stats["submitted_papers"] += len(chunk)
+        return stats
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the library through provider batch APIs")
+    parser.add_argument("--provider", choices=sorted(BATCH_APIS), default=ANALYSIS_BATCH_PROVIDER,
+                        help="Provider new batches are submitted to")
+    parser.add_argument("--limit", type=int, default=None, help="Submit at most this many papers")
+    parser.add_argument("--no-submit", action="store_true", help="Only poll and ingest open batches")
+    parser.add_argument("--no-github", action="store_true", help="Skip the GitHub dual-write")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    stats = asyncio.run(run_analysis_batches(
+        provider=args.provider,
+        limit=args.limit,
+        submit=not args.no_submit,
+        github=not args.no_github,
+    ))
+    log_audit(event="batch_analysis", message=f"Provider batch analysis: {stats}", details=stats)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
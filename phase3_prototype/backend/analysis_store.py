@@ -0,0 +1,85 @@
+"""
+MACP Research Assistant — Analysis Store
+=========================================
+Persistence of abstract analyses produced outside the one-paper /analyze
+endpoint: batch, fan-out and streamed analyses, and the provider-side batch
+results ingested by analysis_batch_job.py.
+
+Results are written with one bulk INSERT into analyses and one UPDATE of the
+papers' status, then mirrored to GitHub with one manifest update. The LLM
+calls behind them are added to the llm_usage totals (usage_store).
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import insert, update
+
+from database import Analysis, Paper, SessionLocal
+from llm_providers import PROVIDERS
+from usage_store import record_llm_usage
+
+
+def analysis_columns(paper_pk: int, user_id: Optional[int], provider: str, analysis: dict) -> dict:
+    """Column values of the analyses row for an abstract analysis."""
+    return {
+        "paper_id": paper_pk,
+        "user_id": user_id,
+        "provider": provider,
+        "summary": analysis.get("summary", ""),
+        "key_insights": json.dumps(analysis.get("key_insights", [])),
+        "methodology": analysis.get("methodology", ""),
+        "research_gaps": json.dumps(analysis.get("research_gaps", [])),
+        "relevance_tags": json.dumps(analysis.get("relevance_tags", [])),
+        "score": analysis.get("strength_score", 0),
+        "provenance": json.dumps({"provider": provider, "model": PROVIDERS[provider]["model"]}),
+    }
+
+
+def save_analyses(user_id: Optional[int], finished: list[tuple[dict, str, dict]]) -> list[tuple[Paper, Analysis, dict]]:
+    """
+    Persist (paper, provider, analysis) results of a batch or fan-out: one
+    bulk INSERT into analyses and one UPDATE of the papers' status, in a
+    single transaction. ``paper`` needs only its "pk". Their LLM calls are
+    then recorded in llm_usage.
+
+    Returns (paper, analysis row, analysis) for the GitHub write; the rows
+    are transient copies of what was inserted.
+    """
+    if not finished:
+        return []
+    rows = [analysis_columns(paper["pk"], user_id, provider, analysis) for paper, provider, analysis in finished]
+    paper_pks = list({paper["pk"] for paper, _, _ in finished})
+    db = SessionLocal()
+    try:
+        db.execute(insert(Analysis), rows)
+        db.execute(update(Paper).where(Paper.id.in_(paper_pks)).values(status="analyzed"))
+        db.commit()
+        papers = {p.id: p for p in db.query(Paper).filter(Paper.id.in_(paper_pks))}
+    finally:
+        db.close()
+    record_llm_usage(user_id, [analysis for _, _, analysis in finished])
+    return [
+        (papers[paper["pk"]], Analysis(**row), analysis)
+        for (paper, _, analysis), row in zip(finished, rows)
+    ]
+
+
+async def sync_analyses(storage, saved: list[tuple[Paper, Analysis, dict]], message: str) -> int:
+    """GitHub dual-write for save_analyses() results: per-agent files, then one manifest update.
+
+    Returns the number of analysis files written.
+    """
+    analyzed_at = datetime.now(timezone.utc).isoformat()
+    entries = {}
+    written = 0
+    for paper, db_analysis, analysis in saved:
+        if await storage.save_analysis_per_agent(paper, db_analysis, analysis):
+            written += 1
+            entries.setdefault(paper.arxiv_id, {"providers": []})["providers"].append(
+                {"provider": db_analysis.provider, "type": "abstract", "analyzed_at": analyzed_at}
+            )
+    if entries:
+        await storage.update_manifest_entries("analyses", entries, message)
+    return written
@@ -93,3 +93,63 @@ RATE_LIMIT_AUTH_MCP: str = os.getenv("RATE_LIMIT_AUTH_MCP", "60/minute")
 # ---------------------------------------------------------------------------
 
 MCP_SERVER_PORT: int = int(os.getenv("MCP_SERVER_PORT", "8001"))
+
+# ---------------------------------------------------------------------------
+# GitHub API budget (per user token, 5000 requests/hour)
+# ---------------------------------------------------------------------------
+
+# Below this many remaining requests, low-priority writes (graph, manifest)
+# wait for the quota window to reset so paper/analysis/note writes keep headroom.
+GITHUB_LOW_PRIORITY_RESERVE: int = int(os.getenv("GITHUB_LOW_PRIORITY_RESERVE", "500"))
+# Longest a GitHub call may be deferred for quota before it is dropped.
+GITHUB_MAX_DEFER_SECONDS: int = int(os.getenv("GITHUB_MAX_DEFER_SECONDS", "900"))
+
+# ---------------------------------------------------------------------------
+# Consensus
+# ---------------------------------------------------------------------------
+
+# The LLM synthesis for a paper is re-generated only once the agreement score
+# has moved at least this far from the score it was generated at.
+CONSENSUS_RESYNTHESIS_DELTA: float = float(os.getenv("CONSENSUS_RESYNTHESIS_DELTA", "0.05"))
+# Concurrent LLM synthesis calls in the library-wide batch consensus job.
+CONSENSUS_BATCH_CONCURRENCY: int = int(os.getenv("CONSENSUS_BATCH_CONCURRENCY", "4"))
+
+# ---------------------------------------------------------------------------
+# Batch Analysis
+# ---------------------------------------------------------------------------
+
+# Most papers one /api/mcp/analyze-batch request may analyze. Per-provider
+# concurrency caps live with the providers (tools/llm_providers.py).
+ANALYZE_BATCH_MAX_PAPERS: int = int(os.getenv("ANALYZE_BATCH_MAX_PAPERS", "200"))
+# Provider for the nightly provider-side batch analysis job
+# (analysis_batch_job.py); it must have a batch API (llm_providers.BATCH_APIS).
+ANALYSIS_BATCH_PROVIDER: str = os.getenv("ANALYSIS_BATCH_PROVIDER", "openai")
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+# Request/LLM/GitHub metrics are collected when enabled, but /metrics
+# (Prometheus text format) is only served once METRICS_TOKEN is set: scrapers
+# send "Authorization: Bearer <token>". Without a token it answers 404 — it
+# lives outside /api/, so no other guard covers it.
+METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() in ("true", "1", "yes")
+METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+
+# ---------------------------------------------------------------------------
+# Tracing + Profiling
+# ---------------------------------------------------------------------------
+
+# Per-request stage timings (HTML/PDF fetch, extraction, LLM passes, DB,
+# graph, GitHub writes) as a Server-Timing header and a JSON log line. Off
+# by default: the header tells any client how long each internal stage took.
+TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() in ("true", "1", "yes")
+# Admins are GitHub logins (comma-separated). Only their requests can be
+# profiled: those sending "X-MACP-Profile: 1", plus PROFILE_SAMPLE_RATE of
+# the rest. Each profile is a cProfile dump in PROFILE_DIR and a log line
+# with its top functions (the dump is gone when a Cloud Run instance is).
+ADMIN_GITHUB_LOGINS: set[str] = {
+    login.strip().lower() for login in os.getenv("ADMIN_GITHUB_LOGINS", "").split(",") if login.strip()
+}
+PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR: str = os.getenv("PROFILE_DIR", os.path.join(MACP_DIR, "profiles"))
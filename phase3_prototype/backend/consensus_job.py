@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Batch Consensus Job (P4.1)
+=====================================================
+Library-wide consensus refresh, meant to run nightly.
+
+Finds every (paper, analysis type) with at least get_consensus_min_agents()
+analyses of that type and brings its consensus up to date:
+
+1. Embeddings for all papers that gained analyses go out in one
+   embed_texts_cached() call, which splits them into provider-maximal
+   requests and skips everything already in embedding_cache.
+2. Each paper is scored incrementally against its consensus_states row, as
+   /api/mcp/consensus does.
+3. LLM syntheses — only where the agreement score moved past
+   CONSENSUS_RESYNTHESIS_DELTA — run at most ``concurrency`` at a time.
+4. Changed consensuses are saved to consensus_states and, per paper owner
+   with a connected repo, to GitHub with one manifest update per owner.
+
+Usage:
+    python consensus_job.py [--type abstract|deep] [--provider gemini]
+                            [--concurrency 4] [--no-github] [--force]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import CONSENSUS_BATCH_CONCURRENCY, TOOLS_DIR  # noqa: E402
+
+sys.path.insert(0, os.path.abspath(TOOLS_DIR))
+from consensus_store import (  # noqa: E402
+    build_consensus,
+    consensus_inputs,
+    get_consensus_state,
+    manifest_entry,
+    reusable_synthesis,
+    save_consensus_state,
+    scoring_state,
+)
+from database import Analysis, Paper, SessionLocal, User, init_db, log_audit  # noqa: E402
+from embedding_store import LOOKUP_CHUNK, EmbeddingStore  # noqa: E402
+from github_storage import get_storage_service  # noqa: E402
+from llm_providers import (  # noqa: E402
+    EMBEDDING_PROVIDERS,
+    consensus_documents,
+    embed_texts_cached,
+    embedding_digest,
+    generate_consensus_synthesis,
+    resolve_embed_provider,
+    update_agreement_state,
+)
+from schema_validator import get_consensus_min_agents, get_consensus_weights  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+class _PrefetchedEmbeddings:
+    """In-memory view of the vectors fetched up front, so per-paper scoring never leaves the process."""
+
+    def __init__(self, provider: str, model: str, texts: list[str], vectors: list[list[float]]):
+        self.key = (provider, model)
+        self.vectors = {embedding_digest(t): v for t, v in zip(texts, vectors)}
+
+    def get_many(self, provider: str, model: str, digests: list[str]) -> dict[str, list[float]]:
+        if (provider, model) != self.key:
+            return {}
+        return {d: self.vectors[d] for d in digests if d in self.vectors}
+
+    def put_many(self, provider: str, model: str, vectors: dict[str, list[float]]) -> None:
+        if (provider, model) == self.key:
+            self.vectors.update(vectors)
+
+
+def find_consensus_groups(
+    db,
+    analysis_type: Optional[str] = None,
+    min_agents: Optional[int] = None,
+) -> list[tuple[int, str, list[Analysis]]]:
+    """(paper pk, analysis type, analyses) for every group with enough analyses.
+
+    Groups are found from (id, paper, provenance) only; full rows are loaded
+    just for the qualifying analyses.
+    """
+    min_agents = min_agents or get_consensus_min_agents()
+    groups: dict[tuple[int, str], list[int]] = {}
+    rows = db.query(Analysis.id, Analysis.paper_id, Analysis.provenance).filter(
+        Analysis.stale.isnot(True),
+    ).order_by(Analysis.id).all()
+    for analysis_id, paper_id, provenance in rows:
+        a_type = (json.loads(provenance) if provenance else {}).get("type", "abstract")
+        if analysis_type and a_type != analysis_type:
+            continue
+        groups.setdefault((paper_id, a_type), []).append(analysis_id)
+    groups = {key: ids for key, ids in groups.items() if len(ids) >= min_agents}
+
+    wanted = [i for ids in groups.values() for i in ids]
+    loaded: dict[int, Analysis] = {}
+    for start in range(0, len(wanted), LOOKUP_CHUNK):
+        for a in db.query(Analysis).filter(Analysis.id.in_(wanted[start:start + LOOKUP_CHUNK])).all():
+            loaded[a.id] = a
+    return [
+        (paper_id, a_type, [loaded[i] for i in ids])
+        for (paper_id, a_type), ids in sorted(groups.items())
+    ]
+
+
+async def run_batch_consensus(
+    analysis_type: Optional[str] = None,
+    provider: str = "gemini",
+    concurrency: int = CONSENSUS_BATCH_CONCURRENCY,
+    github: bool = True,
+    force: bool = False,
+) -> dict:
+    """Refresh consensus for the whole library. Returns counters for the run."""
+    stats = {"groups": 0, "unchanged": 0, "scored_pairs": 0, "synthesized": 0,
+             "synthesis_reused": 0, "saved": 0, "github_written": 0, "github_failed": 0}
+    db = SessionLocal()
+    try:
+        weights = get_consensus_weights()
+        groups = []
+        for paper_id, a_type, analyses in find_consensus_groups(db, analysis_type):
+            analysis_dicts, agents = consensus_inputs(analyses)
+            row = get_consensus_state(db, paper_id, a_type)
+            groups.append({"paper_id": paper_id, "type": a_type, "dicts": analysis_dicts,
+                           "agents": agents, "row": row, "state": scoring_state(row)})
+        stats["groups"] = len(groups)
+
+        # One embedding pass for every group with analyses the state has not seen.
+        cache = EmbeddingStore(db)
+        embed_provider, key = resolve_embed_provider(provider)
+        if embed_provider:
+            model = EMBEDDING_PROVIDERS[embed_provider]["model"]
+            method = f"semantic:{embed_provider}:{model}"
+            texts = []
+            for g in groups:
+                state = g["state"]
+                known = set(state["ids"]) if state and state.get("method") == method else set()
+                if any(d["id"] not in known for d in g["dicts"]):
+                    texts += consensus_documents(g["dicts"])
+            texts = list(dict.fromkeys(texts))
+            vectors = embed_texts_cached(texts, embed_provider, key, cache) if texts else []
+            if vectors is not None:
+                cache = _PrefetchedEmbeddings(embed_provider, model, texts, vectors)
+
+        pending = []
+        for g in groups:
+            g["scoring"], g["agreement"] = update_agreement_state(
+                g["state"], g["dicts"], weights=weights, semantic=True,
+                embed_provider=provider, embedding_cache=cache,
+            )
+            stats["scored_pairs"] += g["agreement"]["pairs_computed"]
+            score = g["agreement"]["agreement_score"]
+            g["synthesis"] = reusable_synthesis(g["row"], score, force=force)
+            if g["synthesis"] is not None:
+                stats["synthesis_reused"] += 1
+                g["synthesized_score"] = g["row"].synthesized_score
+                if g["agreement"]["pairs_computed"] == 0 and g["row"].agreement_score == score:
+                    g["unchanged"] = True
+                    stats["unchanged"] += 1
+            else:
+                pending.append(g)
+
+        papers = {
+            p.id: p for p in db.query(Paper).filter(Paper.id.in_({g["paper_id"] for g in groups})).all()
+        } if groups else {}
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _synthesize(g: dict):
+            async with semaphore:
+                g["synthesis"] = await asyncio.to_thread(
+                    generate_consensus_synthesis,
+                    title=papers[g["paper_id"]].title,
+                    analyses=g["dicts"],
+                    provider_id=provider,
+                )
+            g["synthesized_score"] = g["agreement"]["agreement_score"] if g["synthesis"] else None
+            stats["synthesized"] += 1 if g["synthesis"] else 0
+
+        await asyncio.gather(*(_synthesize(g) for g in pending))
+
+        # Persist, and collect GitHub writes per paper owner.
+        writes: dict[int, list[tuple[str, dict]]] = {}
+        for g in groups:
+            if g.get("unchanged"):
+                continue
+            paper = papers[g["paper_id"]]
+            consensus = build_consensus(
+                paper.arxiv_id, g["dicts"], g["agents"], g["agreement"], g["synthesis"], provider,
+            )
+            save_consensus_state(db, g["row"], g["paper_id"], g["type"], g["scoring"], consensus,
+                                 g["synthesized_score"])
+            stats["saved"] += 1
+            if github and paper.user_id:
+                writes.setdefault(paper.user_id, []).append((paper.arxiv_id, consensus))
+
+        for user_id, items in writes.items():
+            storage = get_storage_service(db.query(User).filter(User.id == user_id).first())
+            if not storage:
+                continue
+            entries = {}
+            for arxiv_id, consensus in items:
+                if await storage.save_consensus(arxiv_id, consensus):
+                    entries[arxiv_id] = manifest_entry(consensus)
+                    stats["github_written"] += 1
+                else:
+                    stats["github_failed"] += 1
+            if entries:
+                await storage.update_manifest_entries(
+                    "analyses", entries, f"Batch consensus refresh: {len(entries)} papers",
+                )
+        return stats
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh consensus for every paper with enough analyses")
+    parser.add_argument("--type", choices=["abstract", "deep", "mapreduce"], default=None, help="Only this analysis type")
+    parser.add_argument("--provider", default="gemini", help="LLM provider for synthesis / embedding preference")
+    parser.add_argument("--concurrency", type=int, default=CONSENSUS_BATCH_CONCURRENCY,
+                        help="Concurrent synthesis calls")
+    parser.add_argument("--no-github", action="store_true", help="Skip the GitHub dual-write")
+    parser.add_argument("--force", action="store_true", help="Re-run every synthesis")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    stats = asyncio.run(run_batch_consensus(
+        analysis_type=args.type,
+        provider=args.provider,
+        concurrency=args.concurrency,
+        github=not args.no_github,
+        force=args.force,
+    ))
+    log_audit(event="batch_consensus", message=f"Batch consensus: {stats}", details=stats)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+MACP Research Assistant — Consensus Store (P4.1)
+=================================================
+Persisted consensus per (paper, analysis type) for /api/mcp/consensus.
+
+consensus_states keeps the incremental scoring state of
+llm_providers.update_agreement_state() — pairwise similarity matrices and
+relevance statistics — so a new analysis is scored against the existing ones
+in O(N) instead of recomputing every pair. It also keeps the last consensus
+object and the agreement score its LLM synthesis was generated at; the
+synthesis, the expensive part, is only re-run once the score has moved by
+CONSENSUS_RESYNTHESIS_DELTA.
+
+The endpoint and the nightly batch job (consensus_job.py) share the input,
+consensus-object and manifest-entry builders below.
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from config import CONSENSUS_RESYNTHESIS_DELTA
+from database import Analysis, ConsensusState
+
+logger = logging.getLogger(__name__)
+
+# Consensus fields produced by generate_consensus_synthesis().
+SYNTHESIS_FIELDS = (
+    "synthesized_summary",
+    "convergence_points",
+    "divergence_points",
+    "recommended_action",
+    "bias_cross_check",
+)
+
+
+def consensus_inputs(analyses: list[Analysis]) -> tuple[list[dict], list[str]]:
+    """Analysis rows as scoring dicts, plus the distinct agents in first-seen order."""
+    analysis_dicts = []
+    agents_compared = []
+    for a in analyses:
+        agent_id = a.provider or "unknown"
+        if agent_id not in agents_compared:
+            agents_compared.append(agent_id)
+        analysis_dicts.append({
+            "id": a.id,
+            "agent_id": agent_id,
+            "summary": a.summary or "",
+            "key_findings": json.loads(a.key_insights) if a.key_insights else [],
+            "methodology": a.methodology or "",
+            "relevance_score": (a.score or 5) / 10.0 if a.score and a.score > 1 else (a.score or 0.5),
+            "strength_score": a.score or 5,
+        })
+    return analysis_dicts, agents_compared
+
+
+def build_consensus(
+    arxiv_id: str,
+    analysis_dicts: list[dict],
+    agents_compared: list[str],
+    agreement: dict,
+    synthesis: Optional[dict],
+    provider: str,
+) -> dict:
+    """Consensus object per MACP v2.0 schema; a basic one from the findings if synthesis failed."""
+    agreement_score = agreement["agreement_score"]
+    consensus = {
+        "arxiv_id": arxiv_id,
+        "agents_compared": agents_compared,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "generated_by": (synthesis or {}).get("generated_by") or provider,
+        "agreement_score": agreement_score,
+        "agreement_method": agreement["method"],
+        "agreement_components": agreement["components"],
+        "synthesized_summary": (synthesis or {}).get("synthesized_summary", ""),
+        "convergence_points": (synthesis or {}).get("convergence_points", []),
+        "divergence_points": (synthesis or {}).get("divergence_points", []),
+        "recommended_action": (synthesis or {}).get("recommended_action", "read_full_paper"),
+        "bias_cross_check": (synthesis or {}).get("bias_cross_check", ""),
+        "confidence_distribution": {
+            a["agent_id"]: a["relevance_score"] for a in analysis_dicts
+        },
+    }
+
+    if not synthesis:
+        # Deduplicate findings
+        seen = set()
+        unique_findings = []
+        for a in analysis_dicts:
+            for f in a.get("key_findings", []):
+                f_lower = f.lower().strip()
+                if f_lower not in seen:
+                    seen.add(f_lower)
+                    unique_findings.append(f)
+        consensus["synthesized_summary"] = f"Consensus from {len(agents_compared)} agents. Agreement score: {agreement_score:.2f}."
+        consensus["convergence_points"] = unique_findings[:5]
+    return consensus
+
+
+def manifest_entry(consensus: dict) -> dict:
+    """The manifest.json "analyses" entry recorded for a consensus."""
+    return {
+        "consensus": {
+            "agreement_score": consensus["agreement_score"],
+            "agreement_method": consensus["agreement_method"],
+            "agents": consensus["agents_compared"],
+            "generated_at": consensus["generated_at"],
+        },
+    }
+
+
+def get_consensus_state(db, paper_id: int, analysis_type: str) -> Optional[ConsensusState]:
+    return db.query(ConsensusState).filter(
+        ConsensusState.paper_id == paper_id,
+        ConsensusState.analysis_type == analysis_type,
+    ).first()
+
+
+def scoring_state(row: Optional[ConsensusState]) -> Optional[dict]:
+    """The stored update_agreement_state() state, or None to start fresh."""
+    if not row or not row.state:
+        return None
+    return json.loads(row.state) or None
+
+
+def reusable_synthesis(
+    row: Optional[ConsensusState],
+    agreement_score: float,
+    force: bool = False,
+) -> Optional[dict]:
+    """The stored synthesis if it is still close enough to ``agreement_score``.
+
+    Returns None — meaning "call the LLM" — when forced, when no LLM
+    synthesis has succeeded yet, or when the score has moved at least
+    CONSENSUS_RESYNTHESIS_DELTA since the synthesis was generated.
+    """
+    if force or not row or row.synthesized_score is None:
+        return None
+    if abs(agreement_score - row.synthesized_score) >= CONSENSUS_RESYNTHESIS_DELTA:
+        return None
+    previous = json.loads(row.consensus) if row.consensus else {}
+    if not all(field in previous for field in SYNTHESIS_FIELDS):
+        return None
+    return {field: previous[field] for field in (*SYNTHESIS_FIELDS, "generated_by")}
+
+
+def save_consensus_state(
+    db,
+    row: Optional[ConsensusState],
+    paper_id: int,
+    analysis_type: str,
+    state: Optional[dict],
+    consensus: dict,
+    synthesized_score: Optional[float],
+) -> None:
+    """Upsert the state. Losing a race to a concurrent first write is fine — it is a cache."""
+    if row is None:
+        row = ConsensusState(paper_id=paper_id, analysis_type=analysis_type)
+        db.add(row)
+    row.state = json.dumps(state or {})
+    row.agreement_score = consensus["agreement_score"]
+    row.consensus = json.dumps(consensus)
+    row.synthesized_score = synthesized_score
+    row.updated_at = datetime.now(timezone.utc)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info("Consensus state for paper %s/%s written concurrently — keeping theirs", paper_id, analysis_type)
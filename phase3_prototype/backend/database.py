@@ -4,22 +4,29 @@ MACP Research Assistant — Database Layer (Phase 3C)
 SQLAlchemy ORM models and session management.
 SQLite for local dev, PostgreSQL for production via DATABASE_URL.
 
-Tables: users, papers, analyses, learning_sessions, citations, notes, projects, audit_log
+Tables: users, papers, analyses, learning_sessions, citations, notes, projects, audit_log,
+        graph_nodes, graph_edges, graph_snapshots, embedding_cache, consensus_states,
+        analysis_batches, llm_usage
 """
 
 import json
+import logging
 from datetime import datetime, timezone
 from typing import Optional
 
 from sqlalchemy import (
+    Boolean,
     Column,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     Text,
     create_engine,
+    insert,
     inspect,
     text,
 )
@@ -27,6 +34,8 @@ from sqlalchemy.orm import DeclarativeBase, Session, relationship, sessionmaker
 
 from config import DATABASE_URL, MACP_DIR
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
 # Engine & Session
 # ---------------------------------------------------------------------------
@@ -87,6 +96,34 @@ def _ensure_sqlite_columns():
                 column_type = column.type.compile(dialect=engine.dialect)
                 conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
 
+    # graph_snapshots is derived data: before its unique index is added, drop
+    # all but the newest version of any user's duplicated snapshot.
+    if "graph_snapshots" in existing_tables and "uq_graph_snapshots_user" not in {
+        ix["name"] for ix in inspector.get_indexes("graph_snapshots")
+    }:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM graph_snapshots WHERE user_id IS NOT NULL AND EXISTS ("
+                "SELECT 1 FROM graph_snapshots o WHERE o.user_id = graph_snapshots.user_id"
+                " AND (o.version > graph_snapshots.version"
+                " OR (o.version = graph_snapshots.version AND o.id > graph_snapshots.id)))"
+            ))
+
+    # Indexes declared after a table was first created (e.g. the graph_edges
+    # uniqueness index). Each runs in its own transaction: pre-existing
+    # duplicate rows make a unique index fail, which is logged and skipped.
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            try:
+                index.create(bind=engine)
+            except Exception as e:
+                logger.warning("Could not create index %s: %s", index.name, e)
+
 
 # ---------------------------------------------------------------------------
 # Models
@@ -102,6 +139,7 @@ class User(Base):
     github_avatar_url = Column(String(500), default="")
     github_access_token = Column(Text, default="")  # Fernet-encrypted
     connected_repo = Column(String(300), default="")  # owner/repo
+    github_synced_sha = Column(String(64), default="")  # last commit hydrated from connected_repo
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     last_login = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
@@ -133,6 +171,7 @@ class Paper(Base):
     url = Column(String(500), default="")
     source = Column(String(50), default="unknown")
     status = Column(String(20), default="discovered")
+    stale = Column(Boolean, default=False)  # backing GitHub file was removed
     added_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     user = relationship("User", back_populates="papers")
@@ -168,6 +207,7 @@ class Analysis(Base):
     relevance_tags = Column(Text, default="[]")  # JSON array
     score = Column(Float, default=0)
     provenance = Column(Text, default="{}")  # JSON: model, timestamp, params
+    stale = Column(Boolean, default=False)  # backing GitHub file was removed
     analyzed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     user = relationship("User")
@@ -243,6 +283,7 @@ class Note(Base):
     paper_id = Column(Integer, ForeignKey("papers.id"), nullable=True)
     content = Column(Text, nullable=False)
     tags = Column(Text, default="[]")  # JSON array
+    stale = Column(Boolean, default=False)  # backing GitHub file was removed
     created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc),
                         onupdate=lambda: datetime.now(timezone.utc))
@@ -309,6 +350,10 @@ class GraphNode(Base):
 class GraphEdge(Base):
     """Knowledge graph edge connecting two nodes."""
     __tablename__ = "graph_edges"
+    __table_args__ = (
+        # One edge per (user, source, target, type); bulk inserts rely on it for conflict-ignore.
+        Index("uq_graph_edges_link", "user_id", "source_node_id", "target_node_id", "edge_type", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
@@ -321,6 +366,102 @@ class GraphEdge(Base):
     target_node = relationship("GraphNode", foreign_keys=[target_node_id], back_populates="edges_to")
 
 
+class GraphSnapshot(Base):
+    """Materialized /api/mcp/graph payload per user, maintained by _populate_graph."""
+    __tablename__ = "graph_snapshots"
+    __table_args__ = (
+        # One snapshot per user: two first builds racing must not leave two versions to serve.
+        Index("uq_graph_snapshots_user", "user_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    version = Column(Integer, default=1)  # bumped on every change; the ETag derives from it
+    payload = Column(Text, default="{}")  # JSON: {"nodes", "edges", "stats"} as served
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class EmbeddingVector(Base):
+    """Cached embedding of one consensus document (shared across users — keyed by content)."""
+    __tablename__ = "embedding_cache"
+    __table_args__ = (
+        Index("uq_embedding_cache_key", "provider", "model", "text_hash", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider = Column(String(50), nullable=False)  # embedding provider id, e.g. "gemini"
+    model = Column(String(100), nullable=False)
+    text_hash = Column(String(64), nullable=False)  # sha256 of the truncated text that was embedded
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # little-endian float32, dim * 4 bytes
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class ConsensusState(Base):
+    """Incremental consensus scoring state and last synthesis per (paper, analysis type)."""
+    __tablename__ = "consensus_states"
+    __table_args__ = (
+        Index("uq_consensus_states_paper_type", "paper_id", "analysis_type", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    paper_id = Column(Integer, ForeignKey("papers.id"), nullable=False)
+    analysis_type = Column(String(20), nullable=False)  # abstract | deep | mapreduce
+    state = Column(Text, default="{}")  # JSON: llm_providers.update_agreement_state() state
+    agreement_score = Column(Float, default=0)
+    consensus = Column(Text, default="{}")  # JSON: last consensus object returned
+    synthesized_score = Column(Float, nullable=True)  # agreement score when the LLM synthesis last ran; NULL = never succeeded
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class AnalysisBatch(Base):
+    """Provider-side batch of abstract analyses, from submission until its results are ingested."""
+    __tablename__ = "analysis_batches"
+    __table_args__ = (
+        Index("uq_analysis_batches_provider_batch", "provider", "batch_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider = Column(String(50), nullable=False)
+    batch_id = Column(String(100), nullable=False)  # the provider's batch id
+    model = Column(String(100), default="")
+    status = Column(String(20), default="submitted")  # submitted | ingested | failed
+    papers = Column(Text, default="{}")  # JSON: request custom_id -> papers.id
+    counts = Column(Text, default="{}")  # JSON: request counts last reported by the provider
+    submitted_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    completed_at = Column(DateTime, nullable=True)
+
+
+class LlmUsage(Base):
+    """Daily LLM call totals per user, provider, model, route, analysis type and step (see usage_store)."""
+    __tablename__ = "llm_usage"
+    __table_args__ = (
+        Index("ix_llm_usage_day_provider_model", "day", "provider", "model"),
+        Index("ix_llm_usage_user_day", "user_id", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(String(10), nullable=False)  # UTC date, YYYY-MM-DD
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # None: anonymous or server jobs
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), default="")
+    route = Column(String(50), default="")  # select_model() reason, or "batch"
+    analysis_type = Column(String(20), default="abstract")  # abstract | deep | mapreduce
+    step = Column(String(50), default="")  # pass: abstract, overview, ..., map, reduce
+    calls = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    retries = Column(Integer, default=0)
+    input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)
+    cache_write_tokens = Column(Integer, default=0)
+    cost_usd = Column(Float, default=0.0)  # priced calls only (llm_providers.MODEL_PRICES)
+    unpriced = Column(Integer, default=0)  # calls with usage but no price for their model
+    total_ms = Column(Float, default=0.0)
+    max_ms = Column(Float, default=0.0)
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 class AuditLog(Base):
     __tablename__ = "audit_log"
 
@@ -408,6 +549,22 @@ def log_audit(
             db.close()
 
 
+# ---------------------------------------------------------------------------
+# Helper: conflict-ignoring insert
+# ---------------------------------------------------------------------------
+
+def insert_ignore(db: Session, table):
+    """INSERT that skips rows violating a unique index (SQLite / PostgreSQL)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(table)
+    return dialect_insert(table).on_conflict_do_nothing()
+
+
 # ---------------------------------------------------------------------------
 # Helper: upsert paper
 # ---------------------------------------------------------------------------
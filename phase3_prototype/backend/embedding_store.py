@@ -0,0 +1,58 @@
+"""
+MACP Research Assistant — Embedding Store (P4.1)
+=================================================
+DB-backed cache for llm_providers.embed_texts_cached().
+
+Consensus embeds the findings and methodology document of every analysis
+being compared. Stored analyses never change, so each document is embedded
+once per (provider, model) and kept in the embedding_cache table as packed
+float32; a later consensus run only sends the documents it has not seen —
+typically the two from the agent that just submitted.
+"""
+
+import logging
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import EmbeddingVector, insert_ignore
+from llm_providers import pack_vector, unpack_vector
+
+logger = logging.getLogger(__name__)
+
+# Keeps the IN (...) list well below SQLite's bound-parameter limit.
+LOOKUP_CHUNK = 500
+
+
+class EmbeddingStore:
+    """get_many/put_many over the embedding_cache table, bound to one session."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_many(self, provider: str, model: str, digests: list[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        for start in range(0, len(digests), LOOKUP_CHUNK):
+            rows = self.db.query(EmbeddingVector.text_hash, EmbeddingVector.vector).filter(
+                EmbeddingVector.provider == provider,
+                EmbeddingVector.model == model,
+                EmbeddingVector.text_hash.in_(digests[start:start + LOOKUP_CHUNK]),
+            ).all()
+            for text_hash, blob in rows:
+                found[text_hash] = unpack_vector(blob)
+        return found
+
+    def put_many(self, provider: str, model: str, vectors: dict[str, list[float]]) -> None:
+        if not vectors:
+            return
+        try:
+            # Two consensus runs may embed the same new document; the
+            # unique key makes the second insert a no-op.
+            self.db.execute(insert_ignore(self.db, EmbeddingVector.__table__), [
+                {"provider": provider, "model": model, "text_hash": digest,
+                 "dim": len(vector), "vector": pack_vector(vector)}
+                for digest, vector in vectors.items()
+            ])
+            self.db.commit()
+        except SQLAlchemyError:
+            self.db.rollback()
+            logger.warning("Could not store %d embeddings for %s/%s", len(vectors), provider, model)
@@ -12,27 +12,48 @@ MACP v2.0 Directory Standard:
   └── graph/knowledge-graph.json ← Knowledge graph data
 
 Hydration: On cold start (empty SQLite), reads manifest.json from GitHub
-and re-populates the local database cache.
+and re-populates the local database cache. Later syncs are incremental:
+only files changed since the last synced commit SHA are re-read.
+
+Quota: reads are conditional (ETag / If-None-Match) so unchanged resources
+come back as free 304s, and every call goes through a per-token budget fed
+by X-RateLimit-* and Retry-After headers. When the budget runs low, graph and
+manifest writes are deferred until the quota window resets.
 """
 
 import asyncio
 import base64
+import hashlib
 import json
 import logging
+import os
 import re
+import sys
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Optional
 
 import httpx
 
+from config import GITHUB_LOW_PRIORITY_RESERVE, GITHUB_MAX_DEFER_SECONDS, TOOLS_DIR
 from database import SessionLocal, User, Paper, Analysis, Note
 from github_auth import decrypt_token
 from schema_validator import validate_paper_data, validate_analysis_data, validate_consensus_data
 
+sys.path.insert(0, os.path.abspath(TOOLS_DIR))
+from telemetry import cache_lookup, counter, register_collector  # noqa: E402
+from tracing import traced  # noqa: E402
+
 logger = logging.getLogger(__name__)
 
 GITHUB_API = "https://api.github.com"
 REPO_PREFIX = ".macp"  # MACP v2.0 standard
+LEGACY_PREFIX = ".macp-research"  # MACP v1.0
+
+# The compare API lists at most 300 changed files; a diff that large is
+# treated as truncated and the sync falls back to a full hydration.
+_COMPARE_FILE_CAP = 300
 
 # Strict validation: owner/repo must be alphanumeric, hyphens, underscores, dots only
 _REPO_PATTERN = re.compile(r"^[a-zA-Z0-9._-]+/[a-zA-Z0-9._-]+$")
@@ -45,6 +66,107 @@ def _validate_repo(repo: str) -> str:
     return repo
 
 
+# ---------------------------------------------------------------------------
+# Quota budget + conditional-request cache (process-wide, keyed per token)
+# ---------------------------------------------------------------------------
+# A GitHubStorageService is built per request, but the 5000/hour quota belongs
+# to the user's token — so budgets and ETags live at module level.
+
+PRIORITY_HIGH = "high"  # papers, analyses, notes, hydration reads
+PRIORITY_LOW = "low"    # graph + manifest: derived data, safe to defer
+
+_ETAG_CACHE_SIZE = 256
+_SECONDARY_LIMIT_WAIT = 60  # GitHub's advice when a secondary limit sends no Retry-After
+_RATE_LIMIT_RETRIES = 2
+
+GITHUB_CALLS = counter("macp_github_api_calls_total", "GitHub API responses by method and status", ("method", "status"))
+
+
+class _TokenBudget:
+    """One token's GitHub quota, as last reported by response headers.
+
+    ``remaining``/``reset_at`` mirror X-RateLimit-Remaining/-Reset.
+    ``blocked_until`` comes from a Retry-After (secondary limit) or an
+    exhausted primary limit and holds back calls of every priority.
+    """
+
+    def __init__(self):
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def record(self, resp: httpx.Response) -> None:
+        # Every GitHub response passes through here, so it is also where calls are counted.
+        try:
+            method = resp.request.method
+        except RuntimeError:  # a Response built without a request
+            method = "unknown"
+        GITHUB_CALLS.inc(method=method, status=resp.status_code)
+        headers = resp.headers
+        now = time.time()
+        try:
+            if "x-ratelimit-remaining" in headers:
+                self.remaining = int(headers["x-ratelimit-remaining"])
+                self.reset_at = float(headers.get("x-ratelimit-reset", 0))
+        except ValueError:
+            pass
+        if not _is_rate_limited(resp):
+            return
+        retry_after = headers.get("retry-after", "")
+        if retry_after.isdigit():
+            wait_until = now + int(retry_after)
+        elif self.remaining == 0 and self.reset_at > now:
+            wait_until = self.reset_at
+        else:
+            wait_until = now + _SECONDARY_LIMIT_WAIT
+        self.blocked_until = max(self.blocked_until, wait_until)
+
+    def delay(self, priority: str) -> float:
+        """Seconds a call at ``priority`` should wait before going out."""
+        now = time.time()
+        wait = self.blocked_until - now
+        if self.remaining is not None and self.reset_at > now:
+            reserve = GITHUB_LOW_PRIORITY_RESERVE if priority == PRIORITY_LOW else 1
+            if self.remaining < reserve:
+                wait = max(wait, self.reset_at - now)
+        return max(0.0, wait)
+
+
+_budgets: dict[str, _TokenBudget] = {}
+_etag_cache: "OrderedDict[tuple, tuple[str, object]]" = OrderedDict()
+
+
+def _quota_metrics() -> list[tuple]:
+    """/metrics view of _budgets: tokens seen, tokens held back, and the lowest remaining quota."""
+    now = time.time()
+    budgets = list(_budgets.values())
+    known = [b.remaining for b in budgets if b.remaining is not None and b.reset_at > now]
+    samples = [({}, min(known))] if known else []
+    return [
+        ("macp_github_tokens", "GitHub tokens with a quota budget, and how many are held back now", "gauge",
+         [({"state": "tracked"}, len(budgets)),
+          ({"state": "blocked"}, sum(1 for b in budgets if b.delay(PRIORITY_HIGH) > 0))]),
+        ("macp_github_rate_limit_remaining_min", "Lowest X-RateLimit-Remaining across tokens in their window",
+         "gauge", samples),
+    ]
+
+
+register_collector(_quota_metrics)
+
+
+def _is_rate_limited(resp: httpx.Response) -> bool:
+    """True for primary (remaining=0) and secondary (Retry-After / abuse) limits."""
+    if resp.status_code == 429:
+        return True
+    if resp.status_code != 403:
+        return False
+    return (
+        "retry-after" in resp.headers
+        or resp.headers.get("x-ratelimit-remaining") == "0"
+        or "rate limit" in resp.text.lower()
+    )
+
+
 class GitHubStorageService:
     """Manages dual-write to a user's connected GitHub repository."""
 
@@ -52,6 +174,7 @@ class GitHubStorageService:
         self.user = user
         self.repo = _validate_repo(user.connected_repo) if user.connected_repo else ""
         self._token = decrypt_token(user.github_access_token) if user.github_access_token else ""
+        self._token_key = hashlib.sha256(self._token.encode()).hexdigest()[:16]
 
     def _headers(self) -> dict:
         return {
@@ -60,21 +183,87 @@ class GitHubStorageService:
             "X-GitHub-Api-Version": "2022-11-28",
         }
 
-    async def _put_file(self, path: str, content: str, message: str, max_retries: int = 3) -> bool:
-        """Create or update a file via GitHub Contents API with retry logic."""
+    def _budget(self) -> _TokenBudget:
+        return _budgets.setdefault(self._token_key, _TokenBudget())
+
+    async def _wait_for_budget(self, priority: str) -> bool:
+        """Sleep until the token's budget admits a call at ``priority``.
+
+        Returns False (call should be dropped) if the wait would exceed
+        GITHUB_MAX_DEFER_SECONDS.
+        """
+        delay = self._budget().delay(priority)
+        if delay > GITHUB_MAX_DEFER_SECONDS:
+            logger.warning("GitHub quota for %s blocked for %.0fs — dropping %s-priority call",
+                           self.repo, delay, priority)
+            return False
+        if delay > 0:
+            logger.info("Deferring %s-priority GitHub call for %s by %.1fs", priority, self.repo, delay)
+            await asyncio.sleep(delay)
+        return True
+
+    def _etag_key(self, url: str, params: Optional[dict] = None) -> tuple:
+        return (self._token_key, url, tuple(sorted((params or {}).items())))
+
+    async def _get_json(self, client: httpx.AsyncClient, url: str, params: Optional[dict] = None,
+                        priority: str = PRIORITY_HIGH):
+        """Conditional GET returning the decoded JSON body, or None on any non-200.
+
+        Sends If-None-Match for URLs seen before; a 304 (which GitHub does not
+        charge against the quota) replays the cached body. Rate-limited
+        responses are retried after the wait the budget derived from them.
+        """
+        key = self._etag_key(url, params)
+        for _ in range(_RATE_LIMIT_RETRIES + 1):
+            if not await self._wait_for_budget(priority):
+                return None
+            headers = self._headers()
+            cached = _etag_cache.get(key)
+            if cached:
+                headers["If-None-Match"] = cached[0]
+            resp = await client.get(url, headers=headers, params=params)
+            self._budget().record(resp)
+            if resp.status_code == 304 and cached:
+                cache_lookup("github_etag", hits=1)
+                _etag_cache.move_to_end(key)
+                return cached[1]
+            if resp.status_code == 200:
+                cache_lookup("github_etag", misses=1)
+                data = resp.json()
+                etag = resp.headers.get("etag")
+                if etag:
+                    _etag_cache[key] = (etag, data)
+                    _etag_cache.move_to_end(key)
+                    while len(_etag_cache) > _ETAG_CACHE_SIZE:
+                        _etag_cache.popitem(last=False)
+                return data
+            if not _is_rate_limited(resp):
+                return None
+            logger.warning("GitHub GET %s rate-limited (%s)", url, resp.status_code)
+        return None
+
+    @traced("github.put")
+    async def _put_file(self, path: str, content: str, message: str, max_retries: int = 3,
+                        priority: str = PRIORITY_HIGH) -> bool:
+        """Create or update a file via GitHub Contents API with retry logic.
+
+        Waits on the token's quota budget before each attempt; rate-limited
+        attempts are retried after the server-indicated wait instead of the
+        fixed exponential backoff.
+        """
         if not self.repo or not self._token:
             return False
 
         url = f"{GITHUB_API}/repos/{self.repo}/contents/{path}"
 
         for attempt in range(1, max_retries + 1):
+            if not await self._wait_for_budget(priority):
+                return False
             try:
-                # Check if file exists (to get sha for update)
-                sha = None
                 async with httpx.AsyncClient(timeout=30) as client:
-                    resp = await client.get(url, headers=self._headers())
-                    if resp.status_code == 200:
-                        sha = resp.json().get("sha")
+                    # Check if file exists (to get sha for update)
+                    existing = await self._get_json(client, url, priority=priority)
+                    sha = existing.get("sha") if isinstance(existing, dict) else None
 
                     body = {
                         "message": message,
@@ -84,37 +273,45 @@ class GitHubStorageService:
                         body["sha"] = sha
 
                     resp = await client.put(url, json=body, headers=self._headers())
+                    self._budget().record(resp)
                     if resp.status_code in (200, 201):
+                        _etag_cache.pop(self._etag_key(url), None)
                         logger.info("GitHub PUT %s succeeded (attempt %d)", path, attempt)
                         return True
 
+                    if _is_rate_limited(resp):
+                        logger.warning("GitHub PUT %s rate-limited (attempt %d/%d): %s",
+                                       path, attempt, max_retries, resp.status_code)
                     # Don't retry on auth errors
-                    if resp.status_code in (401, 403, 404, 422):
+                    elif resp.status_code in (401, 403, 404, 422):
                         logger.warning("GitHub PUT %s failed (non-retryable): %s", path, resp.status_code)
                         return False
-
-                    logger.warning("GitHub PUT %s failed (attempt %d/%d): %s", path, attempt, max_retries, resp.status_code)
+                    else:
+                        logger.warning("GitHub PUT %s failed (attempt %d/%d): %s",
+                                       path, attempt, max_retries, resp.status_code)
 
             except (httpx.TimeoutException, httpx.ConnectError) as e:
                 logger.warning("GitHub PUT %s error (attempt %d/%d): %s", path, attempt, max_retries, e)
 
-            if attempt < max_retries:
+            # A rate-limit wait is applied by _wait_for_budget at the top of the loop.
+            if attempt < max_retries and self._budget().delay(priority) == 0:
                 await asyncio.sleep(2 ** attempt)  # exponential backoff: 2s, 4s
 
         logger.error("GitHub PUT %s failed after %d attempts", path, max_retries)
         return False
 
-    async def _get_file(self, path: str) -> Optional[str]:
-        """Read a file from the GitHub repo."""
+    async def _get_file(self, path: str, ref: Optional[str] = None,
+                        priority: str = PRIORITY_HIGH) -> Optional[str]:
+        """Read a file from the GitHub repo (at ``ref`` when given, else the default branch)."""
         if not self.repo or not self._token:
             return None
 
         url = f"{GITHUB_API}/repos/{self.repo}/contents/{path}"
+        params = {"ref": ref} if ref else None
         async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.get(url, headers=self._headers())
-            if resp.status_code != 200:
+            data = await self._get_json(client, url, params=params, priority=priority)
+            if not isinstance(data, dict) or "content" not in data:
                 return None
-            data = resp.json()
             return base64.b64decode(data["content"]).decode()
 
     async def _list_dir(self, path: str) -> list[str]:
@@ -124,14 +321,39 @@ class GitHubStorageService:
 
         url = f"{GITHUB_API}/repos/{self.repo}/contents/{path}"
         async with httpx.AsyncClient(timeout=15) as client:
-            resp = await client.get(url, headers=self._headers())
-            if resp.status_code != 200:
-                return []
-            items = resp.json()
+            items = await self._get_json(client, url)
             if isinstance(items, list):
                 return [item["name"] for item in items]
         return []
 
+    async def _get_head_sha(self) -> Optional[str]:
+        """Return the commit SHA at the tip of the repo's default branch."""
+        if not self.repo or not self._token:
+            return None
+
+        url = f"{GITHUB_API}/repos/{self.repo}/commits/HEAD"
+        async with httpx.AsyncClient(timeout=15) as client:
+            data = await self._get_json(client, url)
+            return data.get("sha") if isinstance(data, dict) else None
+
+    async def _compare(self, base: str, head: str) -> Optional[list[dict]]:
+        """List files changed between two commits via the compare API.
+
+        Returns None when the diff cannot be trusted — the base commit is gone
+        (force-push) or GitHub truncated the file list — so the caller can fall
+        back to a full hydration.
+        """
+        if not self.repo or not self._token:
+            return None
+
+        url = f"{GITHUB_API}/repos/{self.repo}/compare/{base}...{head}"
+        async with httpx.AsyncClient(timeout=30) as client:
+            data = await self._get_json(client, url)
+            files = data.get("files") if isinstance(data, dict) else None
+            if not isinstance(files, list) or len(files) >= _COMPARE_FILE_CAP:
+                return None
+            return files
+
     # -----------------------------------------------------------------------
     # Repository initialization
     # -----------------------------------------------------------------------
@@ -259,21 +481,22 @@ class GitHubStorageService:
             f"{REPO_PREFIX}/graph/knowledge-graph.json",
             json.dumps(graph_data, indent=2),
             "Update knowledge graph",
+            priority=PRIORITY_LOW,
         )
 
     # -----------------------------------------------------------------------
     # Manifest
     # -----------------------------------------------------------------------
 
-    async def get_manifest(self) -> Optional[dict]:
+    async def get_manifest(self, priority: str = PRIORITY_HIGH) -> Optional[dict]:
         """Read the manifest from GitHub. Checks both v2.0 (.macp/) and v1.0 (.macp-research/)."""
         # Try MACP v2.0 location first
-        content = await self._get_file(f"{REPO_PREFIX}/manifest.json")
+        content = await self._get_file(f"{REPO_PREFIX}/manifest.json", priority=priority)
         if content:
             return json.loads(content)
 
         # Fall back to legacy v1.0 location
-        content = await self._get_file(".macp-research/manifest.json")
+        content = await self._get_file(f"{LEGACY_PREFIX}/manifest.json", priority=priority)
         if content:
             return json.loads(content)
 
@@ -281,7 +504,7 @@ class GitHubStorageService:
 
     async def update_manifest(self, updates: dict) -> bool:
         """Merge updates into the manifest (deprecated — use update_manifest_entry)."""
-        manifest = await self.get_manifest()
+        manifest = await self.get_manifest(priority=PRIORITY_LOW)
         if not manifest:
             manifest = {"version": "2.0", "schema": "macp-research", "papers": {}, "analyses": {}, "notes": {}}
 
@@ -295,21 +518,27 @@ class GitHubStorageService:
             f"{REPO_PREFIX}/manifest.json",
             json.dumps(manifest, indent=2),
             "Update manifest",
+            priority=PRIORITY_LOW,
         )
 
     async def update_manifest_entry(self, section: str, key: str, data: dict) -> bool:
         """Update a single entry in the manifest. Atomic read-modify-write."""
-        manifest = await self.get_manifest()
+        return await self.update_manifest_entries(section, {key: data}, f"Update manifest: {section}/{key}")
+
+    async def update_manifest_entries(self, section: str, entries: dict, message: str = "") -> bool:
+        """Update many entries of one manifest section in a single read-modify-write (batch jobs)."""
+        manifest = await self.get_manifest(priority=PRIORITY_LOW)
         if not manifest:
             manifest = {"version": "2.0", "schema": "macp-research", "papers": {}, "analyses": {}, "notes": {}}
 
-        manifest.setdefault(section, {})[key] = data
+        manifest.setdefault(section, {}).update(entries)
         manifest["updated_at"] = datetime.now(timezone.utc).isoformat()
 
         return await self._put_file(
             f"{REPO_PREFIX}/manifest.json",
             json.dumps(manifest, indent=2),
-            f"Update manifest: {section}/{key}",
+            message or f"Update manifest: {section} ({len(entries)} entries)",
+            priority=PRIORITY_LOW,
         )
 
     # -----------------------------------------------------------------------
@@ -323,8 +552,13 @@ class GitHubStorageService:
         1. Read manifest.json for indexed entries
         2. Also scan papers/ and analyses/ directories for any files not in manifest
         3. Populate SQLite cache from GitHub data
+        4. Record the synced commit SHA so the next sync can be incremental
         """
-        stats = {"papers": 0, "analyses": 0, "notes": 0, "errors": 0}
+        stats = {"papers": 0, "analyses": 0, "notes": 0, "stale": 0, "errors": 0, "mode": "full"}
+
+        # Read the head first: anything committed while we hydrate is picked
+        # up by the next incremental sync instead of being skipped.
+        head = await self._get_head_sha()
 
         db = SessionLocal()
         try:
@@ -340,7 +574,7 @@ class GitHubStorageService:
                     paper_files.add(arxiv_id.replace(":", "_"))
 
             # Also scan papers/ directory for any files not in manifest
-            for p in (prefix, ".macp-research"):
+            for p in (prefix, LEGACY_PREFIX):
                 dir_files = await self._list_dir(f"{p}/papers")
                 for fname in dir_files:
                     if fname.endswith(".json"):
@@ -350,18 +584,11 @@ class GitHubStorageService:
                     break
 
             # Hydrate papers
-            from database import upsert_paper
             for arxiv_file_id in paper_files:
                 try:
-                    content = await self._get_file(f"{prefix}/papers/{arxiv_file_id}.json")
+                    content = await self._get_file(f"{prefix}/papers/{arxiv_file_id}.json", ref=head)
                     if content:
-                        paper_data = json.loads(content)
-                        paper = upsert_paper(db, paper_data, user_id=self.user.id)
-                        # Mark as saved if it came from the saved papers directory
-                        if paper.status == "discovered":
-                            paper.status = "saved"
-                            db.commit()
-                        stats["papers"] += 1
+                        self._apply_paper(db, content, stats)
                 except Exception as e:
                     logger.warning("Hydrate paper %s failed: %s", arxiv_file_id, e)
                     stats["errors"] += 1
@@ -372,37 +599,9 @@ class GitHubStorageService:
                 if not fname.endswith(".json"):
                     continue
                 try:
-                    content = await self._get_file(f"{prefix}/analyses/{fname}")
+                    content = await self._get_file(f"{prefix}/analyses/{fname}", ref=head)
                     if content:
-                        data = json.loads(content)
-                        paper_data = data.get("paper", {})
-                        analysis_data = data.get("analysis", {})
-                        arxiv_id = paper_data.get("id", "")
-                        if arxiv_id:
-                            paper = db.query(Paper).filter(Paper.arxiv_id == arxiv_id).first()
-                            if paper:
-                                # Check if analysis already exists
-                                existing = db.query(Analysis).filter(
-                                    Analysis.paper_id == paper.id,
-                                    Analysis.provider == analysis_data.get("provenance", {}).get("provider", "unknown"),
-                                ).first()
-                                if not existing:
-                                    provenance = analysis_data.get("_meta", analysis_data.get("provenance", {}))
-                                    db_analysis = Analysis(
-                                        paper_id=paper.id,
-                                        user_id=self.user.id,
-                                        provider=provenance.get("provider", "unknown") if isinstance(provenance, dict) else "unknown",
-                                        summary=analysis_data.get("summary", ""),
-                                        key_insights=json.dumps(analysis_data.get("key_insights", [])),
-                                        methodology=analysis_data.get("methodology", ""),
-                                        research_gaps=json.dumps(analysis_data.get("research_gaps", [])),
-                                        relevance_tags=json.dumps(analysis_data.get("relevance_tags", [])),
-                                        score=analysis_data.get("strength_score", 0),
-                                        provenance=json.dumps(provenance) if isinstance(provenance, dict) else "{}",
-                                    )
-                                    db.add(db_analysis)
-                                    paper.status = "analyzed"
-                                    stats["analyses"] += 1
+                        self._apply_analysis(db, content, stats)
                 except Exception as e:
                     logger.warning("Hydrate analysis %s failed: %s", fname, e)
                     stats["errors"] += 1
@@ -413,38 +612,16 @@ class GitHubStorageService:
                 if not fname.endswith(".md"):
                     continue
                 try:
-                    content = await self._get_file(f"{prefix}/notes/{fname}")
+                    content = await self._get_file(f"{prefix}/notes/{fname}", ref=head)
                     if content:
-                        # Parse Markdown note: extract content after the header
-                        lines = content.split("\n")
-                        note_content = ""
-                        tags = []
-                        for line in lines:
-                            if line.startswith("**Tags:**"):
-                                tag_str = line.replace("**Tags:**", "").strip()
-                                if tag_str and tag_str != "none":
-                                    tags = [t.strip() for t in tag_str.split(",")]
-                            elif not line.startswith("#") and not line.startswith("**Created:**"):
-                                note_content += line + "\n"
-                        note_content = note_content.strip()
-                        if note_content:
-                            # Check for duplicate by content
-                            existing = db.query(Note).filter(
-                                Note.user_id == self.user.id,
-                                Note.content == note_content,
-                            ).first()
-                            if not existing:
-                                note = Note(
-                                    user_id=self.user.id,
-                                    content=note_content,
-                                    tags=json.dumps(tags),
-                                )
-                                db.add(note)
-                                stats["notes"] += 1
+                        self._apply_note(db, content, stats)
                 except Exception as e:
                     logger.warning("Hydrate note %s failed: %s", fname, e)
                     stats["errors"] += 1
 
+            if head:
+                self._record_synced_sha(db, head)
+                stats["sha"] = head
             db.commit()
             logger.info("Hydration complete: %s", stats)
         finally:
@@ -452,6 +629,205 @@ class GitHubStorageService:
 
         return stats
 
+    async def sync_from_github(self) -> dict:
+        """Incremental sync: apply only the research files changed since the last sync.
+
+        Uses the compare API between the recorded ``github_synced_sha`` and the
+        current head, so a routine sync costs O(changes) rather than O(repo).
+        Added/modified papers, analyses and notes are upserted exactly as a
+        full hydration would; removed files mark their rows ``stale``.
+
+        Falls back to ``hydrate_from_github()`` when there is no recorded SHA
+        or the diff is unusable (force-push, truncated file list).
+        """
+        base = self.user.github_synced_sha or ""
+        head = await self._get_head_sha()
+        if not base or not head:
+            return await self.hydrate_from_github()
+
+        stats = {"papers": 0, "analyses": 0, "notes": 0, "stale": 0, "errors": 0,
+                 "mode": "incremental", "sha": head}
+        if base == head:
+            stats["mode"] = "unchanged"
+            return stats
+
+        files = await self._compare(base, head)
+        if files is None:
+            logger.info("Compare %s...%s unusable for %s — full hydration", base[:7], head[:7], self.repo)
+            return await self.hydrate_from_github()
+
+        changes = []  # (kind, path, removed)
+        for f in files:
+            status = f.get("status", "")
+            if status == "renamed" and f.get("previous_filename"):
+                changes.append((_classify_path(f["previous_filename"]), f["previous_filename"], True))
+            changes.append((_classify_path(f.get("filename", "")), f.get("filename", ""), status == "removed"))
+
+        # Papers first: analyses and notes resolve against paper rows.
+        order = {"papers": 0, "analyses": 1, "notes": 2}
+        changes = sorted((c for c in changes if c[0]), key=lambda c: order[c[0]])
+
+        db = SessionLocal()
+        try:
+            for kind, path, removed in changes:
+                try:
+                    if removed:
+                        # Read the file as it was at the last sync to find its rows.
+                        content = await self._get_file(path, ref=base)
+                        if content:
+                            stats["stale"] += self._mark_stale(db, kind, content)
+                        continue
+                    content = await self._get_file(path, ref=head)
+                    if not content:
+                        continue
+                    if kind == "papers":
+                        self._apply_paper(db, content, stats)
+                    elif kind == "analyses":
+                        self._apply_analysis(db, content, stats)
+                    else:
+                        self._apply_note(db, content, stats)
+                except Exception as e:
+                    logger.warning("Incremental sync of %s failed: %s", path, e)
+                    stats["errors"] += 1
+
+            self._record_synced_sha(db, head)
+            db.commit()
+            logger.info("Incremental sync %s...%s complete: %s", base[:7], head[:7], stats)
+        finally:
+            db.close()
+
+        return stats
+
+    # -----------------------------------------------------------------------
+    # Hydration helpers (one GitHub file → DB rows)
+    # -----------------------------------------------------------------------
+
+    def _apply_paper(self, db, content: str, stats: dict) -> None:
+        """Upsert a paper from its papers/{arxiv_id}.json file."""
+        from database import upsert_paper
+        paper = upsert_paper(db, json.loads(content), user_id=self.user.id)
+        # Mark as saved if it came from the saved papers directory
+        if paper.status == "discovered":
+            paper.status = "saved"
+        paper.stale = False
+        db.commit()
+        stats["papers"] += 1
+
+    def _apply_analysis(self, db, content: str, stats: dict) -> None:
+        """Insert an analysis from a legacy analyses/{arxiv_id}.json file."""
+        data = json.loads(content)
+        paper_data = data.get("paper", {})
+        analysis_data = data.get("analysis", {})
+        arxiv_id = paper_data.get("id", "")
+        if not arxiv_id:
+            return
+        paper = db.query(Paper).filter(Paper.arxiv_id == arxiv_id).first()
+        if not paper:
+            return
+        # Check if analysis already exists
+        existing = db.query(Analysis).filter(
+            Analysis.paper_id == paper.id,
+            Analysis.provider == analysis_data.get("provenance", {}).get("provider", "unknown"),
+        ).first()
+        if existing:
+            existing.stale = False
+            return
+        provenance = analysis_data.get("_meta", analysis_data.get("provenance", {}))
+        db_analysis = Analysis(
+            paper_id=paper.id,
+            user_id=self.user.id,
+            provider=provenance.get("provider", "unknown") if isinstance(provenance, dict) else "unknown",
+            summary=analysis_data.get("summary", ""),
+            key_insights=json.dumps(analysis_data.get("key_insights", [])),
+            methodology=analysis_data.get("methodology", ""),
+            research_gaps=json.dumps(analysis_data.get("research_gaps", [])),
+            relevance_tags=json.dumps(analysis_data.get("relevance_tags", [])),
+            score=analysis_data.get("strength_score", 0),
+            provenance=json.dumps(provenance) if isinstance(provenance, dict) else "{}",
+        )
+        db.add(db_analysis)
+        paper.status = "analyzed"
+        stats["analyses"] += 1
+
+    def _apply_note(self, db, content: str, stats: dict) -> None:
+        """Insert a note from its notes/note_{id}.md file (deduplicated by content)."""
+        note_content, tags = _parse_note_markdown(content)
+        if not note_content:
+            return
+        # Check for duplicate by content
+        existing = db.query(Note).filter(
+            Note.user_id == self.user.id,
+            Note.content == note_content,
+        ).first()
+        if existing:
+            existing.stale = False
+            return
+        db.add(Note(user_id=self.user.id, content=note_content, tags=json.dumps(tags)))
+        stats["notes"] += 1
+
+    def _mark_stale(self, db, kind: str, content: str) -> int:
+        """Flag this user's rows backed by a removed GitHub file. Returns rows flagged.
+
+        Paper rows are shared across users; only the paper's owner removing
+        it hides it, and only this user's analyses and notes are touched.
+        """
+        if kind == "papers":
+            arxiv_id = json.loads(content).get("id", "")
+            q = db.query(Paper).filter(Paper.arxiv_id == arxiv_id, Paper.user_id == self.user.id)
+        elif kind == "analyses":
+            data = json.loads(content)
+            paper = db.query(Paper).filter(Paper.arxiv_id == data.get("paper", {}).get("id", "")).first()
+            if not paper:
+                return 0
+            provider = data.get("analysis", {}).get("provenance", {}).get("provider", "unknown")
+            q = db.query(Analysis).filter(
+                Analysis.paper_id == paper.id, Analysis.provider == provider, Analysis.user_id == self.user.id,
+            )
+        else:
+            note_content, _ = _parse_note_markdown(content)
+            q = db.query(Note).filter(Note.user_id == self.user.id, Note.content == note_content)
+        return q.update({"stale": True}, synchronize_session=False)
+
+    def _record_synced_sha(self, db, sha: str) -> None:
+        db.query(User).filter(User.id == self.user.id).update(
+            {User.github_synced_sha: sha}, synchronize_session=False,
+        )
+        self.user.github_synced_sha = sha
+
+
+def _classify_path(path: str) -> Optional[str]:
+    """Map a repo path to the hydration kind it feeds ("papers" | "analyses" | "notes").
+
+    Only the file classes a full hydration reads are recognised; per-agent
+    analysis files and everything else return None.
+    """
+    for prefix in (REPO_PREFIX, LEGACY_PREFIX):
+        if not path.startswith(prefix + "/"):
+            continue
+        parts = path[len(prefix) + 1:].split("/")
+        if len(parts) != 2:
+            return None
+        kind, fname = parts
+        if kind in ("papers", "analyses") and fname.endswith(".json"):
+            return kind
+        if kind == "notes" and fname.endswith(".md"):
+            return kind
+    return None
+
+
+def _parse_note_markdown(content: str) -> tuple[str, list[str]]:
+    """Parse a Markdown note written by save_note(): extract content after the header."""
+    note_content = ""
+    tags = []
+    for line in content.split("\n"):
+        if line.startswith("**Tags:**"):
+            tag_str = line.replace("**Tags:**", "").strip()
+            if tag_str and tag_str != "none":
+                tags = [t.strip() for t in tag_str.split(",")]
+        elif not line.startswith("#") and not line.startswith("**Created:**"):
+            note_content += line + "\n"
+    return note_content.strip(), tags
+
 
 # ---------------------------------------------------------------------------
 # Helper: get storage service for a user
@@ -0,0 +1,354 @@
+"""
+MACP Research Assistant — Knowledge Graph Store (P4.1)
+=======================================================
+Materialized per-user snapshot of the knowledge graph served by /api/mcp/graph.
+
+The graph_nodes/graph_edges tables stay the source of truth. graph_snapshots
+holds the D3 payload ({"nodes", "edges", "stats"}) exactly as served, plus a
+version that is bumped on every change and doubles as the HTTP ETag. Deep
+analyses apply their new nodes/edges to the snapshot in O(delta) via
+apply_graph_delta(); a full rebuild only happens when no snapshot exists yet,
+a concurrent writer raced us, or a failed delta invalidated the snapshot.
+Versions only ever grow, so an ETag is never reused for different content.
+
+GraphIndex answers neighbourhood / shortest-path / related-paper queries from
+adjacency lists, cached per user and invalidated by the snapshot version.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime, timezone
+from itertools import combinations
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from config import TOOLS_DIR
+from database import GraphEdge, GraphNode, GraphSnapshot
+
+sys.path.insert(0, os.path.abspath(TOOLS_DIR))
+from telemetry import cache_lookup  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Same caps the endpoint always applied: at most NODE_CAP nodes and EDGE_CAP
+# stored edges; derived relates_to edges come on top.
+NODE_CAP = 500
+EDGE_CAP = 2000
+
+
+def graph_etag(user_id: Optional[int], version: int) -> str:
+    """Strong ETag for a user's snapshot version."""
+    return f'"graph-{user_id if user_id is not None else "anon"}-v{version}"'
+
+
+def payload_etag(payload: str) -> str:
+    """Content-hash ETag for payloads that are not versioned (legacy graph)."""
+    return f'"graph-{hashlib.sha1(payload.encode()).hexdigest()[:16]}"'
+
+
+def _snapshot_row(db, user_id: Optional[int]) -> Optional[GraphSnapshot]:
+    """The user's snapshot row. Anonymous (NULL) rows are not covered by the
+    unique index, so the oldest one is always the one read and written."""
+    return db.query(GraphSnapshot).filter(GraphSnapshot.user_id == user_id).order_by(GraphSnapshot.id).first()
+
+
+def get_graph_snapshot(db, user_id: Optional[int]) -> Optional[GraphSnapshot]:
+    """Return the user's snapshot, materializing it on first use.
+
+    Returns None when the user has no graph nodes yet (callers fall back to
+    the legacy paper/analysis graph).
+    """
+    snap = _snapshot_row(db, user_id)
+    if snap and snap.payload:
+        return snap
+    return rebuild_graph_snapshot(db, user_id)
+
+
+def rebuild_graph_snapshot(db, user_id: Optional[int]) -> Optional[GraphSnapshot]:
+    """Recompute the snapshot from graph_nodes/graph_edges and store it (version + 1)."""
+    payload = _build_payload(db, user_id)
+    snap = _snapshot_row(db, user_id)
+    if payload is None:
+        return snap if snap and snap.payload else None
+    if snap is None:
+        db.add(GraphSnapshot(user_id=user_id, version=1, payload=json.dumps(payload)))
+        try:
+            db.commit()
+            return _snapshot_row(db, user_id)
+        except IntegrityError:
+            # A concurrent first build inserted the row meanwhile: bump that one instead.
+            db.rollback()
+            snap = _snapshot_row(db, user_id)
+    snap.version = (snap.version or 0) + 1
+    snap.payload = json.dumps(payload)
+    snap.updated_at = datetime.now(timezone.utc)
+    db.commit()
+    db.refresh(snap)
+    return snap
+
+
+def apply_graph_delta(
+    db,
+    user_id: Optional[int],
+    touched: list[GraphNode],
+    new_edges: list[tuple[GraphNode, GraphNode, str]],
+) -> None:
+    """Fold one analysis' graph changes into the user's snapshot.
+
+    ``touched`` are the nodes inserted or updated (paper_count/label refresh);
+    ``new_edges`` are only the edges that did not exist before. A new
+    uses_concept edge links the paper to the papers already using that
+    concept (relates_to), which is the only cross-paper work left — O(papers
+    sharing the concept) instead of the all-pairs pass per request.
+    """
+    snap = _snapshot_row(db, user_id)
+    if snap is None or not snap.payload:
+        rebuild_graph_snapshot(db, user_id)
+        return
+
+    data = json.loads(snap.payload)
+    nodes, edges = data["nodes"], data["edges"]
+    index = {n["id"]: i for i, n in enumerate(nodes)}
+
+    for node in touched:
+        i = index.get(node.node_id)
+        if i is not None:
+            nodes[i] = node.to_dict()
+        elif len(nodes) < NODE_CAP:
+            index[node.node_id] = len(nodes)
+            nodes.append(node.to_dict())
+
+    stored = sum(1 for e in edges if e["type"] != "relates_to")
+    concept_papers: dict[int, list[int]] = {}
+    for e in edges:
+        if e["type"] == "uses_concept":
+            concept_papers.setdefault(e["target"], []).append(e["source"])
+
+    for source, target, edge_type in new_edges:
+        s, t = index.get(source.node_id), index.get(target.node_id)
+        if s is None or t is None or stored >= EDGE_CAP:
+            continue
+        edges.append({"source": s, "target": t, "type": edge_type})
+        stored += 1
+        if edge_type == "uses_concept":
+            for other in concept_papers.get(t, []):
+                if other != s:
+                    edges.append({"source": other, "target": s, "type": "relates_to"})
+            concept_papers.setdefault(t, []).append(s)
+
+    # Optimistic write: if another analysis bumped the version meanwhile, our
+    # copy is stale — rebuild from the tables instead of clobbering theirs.
+    updated = db.query(GraphSnapshot).filter(
+        GraphSnapshot.id == snap.id,
+        GraphSnapshot.version == snap.version,
+    ).update({
+        GraphSnapshot.version: snap.version + 1,
+        GraphSnapshot.payload: json.dumps(_with_stats(nodes, edges)),
+        GraphSnapshot.updated_at: datetime.now(timezone.utc),
+    }, synchronize_session=False)
+    db.commit()
+    if not updated:
+        logger.info("Graph snapshot for user %s changed concurrently — rebuilding", user_id)
+        db.expire_all()
+        rebuild_graph_snapshot(db, user_id)
+
+
+def invalidate_graph_snapshot(db, user_id: Optional[int]) -> None:
+    """Empty the user's snapshot so the next read rebuilds it, bumping its version.
+
+    The row is kept rather than deleted: a recreated row would start again at
+    version 1 and hand out ETags (and index-cache keys) already used for
+    other content.
+    """
+    db.query(GraphSnapshot).filter(GraphSnapshot.user_id == user_id).update({
+        GraphSnapshot.version: GraphSnapshot.version + 1,
+        GraphSnapshot.payload: "",
+        GraphSnapshot.updated_at: datetime.now(timezone.utc),
+    }, synchronize_session=False)
+    db.commit()
+
+
+def snapshot_export(snap: GraphSnapshot) -> dict:
+    """Snapshot as the knowledge-graph.json written to GitHub (stored edges only)."""
+    data = json.loads(snap.payload)
+    return {
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "version": "1.0",
+        "nodes": data["nodes"],
+        "edges": [e for e in data["edges"] if e["type"] != "relates_to"],
+    }
+
+
+def _build_payload(db, user_id: Optional[int]) -> Optional[dict]:
+    db_nodes = db.query(GraphNode).filter(GraphNode.user_id == user_id).limit(NODE_CAP).all()
+    if not db_nodes:
+        return None
+
+    # Build index: db node id → position in nodes list
+    node_idx = {gn.id: i for i, gn in enumerate(db_nodes)}
+    nodes = [gn.to_dict() for gn in db_nodes]
+
+    db_edges = db.query(GraphEdge).filter(GraphEdge.user_id == user_id).limit(EDGE_CAP).all()
+    edges = []
+    concept_papers: dict[int, list[int]] = {}
+    for ge in db_edges:
+        if ge.source_node_id not in node_idx or ge.target_node_id not in node_idx:
+            continue
+        s, t = node_idx[ge.source_node_id], node_idx[ge.target_node_id]
+        edges.append({"source": s, "target": t, "type": ge.edge_type})
+        if ge.edge_type == "uses_concept":
+            concept_papers.setdefault(t, []).append(s)
+
+    # Cross-paper relates_to: papers sharing a concept node
+    for papers in concept_papers.values():
+        for a, b in combinations(dict.fromkeys(papers), 2):
+            edges.append({"source": a, "target": b, "type": "relates_to"})
+
+    return _with_stats(nodes, edges)
+
+
+def _with_stats(nodes: list[dict], edges: list[dict]) -> dict:
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "stats": {
+            "papers": sum(1 for n in nodes if n["type"] == "paper"),
+            "concepts": sum(1 for n in nodes if n["type"] == "concept"),
+            "methods": sum(1 for n in nodes if n["type"] == "method"),
+            "connections": len(edges),
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Adjacency index + graph queries
+# ---------------------------------------------------------------------------
+# Built from the full graph_nodes/graph_edges tables (not the capped snapshot)
+# and cached per user against the snapshot version, which every change bumps.
+
+_INDEX_CACHE_SIZE = 64
+_index_cache: "OrderedDict[Optional[int], tuple[int, GraphIndex]]" = OrderedDict()
+
+
+class GraphIndex:
+    """Undirected adjacency lists over one user's stored graph."""
+
+    def __init__(self, nodes: list[GraphNode], edges: list[tuple[int, int, str]]):
+        self.nodes: dict[str, dict] = {}
+        pk_to_id: dict[int, str] = {}
+        for n in nodes:
+            pk_to_id[n.id] = n.node_id
+            self.nodes[n.node_id] = n.to_dict()
+        self.adj: dict[str, list[tuple[str, str]]] = {node_id: [] for node_id in self.nodes}
+        for source_pk, target_pk, edge_type in edges:
+            s, t = pk_to_id.get(source_pk), pk_to_id.get(target_pk)
+            if s is None or t is None:
+                continue
+            self.adj[s].append((t, edge_type))
+            self.adj[t].append((s, edge_type))
+
+    def neighbourhood(self, node_id: str, hops: int, limit: int) -> dict:
+        """Nodes within ``hops`` edges of ``node_id`` (BFS, nearest first) and the edges among them."""
+        dist = {node_id: 0}
+        frontier = [node_id]
+        for depth in range(1, hops + 1):
+            nxt = []
+            for u in frontier:
+                for v, _ in self.adj[u]:
+                    if v not in dist and len(dist) < limit:
+                        dist[v] = depth
+                        nxt.append(v)
+            frontier = nxt
+        edges = [
+            {"source": u, "target": v, "type": edge_type}
+            for u in dist for v, edge_type in self.adj[u]
+            if v in dist and u < v
+        ]
+        return {
+            "center": node_id,
+            "nodes": [dict(self.nodes[u], distance=d) for u, d in dist.items()],
+            "edges": edges,
+            "truncated": len(dist) >= limit,
+        }
+
+    def shortest_path(self, source: str, target: str, max_hops: int) -> Optional[list[dict]]:
+        """Unweighted shortest path as alternating node/edge steps, or None if unreachable."""
+        parent: dict[str, Optional[tuple[str, str]]] = {source: None}
+        frontier = [source]
+        for _ in range(max_hops):
+            if target in parent or not frontier:
+                break
+            nxt = []
+            for u in frontier:
+                for v, edge_type in self.adj[u]:
+                    if v not in parent:
+                        parent[v] = (u, edge_type)
+                        nxt.append(v)
+            frontier = nxt
+        if target not in parent:
+            return None
+        steps = []
+        node = target
+        while node is not None:
+            step = dict(self.nodes[node])
+            link = parent[node]
+            if link:
+                step["via"] = link[1]
+            steps.append(step)
+            node = link[0] if link else None
+        return steps[::-1]
+
+    def related_papers(self, paper_id: str, k: int) -> list[dict]:
+        """Top-k papers sharing concepts/methods with ``paper_id``.
+
+        Each shared concept/method contributes 1 / log2(1 + paper_count): a
+        concept used by two papers says more about them than one used by
+        fifty.
+        """
+        scores: dict[str, float] = {}
+        shared: dict[str, list[str]] = {}
+        for node, edge_type in self.adj[paper_id]:
+            if edge_type not in ("uses_concept", "uses_method"):
+                continue
+            info = self.nodes[node]
+            weight = 1.0 / math.log2(1 + max(info["paper_count"] or 1, 1))
+            for other, other_type in self.adj[node]:
+                if other == paper_id or other_type != edge_type:
+                    continue
+                scores[other] = scores.get(other, 0.0) + weight
+                shared.setdefault(other, []).append(info["title"])
+        ranked = heapq.nsmallest(k, scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [
+            dict(self.nodes[other], score=round(score, 4), shared=shared[other])
+            for other, score in ranked
+        ]
+
+
+def get_graph_index(db, user_id: Optional[int]) -> Optional[GraphIndex]:
+    """Return the user's adjacency index, rebuilding it when the snapshot version moved."""
+    snap = get_graph_snapshot(db, user_id)
+    if snap is None:
+        return None
+    cached = _index_cache.get(user_id)
+    if cached and cached[0] == snap.version:
+        cache_lookup("graph_index", hits=1)
+        _index_cache.move_to_end(user_id)
+        return cached[1]
+    cache_lookup("graph_index", misses=1)
+    nodes = db.query(GraphNode).filter(GraphNode.user_id == user_id).all()
+    edges = db.query(GraphEdge.source_node_id, GraphEdge.target_node_id, GraphEdge.edge_type).filter(
+        GraphEdge.user_id == user_id,
+    ).all()
+    index = GraphIndex(nodes, edges)
+    _index_cache[user_id] = (snap.version, index)
+    _index_cache.move_to_end(user_id)
+    while len(_index_cache) > _INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
@@ -27,12 +27,15 @@ from slowapi.util import get_remote_address
 import httpx
 
 from config import (
+    ADMIN_GITHUB_LOGINS,
     CORS_ORIGINS,
     ENFORCE_HTTPS,
     GITHUB_APP_CLIENT_ID,
+    METRICS_ENABLED,
     RATE_LIMIT_AUTH_ANALYZE,
     RATE_LIMIT_AUTH_SEARCH,
     TOOLS_DIR,
+    TRACING_ENABLED,
 )
 from database import (
     Analysis,
@@ -59,12 +62,14 @@ from security import SecurityHeadersMiddleware, OriginGuardMiddleware
 from github_storage import GitHubStorageService, get_storage_service
 from rate_limit import limiter
 from webmcp import mcp_router
+from observability import MetricsMiddleware, TracingMiddleware, metrics_router
 
 # Add the tools directory to the Python path
 sys.path.insert(0, os.path.abspath(TOOLS_DIR))
 
 from paper_fetcher import fetch_by_id, fetch_by_query, fetch_from_hysts
-from llm_providers import analyze_paper as _analyze_paper, PROVIDERS
+from llm_providers import CallLog, analyze_paper as _analyze_paper, provider_health, PROVIDERS
+from usage_store import failed_analysis, record_llm_usage
 
 
 # Rate limiting: the 3-tier key function + limiter live in rate_limit.py
@@ -90,6 +95,7 @@ class AnalyzeRequest(BaseModel):
     paper_id: str = Field(..., min_length=1)
     provider: str = Field(default="gemini")
     api_key: Optional[str] = Field(default=None)
+    hedge: bool = Field(default=False, description="Past the provider's p95 latency, also try the next-best provider with a server key (ignored with api_key)")
 
 
 class LearnRequest(BaseModel):
@@ -182,6 +188,12 @@ app.add_middleware(
 # Origin guard runs first on the request (added last). Opt-in via CF_ORIGIN_SECRET:
 # blocks direct *.run.app hits to /api/* that bypass Cloudflare. No-op until set.
 app.add_middleware(OriginGuardMiddleware)
+# Stage timings / admin profiles (opt-in): inside metrics, around everything else.
+if TRACING_ENABLED or ADMIN_GITHUB_LOGINS:
+    app.add_middleware(TracingMiddleware)
+# Outermost: request timing for /metrics covers every other middleware too.
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 # Note: Do NOT use HTTPSRedirectMiddleware on Cloud Run.
 # Cloud Run terminates TLS externally and forwards HTTP internally,
@@ -190,6 +202,8 @@ app.add_middleware(OriginGuardMiddleware)
 
 # Register WebMCP router
 app.include_router(mcp_router)
+if METRICS_ENABLED:
+    app.include_router(metrics_router)
 
 
 # ---------------------------------------------------------------------------
@@ -343,13 +357,13 @@ async def github_connect(
 
 
 @app.post("/api/github/sync")
-async def github_sync(user: User = Depends(require_user)):
-    """Trigger full sync from GitHub to DB (hydration)."""
+async def github_sync(full: bool = False, user: User = Depends(require_user)):
+    """Sync GitHub to DB: incremental since the last synced commit, or a full hydration with ?full=true."""
     storage = get_storage_service(user)
     if not storage:
         raise HTTPException(status_code=400, detail="No repository connected")
 
-    stats = await storage.hydrate_from_github()
+    stats = await (storage.hydrate_from_github() if full else storage.sync_from_github())
     log_audit(event="github_sync", message=f"Hydrated: {stats}", user_id=user.id)
     return {"status": "ok", "stats": stats}
 
@@ -421,6 +435,7 @@ async def health():
         "engine": "macp-research-assistant",
         "version": "v1.4.0",
         "papers_in_db": count,
+        "providers": provider_health(),
     }
 
 
@@ -549,24 +564,28 @@ async def analyze_paper_endpoint(
         if not abstract:
             raise HTTPException(status_code=422, detail="Paper has no abstract.")
 
+        log = CallLog()
         analysis = _analyze_paper(
             title=title, authors=authors, abstract=abstract,
-            provider_id=req.provider, api_key_override=req.api_key,
+            provider_id=req.provider, api_key_override=req.api_key, hedge=req.hedge, log=log,
         )
 
         if not analysis:
+            record_llm_usage(_get_user_id(user), [failed_analysis(log.calls)])
             raise HTTPException(status_code=502, detail="LLM analysis returned empty result.")
 
+        # A hedged request may have been answered by the backup provider.
+        provider = analysis["_meta"]["provider"]
         provenance = json.dumps({
-            "provider": req.provider,
-            "model": config["model"],
+            "provider": provider,
+            "model": PROVIDERS[provider]["model"],
             "bias_disclaimer": "AI-generated analysis may contain inaccuracies or reflect biases from the underlying model.",
         })
 
         db_analysis = Analysis(
             paper_id=paper.id,
             user_id=_get_user_id(user),
-            provider=req.provider,
+            provider=provider,
             summary=analysis.get("summary", ""),
             key_insights=json.dumps(analysis.get("key_insights", [])),
             methodology=analysis.get("methodology", ""),
@@ -579,6 +598,7 @@ async def analyze_paper_endpoint(
         paper.status = "analyzed"
         db.commit()
         db.refresh(db_analysis)  # populate db_analysis.id
+        record_llm_usage(_get_user_id(user), [analysis])
 
         # MACP v2.0: fire-and-forget GitHub write-back (Source of Truth)
         # Runs after response is sent — non-blocking, no user wait
@@ -588,7 +608,7 @@ async def analyze_paper_endpoint(
                 user.id, paper.arxiv_id, db_analysis.id, analysis,
             )
 
-        log_audit(event="analyze", message=f"paper={paper.arxiv_id} provider={req.provider}",
+        log_audit(event="analyze", message=f"paper={paper.arxiv_id} provider={provider}",
                   source_ip=get_remote_address(request), user_id=_get_user_id(user), db=db)
 
         return {"paper_id": paper.arxiv_id, "title": title, "analysis": analysis}
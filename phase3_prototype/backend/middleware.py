@@ -11,7 +11,7 @@ from typing import Optional
 from fastapi import Cookie, Header, HTTPException, Request
 from jwt import InvalidTokenError
 
-from config import MACP_API_KEY
+from config import ADMIN_GITHUB_LOGINS, MACP_API_KEY
 from database import SessionLocal, User
 from github_auth import decode_jwt
 
@@ -108,6 +108,28 @@ def is_authenticated(
     return False
 
 
+def admin_login(request: Request) -> Optional[str]:
+    """
+    The GitHub login of the request's JWT (cookie or Bearer) when it is in
+    ADMIN_GITHUB_LOGINS, else None. Reads only the signed claims — no DB
+    lookup — so middleware can call it before routing.
+    """
+    if not ADMIN_GITHUB_LOGINS:
+        return None
+    authorization = request.headers.get("authorization", "")
+    for token in (request.cookies.get("macp_session"),
+                  authorization[7:] if authorization.startswith("Bearer ") else None):
+        if not token:
+            continue
+        try:
+            login = str(decode_jwt(token).get("github_login", "")).lower()
+        except InvalidTokenError:
+            continue
+        if login in ADMIN_GITHUB_LOGINS:
+            return login
+    return None
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
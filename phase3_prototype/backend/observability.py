@@ -0,0 +1,279 @@
+"""
+MACP Research Assistant — Metrics Endpoint
+===========================================
+GET /metrics in the Prometheus text format, from the in-process registry in
+tools/telemetry.py. No client library or metrics service is needed; point a
+Prometheus scrape (e.g. the Cloud Run managed-Prometheus sidecar) at it.
+
+Served here:
+  - macp_http_request_duration_seconds — per method, route template, status
+    (MetricsMiddleware; streamed responses are timed to their last byte)
+  - macp_http_requests_in_progress
+  - macp_db_pool_connections / macp_db_pool_size — SQLAlchemy pool usage
+  - macp_executor_queue_depth / macp_executor_threads — the anyio pool that
+    runs sync endpoints, asyncio.to_thread's default executor and the LLM
+    work pools
+
+And, registered by the modules that own them: LLM call histograms and token
+counters (llm_providers), fetcher latencies per source (paper_fetcher),
+GitHub API calls and remaining quota (github_storage) and cache hit ratios.
+
+Per-request detail lives in TracingMiddleware: opt-in stage timings
+(tools/tracing.py spans) and sampled cProfile dumps of admin requests.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse, Response
+
+from config import (
+    ADMIN_GITHUB_LOGINS,
+    METRICS_TOKEN,
+    PROFILE_DIR,
+    PROFILE_SAMPLE_RATE,
+    TOOLS_DIR,
+    TRACING_ENABLED,
+)
+from database import engine
+from middleware import admin_login
+
+sys.path.insert(0, os.path.abspath(TOOLS_DIR))
+from telemetry import executor_samples, gauge, histogram, register_collector, render  # noqa: E402
+from tracing import current_trace, end_trace, start_trace  # noqa: E402
+
+# Functions listed (by own time) in a profiled request's log line; the dump has the rest.
+PROFILE_TOP_FUNCTIONS = 20
+
+HTTP_SECONDS = histogram("macp_http_request_duration_seconds", "HTTP request wall time by method, route and status",
+                         ("method", "route", "status"))
+HTTP_IN_PROGRESS = gauge("macp_http_requests_in_progress", "HTTP requests being served")
+
+metrics_router = APIRouter()
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request into HTTP_SECONDS under its route template
+    ("/api/mcp/analysis/{paper_id}", not the raw path, to bound the label
+    set); unmatched paths share "unmatched". Pure ASGI, so NDJSON streams
+    are timed until their last chunk rather than their headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            route = scope.get("route")
+            HTTP_SECONDS.observe(time.monotonic() - started, method=scope["method"],
+                                 route=getattr(route, "path", "unmatched"), status=status["code"])
+
+
+def _db_pool() -> list[tuple]:
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):  # NullPool / StaticPool keep no count
+        return []
+    return [
+        ("macp_db_pool_connections", "Database connections by state", "gauge", [
+            ({"state": "checked_out"}, pool.checkedout()),
+            ({"state": "checked_in"}, pool.checkedin()),
+            ({"state": "overflow"}, max(0, pool.overflow())),
+        ]),
+        ("macp_db_pool_size", "Configured database pool size (overflow comes on top)", "gauge",
+         [({}, pool.size())]),
+    ]
+
+
+def _server_executors() -> list[tuple]:
+    """The executors behind sync endpoints and asyncio.to_thread; needs the running event loop."""
+    depth, threads = [], []
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return []
+    default = getattr(loop, "_default_executor", None)
+    if default is not None:
+        queued, alive = executor_samples("asyncio", default)
+        depth.append(queued)
+        threads.append(alive)
+    try:
+        from anyio import to_thread
+
+        stats = to_thread.current_default_thread_limiter().statistics()
+        depth.append(({"executor": "anyio"}, stats.tasks_waiting))
+        threads.append(({"executor": "anyio"}, stats.borrowed_tokens))
+    except (ImportError, RuntimeError):
+        pass
+    return [
+        ("macp_executor_queue_depth", "Tasks waiting for a worker thread, per executor", "gauge", depth),
+        ("macp_executor_threads", "Worker threads alive, per executor", "gauge", threads),
+    ]
+
+
+register_collector(_db_pool)
+register_collector(_server_executors)
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus scrape target. Needs "Authorization: Bearer <METRICS_TOKEN>"; absent (404) until that is set."""
+    if not METRICS_TOKEN:
+        return Response(status_code=404)
+    provided = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(provided, METRICS_TOKEN):
+        return Response(status_code=401)
+    # Rendered on the event loop: the executor collector reads the loop's own pools.
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Tracing + Admin Profiling
+# ---------------------------------------------------------------------------
+
+# cProfile hooks the whole event-loop thread, so one profile at a time.
+_PROFILING = threading.Lock()
+
+
+class TracingMiddleware:
+    """
+    With TRACING_ENABLED, runs each HTTP request under a tracing.Trace: the
+    stages finished before the response starts go out as a Server-Timing
+    header, and once the request is fully done (background GitHub writes
+    included) every span is printed as a "request_trace" JSON log line.
+
+    Admin requests (middleware.admin_login) are also profiled when they send
+    "X-MACP-Profile: 1" or fall in PROFILE_SAMPLE_RATE, whether or not
+    tracing is on. The profiler sees the event-loop thread — async endpoints
+    and whatever else the loop runs meanwhile, not sync endpoints' worker
+    threads. The dump's file name comes back as X-MACP-Profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile_name = _profile_name(scope) if ADMIN_GITHUB_LOGINS else None
+        if not TRACING_ENABLED and profile_name is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = start_trace()
+        trace = current_trace()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                if profile_name:
+                    headers.append((b"x-macp-profile", profile_name.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = _start_profiler() if profile_name else None
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            profile = _finish_profiler(profiler, profile_name) if profiler else None
+            end_trace(token)
+            route = scope.get("route")
+            _log_trace(scope["method"], getattr(route, "path", scope["path"]), status["code"], trace, profile)
+
+
+def _profile_name(scope) -> str | None:
+    """A dump file name if this request is to be profiled (admin, and asked for or sampled)."""
+    request = Request(scope)
+    asked = request.headers.get("x-macp-profile") == "1"
+    if not asked and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return None
+    if admin_login(request) is None:
+        return None
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:60] or "root"
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{slug}-{os.getpid()}-{random.randrange(16 ** 4):04x}.prof"
+
+
+def _start_profiler() -> cProfile.Profile | None:
+    if not _PROFILING.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler (e.g. a debugger) holds the hook
+        _PROFILING.release()
+        return None
+    return profiler
+
+
+def _finish_profiler(profiler: cProfile.Profile, name: str) -> dict:
+    """Stop, dump to PROFILE_DIR/<name> and summarize the functions that spent the most time themselves."""
+    try:
+        profiler.disable()
+    finally:
+        _PROFILING.release()
+    path = os.path.join(PROFILE_DIR, name)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+    except OSError as e:
+        print(f"[WARN] Could not write profile {path}: {e}", file=sys.stderr)
+        path = None
+    stats = pstats.Stats(profiler).sort_stats(pstats.SortKey.TIME)
+    top = []
+    for key in stats.fcn_list[:PROFILE_TOP_FUNCTIONS]:
+        filename, line, function = key
+        _, calls, own, cumulative, _ = stats.stats[key]
+        top.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                    "own_ms": round(own * 1000, 1), "cumulative_ms": round(cumulative * 1000, 1)})
+    return {"path": path, "top": top}
+
+
+def _log_trace(method: str, route: str, status: int, trace, profile: dict | None) -> None:
+    """One structured JSON line per traced request (stdout, as log_audit writes for Cloud Logging)."""
+    total_ms = trace.elapsed_ms()
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "severity": "INFO",
+        "event": "request_trace",
+        "message": f"{method} {route} {status} in {total_ms:.0f}ms",
+        "method": method,
+        "route": route,
+        "status": status,
+        "total_ms": total_ms,
+        "stages": trace.totals(),
+        "spans": trace.spans,
+        "service": "macp-research-assistant",
+    }
+    if profile:
+        entry["profile"] = profile
+    print(json.dumps(entry, default=str), flush=True)
@@ -130,7 +130,7 @@ def validate_analysis_data(data: dict) -> ValidationResult:
         errors.append("Missing required field: summary")
 
     # Analysis type
-    valid_types = {"abstract", "deep", "comparative", "methodological"}
+    valid_types = {"abstract", "deep", "mapreduce", "comparative", "methodological"}
     analysis_type = data.get("type") or data.get("analysis_type", "abstract")
     if analysis_type not in valid_types:
         errors.append(f"Invalid analysis type '{analysis_type}'. Must be one of: {valid_types}")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Tests for the nightly provider batch analysis job
+(analysis_batch_job.run_analysis_batches).
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend. The provider is the local FakeBatchServer from
+tools/test_provider_batch.py and GitHub storage is a recorder, so nothing
+leaves the machine.
+
+Run:  python phase3_prototype/backend/test_analysis_batch_job.py
+Or:   pytest phase3_prototype/backend/test_analysis_batch_job.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_analysis_batch_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import analysis_batch_job as job  # noqa: E402
+from database import init_db, SessionLocal, Analysis, AnalysisBatch, Paper, User  # noqa: E402
+from test_provider_batch import _KEY, FakeBatchServer  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_OWNER = User(github_id=9393, github_login="night-owl", connected_repo="owner/repo")
+_db.add(_OWNER)
+_db.commit()
+_OWNER_ID = _OWNER.id
+_PAPERS = {}
+for n, abstract, stale in [
+    (1, "Abstract one.", False),
+    (2, "Abstract two.", False),
+    (3, "Abstract three.", False),
+    (4, "", False),                  # no abstract: never submitted
+    (5, "Abstract five.", True),     # stale: never submitted
+    (6, "Abstract six.", False),     # already analyzed: never submitted
+]:
+    paper = Paper(arxiv_id=f"arxiv:9101.0000{n}", title=f"Night Paper {n}", abstract=abstract,
+                  user_id=_OWNER_ID, stale=stale, status="saved")
+    _db.add(paper)
+    _db.commit()
+    _PAPERS[n] = paper.id
+_db.add(Analysis(paper_id=_PAPERS[6], provider="gemini", user_id=_OWNER_ID))
+_db.commit()
+_db.close()
+
+_ELIGIBLE = {_PAPERS[1], _PAPERS[2], _PAPERS[3]}
+
+
+class _FakeStorage:
+    def __init__(self):
+        self.saved: list[tuple[str, str]] = []
+        self.manifest_updates: list[list[str]] = []
+
+    async def save_analysis_per_agent(self, paper, db_analysis, full_analysis):
+        self.saved.append((paper.arxiv_id, db_analysis.provider))
+        return True
+
+    async def update_manifest_entries(self, section, entries, message=""):
+        self.manifest_updates.append(sorted(entries))
+        return True
+
+
+def _run(storage: _FakeStorage, **kwargs) -> dict:
+    """One job run, restricted to this module's papers (pytest shares one database across modules)."""
+    originals = job.find_unbatched_papers, job.get_storage_service
+    job.find_unbatched_papers = lambda db, limit=None: [p for p in originals[0](db, limit) if p.id in _PAPERS.values()]
+    job.get_storage_service = lambda user: storage
+    os.environ["OPENAI_API_KEY"], saved_key = _KEY, os.environ.get("OPENAI_API_KEY")
+    try:
+        return asyncio.run(job.run_analysis_batches(provider="openai", **kwargs))
+    finally:
+        job.find_unbatched_papers, job.get_storage_service = originals
+        if saved_key is None:
+            os.environ.pop("OPENAI_API_KEY")
+        else:
+            os.environ["OPENAI_API_KEY"] = saved_key
+
+
+def _batches() -> list[AnalysisBatch]:
+    db = SessionLocal()
+    try:
+        return [b for b in db.query(AnalysisBatch).order_by(AnalysisBatch.id)
+                if set(json.loads(b.papers).values()) & set(_PAPERS.values())]
+    finally:
+        db.close()
+
+
+def test_unbatched_papers_have_an_abstract_and_no_analysis():
+    db = SessionLocal()
+    found = {p.id for p in job.find_unbatched_papers(db)}
+    db.close()
+    assert _ELIGIBLE <= found
+    assert not {_PAPERS[4], _PAPERS[5], _PAPERS[6]} & found
+
+
+def test_nightly_runs_submit_then_ingest():
+    storage = _FakeStorage()
+    with FakeBatchServer().serve("openai") as server:
+        server.fail = {f"paper-{_PAPERS[3]}"}
+        stats = _run(storage)
+        assert stats["submitted_batches"] == 1 and stats["submitted_papers"] == 3, stats
+        [batch] = _batches()
+        assert batch.status == "submitted" and set(json.loads(batch.papers).values()) == _ELIGIBLE
+
+        # Still running: nothing ingested, and its papers are not submitted twice.
+        stats = _run(storage)
+        assert stats["in_progress"] == 1 and stats["submitted_papers"] == 0, stats
+
+        server.finish()
+        stats = _run(storage)
+        assert stats["ingested_batches"] == 1 and stats["analyzed"] == 2 and stats["failed_requests"] == 1, stats
+        # The paper whose request failed goes out again in a new batch.
+        assert stats["submitted_papers"] == 1 and stats["github_written"] == 2, stats
+
+    first, retry = _batches()
+    assert first.status == "ingested" and first.completed_at is not None
+    assert json.loads(first.counts)["failed"] == 1
+    assert set(json.loads(retry.papers).values()) == {_PAPERS[3]}
+
+    db = SessionLocal()
+    rows = db.query(Analysis).filter(Analysis.paper_id.in_([_PAPERS[1], _PAPERS[2]])).all()
+    papers = {p.id: p.status for p in db.query(Paper).filter(Paper.id.in_(_ELIGIBLE))}
+    db.close()
+    assert sorted(r.summary for r in rows) == ["Batch summary of Night Paper 1", "Batch summary of Night Paper 2"]
+    assert all(r.user_id == _OWNER_ID and r.provider == "openai" for r in rows)
+    assert papers == {_PAPERS[1]: "analyzed", _PAPERS[2]: "analyzed", _PAPERS[3]: "saved"}
+    assert storage.manifest_updates == [["arxiv:9101.00001", "arxiv:9101.00002"]]
+
+
+def test_failed_batch_releases_its_papers():
+    with FakeBatchServer().serve("openai") as server:
+        # The retry batch left open by the previous test cannot be polled here: it stays open.
+        stats = _run(_FakeStorage(), submit=False)
+        assert stats["in_progress"] == 1 and stats["submitted_batches"] == 0
+
+        db = SessionLocal()
+        db.query(AnalysisBatch).filter(AnalysisBatch.id.in_([b.id for b in _batches()]),
+                                       AnalysisBatch.status == "submitted").delete(synchronize_session=False)
+        db.commit()
+        db.close()
+        assert _run(_FakeStorage())["submitted_papers"] == 1
+        server.finish(failed=True)
+        stats = _run(_FakeStorage(), submit=False)
+    assert stats["failed_batches"] == 1
+    assert _batches()[-1].status == "failed"
+    db = SessionLocal()
+    assert _PAPERS[3] in {p.id for p in job.find_unbatched_papers(db)}
+    db.close()
+
+
+def teardown_module(module):
+    """pytest shares one database across modules; keep these analyses out of library-wide job tests."""
+    db = SessionLocal()
+    db.query(Analysis).filter(Analysis.paper_id.in_(list(_PAPERS.values()))).delete(synchronize_session=False)
+    for batch in _batches():
+        db.query(AnalysisBatch).filter(AnalysisBatch.id == batch.id).delete()
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    # Order matters: each run picks up the batches the one before left open.
+    tests.sort(key=lambda t: t.__code__.co_firstlineno)
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
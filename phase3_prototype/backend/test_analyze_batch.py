@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Tests for POST /api/mcp/analyze-batch (many papers), /api/mcp/analyze-fanout
+(one paper, several providers) and /api/mcp/analyze-stream (one paper, fields
+as the LLM writes them). All three stream NDJSON.
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts only the mcp_router. The LLM callers are fakes and GitHub
+storage is a recorder, so no network is used. SQL statements are counted on
+the engine to check that results are persisted with one bulk INSERT.
+
+Run:  python phase3_prototype/backend/test_analyze_batch.py
+Or:   pytest phase3_prototype/backend/test_analyze_batch.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_TMP = tempfile.mkdtemp(prefix="macp_batch_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import llm_providers as lp  # noqa: E402
+import webmcp  # noqa: E402
+from fastapi import BackgroundTasks, FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from database import init_db, engine, SessionLocal, Analysis, Paper, User  # noqa: E402
+from middleware import get_current_user, require_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=9191, github_login="onboarder", connected_repo="owner/repo")
+_OTHER = User(github_id=9292, github_login="someone-else")
+_db.add_all([_USER, _OTHER])
+_db.commit()
+for n, owner, abstract in [
+    (1, _USER.id, "Abstract one."),
+    (2, _USER.id, "Abstract two."),
+    (3, _USER.id, "Abstract three."),
+    (4, _USER.id, "Abstract four."),
+    (5, _USER.id, ""),                   # no abstract: skipped
+    (6, _OTHER.id, "Someone else's."),   # other library: never picked up
+    (7, None, "A paper for fan-out."),
+    (8, _OTHER.id, "Analyzed while the client goes away."),
+    (9, _OTHER.id, "Also analyzed while the client goes away."),
+    (10, None, "Fanned out while the client goes away."),
+]:
+    _db.add(Paper(arxiv_id=f"arxiv:8001.{n:05d}", title=f"Batch Paper {n}", abstract=abstract,
+                  user_id=owner, status="saved"))
+_db.commit()
+_USER = _db.query(User).filter(User.id == _USER.id).first()
+_PAPER_PKS = [p.id for p in _db.query(Paper).filter(Paper.arxiv_id.like("arxiv:8001.%"))]
+_db.close()
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.include_router(webmcp.mcp_router)
+_app.dependency_overrides[require_user] = lambda: _USER
+_app.dependency_overrides[get_current_user] = lambda: _USER
+client = TestClient(_app)
+
+
+class _FakeStorage:
+    def __init__(self):
+        self.saved: list[tuple[str, str]] = []
+        self.manifest_updates: list[list[str]] = []
+
+    async def save_analysis_per_agent(self, paper, db_analysis, full_analysis):
+        self.saved.append((paper.arxiv_id, db_analysis.provider))
+        return True
+
+    async def update_manifest_entries(self, section, entries, message=""):
+        assert section == "analyses"
+        self.manifest_updates.append(sorted(entries))
+        return True
+
+
+def _fake_caller(provider: str, delay: float = 0.0):
+    def _call(api_key, prompt, model):
+        time.sleep(delay)
+        return json.dumps({"summary": f"{provider} summary", "key_insights": [f"{provider} finds attention helps"],
+                           "methodology": "transformer", "strength_score": 7})
+    return _call
+
+
+def _batch(payload: dict, route: str = "analyze-batch") -> tuple[list[dict], int, _FakeStorage]:
+    """POST with fake providers; returns (stream lines, analyses INSERTs, storage)."""
+    storage = _FakeStorage()
+    inserts = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("INSERT INTO ANALYSES"):
+            inserts.append(statement)
+
+    saved_callers = dict(lp._CALLERS)
+    originals = webmcp.get_storage_service, lp.resolve_embed_provider
+    lp._CALLERS.update({"gemini": _fake_caller("gemini"), "openai": _fake_caller("openai"),
+                        "anthropic": _fake_caller("anthropic", delay=1.0)})
+    webmcp.get_storage_service = lambda user: storage
+    lp.resolve_embed_provider = lambda *a, **k: (None, None)  # lexical agreement, no network
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        r = client.post(f"/api/mcp/{route}", json={
+            "providers": ["gemini", "openai"],
+            "api_keys": {"gemini": "fake-key", "openai": "fake-key", "anthropic": "fake-key"},
+            **payload,
+        })
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+        lp._CALLERS.clear()
+        lp._CALLERS.update(saved_callers)
+        webmcp.get_storage_service, lp.resolve_embed_provider = originals
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in r.text.splitlines()], len(inserts), storage
+
+
+def test_explicit_ids_stream_and_bulk_insert():
+    lines, inserts, storage = _batch({"paper_ids": [
+        "8001.00001", "arxiv:8001.00002", "8001.00003", "8001.00005", "8001.99999",
+    ]})
+    assert lines[0]["event"] == "start" and lines[0]["total"] == 3, lines[0]
+    assert sorted(s["reason"] for s in lines[0]["skipped"]) == ["no abstract", "not found"]
+    results = [line for line in lines if line["event"] == "result"]
+    assert sorted(r["paper_id"] for r in results) == [f"arxiv:8001.0000{n}" for n in (1, 2, 3)]
+    assert {r["provider"] for r in results} <= {"gemini", "openai"}
+    assert lines[-1] == {"event": "done", "analyzed": 3, "failed": 0, "skipped": 2}, lines[-1]
+    assert inserts == 1, inserts
+
+    db = SessionLocal()
+    papers = db.query(Paper).filter(Paper.arxiv_id.in_([r["paper_id"] for r in results])).all()
+    assert {p.status for p in papers} == {"analyzed"}
+    rows = db.query(Analysis).filter(Analysis.paper_id.in_([p.id for p in papers])).all()
+    db.close()
+    assert len(rows) == 3 and all(r.user_id == _USER.id for r in rows)
+    assert json.loads(rows[0].provenance)["provider"] == rows[0].provider
+
+    assert sorted(a for a, _ in storage.saved) == sorted(r["paper_id"] for r in results)
+    assert storage.manifest_updates == [sorted(r["paper_id"] for r in results)]
+
+
+def test_all_unanalyzed_picks_only_the_rest_of_the_library():
+    lines, inserts, _ = _batch({"all_unanalyzed": True})
+    results = [line for line in lines if line["event"] == "result"]
+    assert [r["paper_id"] for r in results] == ["arxiv:8001.00004"], results
+    assert lines[0]["skipped"] == [{"paper_id": "arxiv:8001.00005", "reason": "no abstract"}]
+    assert inserts == 1
+
+
+def test_fanout_streams_results_then_agreement():
+    lines, inserts, storage = _batch({
+        "paper_id": "8001.00007", "providers": ["gemini", "anthropic", "openai"], "deadline_seconds": 0.4,
+    }, route="analyze-fanout")
+    events = [line["event"] for line in lines]
+    assert events == ["start", "result", "result", "result", "agreement", "done"], events
+    results = lines[1:4]
+    assert {r["provider"] for r in results[:2]} == {"gemini", "openai"}
+    assert results[2]["provider"] == "anthropic" and results[2]["timed_out"] is True
+    assert lines[4]["method"] == "lexical" and lines[4]["agreement_score"] > 0
+    assert lines[-1] == {"event": "done", "analyzed": 2, "failed": 0, "abandoned": 1}, lines[-1]
+    assert inserts == 1
+    assert sorted(p for _, p in storage.saved) == ["gemini", "openai"]
+
+    db = SessionLocal()
+    paper = db.query(Paper).filter(Paper.arxiv_id == "arxiv:8001.00007").one()
+    assert db.query(Analysis).filter(Analysis.paper_id == paper.id).count() == 2
+    db.close()
+
+
+def test_rejects_unknown_provider_and_empty_request():
+    r = client.post("/api/mcp/analyze-batch", json={"paper_ids": ["8001.00001"], "providers": ["nope"]})
+    assert r.json()["isError"] is True
+    r = client.post("/api/mcp/analyze-batch", json={})
+    assert r.json()["isError"] is True
+    r = client.post("/api/mcp/analyze-fanout", json={"paper_id": "8001.00005", "providers": ["gemini", "openai"]})
+    assert r.json()["isError"] is True  # no abstract
+    r = client.post("/api/mcp/analyze-fanout", json={"paper_id": "8001.00001", "providers": ["gemini"]})
+    assert r.status_code == 422  # fan-out needs at least two providers
+
+
+def test_analyze_stream_forwards_fields_then_stores_the_result():
+    storage = _FakeStorage()
+
+    def _stream(api_key, prompt, model):
+        yield '{"summary": "streamed summary", '
+        yield '"key_insights": ["fields arrive early"], "strength_score": 6}'
+
+    saved_stream = lp._STREAM_CALLERS["gemini"]
+    original_storage = webmcp.get_storage_service
+    lp._STREAM_CALLERS["gemini"] = _stream
+    webmcp.get_storage_service = lambda user: storage
+    lp.reset_provider_guards()
+    try:
+        r = client.post("/api/mcp/analyze-stream", json={
+            "paper_id": "8001.00006", "provider": "gemini", "api_key": "fake-key", "hedge": False,
+        })
+    finally:
+        lp._STREAM_CALLERS["gemini"] = saved_stream
+        webmcp.get_storage_service = original_storage
+        lp.reset_provider_guards()
+    assert r.status_code == 200 and r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [line["event"] for line in lines] == ["start", "field", "field", "field", "result"], lines
+    assert lines[1] == {"event": "field", "name": "summary", "value": "streamed summary"}
+    assert lines[-1]["analysis"]["_meta"]["provider"] == "gemini"
+    assert storage.saved == [("arxiv:8001.00006", "gemini")]
+
+    db = SessionLocal()
+    paper = db.query(Paper).filter(Paper.arxiv_id == "arxiv:8001.00006").one()
+    rows = db.query(Analysis).filter(Analysis.paper_id == paper.id).all()
+    db.close()
+    assert [row.summary for row in rows] == ["streamed summary"]
+
+    r = client.post("/api/mcp/analyze-stream", json={"paper_id": "8001.00005"})
+    assert r.json()["isError"] is True  # no abstract
+
+
+def test_analyze_stream_survives_a_client_disconnect_mid_call():
+    release = threading.Event()
+
+    def _stream(api_key, prompt, model):
+        yield '{"summary": "cut short", '
+        release.wait(5)  # the provider is still writing when the client goes away
+        yield '"key_insights": ["never delivered"], "strength_score": 6}'
+
+    async def _disconnect():
+        request = Request({"type": "http", "method": "POST", "path": "/api/mcp/analyze-stream",
+                           "headers": [], "query_string": b"", "client": ("test", 1)})
+        req = webmcp.McpAnalyzeRequest(paper_id="8001.00007", provider="gemini", api_key="fake-key")
+        response = await webmcp.mcp_analyze_stream(request, req, BackgroundTasks(), user=None)
+        body = response.body_iterator
+        assert json.loads(await body.__anext__())["event"] == "start"
+        assert json.loads(await body.__anext__())["name"] == "summary"
+        pending = asyncio.ensure_future(body.__anext__())
+        await asyncio.sleep(0.2)
+        pending.cancel()  # what Starlette does when the client disconnects
+        try:
+            await pending
+            assert False, "expected the stream to be cancelled"
+        except asyncio.CancelledError:
+            pass  # not ValueError("generator already executing")
+        await body.aclose()
+        release.set()
+        deadline = time.monotonic() + 5
+        while lp.concurrency_limiter("gemini").in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert lp.concurrency_limiter("gemini").in_flight == 0  # the abandoned call still ran to the end
+
+    saved_stream = lp._STREAM_CALLERS["gemini"]
+    lp._STREAM_CALLERS["gemini"] = _stream
+    lp.reset_provider_guards()
+    limiter.enabled = False
+    try:
+        asyncio.run(_disconnect())
+    finally:
+        limiter.enabled = True
+        lp._STREAM_CALLERS["gemini"] = saved_stream
+        lp.reset_provider_guards()
+
+
+def _disconnect_after_first_result(route, req, paper_ids: list[str], expected: int) -> int:
+    """Read "start" and one "result", drop the stream, release the providers; returns the analyses stored."""
+    release = threading.Event()
+
+    def _held(provider: str):
+        answer = _fake_caller(provider)
+
+        def _call(api_key, prompt, model):
+            if "Also analyzed" in prompt or provider == "openai":
+                release.wait(5)  # still running when the client goes away
+            return answer(api_key, prompt, model)
+        return _call
+
+    async def _run() -> int:
+        request = Request({"type": "http", "method": "POST", "path": "/api/mcp/x",
+                           "headers": [], "query_string": b"", "client": ("test", 1)})
+        response = await route(request, req, BackgroundTasks(), user=_USER)
+        body = response.body_iterator
+        assert json.loads(await body.__anext__())["event"] == "start"
+        assert json.loads(await body.__anext__())["event"] == "result"
+        await body.aclose()
+        release.set()
+        db = SessionLocal()
+        try:
+            pks = [p.id for p in db.query(Paper).filter(Paper.arxiv_id.in_(paper_ids))]
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                stored = db.query(Analysis).filter(Analysis.paper_id.in_(pks)).count()
+                if stored >= expected:
+                    break
+                await asyncio.sleep(0.05)
+                db.expire_all()
+            return stored
+        finally:
+            db.close()
+
+    saved_callers = dict(lp._CALLERS)
+    lp._CALLERS.update({"gemini": _held("gemini"), "openai": _held("openai")})
+    lp.reset_provider_guards()
+    limiter.enabled = False
+    try:
+        return asyncio.run(_run())
+    finally:
+        limiter.enabled = True
+        lp._CALLERS.clear()
+        lp._CALLERS.update(saved_callers)
+        lp.reset_provider_guards()
+
+
+def test_batch_keeps_the_analyses_in_flight_when_the_client_disconnects():
+    req = webmcp.McpAnalyzeBatchRequest(paper_ids=["8001.00008", "8001.00009"], providers=["gemini"],
+                                        api_keys={"gemini": "fake-key"})
+    stored = _disconnect_after_first_result(webmcp.mcp_analyze_batch, req,
+                                            ["arxiv:8001.00008", "arxiv:8001.00009"], expected=2)
+    assert stored == 2  # the paper still running at the disconnect was stored too
+
+
+def test_fanout_keeps_the_providers_still_running_when_the_client_disconnects():
+    req = webmcp.McpAnalyzeFanoutRequest(paper_id="8001.00010", providers=["gemini", "openai"],
+                                         api_keys={"gemini": "fake-key", "openai": "fake-key"})
+    stored = _disconnect_after_first_result(webmcp.mcp_analyze_fanout, req, ["arxiv:8001.00010"], expected=2)
+    assert stored == 2  # openai answered after the disconnect and was stored, not discarded
+
+
+def teardown_module(module):
+    """pytest shares one database across modules; keep these analyses out of library-wide job tests."""
+    db = SessionLocal()
+    db.query(Analysis).filter(Analysis.paper_id.in_(_PAPER_PKS)).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    # Order matters: the all-unanalyzed run relies on the explicit batch before it.
+    tests.sort(key=lambda t: t.__code__.co_firstlineno)
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
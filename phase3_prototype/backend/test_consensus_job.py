@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Tests for the library-wide batch consensus job (consensus_job.run_batch_consensus).
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend. Embeddings, synthesis and GitHub are fakes that record how they were
+called: embedding batch sizes, peak synthesis concurrency, and writes.
+
+Run:  python phase3_prototype/backend/test_consensus_job.py
+Or:   pytest phase3_prototype/backend/test_consensus_job.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_TMP = tempfile.mkdtemp(prefix="macp_consensus_job_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import consensus_job as job  # noqa: E402
+import llm_providers as lp  # noqa: E402
+from database import init_db, SessionLocal, Analysis, ConsensusState, Paper, User  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_OWNER = User(github_id=8181, github_login="nightly", connected_repo="owner/repo")
+_db.add(_OWNER)
+_db.commit()
+_OWNER_ID = _OWNER.id
+_PAPERS = {}
+for n, owner in [(1, _OWNER_ID), (2, _OWNER_ID), (3, _OWNER_ID), (4, _OWNER_ID), (5, _OWNER_ID), (6, None)]:
+    paper = Paper(arxiv_id=f"arxiv:7001.0000{n}", title=f"Paper {n}", user_id=owner)
+    _db.add(paper)
+    _db.commit()
+    _PAPERS[n] = paper.id
+_db.close()
+
+
+def _submit(paper: int, agent: str, finding: str, a_type: str = "abstract", score: float = 7):
+    db = SessionLocal()
+    db.add(Analysis(
+        paper_id=_PAPERS[paper], provider=agent, key_insights=json.dumps([finding]),
+        methodology=f"{agent} method for paper {paper}", score=score,
+        provenance=json.dumps({"type": a_type}),
+    ))
+    db.commit()
+    db.close()
+
+
+for _paper, _agents, _type in [
+    (1, ["gemini", "claude", "grok"], "abstract"),
+    (2, ["gemini", "claude"], "abstract"),
+    (3, ["gemini"], "abstract"),           # below minimum: skipped
+    (4, ["gemini", "openai"], "deep"),
+    (5, ["claude", "openai"], "abstract"),
+    (6, ["gemini", "grok"], "abstract"),    # no owner: no GitHub write
+]:
+    for _agent in _agents:
+        _submit(_paper, _agent, f"{_agent} finds something about paper {_paper}", _type)
+_submit(2, "grok", "a deep reading of paper 2", "deep")  # lone deep analysis: skipped
+
+
+class _Recorder:
+    def __init__(self):
+        self.embed_batches: list[int] = []
+        self.synth_calls = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.saved: list[str] = []
+        self.manifest_updates: list[list[str]] = []
+
+
+class _FakeStorage:
+    def __init__(self, rec: _Recorder):
+        self.rec = rec
+
+    async def save_consensus(self, arxiv_id, consensus):
+        self.rec.saved.append(arxiv_id)
+        return True
+
+    async def update_manifest_entries(self, section, entries, message=""):
+        assert section == "analyses"
+        self.rec.manifest_updates.append(sorted(entries))
+        return True
+
+
+def _run(concurrency: int = 2, **kwargs) -> tuple[dict, _Recorder]:
+    rec = _Recorder()
+
+    def _embed(texts, provider, api_key, timeout=60):
+        rec.embed_batches.append(len(texts))
+        return [[float(len(t)), float(sum(map(ord, t)) % 13), 1.0] for t in texts]
+
+    def _synthesize(title, analyses, provider_id, api_key_override=None):
+        with rec.lock:
+            rec.synth_calls += 1
+            rec.active += 1
+            rec.peak = max(rec.peak, rec.active)
+        time.sleep(0.03)
+        with rec.lock:
+            rec.active -= 1
+        return {"synthesized_summary": title, "convergence_points": [], "divergence_points": [],
+                "recommended_action": "read_full_paper", "bias_cross_check": ""}
+
+    originals = (lp.resolve_embed_provider, lp.embed_texts, job.resolve_embed_provider,
+                 job.generate_consensus_synthesis, job.get_storage_service)
+    max_batch = lp.EMBEDDING_PROVIDERS["gemini"]["max_batch"]
+    lp.resolve_embed_provider = job.resolve_embed_provider = lambda *a, **k: ("gemini", "fake-key")
+    lp.embed_texts = _embed
+    lp.EMBEDDING_PROVIDERS["gemini"]["max_batch"] = 4
+    job.generate_consensus_synthesis = _synthesize
+    job.get_storage_service = lambda user: _FakeStorage(rec) if user and user.connected_repo else None
+    try:
+        stats = asyncio.run(job.run_batch_consensus(concurrency=concurrency, **kwargs))
+    finally:
+        (lp.resolve_embed_provider, lp.embed_texts, job.resolve_embed_provider,
+         job.generate_consensus_synthesis, job.get_storage_service) = originals
+        lp.EMBEDDING_PROVIDERS["gemini"]["max_batch"] = max_batch
+    return stats, rec
+
+
+def test_first_run_batches_embeddings_and_limits_concurrency():
+    stats, rec = _run(concurrency=2)
+    assert stats["groups"] == 5, stats
+    # 11 analyses x 2 documents, sent in provider-maximal chunks of 4.
+    assert rec.embed_batches == [4, 4, 4, 4, 4, 2], rec.embed_batches
+    assert rec.synth_calls == 5 and rec.peak == 2, (rec.synth_calls, rec.peak)
+    assert stats["saved"] == 5
+    # Paper 6 has no owner; the rest go out with a single manifest update.
+    assert sorted(rec.saved) == [f"arxiv:7001.0000{n}" for n in (1, 2, 4, 5)]
+    assert rec.manifest_updates == [sorted(rec.saved)]
+    db = SessionLocal()
+    assert db.query(ConsensusState).count() == 5
+    deep = db.query(ConsensusState).filter(ConsensusState.paper_id == _PAPERS[4]).one()
+    db.close()
+    assert deep.analysis_type == "deep" and json.loads(deep.consensus)["synthesized_summary"] == "Paper 4"
+
+
+def test_second_run_is_a_no_op():
+    stats, rec = _run()
+    assert stats["unchanged"] == 5 and stats["saved"] == 0, stats
+    assert rec.embed_batches == [] and rec.synth_calls == 0
+    assert rec.saved == [] and rec.manifest_updates == []
+
+
+def test_new_analysis_only_touches_its_paper():
+    _submit(5, "grok", "grok finds something about paper 5")
+    stats, rec = _run()
+    assert stats["unchanged"] == 4 and stats["saved"] == 1, stats
+    assert stats["scored_pairs"] == 2
+    assert rec.embed_batches == [2], rec.embed_batches  # only the new analysis' documents
+    assert rec.saved == ["arxiv:7001.00005"]
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    # Order matters: later tests build on the state written by earlier ones.
+    tests.sort(key=lambda t: t.__code__.co_firstlineno)
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental consensus (POST /api/mcp/consensus over consensus_states).
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts only the mcp_router. Scoring is forced lexical and the LLM
+synthesis is a counting fake, so no network is used.
+
+Run:  python phase3_prototype/backend/test_consensus_state.py
+Or:   pytest phase3_prototype/backend/test_consensus_state.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_consensus_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import llm_providers as lp  # noqa: E402
+import webmcp  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import init_db, SessionLocal, Analysis, ConsensusState, Paper  # noqa: E402
+from middleware import get_current_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+from schema_validator import get_consensus_weights  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_PAPER = Paper(arxiv_id="arxiv:6001.00001", title="Consensus Paper")
+_db.add(_PAPER)
+_db.commit()
+_PAPER_ID = _PAPER.id
+_db.close()
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.include_router(webmcp.mcp_router)
+_app.dependency_overrides[get_current_user] = lambda: None
+client = TestClient(_app)
+
+_SYNTH_CALLS: list[int] = []
+
+
+def _fake_synthesis(title, analyses, provider_id, api_key_override=None):
+    _SYNTH_CALLS.append(len(analyses))
+    return {
+        "synthesized_summary": f"{len(analyses)} agents",
+        "convergence_points": ["attention"],
+        "divergence_points": [],
+        "recommended_action": "cite",
+        "bias_cross_check": "",
+    }
+
+
+def _submit(provider: str, findings: list[str], methodology: str, score: float):
+    db = SessionLocal()
+    db.add(Analysis(
+        paper_id=_PAPER_ID, provider=provider, key_insights=json.dumps(findings),
+        methodology=methodology, score=score, provenance=json.dumps({"type": "abstract"}),
+    ))
+    db.commit()
+    db.close()
+
+
+def _consensus(**extra) -> dict:
+    originals = lp.resolve_embed_provider, webmcp.generate_consensus_synthesis
+    lp.resolve_embed_provider = lambda *a, **k: (None, None)
+    webmcp.generate_consensus_synthesis = _fake_synthesis
+    try:
+        r = client.post("/api/mcp/consensus", json={"paper_id": "6001.00001", **extra})
+    finally:
+        lp.resolve_embed_provider, webmcp.generate_consensus_synthesis = originals
+    body = r.json()
+    assert body["isError"] is False, body
+    return json.loads(body["content"][0]["text"])
+
+
+def _state() -> ConsensusState:
+    db = SessionLocal()
+    row = db.query(ConsensusState).filter(ConsensusState.paper_id == _PAPER_ID).one()
+    db.close()
+    return row
+
+
+def test_synthesis_reused_until_score_moves():
+    _submit("gemini", ["Attention improves translation quality"], "Transformer encoder decoder", 8)
+    _submit("claude", ["Attention improves translation quality"], "Transformer encoder decoder", 8)
+    first = _consensus()
+    assert first["synthesis_reused"] is False and _SYNTH_CALLS == [2]
+    assert first["consensus"]["agreement_score"] == 1.0
+
+    # A third agreeing agent: score unchanged, synthesis reused, state grows by one row.
+    _submit("grok", ["Attention improves translation quality"], "Transformer encoder decoder", 8)
+    second = _consensus()
+    assert second["synthesis_reused"] is True and _SYNTH_CALLS == [2]
+    assert second["consensus"]["agents_compared"] == ["gemini", "claude", "grok"]
+    assert second["consensus"]["synthesized_summary"] == "2 agents"
+    assert len(json.loads(_state().state)["findings"]) == 3
+
+    # A dissenting agent moves the score past the threshold: re-synthesize.
+    _submit("openai", ["Recurrent networks remain competitive"], "LSTM baseline", 2)
+    third = _consensus()
+    assert third["synthesis_reused"] is False and _SYNTH_CALLS == [2, 4]
+    assert _state().synthesized_score == third["consensus"]["agreement_score"]
+
+
+def test_incremental_score_matches_full_recompute():
+    data = _consensus()
+    db = SessionLocal()
+    analyses = db.query(Analysis).filter(Analysis.paper_id == _PAPER_ID).all()
+    full = lp.compute_agreement_detail([{
+        "key_findings": json.loads(a.key_insights),
+        "methodology": a.methodology,
+        "relevance_score": a.score / 10.0,
+    } for a in analyses], weights=get_consensus_weights(), semantic=False)
+    db.close()
+    assert data["consensus"]["agreement_components"] == full["components"]
+    assert data["consensus"]["agreement_score"] == full["agreement_score"]
+
+
+def test_force_synthesis():
+    calls = len(_SYNTH_CALLS)
+    assert _consensus()["synthesis_reused"] is True
+    assert _consensus(force_synthesis=True)["synthesis_reused"] is False
+    assert len(_SYNTH_CALLS) == calls + 1
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    # Order matters: later tests build on the analyses submitted by earlier ones.
+    tests.sort(key=lambda t: t.__code__.co_firstlineno)
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the DB-backed embedding cache used by /api/mcp/consensus.
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend. embed_texts is replaced with a counting fake, so no network is used.
+
+Run:  python phase3_prototype/backend/test_embedding_store.py
+Or:   pytest phase3_prototype/backend/test_embedding_store.py
+"""
+
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_embed_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import llm_providers as lp  # noqa: E402
+from database import init_db, SessionLocal, EmbeddingVector  # noqa: E402
+from embedding_store import EmbeddingStore  # noqa: E402
+
+init_db()
+
+_SENT: list[str] = []
+
+
+def _fake_embed(texts, provider, api_key, timeout=60):
+    _SENT.extend(texts)
+    return [[float(len(t)), 0.5, -1.25] for t in texts]
+
+
+def _consensus(analyses: list[dict]) -> dict:
+    """One consensus scoring pass in its own session, with the fake embedder."""
+    originals = lp.resolve_embed_provider, lp.embed_texts
+    lp.resolve_embed_provider = lambda *a, **k: ("gemini", "fake-key")
+    lp.embed_texts = _fake_embed
+    db = SessionLocal()
+    try:
+        return lp.compute_agreement_detail(analyses, semantic=True, embedding_cache=EmbeddingStore(db))
+    finally:
+        db.close()
+        lp.resolve_embed_provider, lp.embed_texts = originals
+
+
+def _analysis(agent: str, finding: str, method: str) -> dict:
+    return {"agent_id": agent, "key_findings": [finding], "methodology": method, "relevance_score": 0.7}
+
+
+def test_store_round_trips_float32_vectors():
+    db = SessionLocal()
+    store = EmbeddingStore(db)
+    store.put_many("gemini", "m", {"a" * 64: [0.25, -1.5, 3.0]})
+    store.put_many("gemini", "m", {"a" * 64: [9.0, 9.0, 9.0]})  # duplicate key: ignored
+    assert store.get_many("gemini", "m", ["a" * 64, "b" * 64]) == {"a" * 64: [0.25, -1.5, 3.0]}
+    assert store.get_many("openai", "m", ["a" * 64]) == {}
+    row = db.query(EmbeddingVector).filter(EmbeddingVector.text_hash == "a" * 64).one()
+    assert row.dim == 3 and len(row.vector) == 12
+    db.close()
+
+
+def test_new_agent_embeds_two_documents_not_2n():
+    analyses = [_analysis(f"agent{i}", f"finding number {i}", f"method {i}") for i in range(4)]
+    first = _consensus(analyses)
+    assert first["method"].startswith("semantic:gemini")
+    sent_before = len(_SENT)
+
+    # A later request after a fifth agent submitted.
+    analyses.append(_analysis("agent4", "a brand new finding", "a brand new method"))
+    assert _consensus(analyses)["method"] == first["method"]
+    assert _SENT[sent_before:] == ["a brand new finding", "a brand new method"]
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for GitHub quota handling in GitHubStorageService: conditional GETs
+(ETag / 304 replay), the per-token budget that defers low-priority writes,
+and Retry-After on secondary rate limits.
+
+GitHub is an httpx.MockTransport handler; asyncio.sleep and time.time are
+replaced by a fake clock so waits are recorded instead of slept.
+
+Run:  python phase3_prototype/backend/test_github_budget.py
+Or:   pytest phase3_prototype/backend/test_github_budget.py
+"""
+
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+_TMP = tempfile.mkdtemp(prefix="macp_budget_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+
+import httpx  # noqa: E402
+
+import github_storage as gs  # noqa: E402
+from database import User  # noqa: E402
+from github_auth import encrypt_token  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps: list[float] = []
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _service(handler, clock: FakeClock) -> gs.GitHubStorageService:
+    gs._budgets.clear()
+    gs._etag_cache.clear()
+    transport = httpx.MockTransport(handler)
+    gs.httpx = SimpleNamespace(
+        AsyncClient=lambda **kw: httpx.AsyncClient(transport=transport, **kw),
+        TimeoutException=httpx.TimeoutException,
+        ConnectError=httpx.ConnectError,
+    )
+    gs.time = SimpleNamespace(time=clock.time)
+    gs.asyncio = SimpleNamespace(sleep=clock.sleep)
+    user = User(id=1, github_id=1, github_login="u", connected_repo="owner/repo",
+                github_access_token=encrypt_token("tok"))
+    return gs.GitHubStorageService(user)
+
+
+def _file_body(text: str) -> dict:
+    return {"content": base64.b64encode(text.encode()).decode(), "sha": "blob1"}
+
+
+def test_conditional_get_replays_cached_body_on_304():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"x-ratelimit-remaining": "4000"})
+        return httpx.Response(200, json=_file_body("hello"), headers={"etag": '"v1"'})
+
+    svc = _service(handler, FakeClock())
+    assert asyncio.run(svc._get_file("a.json")) == "hello"
+    assert asyncio.run(svc._get_file("a.json")) == "hello"
+    assert seen == [None, '"v1"'], seen
+
+
+def test_low_priority_write_dropped_when_quota_low_and_reset_far():
+    clock = FakeClock()
+    requests_made = []
+
+    def handler(request):
+        requests_made.append(request.method)
+        return httpx.Response(201, json={}, headers={
+            "x-ratelimit-remaining": "100",
+            "x-ratelimit-reset": str(int(clock.now + 3000)),
+        })
+
+    svc = _service(handler, clock)
+    # First high-priority write goes out and teaches the budget the quota is low.
+    assert asyncio.run(svc.save_note(SimpleNamespace(id=1, tags="[]", created_at=None, content="n")))
+    sent = len(requests_made)
+    assert asyncio.run(svc.save_graph({"nodes": []})) is False
+    assert len(requests_made) == sent, "graph write should not reach GitHub"
+    assert clock.sleeps == []
+
+
+def test_low_priority_write_waits_for_near_reset():
+    clock = FakeClock()
+    reset = clock.now + 120
+
+    def handler(request):
+        return httpx.Response(201 if request.method == "PUT" else 404, json={}, headers={
+            "x-ratelimit-remaining": "10" if clock.now < reset else "5000",
+            "x-ratelimit-reset": str(int(reset if clock.now < reset else reset + 3600)),
+        })
+
+    svc = _service(handler, clock)
+    asyncio.run(svc._get_file("warmup"))
+    assert asyncio.run(svc.save_graph({"nodes": []})) is True
+    assert clock.sleeps and abs(clock.sleeps[0] - 120) < 1, clock.sleeps
+
+
+def test_secondary_limit_retry_after_is_honoured():
+    clock = FakeClock()
+    puts = []
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(404, json={})
+        puts.append(clock.now)
+        if len(puts) == 1:
+            return httpx.Response(403, json={"message": "You have exceeded a secondary rate limit"},
+                                  headers={"retry-after": "30"})
+        return httpx.Response(201, json={})
+
+    svc = _service(handler, clock)
+    assert asyncio.run(svc._put_file("p.json", "{}", "msg")) is True
+    assert len(puts) == 2
+    assert clock.sleeps == [30.0], clock.sleeps  # no extra exponential backoff
+
+
+def test_permission_403_is_not_retried():
+    puts = []
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(404, json={})
+        puts.append(1)
+        return httpx.Response(403, json={"message": "Resource not accessible by integration"})
+
+    svc = _service(handler, FakeClock())
+    assert asyncio.run(svc._put_file("p.json", "{}", "msg")) is False
+    assert len(puts) == 1
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for the knowledge-graph query endpoints (/api/mcp/graph/neighbors,
+/graph/path, /graph/related/{paper_id}) backed by graph_store.GraphIndex.
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts only the mcp_router. The graph is written through
+_populate_graph as deep analyses would.
+
+Run:  python phase3_prototype/backend/test_graph_queries.py
+Or:   pytest phase3_prototype/backend/test_graph_queries.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_graphq_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import init_db, SessionLocal, Paper, User  # noqa: E402
+from middleware import get_current_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+from webmcp import _populate_graph, mcp_router  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=7171, github_login="querier")
+_db.add(_USER)
+_db.commit()
+_USER_ID = _USER.id
+_db.close()
+
+
+class SimpleUser:
+    id = _USER_ID
+
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.include_router(mcp_router)
+_app.dependency_overrides[get_current_user] = lambda: SimpleUser()
+client = TestClient(_app)
+
+
+def _analyze(arxiv_id: str, concepts: list[str], methods: list[str], authors: list[str]):
+    db = SessionLocal()
+    paper = db.query(Paper).filter(Paper.arxiv_id == arxiv_id).first()
+    if not paper:
+        paper = Paper(arxiv_id=arxiv_id, title=f"Paper {arxiv_id}", authors=json.dumps(authors))
+        db.add(paper)
+        db.commit()
+    _populate_graph(db, paper, {"section_analyses": [
+        {"pass": "results", "data": {"concepts": concepts, "methods": methods}},
+    ]}, _USER_ID)
+    db.close()
+
+
+_analyze("arxiv:5001.00001", ["RLHF", "Reward Modeling"], ["PPO"], ["Ada Lovelace"])
+_analyze("arxiv:5001.00002", ["RLHF", "Reward Modeling"], ["DPO"], ["Alan Turing"])
+_analyze("arxiv:5001.00003", ["Diffusion"], ["PPO"], ["Alan Turing"])
+_analyze("arxiv:5001.00004", ["Quantum Annealing"], [], ["Carol Shaw"])
+
+
+def _get(url: str) -> dict:
+    r = client.get(url)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["isError"] is False, body
+    return json.loads(body["content"][0]["text"])
+
+
+def test_one_hop_neighbourhood():
+    data = _get("/api/mcp/graph/neighbors?node_id=5001.00001")
+    ids = {n["id"] for n in data["nodes"]}
+    assert ids == {"arxiv:5001.00001", "concept_rlhf", "concept_reward_modeling",
+                   "method_ppo", "author_ada_lovelace"}, ids
+    assert len(data["edges"]) == 4
+
+
+def test_two_hop_reaches_papers_sharing_a_concept():
+    data = _get("/api/mcp/graph/neighbors?node_id=arxiv:5001.00001&hops=2")
+    dist = {n["id"]: n["distance"] for n in data["nodes"]}
+    assert dist["arxiv:5001.00002"] == 2  # via RLHF
+    assert dist["arxiv:5001.00003"] == 2  # via PPO
+    assert "arxiv:5001.00004" not in dist
+
+
+def test_shortest_path_and_unreachable():
+    data = _get("/api/mcp/graph/path?source=5001.00002&target=5001.00003")
+    assert data["hops"] == 2, data  # shared author
+    assert data["path"][1]["id"] == "author_alan_turing"
+    assert data["path"][1]["via"] == "authored_by"
+    data = _get("/api/mcp/graph/path?source=5001.00001&target=5001.00004")
+    assert data["path"] == [] and data["hops"] is None
+
+
+def test_related_papers_ranked_by_rarity():
+    data = _get("/api/mcp/graph/related/5001.00001?k=5")
+    ranked = [r["id"] for r in data["related"]]
+    # Two shared concepts beat one shared method; the unrelated paper is absent.
+    assert ranked[0] == "arxiv:5001.00002", data
+    assert sorted(data["related"][0]["shared"]) == ["RLHF", "Reward Modeling"]
+    assert "arxiv:5001.00003" in ranked and "arxiv:5001.00004" not in ranked
+
+
+def test_index_refreshes_after_new_analysis():
+    _analyze("arxiv:5001.00005", ["Reward Modeling"], [], [])
+    ranked = [r["id"] for r in _get("/api/mcp/graph/related/5001.00001")["related"]]
+    assert "arxiv:5001.00005" in ranked
+
+
+def test_unknown_node_is_error():
+    body = client.get("/api/mcp/graph/neighbors?node_id=concept_nope").json()
+    assert body["isError"] is True
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
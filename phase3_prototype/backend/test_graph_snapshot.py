@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Tests for the materialized knowledge-graph snapshot behind GET /api/mcp/graph.
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts only the mcp_router. Graph rows are written through
+_populate_graph exactly as a deep analysis would; the incrementally maintained
+snapshot must match a from-scratch rebuild, and the endpoint must honour
+If-None-Match.
+
+Run:  python phase3_prototype/backend/test_graph_snapshot.py
+Or:   pytest phase3_prototype/backend/test_graph_snapshot.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from collections import Counter
+
+_TMP = tempfile.mkdtemp(prefix="macp_graph_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import init_db, SessionLocal, GraphSnapshot, Paper, User  # noqa: E402
+import webmcp  # noqa: E402
+import graph_store  # noqa: E402
+from graph_store import _build_payload, get_graph_index, rebuild_graph_snapshot  # noqa: E402
+from middleware import get_current_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+from webmcp import _populate_graph, mcp_router  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=5151, github_login="grapher")
+_db.add(_USER)
+_db.commit()
+_USER_ID = _USER.id
+_db.close()
+
+
+class SimpleUser:
+    id = _USER_ID
+
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.include_router(mcp_router)
+_app.dependency_overrides[get_current_user] = lambda: SimpleUser()
+client = TestClient(_app)
+
+
+def _analyze(arxiv_id: str, concepts: list[str], methods: list[str], authors: list[str]):
+    db = SessionLocal()
+    paper = db.query(Paper).filter(Paper.arxiv_id == arxiv_id).first()
+    if not paper:
+        paper = Paper(arxiv_id=arxiv_id, title=f"Paper {arxiv_id}", authors=json.dumps(authors))
+        db.add(paper)
+        db.commit()
+    analysis = {"section_analyses": [
+        {"pass": "results", "data": {"concepts": concepts, "methods": methods}},
+    ]}
+    _populate_graph(db, paper, analysis, _USER_ID)
+    db.close()
+
+
+def _graph(etag: str = ""):
+    headers = {"If-None-Match": etag} if etag else {}
+    return client.get("/api/mcp/graph", headers=headers)
+
+
+def _edge_keys(payload: dict) -> Counter:
+    ids = [n["id"] for n in payload["nodes"]]
+    return Counter(
+        (e["type"],) + tuple(sorted((ids[e["source"]], ids[e["target"]])))
+        if e["type"] == "relates_to" else (e["type"], ids[e["source"]], ids[e["target"]])
+        for e in payload["edges"]
+    )
+
+
+def test_graph_etag_and_304():
+    _analyze("arxiv:3001.00001", ["RLHF", "Reward Model"], ["PPO"], ["Ada Lovelace"])
+    r = _graph()
+    assert r.status_code == 200, r.text
+    etag = r.headers["etag"]
+    data = json.loads(r.json()["content"][0]["text"])
+    assert data["stats"]["papers"] >= 1
+    r2 = _graph(etag)
+    assert r2.status_code == 304
+    assert r2.content == b""
+
+
+def test_incremental_snapshot_matches_rebuild():
+    _analyze("arxiv:3001.00002", ["RLHF"], ["DPO"], ["Alan Turing"])
+    _analyze("arxiv:3001.00003", ["Reward Model", "RLHF"], ["PPO"], ["Ada Lovelace"])
+    # Re-analysing a paper must not duplicate edges or relates_to links.
+    _analyze("arxiv:3001.00002", ["RLHF"], ["DPO"], ["Alan Turing"])
+
+    db = SessionLocal()
+    snap = db.query(GraphSnapshot).filter(GraphSnapshot.user_id == _USER_ID).first()
+    incremental = json.loads(snap.payload)
+    rebuilt = _build_payload(db, _USER_ID)
+    db.close()
+
+    assert _edge_keys(incremental) == _edge_keys(rebuilt)
+    assert incremental["stats"] == rebuilt["stats"]
+    counts = {n["id"]: n["paper_count"] for n in incremental["nodes"]}
+    assert counts == {n["id"]: n["paper_count"] for n in rebuilt["nodes"]}
+    relates = [e for e in incremental["edges"] if e["type"] == "relates_to"]
+    # 00001-00002 (RLHF), 00001-00003 (RLHF, Reward Model), 00002-00003 (RLHF)
+    assert len(relates) == 4, relates
+
+
+def test_new_analysis_changes_etag():
+    etag = _graph().headers["etag"]
+    _analyze("arxiv:3001.00004", ["Constitutional AI"], [], [])
+    r = _graph(etag)
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag
+
+
+def test_failed_delta_never_reuses_an_etag():
+    db = SessionLocal()
+    index_before = get_graph_index(db, _USER_ID)
+    db.close()
+    etag = _graph().headers["etag"]
+
+    def _broken(*args, **kwargs):
+        raise RuntimeError("delta failed")
+
+    saved, webmcp.apply_graph_delta = webmcp.apply_graph_delta, _broken
+    try:
+        _analyze("arxiv:3001.00005", ["Debate"], [], [])
+    finally:
+        webmcp.apply_graph_delta = saved
+
+    r = _graph(etag)
+    assert r.status_code == 200 and r.headers["etag"] != etag
+    assert "arxiv:3001.00005" in r.json()["content"][0]["text"]
+    db = SessionLocal()
+    assert get_graph_index(db, _USER_ID) is not index_before
+    db.close()
+
+
+def test_racing_first_builds_leave_one_snapshot():
+    first, second = SessionLocal(), SessionLocal()
+    first.query(GraphSnapshot).filter(GraphSnapshot.user_id == _USER_ID).delete()
+    first.commit()
+    real = graph_store._snapshot_row
+    misses = iter([None])
+
+    def _not_there_yet(db, user_id):
+        # The second build looks once before the first one has committed its row.
+        return next(misses, real(db, user_id)) if db is second else real(db, user_id)
+
+    graph_store._snapshot_row = _not_there_yet
+    try:
+        assert rebuild_graph_snapshot(first, _USER_ID).version == 1
+        snap = rebuild_graph_snapshot(second, _USER_ID)
+    finally:
+        graph_store._snapshot_row = real
+    rows = first.query(GraphSnapshot).filter(GraphSnapshot.user_id == _USER_ID).all()
+    first.close()
+    second.close()
+    assert len(rows) == 1 and rows[0].version == 2 and snap.version == 2
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    # Order matters: later tests build on the graph written by earlier ones.
+    tests.sort(key=lambda t: t.__code__.co_firstlineno)
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
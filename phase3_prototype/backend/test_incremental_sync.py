@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental GitHub hydration (GitHubStorageService.sync_from_github).
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend. GitHub is replaced by an in-memory fake served through
+httpx.MockTransport — commits are snapshots of {path: content}, and the
+contents / commits / compare endpoints are answered from them.
+
+Run:  python phase3_prototype/backend/test_incremental_sync.py
+Or:   pytest phase3_prototype/backend/test_incremental_sync.py
+"""
+
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+_TMP = tempfile.mkdtemp(prefix="macp_sync_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+
+import httpx  # noqa: E402
+
+import github_storage as gs  # noqa: E402
+import consensus_job  # noqa: E402
+from database import init_db, SessionLocal, Analysis, Note, Paper, User  # noqa: E402
+from github_auth import encrypt_token  # noqa: E402
+
+init_db()
+
+
+# --- Fake GitHub ----------------------------------------------------------
+
+class FakeGitHub:
+    def __init__(self):
+        self.commits: dict[str, dict[str, str]] = {}
+        self.head = ""
+        self.content_gets: list[str] = []
+        self.compare_status = 200
+
+    def commit(self, sha: str, files: dict[str, str]):
+        self.commits[sha] = dict(files)
+        self.head = sha
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.split("/repos/owner/repo/", 1)[1]
+        if path == "commits/HEAD":
+            return httpx.Response(200, json={"sha": self.head})
+        if path.startswith("compare/"):
+            if self.compare_status != 200:
+                return httpx.Response(self.compare_status, json={})
+            base, head = path[len("compare/"):].split("...")
+            old, new = self.commits[base], self.commits[head]
+            files = [{"filename": p, "status": "removed"} for p in old if p not in new]
+            files += [
+                {"filename": p, "status": "added" if p not in old else "modified"}
+                for p in new if old.get(p) != new[p]
+            ]
+            return httpx.Response(200, json={"files": files})
+        if path.startswith("contents/"):
+            target = path[len("contents/"):]
+            snapshot = self.commits[request.url.params.get("ref") or self.head]
+            if target in snapshot:
+                self.content_gets.append(target)
+                encoded = base64.b64encode(snapshot[target].encode()).decode()
+                return httpx.Response(200, json={"content": encoded, "sha": "blob"})
+            children = sorted({p[len(target) + 1:].split("/")[0] for p in snapshot if p.startswith(target + "/")})
+            if children:
+                return httpx.Response(200, json=[{"name": c} for c in children])
+        return httpx.Response(404, json={"message": "Not Found"})
+
+
+def _service(fake: FakeGitHub, user: User) -> gs.GitHubStorageService:
+    transport = httpx.MockTransport(fake.handler)
+    gs.httpx = SimpleNamespace(
+        AsyncClient=lambda **kw: httpx.AsyncClient(transport=transport, **kw),
+        TimeoutException=httpx.TimeoutException,
+        ConnectError=httpx.ConnectError,
+    )
+    return gs.GitHubStorageService(user)
+
+
+def _new_user(github_id: int) -> User:
+    db = SessionLocal()
+    user = User(github_id=github_id, github_login=f"u{github_id}", connected_repo="owner/repo",
+                github_access_token=encrypt_token("tok"))
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+
+def _paper(arxiv_id: str, title: str) -> str:
+    return json.dumps({"id": arxiv_id, "title": title, "authors": ["A"], "abstract": "x"})
+
+
+def _note(text: str) -> str:
+    return f"# Research Note #1\n\n**Tags:** t1\n**Created:** now\n\n{text}"
+
+
+# --- Tests ----------------------------------------------------------------
+
+def test_first_sync_is_full_and_records_sha():
+    fake = FakeGitHub()
+    fake.commit("c1", {".macp/papers/arxiv_9001.00001.json": _paper("arxiv:9001.00001", "P1")})
+    user = _new_user(9101)
+    stats = asyncio.run(_service(fake, user).sync_from_github())
+    assert stats["mode"] == "full", stats
+    assert stats["papers"] == 1 and stats["sha"] == "c1"
+    db = SessionLocal()
+    assert db.query(User).filter(User.id == user.id).first().github_synced_sha == "c1"
+    db.close()
+
+
+def test_incremental_reads_only_changed_files_and_marks_removed_stale():
+    fake = FakeGitHub()
+    fake.commit("c1", {
+        ".macp/papers/arxiv_9002.00001.json": _paper("arxiv:9002.00001", "Kept"),
+        ".macp/notes/note_1.md": _note("soon removed"),
+    })
+    user = _new_user(9102)
+    svc = _service(fake, user)
+    asyncio.run(svc.hydrate_from_github())
+
+    fake.commit("c2", {
+        ".macp/papers/arxiv_9002.00001.json": _paper("arxiv:9002.00001", "Kept"),
+        ".macp/papers/arxiv_9002.00002.json": _paper("arxiv:9002.00002", "New"),
+        ".macp/graph/knowledge-graph.json": "{}",
+    })
+    fake.content_gets.clear()
+    stats = asyncio.run(svc.sync_from_github())
+
+    assert stats["mode"] == "incremental", stats
+    assert stats["papers"] == 1 and stats["stale"] == 1 and stats["errors"] == 0, stats
+    # Unchanged paper and non-hydrated paths are never fetched.
+    assert ".macp/papers/arxiv_9002.00001.json" not in fake.content_gets
+    assert ".macp/graph/knowledge-graph.json" not in fake.content_gets
+    db = SessionLocal()
+    assert db.query(Paper).filter(Paper.arxiv_id == "arxiv:9002.00002").first() is not None
+    note = db.query(Note).filter(Note.user_id == user.id).first()
+    assert note.stale is True
+    db.close()
+
+
+def _analysis(arxiv_id: str, provider: str) -> str:
+    return json.dumps({"paper": {"id": arxiv_id}, "analysis": {
+        "summary": "s", "provenance": {"provider": provider, "type": "abstract"}}})
+
+
+def test_removals_only_flag_the_syncing_users_rows():
+    files = {
+        ".macp/papers/arxiv_9005.00001.json": _paper("arxiv:9005.00001", "Shared"),
+        ".macp/analyses/arxiv_9005.00001.json": _analysis("arxiv:9005.00001", "gemini"),
+    }
+    owner_repo, other_repo = FakeGitHub(), FakeGitHub()
+    owner_repo.commit("c1", files)
+    other_repo.commit("c1", files)
+    owner, other = _new_user(9105), _new_user(9106)
+    asyncio.run(_service(owner_repo, owner).sync_from_github())
+    other_svc = _service(other_repo, other)
+    asyncio.run(other_svc.sync_from_github())
+
+    other_repo.commit("c2", {})  # the second user deletes their copies
+    stats = asyncio.run(other_svc.sync_from_github())
+    assert stats["mode"] == "incremental" and stats["stale"] == 0, stats
+    db = SessionLocal()
+    paper = db.query(Paper).filter(Paper.arxiv_id == "arxiv:9005.00001").first()
+    assert paper.stale is False and paper.user_id == owner.id
+    assert db.query(Analysis).filter(Analysis.paper_id == paper.id).one().stale is False
+    db.close()
+
+    owner_repo.commit("c2", {k: v for k, v in files.items() if "/papers/" in k})
+    owner_svc = _service(owner_repo, owner)
+    assert asyncio.run(owner_svc.sync_from_github())["stale"] == 1
+    db = SessionLocal()
+    groups = consensus_job.find_consensus_groups(db, min_agents=1)
+    assert all(paper_pk != paper.id for paper_pk, _, _ in groups)  # stale analyses are not served
+    db.close()
+
+
+def test_unchanged_head_makes_no_content_requests():
+    fake = FakeGitHub()
+    fake.commit("c1", {".macp/papers/arxiv_9003.00001.json": _paper("arxiv:9003.00001", "P")})
+    user = _new_user(9103)
+    svc = _service(fake, user)
+    asyncio.run(svc.sync_from_github())
+    fake.content_gets.clear()
+    stats = asyncio.run(svc.sync_from_github())
+    assert stats["mode"] == "unchanged"
+    assert fake.content_gets == []
+
+
+def test_unusable_compare_falls_back_to_full():
+    fake = FakeGitHub()
+    fake.commit("c1", {".macp/papers/arxiv_9004.00001.json": _paper("arxiv:9004.00001", "P")})
+    user = _new_user(9104)
+    svc = _service(fake, user)
+    asyncio.run(svc.sync_from_github())
+    fake.commit("c2", {".macp/papers/arxiv_9004.00001.json": _paper("arxiv:9004.00001", "P v2")})
+    fake.compare_status = 404  # e.g. base commit lost to a force-push
+    stats = asyncio.run(svc.sync_from_github())
+    assert stats["mode"] == "full" and stats["sha"] == "c2"
+
+
+def test_classify_path():
+    assert gs._classify_path(".macp/papers/arxiv_1.json") == "papers"
+    assert gs._classify_path(".macp-research/notes/note_3.md") == "notes"
+    assert gs._classify_path(".macp/analyses/arxiv_1.json") == "analyses"
+    assert gs._classify_path(".macp/analyses/arxiv_1/gemini_20260101.json") is None
+    assert gs._classify_path("README.md") is None
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Tests for the llm_usage totals (usage_store) and GET /api/mcp/usage: the
+per-call telemetry in analysis _meta rolled up per user, provider, model,
+route, analysis type and step.
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts only the mcp_router. The LLM caller is a fake that reports
+usage like Gemini does, so no network is used.
+
+Run:  python phase3_prototype/backend/test_llm_usage.py
+Or:   pytest phase3_prototype/backend/test_llm_usage.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+
+_TMP = tempfile.mkdtemp(prefix="macp_usage_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import llm_providers as lp  # noqa: E402
+import webmcp  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import init_db, SessionLocal, Analysis, LlmUsage, Paper, User  # noqa: E402
+from middleware import get_current_user, require_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+from usage_store import record_llm_usage, usage_rows, usage_summary  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=9494, github_login="usage-watcher")
+_OTHER = User(github_id=9595, github_login="usage-neighbour")
+_db.add_all([_USER, _OTHER])
+_db.commit()
+_PAPER = Paper(arxiv_id="arxiv:9201.00001", title="Usage Paper", abstract="We count tokens.",
+               user_id=_USER.id, status="saved")
+_db.add(_PAPER)
+_db.commit()
+_USER = _db.query(User).filter(User.id == _USER.id).first()
+_USER_ID, _OTHER_ID, _PAPER_PK = _USER.id, _OTHER.id, _PAPER.id
+_db.close()
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.include_router(webmcp.mcp_router)
+_app.dependency_overrides[require_user] = lambda: _USER
+_app.dependency_overrides[get_current_user] = lambda: _USER
+client = TestClient(_app)
+
+
+def _call(step: str, ms: float, outcome: str = "ok", attempt: int = 1, route: str = "deep->standard",
+          model: str = "std", **tokens) -> dict:
+    return {"step": step, "provider": "gemini", "model": model, "route": route, "ms": ms,
+            "outcome": outcome, "attempt": attempt, "input_tokens": tokens.get("input_tokens", 0),
+            "output_tokens": tokens.get("output_tokens", 0), "cached_tokens": tokens.get("cached_tokens", 0),
+            "cache_write_tokens": 0}
+
+
+_MAPREDUCE = {"summary": "s", "_meta": {"analysis_type": "mapreduce", "calls": [
+    _call("map:1", 100.0, route="map->lite", model="lite", input_tokens=1000),
+    _call("map:2", 300.0, outcome="timeout", route="map->lite", model="lite"),
+    _call("map:2", 200.0, attempt=2, route="map->lite", model="lite", input_tokens=1000, cached_tokens=800),
+    _call("reduce", 900.0, input_tokens=2000, output_tokens=500),
+]}}
+
+
+def test_rows_roll_map_steps_up_and_count_retries():
+    rows = {(r["step"], r["model"]): r for r in usage_rows(_USER_ID, [_MAPREDUCE], day="2026-01-01")}
+    assert set(rows) == {("map", "lite"), ("reduce", "std")}
+    mapped = rows[("map", "lite")]
+    assert (mapped["calls"], mapped["failed"], mapped["retries"]) == (3, 1, 1)
+    assert mapped["input_tokens"] == 2000 and mapped["cached_tokens"] == 800
+    assert mapped["total_ms"] == 600.0 and mapped["max_ms"] == 300.0
+    assert mapped["analysis_type"] == "mapreduce" and mapped["route"] == "map->lite"
+    assert usage_rows(_USER_ID, [{"summary": "no telemetry"}, None]) == []
+
+
+def test_rows_sum_the_cost_of_priced_calls_and_count_the_rest():
+    priced = {**_call("abstract", 50.0, model="gpt-4o-mini", input_tokens=1000),
+              "usage_reported": True, "cost_usd": 0.00015}
+    unpriced = {**_call("abstract", 50.0, model="gpt-4o-mini", input_tokens=1000),
+                "usage_reported": True, "cost_usd": None}
+    silent = {**_call("abstract", 50.0, model="gpt-4o-mini", outcome="timeout"),
+              "usage_reported": False, "cost_usd": None}
+    [row] = usage_rows(_USER_ID, [{"_meta": {"calls": [priced, priced, unpriced, silent]}}])
+    assert row["cost_usd"] == 0.0003 and row["unpriced"] == 1
+
+
+def test_recorded_usage_accumulates_and_summarizes_per_user():
+    assert record_llm_usage(_OTHER_ID, [_MAPREDUCE]) == 4
+    assert record_llm_usage(_OTHER_ID, [_MAPREDUCE]) == 4
+    db = SessionLocal()
+    try:
+        assert db.query(LlmUsage).filter(LlmUsage.user_id == _OTHER_ID).count() == 2  # same keys: added up
+        by_route = {r["route"]: r for r in usage_summary(db, ("route", "model"), user_id=_OTHER_ID)}
+        by_user = usage_summary(db, ("user_id",), user_id=_OTHER_ID)
+    finally:
+        db.close()
+    lite = by_route["map->lite"]
+    assert lite["calls"] == 6 and lite["failed"] == 2 and lite["error_rate"] == round(2 / 6, 4)
+    assert lite["cache_hit_ratio"] == 0.4 and lite["avg_ms"] == 200.0 and lite["max_ms"] == 300.0
+    assert by_route["deep->standard"]["output_tokens"] == 1000
+    assert by_user == [{**by_user[0], "user_id": _OTHER_ID, "calls": 8}]
+
+
+def test_concurrent_writers_never_lose_increments():
+    race = {"_meta": {"calls": [_call("abstract", 10.0, model="race-model", input_tokens=10)]}}
+    barrier = threading.Barrier(2)
+    recorded = []
+
+    def _writer():
+        barrier.wait()
+        recorded.extend(record_llm_usage(None, [race]) for _ in range(25))
+
+    threads = [threading.Thread(target=_writer) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    db = SessionLocal()
+    try:
+        # A key with several partial rows: the next write lands on exactly one of them.
+        db.add(LlmUsage(**{**usage_rows(None, [race])[0], "calls": 0, "input_tokens": 0}))
+        db.commit()
+        assert record_llm_usage(None, [race]) == 1
+        [row] = [r for r in usage_summary(db, ("model",)) if r["model"] == "race-model"]
+    finally:
+        db.close()
+    assert recorded == [1] * 50
+    assert row["calls"] == 51 and row["input_tokens"] == 510
+
+
+def test_analyze_records_usage_the_caller_can_query():
+    def _gemini(api_key, prompt, model):
+        lp._note_usage({"usageMetadata": {"promptTokenCount": 420, "candidatesTokenCount": 60}})
+        return json.dumps({"summary": "counted", "key_insights": ["usage is tracked"], "strength_score": 6})
+
+    saved = lp._CALLERS["gemini"]
+    lp._CALLERS["gemini"] = _gemini
+    lp.reset_provider_guards()
+    try:
+        r = client.post("/api/mcp/analyze", json={
+            "paper_id": "9201.00001", "provider": "gemini", "api_key": "fake-key", "hedge": False,
+        })
+    finally:
+        lp._CALLERS["gemini"] = saved
+        lp.reset_provider_guards()
+    assert r.json()["isError"] is False, r.text
+
+    r = client.get("/api/mcp/usage", params={"group_by": "provider,route,step"})
+    body = json.loads(r.json()["content"][0]["text"])
+    [row] = body["usage"]  # only the caller's usage: the neighbour's map-reduce calls are not here
+    assert row["provider"] == "gemini" and row["step"] == "abstract" and row["route"] == "abstract->lite"
+    assert row["calls"] == 1 and row["input_tokens"] == 420 and row["output_tokens"] == 60
+    assert row["cost_usd"] == 0.0 and row["unpriced"] == 1  # the lite Gemini model has no listed price
+
+    r = client.get("/api/mcp/usage", params={"group_by": "provider,secrets"})
+    assert r.json()["isError"] is True
+
+
+def test_failed_analyses_are_recorded_too():
+    def _down(api_key, prompt, model):
+        raise lp.requests.ConnectionError("provider down")
+
+    saved = lp._CALLERS["gemini"]
+    lp._CALLERS["gemini"] = _down
+    lp.reset_provider_guards()
+    try:
+        r = client.post("/api/mcp/analyze", json={
+            "paper_id": "9201.00001", "provider": "gemini", "api_key": "fake-key", "hedge": False,
+        })
+    finally:
+        lp._CALLERS["gemini"] = saved
+        lp.reset_provider_guards()
+    assert r.json()["isError"] is True
+
+    r = client.get("/api/mcp/usage", params={"group_by": "provider,step"})
+    [row] = json.loads(r.json()["content"][0]["text"])["usage"]
+    assert row["calls"] == 2 and row["failed"] == 1 and row["error_rate"] == 0.5  # after the successful /analyze
+
+
+def teardown_module(module):
+    """pytest shares one database across modules; keep these analyses out of library-wide job tests."""
+    db = SessionLocal()
+    db.query(Analysis).filter(Analysis.paper_id == _PAPER_PK).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
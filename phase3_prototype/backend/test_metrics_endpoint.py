@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for GET /metrics (observability.py): per-route request histograms from
+MetricsMiddleware, the scrape-time DB pool, executor and GitHub quota gauges,
+and the METRICS_TOKEN bearer check (no token configured: no endpoint).
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts the middleware, the metrics router and the mcp_router on a
+bare app. GitHub responses are built locally; no network is used.
+
+Run:  python phase3_prototype/backend/test_metrics_endpoint.py
+Or:   pytest phase3_prototype/backend/test_metrics_endpoint.py
+"""
+
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_metrics_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+
+import httpx  # noqa: E402
+import github_storage as gs  # noqa: E402
+import observability  # noqa: E402
+import webmcp  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import init_db, SessionLocal, User  # noqa: E402
+from middleware import get_current_user, require_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=9696, github_login="metrics-scraper")
+_db.add(_USER)
+_db.commit()
+_USER = _db.query(User).filter(User.id == _USER.id).first()
+_db.close()
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.add_middleware(observability.MetricsMiddleware)
+_app.include_router(webmcp.mcp_router)
+_app.include_router(observability.metrics_router)
+_app.dependency_overrides[require_user] = lambda: _USER
+_app.dependency_overrides[get_current_user] = lambda: _USER
+client = TestClient(_app)
+observability.METRICS_TOKEN = "scrape-secret"
+_SCRAPE = {"Authorization": "Bearer scrape-secret"}
+
+
+def _scrape() -> str:
+    r = client.get("/metrics", headers=_SCRAPE)
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return r.text
+
+
+def test_requests_are_timed_per_route_template():
+    observability.HTTP_SECONDS.clear()
+    client.get("/api/mcp/analysis/9301.00001")
+    client.get("/api/mcp/analysis/9301.00002")
+    client.get("/no/such/path")
+    seconds = observability.HTTP_SECONDS
+    assert seconds.count(method="GET", route="/api/mcp/analysis/{paper_id}", status="200") == 2
+    assert seconds.count(method="GET", route="unmatched", status="404") == 1
+    text = _scrape()
+    assert 'route="/api/mcp/analysis/{paper_id}"' in text and "9301.00001" not in text
+
+
+def test_scrape_reports_pool_and_executor_gauges():
+    text = _scrape()
+    assert "# TYPE macp_db_pool_connections gauge" in text
+    assert 'macp_executor_queue_depth{executor="anyio"} 0' in text
+    assert "macp_http_requests_in_progress 1" in text  # the scrape itself
+
+
+def test_github_calls_and_quota_are_reported():
+    gs._budgets.clear()
+    gs.GITHUB_CALLS.clear()
+    reset = gs.time.time() + 3600
+    for key, remaining in (("a", 4000), ("b", 120)):
+        resp = httpx.Response(200, headers={"x-ratelimit-remaining": str(remaining),
+                                            "x-ratelimit-reset": str(reset)},
+                              request=httpx.Request("PUT", "https://api.github.com/repos/o/r/contents/x"))
+        gs._budgets.setdefault(key, gs._TokenBudget()).record(resp)
+    gs._TokenBudget().record(httpx.Response(403, text="Resource not accessible"))
+    text = _scrape()
+    gs._budgets.clear()
+    assert 'macp_github_api_calls_total{method="PUT",status="200"} 2' in text
+    assert 'macp_github_api_calls_total{method="unknown",status="403"} 1' in text
+    assert "macp_github_rate_limit_remaining_min 120" in text
+    assert 'macp_github_tokens{state="tracked"} 2' in text
+
+
+def test_metrics_need_a_token():
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    r = client.get("/metrics", headers=_SCRAPE)
+    assert r.status_code == 200 and "macp_http_request_duration_seconds" in r.text
+
+    observability.METRICS_TOKEN = ""
+    try:
+        assert client.get("/metrics").status_code == 404  # not served without a configured token
+    finally:
+        observability.METRICS_TOKEN = "scrape-secret"
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the set-based _populate_graph (knowledge-graph upsert after a deep analysis).
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend. Checks paper_count semantics, edge de-duplication, the
+graph_edges uniqueness index, and that the number of SQL statements no
+longer grows with the number of extracted nodes.
+
+Run:  python phase3_prototype/backend/test_populate_graph.py
+Or:   pytest phase3_prototype/backend/test_populate_graph.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_populate_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+from sqlalchemy import event, inspect  # noqa: E402
+from database import init_db, engine, SessionLocal, GraphEdge, GraphNode, Paper, User  # noqa: E402
+from webmcp import _populate_graph  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=6161, github_login="populator")
+_db.add(_USER)
+_db.commit()
+_USER_ID = _USER.id
+_db.close()
+
+
+def _run(arxiv_id: str, authors: list[str], concepts: list[str], methods: list[str]) -> int:
+    """Populate the graph for one analysis; return the number of SQL statements issued."""
+    db = SessionLocal()
+    paper = db.query(Paper).filter(Paper.arxiv_id == arxiv_id).first()
+    if not paper:
+        paper = Paper(arxiv_id=arxiv_id, title=f"Paper {arxiv_id}", authors=json.dumps(authors))
+        db.add(paper)
+        db.commit()
+    analysis = {"section_analyses": [
+        {"pass": "results", "data": {"concepts": concepts, "methods": methods}},
+    ]}
+    statements = []
+
+    def _count(conn, cursor, statement, params, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _count)
+    try:
+        _populate_graph(db, paper, analysis, _USER_ID)
+    finally:
+        event.remove(engine, "before_cursor_execute", _count)
+        db.close()
+    return len(statements)
+
+
+def _node(node_id: str) -> GraphNode:
+    db = SessionLocal()
+    node = db.query(GraphNode).filter(GraphNode.user_id == _USER_ID, GraphNode.node_id == node_id).first()
+    db.close()
+    return node
+
+
+def test_statement_count_is_constant():
+    _run("arxiv:4001.00000", [], [], [])  # first analysis also materializes the snapshot
+    small = _run("arxiv:4001.00001", ["A One"], ["C1"], ["M1"])
+    large = _run(
+        "arxiv:4001.00002",
+        [f"Author {i}" for i in range(5)],
+        [f"Concept {i}" for i in range(5)],
+        [f"Method {i}" for i in range(5)],
+    )
+    assert large == small, (small, large)
+    assert large <= 10, large
+
+
+def test_paper_count_semantics():
+    _run("arxiv:4002.00001", ["Grace Hopper"], ["Compilers"], ["Parsing"])
+    _run("arxiv:4002.00002", ["Grace Hopper"], ["Compilers", "compilers!"], [])
+    assert _node("author_grace_hopper").paper_count == 2
+    # "Compilers" and "compilers!" share a slug: each mention counts, one edge.
+    assert _node("concept_compilers").paper_count == 3
+    assert _node("concept_compilers").label == "Compilers"
+    # Re-analysis bumps the paper node again, as the per-node upsert did.
+    _run("arxiv:4002.00001", ["Grace Hopper"], ["Compilers"], ["Parsing"])
+    assert _node("arxiv:4002.00001").paper_count == 2
+
+
+def test_no_duplicate_edges_on_reanalysis():
+    for _ in range(3):
+        _run("arxiv:4003.00001", ["Barbara Liskov"], ["Abstraction"], ["CLU"])
+    db = SessionLocal()
+    paper_pk = db.query(GraphNode.id).filter(
+        GraphNode.user_id == _USER_ID, GraphNode.node_id == "arxiv:4003.00001"
+    ).scalar()
+    edges = db.query(GraphEdge).filter(GraphEdge.source_node_id == paper_pk).all()
+    db.close()
+    assert sorted(e.edge_type for e in edges) == ["authored_by", "uses_concept", "uses_method"]
+
+
+def test_edge_uniqueness_index_exists():
+    names = {ix["name"]: ix for ix in inspect(engine).get_indexes("graph_edges")}
+    assert "uq_graph_edges_link" in names
+    assert names["uq_graph_edges_link"]["unique"]
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Tests for TracingMiddleware (observability.py): the Server-Timing header
+and "request_trace" log line of a traced /api/mcp/analyze-deep, the no-op
+when tracing is off, and cProfile dumps for admin requests only.
+
+Isolated: points MACP_DIR + DATABASE_URL at a temp dir BEFORE importing the
+backend and mounts the middleware and the mcp_router on a bare app. The HTML
+fetch and the LLM caller are fakes, so no network is used.
+
+Run:  python phase3_prototype/backend/test_request_tracing.py
+Or:   pytest phase3_prototype/backend/test_request_tracing.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="macp_tracing_test_")
+os.environ["MACP_DIR"] = _TMP
+os.environ["MACP_DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("JWT_SECRET", "test-secret-not-used-for-real-auth")
+
+_BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, _BACKEND)
+sys.path.insert(0, os.path.abspath(os.path.join(_BACKEND, "..", "..", "tools")))
+
+import llm_providers as lp  # noqa: E402
+import middleware  # noqa: E402
+import observability  # noqa: E402
+import webmcp  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import init_db, SessionLocal, Analysis, GraphEdge, GraphNode, GraphSnapshot, Paper, User  # noqa: E402
+from github_auth import create_jwt  # noqa: E402
+from middleware import get_current_user, require_user  # noqa: E402
+from rate_limit import limiter  # noqa: E402
+
+init_db()
+_db = SessionLocal()
+_USER = User(github_id=9797, github_login="trace-admin")
+_db.add(_USER)
+_db.commit()
+_PAPER = Paper(arxiv_id="arxiv:9401.00001", title="Traced Paper", abstract="We time stages.",
+               authors=json.dumps(["A. Timer"]), user_id=_USER.id, status="saved")
+_db.add(_PAPER)
+_db.commit()
+_USER = _db.query(User).filter(User.id == _USER.id).first()
+_PAPER_PK = _PAPER.id
+_db.close()
+
+_app = FastAPI()
+_app.state.limiter = limiter
+_app.add_middleware(observability.TracingMiddleware)
+_app.include_router(webmcp.mcp_router)
+_app.dependency_overrides[require_user] = lambda: _USER
+_app.dependency_overrides[get_current_user] = lambda: _USER
+client = TestClient(_app)
+
+_SECTIONS = [
+    {"title": "Abstract", "content": "We time every stage. " * 30},
+    {"title": "3 Method", "content": "Spans wrap each stage. " * 40},
+    {"title": "5 Results", "content": "Stages add up. " * 40},
+]
+
+
+@contextlib.contextmanager
+def _settings(tracing: bool, admins: set = frozenset(), sample_rate: float = 0.0):
+    saved = (observability.TRACING_ENABLED, observability.ADMIN_GITHUB_LOGINS,
+             middleware.ADMIN_GITHUB_LOGINS, observability.PROFILE_SAMPLE_RATE, observability.PROFILE_DIR)
+    observability.TRACING_ENABLED = tracing
+    observability.ADMIN_GITHUB_LOGINS = middleware.ADMIN_GITHUB_LOGINS = set(admins)
+    observability.PROFILE_SAMPLE_RATE = sample_rate
+    observability.PROFILE_DIR = os.path.join(_TMP, "profiles")
+    try:
+        yield
+    finally:
+        (observability.TRACING_ENABLED, observability.ADMIN_GITHUB_LOGINS,
+         middleware.ADMIN_GITHUB_LOGINS, observability.PROFILE_SAMPLE_RATE, observability.PROFILE_DIR) = saved
+
+
+def _deep(**kwargs):
+    """POST /analyze-deep with HTML extraction and Gemini faked; returns (response, log lines)."""
+    def _gemini(api_key, prompt, model):
+        return json.dumps({"summary": "traced", "concepts": ["stage timing"], "methods": ["spans"]})
+
+    saved = (webmcp.fetch_arxiv_html, webmcp.check_extraction_quality, lp._CALLERS["gemini"])
+    webmcp.fetch_arxiv_html = lambda arxiv_id: {"sections": _SECTIONS, "full_text": "x" * 3000, "page_count": 3}
+    webmcp.check_extraction_quality = lambda extracted: {"is_sufficient": True}
+    lp._CALLERS["gemini"] = _gemini
+    lp.reset_provider_guards()
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            r = client.post("/api/mcp/analyze-deep",
+                            json={"paper_id": "9401.00001", "provider": "gemini", "api_key": "fake-key"}, **kwargs)
+    finally:
+        webmcp.fetch_arxiv_html, webmcp.check_extraction_quality, lp._CALLERS["gemini"] = saved
+        lp.reset_provider_guards()
+    traces = [json.loads(line) for line in out.getvalue().splitlines()
+              if line.startswith("{") and '"request_trace"' in line]
+    return r, traces
+
+
+def test_traced_deep_analysis_reports_stages():
+    with _settings(tracing=True):
+        r, [trace] = _deep()
+    assert r.json()["isError"] is False, r.text
+    timing = r.headers["server-timing"]
+    for stage in ("deep.html_fetch", "llm.deep", "llm.overview", "llm.synthesis", "db.commit", "usage.record",
+                  "graph.populate"):
+        assert f"{stage};dur=" in timing, timing
+    usage = next(s for s in trace["spans"] if s["name"] == "usage.record")
+    assert usage.get("parent") != "db.commit"  # telemetry writes are not part of the commit stage
+    assert timing.split(", ")[-1].startswith("total;dur=")
+    assert trace["route"] == "/api/mcp/analyze-deep" and trace["status"] == 200
+    passes = [s for s in trace["spans"] if s["name"].startswith("llm.") and s["name"] != "llm.deep"]
+    assert len(passes) == 4 and all(s["parent"] == "llm.deep" for s in passes)
+    assert "profile" not in trace and "x-macp-profile" not in r.headers
+
+
+def test_tracing_off_adds_nothing():
+    with _settings(tracing=False):
+        r, traces = _deep()
+    assert r.json()["isError"] is False
+    assert "server-timing" not in r.headers and traces == []
+
+
+def test_only_admins_can_profile():
+    token = create_jwt(_USER)
+    with _settings(tracing=False, admins={"someone-else"}):
+        r, traces = _deep(headers={"Authorization": f"Bearer {token}", "X-MACP-Profile": "1"})
+    assert "x-macp-profile" not in r.headers and traces == []
+
+    with _settings(tracing=False, admins={"trace-admin"}):
+        r, [trace] = _deep(headers={"Authorization": f"Bearer {token}", "X-MACP-Profile": "1"})
+    name = r.headers["x-macp-profile"]
+    assert trace["profile"]["path"].endswith(name) and os.path.getsize(trace["profile"]["path"]) > 0
+    assert trace["profile"]["top"] and "own_ms" in trace["profile"]["top"][0]
+    dumped = pstats.Stats(trace["profile"]["path"]).stats
+    assert any(function == "mcp_analyze_deep" for _, _, function in dumped)
+    assert "server-timing" in r.headers  # profiled requests are traced too
+
+
+def teardown_module(module):
+    """pytest shares one database across modules; keep this user's analyses and graph out of other tests."""
+    db = SessionLocal()
+    db.query(Analysis).filter(Analysis.paper_id == _PAPER_PK).delete(synchronize_session=False)
+    db.query(GraphEdge).filter(GraphEdge.user_id == _USER.id).delete(synchronize_session=False)
+    db.query(GraphNode).filter(GraphNode.user_id == _USER.id).delete(synchronize_session=False)
+    db.query(GraphSnapshot).filter(GraphSnapshot.user_id == _USER.id).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — LLM Usage Report
+===========================================
+Library-wide LLM usage from the llm_usage table: calls, failures, retries,
+tokens (cached included), cost in USD (unpriced calls counted apart),
+average and worst latency, grouped by any of
+day, user_id, provider, model, route, analysis_type and step. Read this
+before changing MODEL_TIERS: e.g. group by route,model,step to see what
+each routing decision costs per pass.
+
+Usage:
+    python usage_report.py [--group-by provider,model,route] [--days 30]
+                           [--user 12] [--provider gemini]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import TOOLS_DIR  # noqa: E402
+
+sys.path.insert(0, os.path.abspath(TOOLS_DIR))
+from database import SessionLocal, init_db  # noqa: E402
+from usage_store import GROUP_BY_FIELDS, usage_summary  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize LLM usage per provider, model, route and user")
+    parser.add_argument("--group-by", default="provider,model,route",
+                        help=f"Comma-separated fields: {', '.join(GROUP_BY_FIELDS)}")
+    parser.add_argument("--days", type=int, default=30, help="Look back this many days")
+    parser.add_argument("--user", type=int, default=None, help="Only this user id")
+    parser.add_argument("--provider", default=None, help="Only this provider")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        rows = usage_summary(
+            db,
+            tuple(f.strip() for f in args.group_by.split(",") if f.strip()),
+            days=args.days,
+            user_id=args.user,
+            provider=args.provider,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        db.close()
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+MACP Research Assistant — LLM Usage Store
+==========================================
+Aggregates the per-call telemetry llm_providers attaches to every analysis
+(_meta["calls"]: step, provider, model, route, wall time, outcome, tokens,
+cost) into the llm_usage table: one row of daily totals per user, provider,
+model, route, analysis type and step. That is what MODEL_TIERS routing is
+tuned from — tokens, cost, latency and failure rate per route and model.
+Cost covers the models in llm_providers.MODEL_PRICES; calls to other models
+are counted as unpriced. Analyses that failed are recorded too, through
+failed_analysis(): their calls are exactly what the failure rate needs.
+
+Rows are partial sums: record_llm_usage() adds to a key's row with one
+UPDATE ... SET calls = calls + n (no read-modify-write, so concurrent
+writers never lose increments) and inserts a row when there is none yet.
+Two writers may both insert for a new key; usage_summary() adds the rows
+up, so that needs no upsert.
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import LlmUsage, SessionLocal
+from llm_providers import USAGE_FIELDS
+from tracing import traced
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY_FIELDS = ("day", "user_id", "provider", "model", "route", "analysis_type", "step")
+
+_COUNTERS = ("calls", "failed", "retries") + USAGE_FIELDS + ("cost_usd", "unpriced", "total_ms")
+
+
+def _step_name(step: str) -> str:
+    """Pass name of a call: map steps ("map:3", "map:1-4") roll up into "map"."""
+    return step.split(":", 1)[0] or "abstract"
+
+
+def failed_analysis(calls: list[dict], analysis_type: str = "abstract") -> dict:
+    """Stand-in for an analysis that failed, carrying its CallLog records for record_llm_usage()."""
+    return {"_meta": {"analysis_type": analysis_type, "calls": calls}}
+
+
+def usage_rows(user_id: Optional[int], analyses: list[dict], day: Optional[str] = None) -> list[dict]:
+    """Per-key totals of the analyses' _meta["calls"], as llm_usage column values."""
+    day = day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    rows: dict[tuple, dict] = {}
+    for analysis in analyses:
+        meta = (analysis or {}).get("_meta") or {}
+        analysis_type = meta.get("analysis_type", "abstract")
+        for call in meta.get("calls") or []:
+            key = (call["provider"], call.get("model") or "", call.get("route") or "",
+                   analysis_type, _step_name(call.get("step", "")))
+            row = rows.setdefault(key, {
+                "day": day, "user_id": user_id, "provider": key[0], "model": key[1], "route": key[2],
+                "analysis_type": key[3], "step": key[4], **dict.fromkeys(_COUNTERS, 0), "max_ms": 0.0,
+            })
+            row["calls"] += 1
+            row["failed"] += call.get("outcome") != "ok"
+            row["retries"] += call.get("attempt", 1) > 1
+            for field in USAGE_FIELDS:
+                row[field] += call.get(field, 0)
+            if call.get("cost_usd") is not None:
+                row["cost_usd"] += call["cost_usd"]
+            elif call.get("usage_reported"):
+                row["unpriced"] += 1
+            row["total_ms"] += call.get("ms", 0.0)
+            row["max_ms"] = max(row["max_ms"], call.get("ms", 0.0))
+    return list(rows.values())
+
+
+@traced("usage.record")
+def record_llm_usage(user_id: Optional[int], analyses: list[dict]) -> int:
+    """
+    Add the LLM calls behind ``analyses`` to today's llm_usage totals.
+
+    Telemetry never fails the request that produced the analyses: database
+    errors are logged and 0 is returned. Returns the number of calls recorded.
+    """
+    rows = usage_rows(user_id, analyses)
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        for row in rows:
+            key = {field: row[field] for field in GROUP_BY_FIELDS}
+            matches = [
+                getattr(LlmUsage, field).is_(None) if value is None else getattr(LlmUsage, field) == value
+                for field, value in key.items()
+            ]
+            # One row per key takes the increments, even when concurrent inserts left several.
+            first = select(func.min(LlmUsage.id)).where(*matches).scalar_subquery()
+            query = db.query(LlmUsage).filter(LlmUsage.id == first)
+            increments = {getattr(LlmUsage, field): func.coalesce(getattr(LlmUsage, field), 0) + row[field]
+                          for field in _COUNTERS}
+            updated = query.update({
+                **increments,
+                LlmUsage.max_ms: case((func.coalesce(LlmUsage.max_ms, 0.0) < row["max_ms"], row["max_ms"]),
+                                      else_=LlmUsage.max_ms),
+                LlmUsage.updated_at: datetime.now(timezone.utc),
+            }, synchronize_session=False)
+            if not updated:
+                db.add(LlmUsage(**row))
+        db.commit()
+        return sum(row["calls"] for row in rows)
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.warning("LLM usage not recorded: %s", e)
+        return 0
+    finally:
+        db.close()
+
+
+def usage_summary(
+    db,
+    group_by: tuple[str, ...] = ("provider", "model", "route"),
+    days: int = 30,
+    user_id: Optional[int] = None,
+    provider: Optional[str] = None,
+) -> list[dict]:
+    """
+    Totals over the last ``days`` days, one dict per ``group_by`` combination,
+    optionally restricted to one user or provider. Besides the summed
+    counters (cost_usd rounded to 1e-6) each row has avg_ms, max_ms,
+    error_rate (failed / calls) and cache_hit_ratio (cached / input tokens).
+    Busiest groups first.
+    """
+    unknown = set(group_by) - set(GROUP_BY_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(sorted(unknown))}; use {', '.join(GROUP_BY_FIELDS)}")
+    since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    keys = [getattr(LlmUsage, field) for field in group_by]
+    sums = [func.sum(getattr(LlmUsage, field)).label(field) for field in _COUNTERS]
+    query = db.query(*keys, *sums, func.max(LlmUsage.max_ms).label("max_ms")).filter(LlmUsage.day >= since)
+    if user_id is not None:
+        query = query.filter(LlmUsage.user_id == user_id)
+    if provider:
+        query = query.filter(LlmUsage.provider == provider)
+    summary = []
+    for row in query.group_by(*keys).order_by(func.sum(LlmUsage.calls).desc()):
+        entry = row._asdict()
+        calls = entry["calls"] or 0
+        entry["total_ms"] = round(entry["total_ms"] or 0.0, 1)
+        entry["cost_usd"] = round(entry["cost_usd"] or 0.0, 6)
+        entry["avg_ms"] = round(entry["total_ms"] / calls, 1) if calls else 0.0
+        entry["error_rate"] = round(entry["failed"] / calls, 4) if calls else 0.0
+        entry["cache_hit_ratio"] = (
+            round(entry["cached_tokens"] / entry["input_tokens"], 4) if entry["input_tokens"] else 0.0
+        )
+        summary.append(entry)
+    return summary
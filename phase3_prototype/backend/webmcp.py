@@ -5,18 +5,24 @@ MACP Research Assistant — WebMCP Endpoints (Phase 3C)
 Response format follows MCP tool result convention.
 """
 
+import asyncio
 import json
 import logging
 import os
 import re
 import sys
+import threading
+from collections import Counter
 from datetime import datetime, timezone
+from itertools import combinations
 from typing import Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from sqlalchemy import bindparam, insert, update
 
-from config import TOOLS_DIR, RATE_LIMIT_AUTH_ANALYZE, RATE_LIMIT_AUTH_MCP
+from config import TOOLS_DIR, ANALYZE_BATCH_MAX_PAPERS, RATE_LIMIT_AUTH_ANALYZE, RATE_LIMIT_AUTH_MCP
 from database import (
     Analysis,
     GraphEdge,
@@ -25,23 +31,52 @@ from database import (
     Paper,
     SessionLocal,
     User,
+    insert_ignore,
     upsert_paper,
 )
 from middleware import get_current_user, require_user
 from rate_limit import limiter
 from github_storage import get_storage_service
+from graph_store import (
+    apply_graph_delta,
+    get_graph_index,
+    get_graph_snapshot,
+    graph_etag,
+    invalidate_graph_snapshot,
+    payload_etag,
+    snapshot_export,
+)
 
 # Add tools dir for imports
 sys.path.insert(0, os.path.abspath(TOOLS_DIR))
 from paper_fetcher import fetch_by_id, fetch_by_query, fetch_from_hysts, fetch_from_semantic_scholar, download_pdf, extract_text, check_extraction_quality, fetch_arxiv_html
 from llm_providers import (
+    CallLog,
     analyze_paper as _analyze_paper,
-    analyze_paper_deep as _analyze_deep,
+    analyze_paper_fanout,
+    analyze_paper_stream,
+    analyze_papers_batch,
     compute_agreement_detail,
+    analyze_paper_deep as _analyze_deep,
+    analyze_paper_mapreduce as _analyze_mapreduce,
     generate_consensus_synthesis,
+    update_agreement_state,
     deep_research as _deep_research,
     PROVIDERS,
 )
+from analysis_store import analysis_columns, save_analyses, sync_analyses
+from usage_store import GROUP_BY_FIELDS, failed_analysis, record_llm_usage, usage_summary
+from consensus_store import (
+    build_consensus,
+    consensus_inputs,
+    get_consensus_state,
+    manifest_entry,
+    reusable_synthesis,
+    save_consensus_state,
+    scoring_state,
+)
+from embedding_store import EmbeddingStore
+from tracing import span, traced
 from schema_validator import get_consensus_weights, get_consensus_min_agents
 
 logger = logging.getLogger(__name__)
@@ -72,19 +107,39 @@ class McpAnalyzeRequest(BaseModel):
     paper_id: str = Field(..., min_length=1)
     provider: str = Field(default="gemini")
     api_key: Optional[str] = Field(default=None)
+    hedge: bool = Field(default=False, description="Past the provider's p95 latency, also try the next-best provider with a server key (ignored with api_key)")
+
+
+class McpAnalyzeBatchRequest(BaseModel):
+    paper_ids: list[str] = Field(default=[], max_length=ANALYZE_BATCH_MAX_PAPERS)
+    all_unanalyzed: bool = Field(default=False, description="Analyze every library paper that has no analysis yet")
+    providers: list[str] = Field(default=["gemini"], min_length=1, description="Providers to spread the batch over")
+    api_keys: dict[str, str] = Field(default={}, description="Optional BYOK keys by provider")
+
+
+class McpAnalyzeFanoutRequest(BaseModel):
+    paper_id: str = Field(..., min_length=1)
+    providers: list[str] = Field(..., min_length=2, max_length=len(PROVIDERS), description="Providers to run concurrently")
+    api_keys: dict[str, str] = Field(default={}, description="Optional BYOK keys by provider")
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, le=120, description="Abandon providers that have not answered by then")
 
 
 class McpAnalyzeDeepRequest(BaseModel):
     paper_id: str = Field(..., min_length=1)
     provider: str = Field(default="gemini")
     api_key: Optional[str] = Field(default=None)
+    analysis_type: str = Field(
+        default="deep", pattern="^(deep|mapreduce)$",
+        description="deep: multi-pass over the key sections; mapreduce: every section, for long papers",
+    )
 
 
 class McpConsensusRequest(BaseModel):
     paper_id: str = Field(..., min_length=1)
     provider: str = Field(default="gemini", description="LLM provider for synthesis generation")
     api_key: Optional[str] = Field(default=None)
-    analysis_type: str = Field(default="abstract", pattern="^(abstract|deep)$", description="Compare only analyses of this type")
+    analysis_type: str = Field(default="abstract", pattern="^(abstract|deep|mapreduce)$", description="Compare only analyses of this type")
+    force_synthesis: bool = Field(default=False, description="Re-run the LLM synthesis even if the agreement score barely moved")
 
 
 class McpDeepResearchRequest(BaseModel):
@@ -103,7 +158,7 @@ class McpNoteRequest(BaseModel):
 
 
 class McpSyncRequest(BaseModel):
-    pass
+    full: bool = Field(default=False, description="Re-read the whole repository instead of only files changed since the last sync")
 
 
 class SubmitAnalysisContent(BaseModel):
@@ -128,7 +183,7 @@ class McpSubmitAnalysisRequest(BaseModel):
     """Phase 5A — any external agent submits a provenance-tracked analysis."""
     paper_id: str = Field(..., min_length=1)
     agent_id: str = Field(..., min_length=1, max_length=100, description="Submitting agent, e.g. claude_code, manus_ai")
-    analysis_type: str = Field(default="abstract", pattern="^(abstract|deep)$")
+    analysis_type: str = Field(default="abstract", pattern="^(abstract|deep|mapreduce)$")
     content: SubmitAnalysisContent
     continues_from: Optional[ContinuesFrom] = Field(default=None, description="Analysis this submission builds on (continuation chain)")
 
@@ -155,9 +210,30 @@ async def mcp_discovery():
             "method": "POST",
             "inputSchema": McpAnalyzeRequest.model_json_schema(),
         },
+        {
+            "name": "macp.analyze-stream",
+            "description": "AI analysis of a paper with the LLM response streamed; NDJSON field events as each field completes",
+            "endpoint": "/api/mcp/analyze-stream",
+            "method": "POST",
+            "inputSchema": McpAnalyzeRequest.model_json_schema(),
+        },
+        {
+            "name": "macp.analyze-batch",
+            "description": "Abstract analysis of many papers across providers; streams NDJSON results as they finish",
+            "endpoint": "/api/mcp/analyze-batch",
+            "method": "POST",
+            "inputSchema": McpAnalyzeBatchRequest.model_json_schema(),
+        },
+        {
+            "name": "macp.analyze-fanout",
+            "description": "Analyze one paper with several providers concurrently and score their agreement; streams NDJSON",
+            "endpoint": "/api/mcp/analyze-fanout",
+            "method": "POST",
+            "inputSchema": McpAnalyzeFanoutRequest.model_json_schema(),
+        },
         {
             "name": "macp.analyze-deep",
-            "description": "Deep full-text analysis of a paper using PDF extraction and multi-pass LLM",
+            "description": "Deep full-text analysis of a paper using PDF extraction and multi-pass (or map-reduce) LLM",
             "endpoint": "/api/mcp/analyze-deep",
             "method": "POST",
             "inputSchema": McpAnalyzeDeepRequest.model_json_schema(),
@@ -194,6 +270,24 @@ async def mcp_discovery():
             "endpoint": "/api/mcp/graph",
             "method": "GET",
         },
+        {
+            "name": "macp.graph-neighbors",
+            "description": "k-hop neighbourhood of a knowledge graph node (query: node_id, hops<=3, limit)",
+            "endpoint": "/api/mcp/graph/neighbors",
+            "method": "GET",
+        },
+        {
+            "name": "macp.graph-path",
+            "description": "Shortest path between two papers in the knowledge graph (query: source, target, max_hops)",
+            "endpoint": "/api/mcp/graph/path",
+            "method": "GET",
+        },
+        {
+            "name": "macp.graph-related",
+            "description": "Top-k papers sharing concepts/methods with a paper, weighted by concept rarity (query: k)",
+            "endpoint": "/api/mcp/graph/related/{paper_id}",
+            "method": "GET",
+        },
         {
             "name": "macp.consensus",
             "description": "Generate multi-agent consensus analysis for a paper (requires 2+ existing analyses)",
@@ -226,6 +320,7 @@ async def mcp_discovery():
             "description": "Force sync between database and GitHub repository",
             "endpoint": "/api/mcp/sync",
             "method": "POST",
+            "inputSchema": McpSyncRequest.model_json_schema(),
         },
     ]
     return {"tools": tools, "count": len(tools), "version": "0.4.0"}
@@ -292,38 +387,31 @@ async def mcp_analyze(
         if req.provider not in PROVIDERS:
             return mcp_response(f"Unknown provider: {req.provider}", is_error=True)
 
-        config = PROVIDERS[req.provider]
         authors = json.loads(paper.authors) if paper.authors else []
         abstract = paper.abstract or ""
 
         if not abstract:
             return mcp_response("Paper has no abstract", is_error=True)
 
+        log = CallLog()
         analysis = _analyze_paper(
             title=paper.title, authors=authors, abstract=abstract,
-            provider_id=req.provider, api_key_override=req.api_key,
+            provider_id=req.provider, api_key_override=req.api_key, hedge=req.hedge, log=log,
         )
 
         if not analysis:
+            record_llm_usage(user.id if user else None, [failed_analysis(log.calls)])
             return mcp_response("Analysis returned empty result", is_error=True)
 
-        provenance = json.dumps({"provider": req.provider, "model": config["model"]})
-        db_analysis = Analysis(
-            paper_id=paper.id, user_id=user.id if user else None,
-            provider=req.provider,
-            summary=analysis.get("summary", ""),
-            key_insights=json.dumps(analysis.get("key_insights", [])),
-            methodology=analysis.get("methodology", ""),
-            research_gaps=json.dumps(analysis.get("research_gaps", [])),
-            relevance_tags=json.dumps(analysis.get("relevance_tags", [])),
-            score=analysis.get("strength_score", 0),
-            provenance=provenance,
-        )
+        # A hedged request may have been answered by the backup provider.
+        provider = analysis["_meta"]["provider"]
+        db_analysis = Analysis(**analysis_columns(paper.id, user.id if user else None, provider, analysis))
         db.add(db_analysis)
         paper.status = "analyzed"
         db.commit()
         db.refresh(paper)        # reload attrs before session closes (prevents DetachedInstanceError)
         db.refresh(db_analysis)  # same — background task accesses these after db.close()
+        record_llm_usage(user.id if user else None, [analysis])
 
         # GitHub dual-write: save analysis with per-agent path (MACP v2.0)
         if user:
@@ -333,7 +421,7 @@ async def mcp_analyze(
                     await storage.save_analysis_per_agent(paper, db_analysis, analysis)
                     await storage.update_manifest_entry("analyses", paper.arxiv_id, {
                         "providers": [{
-                            "provider": req.provider,
+                            "provider": provider,
                             "type": "abstract",
                             "analyzed_at": __import__("datetime").datetime.now(
                                 __import__("datetime").timezone.utc).isoformat(),
@@ -350,19 +438,356 @@ async def mcp_analyze(
         db.close()
 
 
+# ---------------------------------------------------------------------------
+# Batch Analyze (topic onboarding)
+# ---------------------------------------------------------------------------
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data, default=str) + "\n"
+
+
+def _post_threadsafe(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, item) -> None:
+    """Hand ``item`` from a worker thread to an endpoint's stream; a no-op once the event loop is closed."""
+    try:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+    except RuntimeError:
+        pass
+
+
+@mcp_router.post("/analyze-batch")
+@limiter.limit(RATE_LIMIT_AUTH_ANALYZE)
+async def mcp_analyze_batch(
+    request: Request,
+    req: McpAnalyzeBatchRequest,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(require_user),
+):
+    """
+    Abstract analysis of many papers in one request, e.g. onboarding a topic.
+
+    Papers are spread over req.providers with per-provider concurrency caps
+    (llm_providers.analyze_papers_batch). The response streams NDJSON: a
+    "start" line, one "result" line per paper as soon as it finishes, and a
+    "done" line once every successful analysis is stored with a single bulk
+    INSERT. GitHub writes follow in one background task with one manifest
+    update. If the client disconnects, no more papers are started; those
+    already in flight are still stored.
+    """
+    unknown = [p for p in req.providers if p not in PROVIDERS]
+    if unknown:
+        return mcp_response(f"Unknown provider: {', '.join(unknown)}", is_error=True)
+    if not req.paper_ids and not req.all_unanalyzed:
+        return mcp_response("Provide paper_ids or set all_unanalyzed", is_error=True)
+
+    db = SessionLocal()
+    try:
+        skipped = []
+        if req.all_unanalyzed:
+            rows = db.query(Paper).filter(
+                Paper.user_id == user.id,
+                Paper.stale.isnot(True),
+                ~Paper.analyses.any(Analysis.stale.isnot(True)),
+            ).order_by(Paper.id).limit(ANALYZE_BATCH_MAX_PAPERS).all()
+        else:
+            wanted = list(dict.fromkeys(
+                pid if pid.startswith("arxiv:") else f"arxiv:{pid}" for pid in req.paper_ids
+            ))
+            found = {p.arxiv_id: p for p in db.query(Paper).filter(Paper.arxiv_id.in_(wanted))}
+            rows = [found[arxiv_id] for arxiv_id in wanted if arxiv_id in found]
+            skipped = [{"paper_id": arxiv_id, "reason": "not found"} for arxiv_id in wanted if arxiv_id not in found]
+
+        papers = []
+        for p in rows:
+            if not p.abstract:
+                skipped.append({"paper_id": p.arxiv_id, "reason": "no abstract"})
+                continue
+            papers.append({
+                "id": p.arxiv_id, "pk": p.id, "title": p.title,
+                "authors": json.loads(p.authors) if p.authors else [], "abstract": p.abstract,
+            })
+    finally:
+        db.close()
+
+    loop = asyncio.get_running_loop()
+    received: asyncio.Queue = asyncio.Queue()
+    disconnected = threading.Event()
+    outcome = {}
+
+    def _drive() -> None:
+        # The scheduler blocks while it waits for providers, so it runs on this
+        # one thread, which also closes it (see mcp_analyze_stream). After a
+        # client disconnect no more papers start, but the ones in flight are
+        # drained: every analysis paid for is saved and every failure recorded.
+        by_id = {p["id"]: p for p in papers}
+        results = analyze_papers_batch(papers, req.providers, api_keys=req.api_keys, stop=disconnected)
+        finished, failed = [], []
+        try:
+            for result in results:
+                if result["analysis"]:
+                    finished.append((by_id[result["paper_id"]], result["provider"], result["analysis"]))
+                else:
+                    failed.append(failed_analysis(result.pop("calls", [])))
+                if not disconnected.is_set():
+                    _post_threadsafe(loop, received, result)
+        finally:
+            results.close()
+            outcome["saved"] = save_analyses(user.id, finished)
+            outcome["failed"] = len(failed)
+            record_llm_usage(user.id, failed)
+            _post_threadsafe(loop, received, None)
+
+    async def _stream():
+        yield _ndjson({"event": "start", "total": len(papers), "skipped": skipped})
+        driver = asyncio.ensure_future(asyncio.to_thread(_drive))
+        try:
+            while (result := await received.get()) is not None:
+                yield _ndjson({"event": "result", **result})
+            await driver
+        finally:
+            disconnected.set()
+        saved = outcome["saved"]
+
+        storage = get_storage_service(user) if saved else None
+        if storage:
+            # Runs once the stream completes (the response's background tasks are read then).
+            background_tasks.add_task(
+                sync_analyses, storage, saved, f"Batch analysis: {len({p.id for p, _, _ in saved})} papers",
+            )
+
+        yield _ndjson({"event": "done", "analyzed": len(saved), "failed": outcome["failed"],
+                       "skipped": len(skipped)})
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
+# ---------------------------------------------------------------------------
+# Fan-out Analyze (several providers, one paper)
+# ---------------------------------------------------------------------------
+
+def _fanout_agreement(saved: list[tuple[Paper, Analysis, dict]], req: McpAnalyzeFanoutRequest) -> dict:
+    """Agreement detail over a fan-out's analyses, scored as /consensus would score them."""
+    analysis_dicts, _ = consensus_inputs([db_analysis for _, db_analysis, _ in saved])
+    embed_provider = next((p for p in req.providers if p in req.api_keys), req.providers[0])
+    db = SessionLocal()
+    try:
+        return compute_agreement_detail(
+            analysis_dicts,
+            weights=get_consensus_weights(),
+            semantic=True,
+            embed_provider=embed_provider,
+            api_key_override=req.api_keys.get(embed_provider),
+            embedding_cache=EmbeddingStore(db),
+        )
+    finally:
+        db.close()
+
+
+@mcp_router.post("/analyze-fanout")
+@limiter.limit(RATE_LIMIT_AUTH_ANALYZE)
+async def mcp_analyze_fanout(
+    request: Request,
+    req: McpAnalyzeFanoutRequest,
+    background_tasks: BackgroundTasks,
+    user: Optional[User] = Depends(get_current_user),
+):
+    """
+    Analyze one paper with several providers concurrently, ready for consensus.
+
+    Streams NDJSON: a "start" line, one "result" line per provider as it
+    completes (or is abandoned at deadline_seconds), an "agreement" line with
+    compute_agreement_detail() over the successful analyses when there are
+    at least two, and a "done" line. The analyses are stored with one bulk
+    INSERT, so /consensus can use them straight away; after a client
+    disconnect, once the providers still running have answered.
+    """
+    unknown = [p for p in req.providers if p not in PROVIDERS]
+    if unknown:
+        return mcp_response(f"Unknown provider: {', '.join(unknown)}", is_error=True)
+    providers = list(dict.fromkeys(req.providers))
+
+    db = SessionLocal()
+    try:
+        if not req.paper_id.startswith("arxiv:"):
+            req.paper_id = f"arxiv:{req.paper_id}"
+        paper = db.query(Paper).filter(Paper.arxiv_id == req.paper_id).first()
+        if not paper:
+            return mcp_response(f"Paper {req.paper_id} not found", is_error=True)
+        if not paper.abstract:
+            return mcp_response("Paper has no abstract", is_error=True)
+        snapshot = {
+            "id": paper.arxiv_id, "pk": paper.id, "title": paper.title,
+            "authors": json.loads(paper.authors) if paper.authors else [], "abstract": paper.abstract,
+        }
+    finally:
+        db.close()
+
+    loop = asyncio.get_running_loop()
+    received: asyncio.Queue = asyncio.Queue()
+    disconnected = threading.Event()
+    outcome = {}
+
+    def _drive() -> None:
+        # As in mcp_analyze_batch: one thread advances and closes the generator.
+        # Every provider starts at once, so after a client disconnect the rest
+        # are still drained (up to the deadline) and saved rather than discarded.
+        results = analyze_paper_fanout(
+            snapshot["title"], snapshot["authors"], snapshot["abstract"], providers,
+            api_keys=req.api_keys, deadline=req.deadline_seconds,
+        )
+        finished, failed = [], []
+        try:
+            for result in results:
+                if result["analysis"]:
+                    finished.append((snapshot, result["provider"], result["analysis"]))
+                else:
+                    failed.append(failed_analysis(result.pop("calls", [])))
+                if not disconnected.is_set():
+                    _post_threadsafe(loop, received, result)
+        finally:
+            results.close()
+            outcome["saved"] = save_analyses(user.id if user else None, finished)
+            record_llm_usage(user.id if user else None, failed)
+            _post_threadsafe(loop, received, None)
+
+    async def _stream():
+        yield _ndjson({"event": "start", "paper_id": snapshot["id"], "providers": providers,
+                       "deadline_seconds": req.deadline_seconds})
+        driver = asyncio.ensure_future(asyncio.to_thread(_drive))
+        abandoned = 0
+        try:
+            while (result := await received.get()) is not None:
+                abandoned += 1 if result["timed_out"] else 0
+                yield _ndjson({"event": "result", "paper_id": snapshot["id"], **result})
+            await driver
+        finally:
+            disconnected.set()
+        saved = outcome["saved"]
+
+        if len(saved) >= 2:
+            agreement = await asyncio.to_thread(_fanout_agreement, saved, req)
+            yield _ndjson({"event": "agreement", "paper_id": snapshot["id"], **agreement})
+
+        storage = get_storage_service(user) if user and saved else None
+        if storage:
+            background_tasks.add_task(sync_analyses, storage, saved, f"Fan-out analysis: {snapshot['id']}")
+
+        yield _ndjson({"event": "done", "analyzed": len(saved), "failed": len(providers) - len(saved) - abandoned,
+                       "abandoned": abandoned})
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
+# ---------------------------------------------------------------------------
+# Streamed Analyze (fields as the LLM writes them)
+# ---------------------------------------------------------------------------
+
+@mcp_router.post("/analyze-stream")
+@limiter.limit(RATE_LIMIT_AUTH_ANALYZE)
+async def mcp_analyze_stream(
+    request: Request,
+    req: McpAnalyzeRequest,
+    background_tasks: BackgroundTasks,
+    user: Optional[User] = Depends(get_current_user),
+):
+    """
+    /analyze with the provider's response streamed.
+
+    Streams NDJSON: a "start" line, a "field" line for each top-level field
+    of the analysis as soon as the provider has finished writing it, a
+    "restart" line if a response that was clearly not JSON was aborted and
+    retried, then "result" (stored and synced like /analyze) or "error".
+    The "result" analysis is authoritative: a hedge backup may have answered.
+    """
+    if req.provider not in PROVIDERS:
+        return mcp_response(f"Unknown provider: {req.provider}", is_error=True)
+
+    db = SessionLocal()
+    try:
+        if not req.paper_id.startswith("arxiv:"):
+            req.paper_id = f"arxiv:{req.paper_id}"
+        paper = db.query(Paper).filter(Paper.arxiv_id == req.paper_id).first()
+        if not paper:
+            return mcp_response(f"Paper {req.paper_id} not found", is_error=True)
+        if not paper.abstract:
+            return mcp_response("Paper has no abstract", is_error=True)
+        snapshot = {
+            "id": paper.arxiv_id, "pk": paper.id, "title": paper.title,
+            "authors": json.loads(paper.authors) if paper.authors else [], "abstract": paper.abstract,
+        }
+    finally:
+        db.close()
+
+    loop = asyncio.get_running_loop()
+    received: asyncio.Queue = asyncio.Queue()
+    disconnected = threading.Event()
+
+    def _drive() -> None:
+        # The generator is advanced and closed on this one thread: closing it
+        # from the event loop while a next() is blocked here would raise
+        # "generator already executing" when the client disconnects.
+        events = analyze_paper_stream(
+            snapshot["title"], snapshot["authors"], snapshot["abstract"], req.provider,
+            api_key_override=req.api_key, hedge=req.hedge,
+        )
+        try:
+            for event in events:
+                if disconnected.is_set():
+                    break
+                _post_threadsafe(loop, received, event)
+        finally:
+            events.close()
+            _post_threadsafe(loop, received, None)
+
+    async def _stream():
+        yield _ndjson({"event": "start", "paper_id": snapshot["id"], "provider": req.provider})
+        driver = asyncio.ensure_future(asyncio.to_thread(_drive))
+        analysis = None
+        try:
+            while (event := await received.get()) is not None:
+                if "analysis" in event:
+                    analysis = event["analysis"]
+                    if not analysis:
+                        record_llm_usage(user.id if user else None, [failed_analysis(event["calls"])])
+                elif event.get("restart"):
+                    yield _ndjson({"event": "restart"})
+                else:
+                    yield _ndjson({"event": "field", "name": event["field"], "value": event["value"]})
+            await driver
+        finally:
+            disconnected.set()
+
+        if not analysis:
+            yield _ndjson({"event": "error", "message": "Analysis returned empty result"})
+            return
+        provider = analysis["_meta"]["provider"]
+        saved = save_analyses(user.id if user else None, [(snapshot, provider, analysis)])
+        storage = get_storage_service(user) if user else None
+        if storage:
+            background_tasks.add_task(sync_analyses, storage, saved, f"Analysis: {snapshot['id']}")
+        yield _ndjson({"event": "result", "paper_id": snapshot["id"], "analysis": analysis})
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
 # ---------------------------------------------------------------------------
 # Graph population helper (P4.1 — Knowledge Graph)
 # ---------------------------------------------------------------------------
 
+@traced("graph.populate")
 def _populate_graph(db, paper: Paper, analysis: dict, user_id: Optional[int]) -> None:
     """
     Persist concept/method/author nodes and edges extracted from a deep analysis.
 
-    Called after each successful deep analysis. Uses upsert pattern:
-    - If a concept/method node already exists, increment paper_count.
-    - Create paper→concept (uses_concept), paper→method (uses_method),
-      paper→author (authored_by) edges.
-    - Cross-paper relates_to edges are built lazily in the /graph endpoint.
+    Called after each successful deep analysis. Set-based upsert — a constant
+    number of statements regardless of how many nodes the analysis yields:
+    - Compute every node_id up front and fetch the existing rows in one IN-query.
+    - Increment paper_count on existing nodes (one executemany UPDATE) and
+      bulk-insert the missing ones. Each mention counts once, as before.
+    - Insert the missing paper→concept (uses_concept), paper→method
+      (uses_method) and paper→author (authored_by) edges in one statement;
+      the graph_edges uniqueness index turns concurrent duplicates into no-ops.
+    - Fold the new nodes/edges into the user's materialized graph snapshot,
+      which also derives cross-paper relates_to edges (see graph_store).
     """
     from re import sub as re_sub
 
@@ -371,80 +796,76 @@ def _populate_graph(db, paper: Paper, analysis: dict, user_id: Optional[int]) ->
         slug = re_sub(r"[^a-z0-9]+", "_", label.lower().strip()).strip("_")
         return f"{node_type}_{slug[:80]}"
 
-    def _upsert_node(node_id: str, node_type: str, label: str) -> GraphNode:
-        node = db.query(GraphNode).filter(
-            GraphNode.node_id == node_id,
-            GraphNode.user_id == user_id,
-        ).first()
-        if node:
-            node.paper_count += 1
-            node.updated_at = __import__("datetime").datetime.now(
-                __import__("datetime").timezone.utc)
-        else:
-            node = GraphNode(
-                user_id=user_id,
-                node_id=node_id,
-                node_type=node_type,
-                label=label,
-                paper_count=1,
-            )
-            db.add(node)
-        db.flush()
-        return node
-
-    def _add_edge(source: GraphNode, target: GraphNode, edge_type: str) -> None:
-        exists = db.query(GraphEdge).filter(
-            GraphEdge.source_node_id == source.id,
-            GraphEdge.target_node_id == target.id,
-            GraphEdge.edge_type == edge_type,
-            GraphEdge.user_id == user_id,
-        ).first()
-        if not exists:
-            db.add(GraphEdge(
-                user_id=user_id,
-                source_node_id=source.id,
-                target_node_id=target.id,
-                edge_type=edge_type,
-            ))
+    def _results_field(field: str) -> list:
+        for section in analysis.get("section_analyses", []):
+            if section.get("pass") in ("results", "reduce"):
+                return section.get("data", {}).get(field, [])
+        return []
 
     try:
-        # Upsert paper node
-        paper_node = _upsert_node(paper.arxiv_id, "paper", paper.title)
-
-        # Author nodes (from paper metadata — free, no extraction needed)
+        # Node mentions in the order the per-node upsert used to visit them.
         authors = json.loads(paper.authors) if paper.authors else []
-        for author in authors[:5]:  # cap at 5 authors per paper
-            if not author or not author.strip():
-                continue
-            author_id = _node_id("author", author)
-            author_node = _upsert_node(author_id, "author", author)
-            _add_edge(paper_node, author_node, "authored_by")
-
-        # Concept nodes from PASS3
-        concepts = []
-        for section in analysis.get("section_analyses", []):
-            if section.get("pass") == "results":
-                concepts = section.get("data", {}).get("concepts", [])
-                break
-        for concept in concepts[:5]:  # max 5 per paper
-            if not concept or not str(concept).strip():
-                continue
-            c_id = _node_id("concept", str(concept))
-            c_node = _upsert_node(c_id, "concept", str(concept))
-            _add_edge(paper_node, c_node, "uses_concept")
+        concepts = _results_field("concepts")  # PASS3 / reduce
+        methods = _results_field("methods")    # PASS3 / reduce
+        mentions = [(paper.arxiv_id, "paper", paper.title, None)]
+        for items, node_type, edge_type in (
+            (authors, "author", "authored_by"),  # cap at 5 authors per paper
+            (concepts, "concept", "uses_concept"),  # max 5 per paper
+            (methods, "method", "uses_method"),  # max 5 per paper
+        ):
+            for item in items[:5]:
+                if not item or not str(item).strip():
+                    continue
+                mentions.append((_node_id(node_type, str(item)), node_type, str(item), edge_type))
+
+        counts = Counter(node_id for node_id, _, _, _ in mentions)
+        specs = {node_id: (node_type, label) for node_id, node_type, label, _ in reversed(mentions)}
+        now = datetime.now(timezone.utc)
+
+        existing = {
+            n.node_id: n for n in db.query(GraphNode).filter(
+                GraphNode.user_id == user_id,
+                GraphNode.node_id.in_(list(counts)),
+            )
+        }
+        if existing:
+            db.execute(
+                update(GraphNode.__table__)
+                .where(GraphNode.__table__.c.id == bindparam("b_id"))
+                .values(paper_count=GraphNode.__table__.c.paper_count + bindparam("b_n"), updated_at=now),
+                [{"b_id": n.id, "b_n": counts[node_id]} for node_id, n in existing.items()],
+            )
+        missing = [node_id for node_id in counts if node_id not in existing]
+        if missing:
+            db.execute(insert(GraphNode.__table__), [
+                {"user_id": user_id, "node_id": node_id, "node_type": specs[node_id][0],
+                 "label": specs[node_id][1], "paper_count": counts[node_id],
+                 "created_at": now, "updated_at": now}
+                for node_id in missing
+            ])
+        nodes = {
+            n.node_id: n for n in db.query(GraphNode).filter(
+                GraphNode.user_id == user_id,
+                GraphNode.node_id.in_(list(counts)),
+            ).populate_existing()
+        }
 
-        # Method nodes from PASS3
-        methods = []
-        for section in analysis.get("section_analyses", []):
-            if section.get("pass") == "results":
-                methods = section.get("data", {}).get("methods", [])
-                break
-        for method in methods[:5]:  # max 5 per paper
-            if not method or not str(method).strip():
-                continue
-            m_id = _node_id("method", str(method))
-            m_node = _upsert_node(m_id, "method", str(method))
-            _add_edge(paper_node, m_node, "uses_method")
+        node_pks = [n.id for n in nodes.values()]
+        paper_pk = nodes[paper.arxiv_id].id
+        wanted = list(dict.fromkeys(
+            (nodes[node_id].id, edge_type) for node_id, _, _, edge_type in mentions if edge_type
+        ))
+        linked = set(db.query(GraphEdge.target_node_id, GraphEdge.edge_type).filter(
+            GraphEdge.user_id == user_id,
+            GraphEdge.source_node_id == paper_pk,
+        ))
+        new_links = [(target_id, edge_type) for target_id, edge_type in wanted if (target_id, edge_type) not in linked]
+        if new_links:
+            db.execute(insert_ignore(db, GraphEdge.__table__), [
+                {"user_id": user_id, "source_node_id": paper_pk, "target_node_id": target_id,
+                 "edge_type": edge_type, "created_at": now}
+                for target_id, edge_type in new_links
+            ])
 
         db.commit()
         logger.info(
@@ -454,6 +875,17 @@ def _populate_graph(db, paper: Paper, analysis: dict, user_id: Optional[int]) ->
     except Exception:
         logger.exception("Graph population failed for %s — skipping", paper.arxiv_id)
         db.rollback()
+        return
+
+    try:
+        touched = db.query(GraphNode).filter(GraphNode.id.in_(node_pks)).all()
+        by_pk = {n.id: n for n in touched}
+        new_edges = [(by_pk[paper_pk], by_pk[target_id], edge_type) for target_id, edge_type in new_links]
+        apply_graph_delta(db, user_id, touched, new_edges)
+    except Exception:
+        logger.exception("Graph snapshot update failed for %s — rebuilt on next read", paper.arxiv_id)
+        db.rollback()
+        invalidate_graph_snapshot(db, user_id)
 
 
 # ---------------------------------------------------------------------------
@@ -468,7 +900,7 @@ async def mcp_analyze_deep(
     background_tasks: BackgroundTasks,
     user: Optional[User] = Depends(get_current_user),
 ):
-    """Deep full-text analysis: download PDF, extract text, multi-pass LLM analysis."""
+    """Deep full-text analysis: download PDF, extract text, multi-pass or map-reduce LLM analysis."""
     db = SessionLocal()
     try:
         if not req.paper_id.startswith("arxiv:"):
@@ -489,7 +921,8 @@ async def mcp_analyze_deep(
         extracted = None
         extraction_source = "pdf"
 
-        html_extracted = fetch_arxiv_html(arxiv_id)
+        with span("deep.html_fetch"):
+            html_extracted = fetch_arxiv_html(arxiv_id)
         if html_extracted and check_extraction_quality(html_extracted)["is_sufficient"]:
             extracted = html_extracted
             extraction_source = "html"
@@ -521,26 +954,29 @@ async def mcp_analyze_deep(
 
         sections = extracted.get("sections", [])
 
-        # Step 3: Multi-pass deep analysis
-        config = PROVIDERS[req.provider]
+        # Step 3: Multi-pass (or map-reduce) deep analysis
         authors = json.loads(paper.authors) if paper.authors else []
+        analyze = _analyze_mapreduce if req.analysis_type == "mapreduce" else _analyze_deep
 
-        analysis = _analyze_deep(
+        log = CallLog()
+        analysis = analyze(
             title=paper.title,
             authors=authors,
             sections=sections,
             provider_id=req.provider,
             api_key_override=req.api_key,
             extraction_source=extraction_source,
+            log=log,
         )
 
         if not analysis:
+            record_llm_usage(user.id if user else None, [failed_analysis(log.calls, req.analysis_type)])
             return mcp_response("Deep analysis returned empty result", is_error=True)
 
         # Step 4: Save to DB
         provenance = json.dumps({
-            "provider": req.provider, "model": config["model"],
-            "type": "deep", "page_count": extracted.get("page_count", 0),
+            "provider": req.provider, "model": analysis["_meta"]["model"],
+            "type": req.analysis_type, "page_count": extracted.get("page_count", 0),
         })
         db_analysis = Analysis(
             paper_id=paper.id, user_id=user.id if user else None,
@@ -553,11 +989,13 @@ async def mcp_analyze_deep(
             score=analysis.get("strength_score", 0),
             provenance=provenance,
         )
-        db.add(db_analysis)
-        paper.status = "analyzed"
-        db.commit()
-        db.refresh(paper)        # reload attrs before session closes (prevents DetachedInstanceError)
-        db.refresh(db_analysis)  # same — background task accesses these after db.close()
+        with span("db.commit"):
+            db.add(db_analysis)
+            paper.status = "analyzed"
+            db.commit()
+            db.refresh(paper)        # reload attrs before session closes (prevents DetachedInstanceError)
+            db.refresh(db_analysis)  # same — background task accesses these after db.close()
+        record_llm_usage(user.id if user else None, [analysis])
 
         # Step 4b: Populate knowledge graph nodes/edges (P4.1)
         _populate_graph(db, paper, analysis, user.id if user else None)
@@ -571,7 +1009,7 @@ async def mcp_analyze_deep(
                     await storage.update_manifest_entry("analyses", paper.arxiv_id, {
                         "providers": [{
                             "provider": req.provider,
-                            "type": "deep",
+                            "type": req.analysis_type,
                             "analyzed_at": __import__("datetime").datetime.now(
                                 __import__("datetime").timezone.utc).isoformat(),
                         }],
@@ -583,39 +1021,20 @@ async def mcp_analyze_deep(
                     try:
                         _db = SessionLocal()
                         _user_id = user.id
-                        gn_rows = _db.query(GraphNode).filter(
-                            GraphNode.user_id == _user_id
-                        ).limit(500).all()
-                        ge_rows = _db.query(GraphEdge).filter(
-                            GraphEdge.user_id == _user_id
-                        ).limit(2000).all()
-
-                        node_idx = {gn.id: i for i, gn in enumerate(gn_rows)}
-                        graph_json = {
-                            "generated": __import__("datetime").datetime.now(
-                                __import__("datetime").timezone.utc).isoformat(),
-                            "version": "1.0",
-                            "nodes": [gn.to_dict() for gn in gn_rows],
-                            "edges": [
-                                {
-                                    "source": node_idx[ge.source_node_id],
-                                    "target": node_idx[ge.target_node_id],
-                                    "type": ge.edge_type,
-                                }
-                                for ge in ge_rows
-                                if ge.source_node_id in node_idx and ge.target_node_id in node_idx
-                            ],
-                        }
+                        snap = get_graph_snapshot(_db, _user_id)
+                        graph_json = snapshot_export(snap) if snap else None
                         _db.close()
+                        if not graph_json:
+                            return
                         await storage.save_graph(graph_json)
-                        logger.info("Graph synced to GitHub for user %s: %d nodes", _user_id, len(gn_rows))
+                        logger.info("Graph synced to GitHub for user %s: %d nodes", _user_id, len(graph_json["nodes"]))
                     except Exception:
                         logger.exception("GitHub graph sync failed — skipping")
                 background_tasks.add_task(_sync_graph_to_github)
 
         return mcp_response({
             "paper_id": paper.arxiv_id,
-            "analysis_type": "deep",
+            "analysis_type": req.analysis_type,
             "page_count": extracted.get("page_count", 0),
             "sections_extracted": len(sections),
             "extraction_source": extraction_source,
@@ -689,7 +1108,7 @@ async def mcp_get_analysis(paper_id: str, user: Optional[User] = Depends(get_cur
         if not paper:
             return mcp_response(f"Paper {paper_id} not found", is_error=True)
 
-        analyses = db.query(Analysis).filter(Analysis.paper_id == paper.id).all()
+        analyses = db.query(Analysis).filter(Analysis.paper_id == paper.id, Analysis.stale.isnot(True)).all()
         return mcp_response({
             "paper_id": paper.arxiv_id,
             "title": paper.title,
@@ -711,6 +1130,7 @@ async def mcp_library(user: User = Depends(require_user)):
         papers = db.query(Paper).filter(
             Paper.user_id == user.id,
             Paper.status == "saved",
+            Paper.stale.isnot(True),
         ).all()
 
         # Auto-hydrate from GitHub if DB is empty but user has a connected repo
@@ -784,7 +1204,9 @@ async def mcp_list_notes(user: User = Depends(require_user)):
     """List all research notes for the current user."""
     db = SessionLocal()
     try:
-        notes = db.query(Note).filter(Note.user_id == user.id).order_by(Note.created_at.desc()).all()
+        notes = db.query(Note).filter(
+            Note.user_id == user.id, Note.stale.isnot(True),
+        ).order_by(Note.created_at.desc()).all()
         return mcp_response({
             "notes": [n.to_dict() for n in notes],
             "count": len(notes),
@@ -798,66 +1220,28 @@ async def mcp_list_notes(user: User = Depends(require_user)):
 # ---------------------------------------------------------------------------
 
 @mcp_router.get("/graph")
-async def mcp_graph(user: Optional[User] = Depends(get_current_user)):
-    """Get knowledge graph data for D3.js visualization."""
+async def mcp_graph(request: Request, response: Response, user: Optional[User] = Depends(get_current_user)):
+    """Get knowledge graph data for D3.js visualization.
+
+    Served from the user's materialized snapshot with an ETag; a matching
+    If-None-Match gets a bodiless 304.
+    """
     db = SessionLocal()
     try:
         user_id = user.id if user else None
 
-        # --- Rich graph from graph_nodes/graph_edges tables (P4.1) ---
-        db_nodes = db.query(GraphNode).filter(GraphNode.user_id == user_id).limit(500).all()
-
-        if db_nodes:
-            # Build index: db node id → position in nodes list
-            node_idx = {}
-            nodes = []
-            for gn in db_nodes:
-                node_idx[gn.id] = len(nodes)
-                nodes.append(gn.to_dict())
-
-            db_edges = db.query(GraphEdge).filter(GraphEdge.user_id == user_id).limit(2000).all()
-            edges = []
-            for ge in db_edges:
-                if ge.source_node_id in node_idx and ge.target_node_id in node_idx:
-                    edges.append({
-                        "source": node_idx[ge.source_node_id],
-                        "target": node_idx[ge.target_node_id],
-                        "type": ge.edge_type,
-                    })
-
-            # Cross-paper relates_to: papers sharing a concept node
-            concept_papers: dict[int, list[int]] = {}
-            for ge in db_edges:
-                if ge.edge_type == "uses_concept" and ge.source_node_id in node_idx:
-                    concept_papers.setdefault(ge.target_node_id, []).append(ge.source_node_id)
-            for concept_id, paper_db_ids in concept_papers.items():
-                unique_ids = list(set(paper_db_ids))
-                for i in range(len(unique_ids)):
-                    for j in range(i + 1, len(unique_ids)):
-                        if unique_ids[i] in node_idx and unique_ids[j] in node_idx:
-                            edges.append({
-                                "source": node_idx[unique_ids[i]],
-                                "target": node_idx[unique_ids[j]],
-                                "type": "relates_to",
-                            })
-
-            concept_count = sum(1 for n in nodes if n["type"] == "concept")
-            method_count = sum(1 for n in nodes if n["type"] == "method")
-            paper_count = sum(1 for n in nodes if n["type"] == "paper")
-            return mcp_response({
-                "nodes": nodes,
-                "edges": edges,
-                "stats": {
-                    "papers": paper_count,
-                    "concepts": concept_count,
-                    "methods": method_count,
-                    "connections": len(edges),
-                },
-            })
+        # --- Rich graph from the graph_snapshots materialization (P4.1) ---
+        snap = get_graph_snapshot(db, user_id)
+        if snap:
+            etag = graph_etag(user_id, snap.version)
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+            return mcp_response(snap.payload)
 
         # --- Fallback: legacy on-the-fly graph (no graph_nodes data yet) ---
         papers = db.query(Paper).limit(200).all()
-        analyses = db.query(Analysis).limit(500).all()
+        analyses = db.query(Analysis).filter(Analysis.stale.isnot(True)).limit(500).all()
 
         nodes = []
         edges = []
@@ -887,24 +1271,23 @@ async def mcp_graph(user: Optional[User] = Depends(get_current_user)):
                     "type": "analyzed_by",
                 })
 
-        tag_papers: dict[str, list[int]] = {}
+        tag_papers: dict[str, dict[int, None]] = {}
         for a in analyses:
+            if a.paper_id not in paper_idx:
+                continue
             tags = json.loads(a.relevance_tags) if a.relevance_tags else []
             for tag in tags:
-                tag_papers.setdefault(tag, []).append(a.paper_id)
+                tag_papers.setdefault(tag, {})[a.paper_id] = None
         for tag, pids in tag_papers.items():
-            unique_pids = list(set(pids))
-            for i in range(len(unique_pids)):
-                for j in range(i + 1, len(unique_pids)):
-                    if unique_pids[i] in paper_idx and unique_pids[j] in paper_idx:
-                        edges.append({
-                            "source": paper_idx[unique_pids[i]],
-                            "target": paper_idx[unique_pids[j]],
-                            "type": "shared_tag",
-                            "tag": tag,
-                        })
+            for p1, p2 in combinations(pids, 2):
+                edges.append({
+                    "source": paper_idx[p1],
+                    "target": paper_idx[p2],
+                    "type": "shared_tag",
+                    "tag": tag,
+                })
 
-        return mcp_response({
+        payload = json.dumps({
             "nodes": nodes,
             "edges": edges,
             "stats": {
@@ -913,11 +1296,85 @@ async def mcp_graph(user: Optional[User] = Depends(get_current_user)):
                 "methods": 0,
                 "connections": len(edges),
             },
+        }, default=str)
+        etag = payload_etag(payload)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        return mcp_response(payload)
+    finally:
+        db.close()
+
+
+def _graph_node_key(index, node_id: str) -> Optional[str]:
+    """Resolve a node id as given, or as an arXiv paper id without its prefix."""
+    if node_id in index.nodes:
+        return node_id
+    if not node_id.startswith("arxiv:") and f"arxiv:{node_id}" in index.nodes:
+        return f"arxiv:{node_id}"
+    return None
+
+
+@mcp_router.get("/graph/neighbors")
+async def mcp_graph_neighbors(
+    node_id: str,
+    hops: int = 1,
+    limit: int = 200,
+    user: Optional[User] = Depends(get_current_user),
+):
+    """k-hop neighbourhood of a graph node (paper, concept, method or author)."""
+    db = SessionLocal()
+    try:
+        index = get_graph_index(db, user.id if user else None)
+        key = _graph_node_key(index, node_id) if index else None
+        if not key:
+            return mcp_response(f"Graph node {node_id} not found", is_error=True)
+        return mcp_response(index.neighbourhood(key, max(1, min(hops, 3)), max(1, min(limit, 500))))
+    finally:
+        db.close()
+
+
+@mcp_router.get("/graph/path")
+async def mcp_graph_path(
+    source: str,
+    target: str,
+    max_hops: int = 6,
+    user: Optional[User] = Depends(get_current_user),
+):
+    """Shortest path between two papers through shared concepts, methods and authors."""
+    db = SessionLocal()
+    try:
+        index = get_graph_index(db, user.id if user else None)
+        src = _graph_node_key(index, source) if index else None
+        dst = _graph_node_key(index, target) if index else None
+        if not src or not dst:
+            return mcp_response(f"Graph node {source if not src else target} not found", is_error=True)
+        path = index.shortest_path(src, dst, max(1, min(max_hops, 10)))
+        return mcp_response({
+            "source": src,
+            "target": dst,
+            "path": path or [],
+            "hops": len(path) - 1 if path else None,
         })
     finally:
         db.close()
 
 
+@mcp_router.get("/graph/related/{paper_id}")
+async def mcp_graph_related(paper_id: str, k: int = 10, user: Optional[User] = Depends(get_current_user)):
+    """Top-k papers related by shared concepts/methods, rarer ones weighted higher."""
+    db = SessionLocal()
+    try:
+        index = get_graph_index(db, user.id if user else None)
+        key = _graph_node_key(index, paper_id) if index else None
+        if not key or index.nodes[key]["type"] != "paper":
+            return mcp_response(f"Paper {paper_id} not found in knowledge graph", is_error=True)
+        related = index.related_papers(key, max(1, min(k, 50)))
+        return mcp_response({"paper_id": key, "related": related, "count": len(related)})
+    finally:
+        db.close()
+
+
 # ---------------------------------------------------------------------------
 # 8. Deep Research (Phase 3E — Perplexity Web-Grounded)
 # ---------------------------------------------------------------------------
@@ -988,7 +1445,7 @@ async def mcp_consensus(
             return mcp_response(f"Paper {req.paper_id} not found", is_error=True)
 
         # Load all existing analyses for this paper
-        db_analyses = db.query(Analysis).filter(Analysis.paper_id == paper.id).all()
+        db_analyses = db.query(Analysis).filter(Analysis.paper_id == paper.id, Analysis.stale.isnot(True)).all()
 
         # CSO R rule: "Same paper, same type" — filter by analysis type
         filtered_analyses = []
@@ -1011,79 +1468,54 @@ async def mcp_consensus(
             )
 
         # Convert DB analyses to dicts for scoring
-        analysis_dicts = []
-        agents_compared = []
-        for a in filtered_analyses:
-            agent_id = a.provider or "unknown"
-            if agent_id not in agents_compared:
-                agents_compared.append(agent_id)
-            analysis_dicts.append({
-                "agent_id": agent_id,
-                "summary": a.summary or "",
-                "key_findings": json.loads(a.key_insights) if a.key_insights else [],
-                "methodology": a.methodology or "",
-                "relevance_score": (a.score or 5) / 10.0 if a.score and a.score > 1 else (a.score or 0.5),
-                "strength_score": a.score or 5,
-            })
+        analysis_dicts, agents_compared = consensus_inputs(filtered_analyses)
 
         # Compute agreement score with schema-defined weights.
         # Semantic mode uses embedding cosine similarity (paraphrase-robust)
         # and transparently falls back to lexical overlap when no embedding
         # provider is reachable. req.provider/req.api_key seed the embedding
         # provider selection (BYOK-aware); see resolve_embed_provider().
+        # Scoring is incremental: the persisted state already holds every
+        # pairwise similarity, so only analyses new since the last run are
+        # compared (O(N) each), and their embeddings come from embedding_cache.
+        state_row = get_consensus_state(db, paper.id, req.analysis_type)
         weights = get_consensus_weights()
-        agreement = compute_agreement_detail(
+        scoring, agreement = update_agreement_state(
+            scoring_state(state_row),
             analysis_dicts,
             weights=weights,
             semantic=True,
             embed_provider=req.provider,
             api_key_override=req.api_key,
+            embedding_cache=EmbeddingStore(db),
         )
         agreement_score = agreement["agreement_score"]
 
-        # Generate LLM synthesis
-        synthesis = generate_consensus_synthesis(
-            title=paper.title,
-            analyses=analysis_dicts,
-            provider_id=req.provider,
-            api_key_override=req.api_key,
+        # LLM synthesis only when the score moved past CONSENSUS_RESYNTHESIS_DELTA
+        synthesis = reusable_synthesis(state_row, agreement_score, force=req.force_synthesis)
+        synthesis_reused = synthesis is not None
+        synthesized_score = state_row.synthesized_score if synthesis_reused else None
+        if not synthesis_reused:
+            synthesis = generate_consensus_synthesis(
+                title=paper.title,
+                analyses=analysis_dicts,
+                provider_id=req.provider,
+                api_key_override=req.api_key,
+            )
+            if synthesis:
+                synthesized_score = agreement_score
+        logger.info(
+            "Consensus %s/%s: %d new pairs scored, synthesis %s",
+            paper.arxiv_id, req.analysis_type, agreement["pairs_computed"],
+            "reused" if synthesis_reused else "generated",
         )
 
         # Build consensus object per MACP v2.0 schema
-        now = __import__("datetime").datetime.now(__import__("datetime").timezone.utc)
-        consensus = {
-            "arxiv_id": paper.arxiv_id,
-            "agents_compared": agents_compared,
-            "generated_at": now.isoformat(),
-            "generated_by": req.provider,
-            "agreement_score": agreement_score,
-            "agreement_method": agreement["method"],
-            "agreement_components": agreement["components"],
-            "synthesized_summary": (synthesis or {}).get("synthesized_summary", ""),
-            "convergence_points": (synthesis or {}).get("convergence_points", []),
-            "divergence_points": (synthesis or {}).get("divergence_points", []),
-            "recommended_action": (synthesis or {}).get("recommended_action", "read_full_paper"),
-            "bias_cross_check": (synthesis or {}).get("bias_cross_check", ""),
-            "confidence_distribution": {
-                a["agent_id"]: a["relevance_score"] for a in analysis_dicts
-            },
-        }
+        consensus = build_consensus(
+            paper.arxiv_id, analysis_dicts, agents_compared, agreement, synthesis, req.provider,
+        )
 
-        # If LLM synthesis failed, build a basic consensus from analysis data
-        if not synthesis:
-            all_findings = []
-            for a in analysis_dicts:
-                all_findings.extend(a.get("key_findings", []))
-            # Deduplicate findings
-            seen = set()
-            unique_findings = []
-            for f in all_findings:
-                f_lower = f.lower().strip()
-                if f_lower not in seen:
-                    seen.add(f_lower)
-                    unique_findings.append(f)
-            consensus["synthesized_summary"] = f"Consensus from {len(agents_compared)} agents. Agreement score: {agreement_score:.2f}."
-            consensus["convergence_points"] = unique_findings[:5]
+        save_consensus_state(db, state_row, paper.id, req.analysis_type, scoring, consensus, synthesized_score)
 
         # GitHub dual-write
         if user:
@@ -1091,19 +1523,13 @@ async def mcp_consensus(
             if storage:
                 async def _sync_consensus():
                     await storage.save_consensus(paper.arxiv_id, consensus)
-                    await storage.update_manifest_entry("analyses", paper.arxiv_id, {
-                        "consensus": {
-                            "agreement_score": agreement_score,
-                            "agreement_method": agreement["method"],
-                            "agents": agents_compared,
-                            "generated_at": now.isoformat(),
-                        },
-                    })
+                    await storage.update_manifest_entry("analyses", paper.arxiv_id, manifest_entry(consensus))
                 background_tasks.add_task(_sync_consensus)
 
         return mcp_response({
             "paper_id": paper.arxiv_id,
             "consensus": consensus,
+            "synthesis_reused": synthesis_reused,
         })
 
     except Exception:
@@ -1274,16 +1700,46 @@ def mcp_agents():
     return mcp_response({"agents": providers, "count": len(providers)})
 
 
+# ---------------------------------------------------------------------------
+# 9b. LLM Usage (tokens, latency and failures per provider / model / route)
+# ---------------------------------------------------------------------------
+
+@mcp_router.get("/usage")
+def mcp_usage(
+    group_by: str = "provider,model,route",
+    days: int = 30,
+    provider: Optional[str] = None,
+    user: User = Depends(require_user),
+):
+    """The caller's LLM usage over the last ``days`` days, grouped by comma-separated llm_usage fields.
+
+    Library-wide totals across users are an operator query: usage_report.py.
+    """
+    fields = tuple(f.strip() for f in group_by.split(",") if f.strip() and f.strip() != "user_id")
+    if not fields or set(fields) - set(GROUP_BY_FIELDS):
+        return mcp_response(f"group_by takes {', '.join(f for f in GROUP_BY_FIELDS if f != 'user_id')}", is_error=True)
+    days = max(1, min(days, 365))
+    db = SessionLocal()
+    try:
+        rows = usage_summary(db, fields, days=days, user_id=user.id, provider=provider)
+        return mcp_response({"group_by": list(fields), "days": days, "usage": rows})
+    finally:
+        db.close()
+
+
 # ---------------------------------------------------------------------------
 # 10. Sync
 # ---------------------------------------------------------------------------
 
 @mcp_router.post("/sync")
-async def mcp_sync(user: User = Depends(require_user)):
-    """Force GitHub sync (hydration)."""
+async def mcp_sync(req: Optional[McpSyncRequest] = None, user: User = Depends(require_user)):
+    """Force GitHub sync. Incremental (changed files only) unless full=true."""
     storage = get_storage_service(user)
     if not storage:
         return mcp_response("No repository connected", is_error=True)
 
-    stats = await storage.hydrate_from_github()
+    if req and req.full:
+        stats = await storage.hydrate_from_github()
+    else:
+        stats = await storage.sync_from_github()
     return mcp_response({"status": "synced", "stats": stats})
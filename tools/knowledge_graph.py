@@ -8,10 +8,15 @@ between papers, learning sessions, citations, and projects.
 The knowledge graph is a JSON structure that can be visualized or queried
 to understand the full provenance chain of research insights.
 
+The graph is maintained incrementally: per-source change markers and
+per-record hashes let update_knowledge_graph() re-derive only the papers,
+sessions and citations that changed since the last run.
+
 Author: L (Godel), AI Agent & Project Founder
 Date: February 10, 2026
 """
 
+import hashlib
 import json
 import os
 import sys
@@ -44,139 +49,159 @@ def _load_json(filepath: str, default: dict = None) -> dict:
 
 
 # ---------------------------------------------------------------------------
-# Graph Builder
+# Graph Elements (one source record -> the nodes and edges it contributes)
 # ---------------------------------------------------------------------------
 
-def build_knowledge_graph() -> dict:
-    """
-    Build a knowledge graph from all MACP data sources.
-
-    The graph consists of:
-    - nodes: Papers, Learning Sessions, Citations, Projects, Agents
-    - edges: Relationships between nodes (discovered_by, analyzed_in, cited_in, etc.)
-
-    Returns:
-        A dict representing the knowledge graph.
-    """
-    papers_data = _load_json(PAPERS_FILE, {"papers": []})
-    log_data = _load_json(LEARNING_LOG_FILE, {"learning_sessions": []})
-    citations_data = _load_json(CITATIONS_FILE, {"citations": []})
-
-    nodes = []
+def _paper_elements(paper: dict) -> tuple:
+    paper_id = paper.get("id", "")
+    nodes = [{
+        "id": paper_id,
+        "type": "paper",
+        "label": paper.get("title", "")[:80],
+        "status": paper.get("status", "discovered"),
+        "date": paper.get("discovered_date", ""),
+        "url": paper.get("url", ""),
+    }]
     edges = []
-    projects = set()
-    agents = set()
-
-    # --- Paper Nodes ---
-    for paper in papers_data.get("papers", []):
-        paper_id = paper.get("id", "")
-        nodes.append({
-            "id": paper_id,
-            "type": "paper",
-            "label": paper.get("title", "")[:80],
-            "status": paper.get("status", "discovered"),
-            "date": paper.get("discovered_date", ""),
-            "url": paper.get("url", ""),
-        })
-
-        # Edge: discovered_by agent
-        discovered_by = paper.get("discovered_by", "")
-        if discovered_by:
-            agents.add(discovered_by)
-            edges.append({
-                "source": discovered_by,
-                "target": paper_id,
-                "type": "discovered",
-                "label": "discovered",
-            })
-
-    # --- Learning Session Nodes ---
-    sessions = log_data.get("learning_sessions", log_data.get("sessions", []))
-    for session in sessions:
-        session_id = session.get("session_id", "")
-        nodes.append({
-            "id": session_id,
-            "type": "learning_session",
-            "label": session.get("summary", "")[:80],
-            "date": session.get("date", ""),
-            "agent": session.get("agent", "human"),
-            "tags": session.get("tags", []),
-        })
 
-        # Edge: session -> paper (analyzed)
-        for paper_id in session.get("papers", []):
-            edges.append({
-                "source": session_id,
-                "target": paper_id,
-                "type": "analyzed",
-                "label": "synthesized from",
-            })
-
-        # Edge: agent -> session
-        agent = session.get("agent", "human")
-        agents.add(agent)
+    # Edge: discovered_by agent
+    discovered_by = paper.get("discovered_by", "")
+    if discovered_by:
         edges.append({
-            "source": agent,
-            "target": session_id,
-            "type": "created_by",
-            "label": "created by",
+            "source": discovered_by,
+            "target": paper_id,
+            "type": "discovered",
+            "label": "discovered",
         })
+    return nodes, edges
+
+
+def _session_elements(session: dict) -> tuple:
+    session_id = session.get("session_id", "")
+    nodes = [{
+        "id": session_id,
+        "type": "learning_session",
+        "label": session.get("summary", "")[:80],
+        "date": session.get("date", ""),
+        "agent": session.get("agent", "human"),
+        "tags": session.get("tags", []),
+    }]
+    edges = []
 
-    # --- Citation Nodes ---
-    for citation in citations_data.get("citations", []):
-        cite_id = citation.get("citation_id", "")
-        project = citation.get("cited_in", "")
-        projects.add(project)
-
-        nodes.append({
-            "id": cite_id,
-            "type": "citation",
-            "label": f"Citation in {project}",
-            "date": citation.get("date", ""),
-            "context": citation.get("context", "")[:120],
+    # Edge: session -> paper (analyzed)
+    for paper_id in session.get("papers", []):
+        edges.append({
+            "source": session_id,
+            "target": paper_id,
+            "type": "analyzed",
+            "label": "synthesized from",
         })
 
+    # Edge: agent -> session
+    edges.append({
+        "source": session.get("agent", "human"),
+        "target": session_id,
+        "type": "created_by",
+        "label": "created by",
+    })
+    return nodes, edges
+
+
+def _citation_elements(citation: dict) -> tuple:
+    cite_id = citation.get("citation_id", "")
+    project = citation.get("cited_in", "")
+    nodes = [{
+        "id": cite_id,
+        "type": "citation",
+        "label": f"Citation in {project}",
+        "date": citation.get("date", ""),
+        "context": citation.get("context", "")[:120],
+    }]
+    edges = [
         # Edge: citation -> paper
-        edges.append({
+        {
             "source": cite_id,
             "target": citation.get("paper_id", ""),
             "type": "cites",
             "label": "cites",
-        })
-
+        },
         # Edge: citation -> project
-        edges.append({
+        {
             "source": cite_id,
             "target": f"project:{project}",
             "type": "propagated_to",
             "label": "propagated to",
-        })
-
+        },
         # Edge: agent -> citation
-        cited_by = citation.get("cited_by", "human")
-        agents.add(cited_by)
-        edges.append({
-            "source": cited_by,
+        {
+            "source": citation.get("cited_by", "human"),
             "target": cite_id,
             "type": "cited_by",
             "label": "cited by",
-        })
+        },
+    ]
+    return nodes, edges
+
+
+# Source kind -> (record id field, element builder, node type it owns)
+_SOURCE_KINDS = {
+    "papers": ("id", _paper_elements, "paper"),
+    "sessions": ("session_id", _session_elements, "learning_session"),
+    "citations": ("citation_id", _citation_elements, "citation"),
+}
+
+# Edge type -> (source kind that owns it, endpoint holding the owning record's id)
+_EDGE_OWNERS = {
+    "discovered": ("papers", "target"),
+    "analyzed": ("sessions", "source"),
+    "created_by": ("sessions", "target"),
+    "cites": ("citations", "source"),
+    "propagated_to": ("citations", "source"),
+    "cited_by": ("citations", "target"),
+}
+
+
+def _source_files(macp_dir: str = None) -> dict:
+    """Source kind -> data file (module paths unless an explicit MACP dir is given)."""
+    if macp_dir is None:
+        return {"papers": PAPERS_FILE, "sessions": LEARNING_LOG_FILE, "citations": CITATIONS_FILE}
+    return {
+        "papers": os.path.join(macp_dir, "research_papers.json"),
+        "sessions": os.path.join(macp_dir, "learning_log.json"),
+        "citations": os.path.join(macp_dir, "citations.json"),
+    }
 
-    # --- Project Nodes ---
-    for project in projects:
-        nodes.append({
-            "id": f"project:{project}",
-            "type": "project",
-            "label": project,
-        })
 
-    # --- Agent Nodes ---
-    for agent in agents:
-        nodes.append({
-            "id": agent,
-            "type": "agent",
-            "label": agent,
-        })
+def _source_records(kind: str, data: dict) -> list:
+    if kind == "papers":
+        return data.get("papers", [])
+    if kind == "sessions":
+        return data.get("learning_sessions", data.get("sessions", []))
+    return data.get("citations", [])
+
+
+def _record_hash(record: dict) -> str:
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _derived_nodes(edges: list) -> list:
+    """Project and agent nodes implied by the edges, in first-seen order."""
+    projects = {}
+    agents = {}
+    for edge in edges:
+        if edge["type"] == "propagated_to":
+            projects.setdefault(edge["target"], None)
+        elif edge["type"] == "discovered" or edge["type"] == "cited_by" or edge["type"] == "created_by":
+            agents.setdefault(edge["source"], None)
+
+    nodes = [{"id": pid, "type": "project", "label": pid[len("project:"):]} for pid in projects]
+    nodes += [{"id": agent, "type": "agent", "label": agent} for agent in agents]
+    return nodes
+
+
+def _assemble(nodes: list, edges: list, sources: dict) -> dict:
+    """Wrap record nodes + edges into the graph document (derived nodes, statistics, markers)."""
+    nodes = nodes + _derived_nodes(edges)
 
     # --- Graph Statistics ---
     node_types = defaultdict(int)
@@ -187,11 +212,12 @@ def build_knowledge_graph() -> dict:
     for edge in edges:
         edge_types[edge["type"]] += 1
 
-    graph = {
+    return {
         "metadata": {
             "generated_at": datetime.now().isoformat(),
             "generator": "macp_knowledge_graph",
             "version": "1.0.0",
+            "sources": sources,
         },
         "statistics": {
             "total_nodes": len(nodes),
@@ -203,7 +229,151 @@ def build_knowledge_graph() -> dict:
         "edges": edges,
     }
 
-    return graph
+
+def _file_marker(path: str) -> dict:
+    """Cheap change marker for a source file: mtime + size (empty if missing)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+# ---------------------------------------------------------------------------
+# Graph Builder
+# ---------------------------------------------------------------------------
+
+def build_knowledge_graph(macp_dir: str = None) -> dict:
+    """
+    Build a knowledge graph from all MACP data sources.
+
+    The graph consists of:
+    - nodes: Papers, Learning Sessions, Citations, Projects, Agents
+    - edges: Relationships between nodes (discovered_by, analyzed_in, cited_in, etc.)
+
+    metadata.sources records a change marker per source file and a hash per
+    record, so update_knowledge_graph() can later apply only what changed.
+
+    Returns:
+        A dict representing the knowledge graph.
+    """
+    nodes = []
+    edges = []
+    sources = {}
+
+    for kind, path in _source_files(macp_dir).items():
+        id_field, elements, _ = _SOURCE_KINDS[kind]
+        marker = _file_marker(path)
+        raw = b""
+        if marker:
+            with open(path, "rb") as f:
+                raw = f.read()
+        records = _source_records(kind, json.loads(raw) if raw else {})
+        for record in records:
+            record_nodes, record_edges = elements(record)
+            nodes.extend(record_nodes)
+            edges.extend(record_edges)
+        sources[kind] = {
+            **marker,
+            "sha256": hashlib.sha256(raw).hexdigest(),
+            "records": {record.get(id_field, ""): _record_hash(record) for record in records},
+        }
+
+    return _assemble(nodes, edges, sources)
+
+
+def update_knowledge_graph(macp_dir: str = None, save: bool = True) -> tuple:
+    """
+    Bring the persisted knowledge graph up to date with the source files.
+
+    Each source is checked in increasing cost: file mtime/size marker, then
+    whole-file sha256, then per-record hashes. Only records that were added,
+    changed or removed are re-derived; untouched sources are not even read.
+    Falls back to a full build when no graph (or no markers) exists yet.
+
+    Returns (graph, changes) where changes is
+    {"mode": "full" | "incremental" | "unchanged", <kind>: {"added", "changed", "removed"}}.
+    """
+    graph_file = KNOWLEDGE_GRAPH_FILE if macp_dir is None else os.path.join(macp_dir, "knowledge_graph.json")
+    graph = _load_json(graph_file)
+    previous = graph.get("metadata", {}).get("sources")
+    if not previous or set(previous) != set(_SOURCE_KINDS):
+        graph = build_knowledge_graph(macp_dir)
+        if save:
+            _save_graph_files(graph, graph_file)
+        return graph, {"mode": "full"}
+
+    changes = {"mode": "unchanged"}
+    sources = dict(previous)
+    drop = set()      # (kind, record id) whose old elements must go
+    add = []          # (kind, record) to (re-)derive
+
+    for kind, path in _source_files(macp_dir).items():
+        prev = previous[kind]
+        marker = _file_marker(path)
+        if marker and marker.get("mtime_ns") == prev.get("mtime_ns") and marker.get("size") == prev.get("size"):
+            continue
+        raw = b""
+        if marker:
+            with open(path, "rb") as f:
+                raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == prev.get("sha256"):
+            sources[kind] = {**prev, **marker}  # touched but identical
+            continue
+
+        id_field = _SOURCE_KINDS[kind][0]
+        old_hashes = prev.get("records", {})
+        new_hashes = {}
+        kind_changes = {"added": 0, "changed": 0, "removed": 0}
+        for record in _source_records(kind, json.loads(raw) if raw else {}):
+            rid = record.get(id_field, "")
+            new_hashes[rid] = _record_hash(record)
+            if rid not in old_hashes:
+                kind_changes["added"] += 1
+                add.append((kind, record))
+            elif old_hashes[rid] != new_hashes[rid]:
+                kind_changes["changed"] += 1
+                drop.add((kind, rid))
+                add.append((kind, record))
+        for rid in old_hashes:
+            if rid not in new_hashes:
+                kind_changes["removed"] += 1
+                drop.add((kind, rid))
+
+        sources[kind] = {**marker, "sha256": digest, "records": new_hashes}
+        changes[kind] = kind_changes
+        changes["mode"] = "incremental"
+
+    if changes["mode"] == "unchanged":
+        if sources != previous and save:
+            # Only markers moved (touch); remember them so the next check stays cheap.
+            graph["metadata"]["sources"] = sources
+            _atomic_write_json(graph_file, graph)
+        return graph, changes
+
+    # Record nodes/edges minus the dropped records' contributions
+    node_kinds = {node_type: kind for kind, (_, _, node_type) in _SOURCE_KINDS.items()}
+    nodes = [
+        n for n in graph.get("nodes", [])
+        if n["type"] in node_kinds and (node_kinds[n["type"]], n["id"]) not in drop
+    ]
+    edges = []
+    for edge in graph.get("edges", []):
+        owner_kind, endpoint = _EDGE_OWNERS.get(edge["type"], (None, None))
+        if owner_kind and (owner_kind, edge[endpoint]) in drop:
+            continue
+        edges.append(edge)
+
+    for kind, record in add:
+        record_nodes, record_edges = _SOURCE_KINDS[kind][1](record)
+        nodes.extend(record_nodes)
+        edges.extend(record_edges)
+
+    graph = _assemble(nodes, edges, sources)
+    if save:
+        _save_graph_files(graph, graph_file)
+    return graph, changes
 
 
 def _atomic_write_json(filepath: str, data: dict) -> None:
@@ -231,11 +401,69 @@ def save_knowledge_graph(graph: dict) -> str:
     return KNOWLEDGE_GRAPH_FILE
 
 
+def save_mermaid(graph: dict, mermaid_file: str, index: dict = None) -> str:
+    """Write the Mermaid diagram for the graph (atomic write)."""
+    mermaid = generate_mermaid(graph, max_nodes=15, index=index)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(mermaid_file) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(mermaid)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, mermaid_file)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError as cleanup_err:
+            print(f"[WARN] Failed to clean up temp file: {cleanup_err}", file=sys.stderr)
+        raise
+    return mermaid_file
+
+
+def _save_graph_files(graph: dict, graph_file: str) -> None:
+    """Persist the graph JSON and its Mermaid diagram side by side."""
+    _atomic_write_json(graph_file, graph)
+    save_mermaid(graph, os.path.splitext(graph_file)[0] + ".mmd")
+
+
+# ---------------------------------------------------------------------------
+# Graph Index
+# ---------------------------------------------------------------------------
+
+def index_graph(graph: dict) -> dict:
+    """
+    Build lookup indexes for a loaded graph in one O(N + E) pass.
+
+    Returns a dict with:
+    - nodes_by_id: node id -> node (first occurrence wins)
+    - edges_from: node id -> outgoing edges, in graph order
+    - edges_to:   node id -> incoming edges, in graph order
+
+    Build it once per graph load and pass it to trace_provenance() /
+    generate_mermaid() instead of letting each call rescan the graph.
+    """
+    nodes_by_id = {}
+    for node in graph.get("nodes", []):
+        nodes_by_id.setdefault(node["id"], node)
+
+    edges_from = defaultdict(list)
+    edges_to = defaultdict(list)
+    for edge in graph.get("edges", []):
+        edges_from[edge["source"]].append(edge)
+        edges_to[edge["target"]].append(edge)
+
+    return {
+        "nodes_by_id": nodes_by_id,
+        "edges_from": dict(edges_from),
+        "edges_to": dict(edges_to),
+    }
+
+
 # ---------------------------------------------------------------------------
 # Provenance Tracer
 # ---------------------------------------------------------------------------
 
-def trace_provenance(paper_id: str, graph: dict) -> dict:
+def trace_provenance(paper_id: str, graph: dict, index: dict = None) -> dict:
     """
     Trace the full provenance chain for a specific paper.
 
@@ -243,45 +471,42 @@ def trace_provenance(paper_id: str, graph: dict) -> dict:
     - How the paper was discovered
     - What insights were synthesized from it
     - Where it has been cited (propagated)
+
+    Pass a prebuilt index_graph() result to avoid re-indexing per call;
+    cost is then proportional to the paper's own edges.
     """
+    if index is None:
+        index = index_graph(graph)
     if not paper_id.startswith("arxiv:"):
         paper_id = f"arxiv:{paper_id}"
 
-    # Find the paper node
-    paper_node = None
-    for node in graph.get("nodes", []):
-        if node["id"] == paper_id:
-            paper_node = node
-            break
-
+    nodes_by_id = index["nodes_by_id"]
+    paper_node = nodes_by_id.get(paper_id)
     if not paper_node:
         return {"error": f"Paper {paper_id} not found in knowledge graph"}
 
-    # Find all edges involving this paper
+    # Edges pointing at this paper, by type
     discovery_edges = []
     synthesis_edges = []
     propagation_edges = []
 
-    for edge in graph.get("edges", []):
-        if edge["target"] == paper_id and edge["type"] == "discovered":
+    for edge in index["edges_to"].get(paper_id, []):
+        if edge["type"] == "discovered":
             discovery_edges.append(edge)
-        elif edge["target"] == paper_id and edge["type"] == "analyzed":
+        elif edge["type"] == "analyzed":
             synthesis_edges.append(edge)
         elif edge["type"] == "cites":
-            # Check if this citation references our paper
-            cite_node_id = edge["source"]
-            if edge["target"] == paper_id:
-                # Find the project this citation propagated to
-                for e2 in graph.get("edges", []):
-                    if e2["source"] == cite_node_id and e2["type"] == "propagated_to":
-                        propagation_edges.append({**edge, "project": e2["target"]})
+            # Find the project this citation propagated to
+            for e2 in index["edges_from"].get(edge["source"], []):
+                if e2["type"] == "propagated_to":
+                    propagation_edges.append({**edge, "project": e2["target"]})
 
     # Resolve session summaries
     sessions = []
     for edge in synthesis_edges:
-        for node in graph.get("nodes", []):
-            if node["id"] == edge["source"] and node["type"] == "learning_session":
-                sessions.append(node)
+        node = nodes_by_id.get(edge["source"])
+        if node and node["type"] == "learning_session":
+            sessions.append(node)
 
     provenance = {
         "paper": paper_node,
@@ -302,17 +527,27 @@ def trace_provenance(paper_id: str, graph: dict) -> dict:
     return provenance
 
 
+def trace_provenance_batch(paper_ids: list, graph: dict, index: dict = None) -> dict:
+    """Trace many papers against one index. Returns {paper_id: provenance}."""
+    if index is None:
+        index = index_graph(graph)
+    return {paper_id: trace_provenance(paper_id, graph, index) for paper_id in paper_ids}
+
+
 # ---------------------------------------------------------------------------
 # Mermaid Diagram Generator
 # ---------------------------------------------------------------------------
 
-def generate_mermaid(graph: dict, max_nodes: int = 30) -> str:
+def generate_mermaid(graph: dict, max_nodes: int = 30, index: dict = None) -> str:
     """Generate a Mermaid diagram string from the knowledge graph."""
+    if index is None:
+        index = index_graph(graph)
     lines = ["graph LR"]
 
     # Add nodes (limited for readability)
     node_count = 0
     included_ids = set()
+    included_order = []
 
     for node in graph.get("nodes", []):
         if node_count >= max_nodes:
@@ -334,18 +569,20 @@ def generate_mermaid(graph: dict, max_nodes: int = 30) -> str:
         else:
             lines.append(f'    {nid}["{label}"]')
 
+        if node["id"] not in included_ids:
+            included_order.append(node["id"])
         included_ids.add(node["id"])
         node_count += 1
 
-    # Add edges for included nodes
-    for edge in graph.get("edges", []):
-        src = edge["source"]
-        tgt = edge["target"]
-        if src in included_ids and tgt in included_ids:
-            src_id = src.replace(":", "_").replace(" ", "_").replace("-", "_")
-            tgt_id = tgt.replace(":", "_").replace(" ", "_").replace("-", "_")
-            label = edge.get("label", "")
-            lines.append(f'    {src_id} -->|{label}| {tgt_id}')
+    # Add edges for included nodes — only their own outgoing edges are visited
+    for src in included_order:
+        for edge in index["edges_from"].get(src, []):
+            tgt = edge["target"]
+            if tgt in included_ids:
+                src_id = src.replace(":", "_").replace(" ", "_").replace("-", "_")
+                tgt_id = tgt.replace(":", "_").replace(" ", "_").replace("-", "_")
+                label = edge.get("label", "")
+                lines.append(f'    {src_id} -->|{label}| {tgt_id}')
 
     return "\n".join(lines)
 
@@ -355,12 +592,36 @@ def generate_mermaid(graph: dict, max_nodes: int = 30) -> str:
 # ---------------------------------------------------------------------------
 
 def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MACP Knowledge Graph Generator")
+    parser.add_argument("--trace", nargs="+", metavar="ARXIV_ID",
+                        help="Batch mode: print provenance for these papers from the saved graph")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild from scratch instead of applying only changed records")
+    args = parser.parse_args()
+
+    if args.trace:
+        graph = _load_json(KNOWLEDGE_GRAPH_FILE) or build_knowledge_graph()
+        print(json.dumps(trace_provenance_batch(args.trace, graph), indent=2))
+        return
+
     print("=" * 60)
     print("MACP Knowledge Graph Generator")
     print("=" * 60)
 
-    print("\n[1/3] Building knowledge graph from MACP data...")
-    graph = build_knowledge_graph()
+    if args.full:
+        print("\n[1/3] Building knowledge graph from MACP data...")
+        graph = build_knowledge_graph()
+        _save_graph_files(graph, KNOWLEDGE_GRAPH_FILE)
+        changes = {"mode": "full"}
+    else:
+        print("\n[1/3] Updating knowledge graph from changed MACP data...")
+        graph, changes = update_knowledge_graph()
+    print(f"  Mode: {changes['mode']}")
+    for kind in _SOURCE_KINDS:
+        if kind in changes:
+            print(f"  {kind}: {changes[kind]}")
 
     print("\n[2/3] Graph Statistics:")
     stats = graph["statistics"]
@@ -369,8 +630,8 @@ def main():
     print(f"  Node Types: {json.dumps(stats['node_types'], indent=4)}")
     print(f"  Edge Types: {json.dumps(stats['edge_types'], indent=4)}")
 
-    filepath = save_knowledge_graph(graph)
-    print(f"\n[3/3] Knowledge graph saved to: {filepath}")
+    print(f"\n[3/3] Knowledge graph saved to: {KNOWLEDGE_GRAPH_FILE}")
+    print(f"  Mermaid diagram: {os.path.splitext(KNOWLEDGE_GRAPH_FILE)[0]}.mmd")
 
     # Demo: Trace provenance for a paper
     papers = _load_json(PAPERS_FILE, {"papers": []})
@@ -381,24 +642,6 @@ def main():
         provenance = trace_provenance(demo_id, graph)
         print(json.dumps(provenance, indent=2))
 
-    # Generate Mermaid diagram (atomic write)
-    mermaid = generate_mermaid(graph, max_nodes=15)
-    mermaid_file = os.path.join(MACP_DIR, "knowledge_graph.mmd")
-    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(mermaid_file) or ".", suffix=".tmp")
-    try:
-        with os.fdopen(fd, "w") as f:
-            f.write(mermaid)
-            f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp_path, mermaid_file)
-    except Exception:
-        try:
-            os.unlink(tmp_path)
-        except OSError as cleanup_err:
-            print(f"[WARN] Failed to clean up temp file: {cleanup_err}", file=sys.stderr)
-        raise
-    print(f"\n--- Mermaid diagram saved to: {mermaid_file} ---")
-
     print("\n" + "=" * 60)
 
 
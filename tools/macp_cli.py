@@ -46,6 +46,8 @@ from llm_providers import (
     get_available_providers,
     select_provider,
     analyze_paper,
+    analyze_papers_batch,
+    provider_concurrency,
     PROVIDERS,
 )
 from risk_mitigation import check_for_sensitive_topics, warn_and_confirm
@@ -291,6 +293,27 @@ def save_citations(data: dict, force: bool = False) -> None:
     atomic_write_json(CITATIONS_FILE, data)
 
 
+# ---------------------------------------------------------------------------
+# Knowledge Graph: incremental refresh after data-changing commands
+# ---------------------------------------------------------------------------
+
+def _refresh_knowledge_graph() -> None:
+    """Fold this command's changes into knowledge_graph.json, if one is kept.
+
+    Only changed papers/sessions/citations are re-derived (see
+    knowledge_graph.update_knowledge_graph); a failure never fails the command.
+    """
+    if not os.path.exists(os.path.join(MACP_DIR, "knowledge_graph.json")):
+        return
+    try:
+        from knowledge_graph import update_knowledge_graph
+        _, changes = update_knowledge_graph(MACP_DIR)
+        if changes["mode"] != "unchanged":
+            print(f"[MACP] Knowledge graph updated ({changes['mode']})")
+    except Exception as e:
+        print(f"[WARN] Knowledge graph update skipped: {e}", file=sys.stderr)
+
+
 # ---------------------------------------------------------------------------
 # Command: discover
 # ---------------------------------------------------------------------------
@@ -389,6 +412,7 @@ def cmd_discover(args):
     print(f"\n[MACP Storage] Adding {len(all_papers)} papers to research_papers.json...")
     added, skipped = add_papers(all_papers, force=force)
     print(f"  Added: {added} | Skipped (duplicates): {skipped}")
+    _refresh_knowledge_graph()
 
     # Create research tree nodes for discovered papers
     for p in list(seen_ids.values()):
@@ -405,8 +429,55 @@ def cmd_discover(args):
 # Command: analyze
 # ---------------------------------------------------------------------------
 
+def _analysis_session(paper_id: str, title: str, provider_id: str, analysis: dict) -> dict:
+    """The learning session auto-created for an analysis."""
+    provider_info = PROVIDERS[provider_id]
+    insights = analysis.get("key_insights", [])
+    tags = analysis.get("relevance_tags", [])
+    summary_text = analysis.get("summary", title)
+    insight_text = "; ".join(insights[:3]) if insights else summary_text
+
+    session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    return {
+        "session_id": session_id,
+        "date": date.today().isoformat(),
+        "timestamp": datetime.now().isoformat(),
+        "summary": summary_text,
+        "key_insight": insight_text,
+        "papers": [paper_id],
+        "agent": f"{provider_info['name'].lower().replace(' ', '_')}:{provider_info['model']}",
+        "tags": [sanitize_tags(t)[0] if sanitize_tags(t) else t for t in tags] if tags else [],
+        "analysis": {
+            "provider": provider_id,
+            "model": provider_info["model"],
+            "methodology": analysis.get("methodology", ""),
+            "research_gaps": analysis.get("research_gaps", []),
+            "strength_score": analysis.get("strength_score", "N/A"),
+        },
+    }
+
+
+def _mark_paper_analyzed(papers_data: dict, paper_id: str, insights: list[str]) -> None:
+    """Set a paper's status to analyzed and merge in new insights (in memory)."""
+    for p in papers_data.get("papers", []):
+        if p["id"] == paper_id:
+            p["status"] = "analyzed"
+            existing_insights = p.get("insights", [])
+            for insight in insights:
+                if insight not in existing_insights:
+                    existing_insights.append(insight)
+            p["insights"] = existing_insights
+            break
+
+
 def cmd_analyze(args):
     """Send a paper to an LLM for AI-powered analysis and insight extraction."""
+    if args.batch or args.all_unanalyzed:
+        return cmd_analyze_batch(args)
+    if not args.arxiv_id:
+        print("[ERROR] Give an arXiv ID, --batch FILE or --all-unanalyzed.", file=sys.stderr)
+        return
+
     print("=" * 60)
     print("MACP Research Assistant - ANALYZE")
     print("  C-S-P Phase: SYNTHESIS (AI-powered deep analysis)")
@@ -537,27 +608,8 @@ def cmd_analyze(args):
         print(f"  Tags: {', '.join(tags)}")
 
     # --- Auto-create learning session ---
-    summary_text = analysis.get("summary", title)
-    insight_text = "; ".join(insights[:3]) if insights else summary_text
-
-    session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
-    session = {
-        "session_id": session_id,
-        "date": date.today().isoformat(),
-        "timestamp": datetime.now().isoformat(),
-        "summary": summary_text,
-        "key_insight": insight_text,
-        "papers": [paper_id],
-        "agent": f"{provider_info['name'].lower().replace(' ', '_')}:{provider_info['model']}",
-        "tags": [sanitize_tags(t)[0] if sanitize_tags(t) else t for t in tags] if tags else [],
-        "analysis": {
-            "provider": provider_id,
-            "model": provider_info["model"],
-            "methodology": methodology,
-            "research_gaps": gaps,
-            "strength_score": score,
-        },
-    }
+    session = _analysis_session(paper_id, title, provider_id, analysis)
+    session_id = session["session_id"]
 
     force = getattr(args, "force", False)
     log = load_learning_log()
@@ -565,16 +617,9 @@ def cmd_analyze(args):
     save_learning_log(log, force=force)
 
     # Update paper status + insights
-    for p in papers_data.get("papers", []):
-        if p["id"] == paper_id:
-            p["status"] = "analyzed"
-            existing_insights = p.get("insights", [])
-            for insight in insights:
-                if insight not in existing_insights:
-                    existing_insights.append(insight)
-            p["insights"] = existing_insights
-            break
+    _mark_paper_analyzed(papers_data, paper_id, insights)
     save_papers(papers_data, force=force)
+    _refresh_knowledge_graph()
 
     # --- Save to knowledge tree ---
     research_path = save_to_research_tree(paper, analysis=analysis, session=session)
@@ -587,6 +632,133 @@ def cmd_analyze(args):
     print("=" * 60)
 
 
+def _batch_paper_ids(path: str) -> list[str]:
+    """arXiv IDs from a batch file: one per line, blank lines and # comments ignored."""
+    with open(path, "r") as f:
+        raw = [line.split("#", 1)[0].strip() for line in f]
+    ids = [i if i.startswith("arxiv:") else f"arxiv:{i}" for i in raw if i]
+    return list(dict.fromkeys(ids))
+
+
+def cmd_analyze_batch(args):
+    """Analyze many papers at once, spread over the configured providers."""
+    print("=" * 60)
+    print("MACP Research Assistant - ANALYZE (batch)")
+    print("  C-S-P Phase: SYNTHESIS (AI-powered deep analysis)")
+    print("=" * 60)
+
+    force = getattr(args, "force", False)
+    papers_data = load_papers()
+    known = {p["id"]: p for p in papers_data.get("papers", [])}
+
+    # --- Resolve the papers ---
+    if args.all_unanalyzed:
+        papers = [p for p in papers_data.get("papers", []) if p.get("status") != "analyzed"]
+    else:
+        try:
+            wanted = _batch_paper_ids(args.batch)
+        except OSError as e:
+            print(f"[ERROR] Cannot read batch file: {e}", file=sys.stderr)
+            return
+        fetched = []
+        for paper_id in wanted:
+            if paper_id in known:
+                continue
+            try:
+                raw_id = paper_id.replace("arxiv:", "")
+                validate_arxiv_id(raw_id)
+                paper = fetch_by_id(raw_id)
+            except ValueError as e:
+                print(f"  [WARN] Skipping {paper_id}: {e}", file=sys.stderr)
+                continue
+            if paper:
+                fetched.append(paper)
+            else:
+                print(f"  [WARN] Could not fetch {paper_id} from arXiv, skipped.", file=sys.stderr)
+        if fetched:
+            add_papers(fetched)
+            print(f"\n  Added {len(fetched)} papers from arXiv.")
+            papers_data = load_papers()
+            known = {p["id"]: p for p in papers_data.get("papers", [])}
+        papers = [known[paper_id] for paper_id in wanted if paper_id in known]
+
+    no_abstract = [p["id"] for p in papers if not p.get("abstract")]
+    if no_abstract:
+        print(f"\n[WARN] Skipping {len(no_abstract)} papers without an abstract.", file=sys.stderr)
+    papers = [p for p in papers if p.get("abstract")]
+
+    # --- C4: Dual-use risk check, per paper ---
+    cleared = []
+    for p in papers:
+        matched_keywords = check_for_sensitive_topics(f"{p.get('title', '')} {p.get('abstract', '')}")
+        if matched_keywords and not warn_and_confirm(p["id"], matched_keywords):
+            print(f"  Skipping {p['id']}.")
+            continue
+        cleared.append(p)
+    papers = cleared
+
+    if not papers:
+        print("\n  Nothing to analyze.")
+        return
+
+    # --- Select providers ---
+    configured = [p["id"] for p in get_available_providers() if p["configured"]]
+    if args.provider:
+        providers = [p.strip() for p in args.provider.split(",") if p.strip()]
+    else:
+        providers = configured
+    providers = [p for p in providers if p in configured]
+    if not providers:
+        print("\n[ERROR] No configured LLM provider to run the batch on.", file=sys.stderr)
+        return
+
+    # --- Consent check (once for the whole batch) ---
+    if not args.yes:
+        print(f"\n[CONSENT] About to send {len(papers)} papers (title, authors, abstract) to:")
+        for pid in providers:
+            info = PROVIDERS[pid]
+            tier = "free tier" if info["free_tier"] else "costs may apply"
+            print(f"  - {info['name']} ({info['model']}, {tier}, {provider_concurrency(pid)} at a time)")
+        print()
+        try:
+            confirm = input("  Proceed? [y/N] ").strip().lower()
+        except (EOFError, KeyboardInterrupt):
+            confirm = "n"
+        if confirm != "y":
+            print("  Aborted by user.")
+            return
+
+    # --- Run; report each paper as it finishes ---
+    print(f"\n[Analyzing] {len(papers)} papers across {', '.join(providers)}...")
+    by_id = {p["id"]: p for p in papers}
+    sessions = []
+    done = 0
+    for result in analyze_papers_batch(papers, providers):
+        done += 1
+        paper = by_id[result["paper_id"]]
+        analysis = result["analysis"]
+        if not analysis:
+            print(f"  [{done}/{len(papers)}] FAILED  {paper['id']} (tried: {', '.join(result['attempts']) or 'none'})")
+            continue
+        print(f"  [{done}/{len(papers)}] {result['provider']:<10} {paper['id']}  "
+              f"score {analysis.get('strength_score', 'N/A')}/10  {paper.get('title', '')[:50]}")
+        session = _analysis_session(paper["id"], paper.get("title", "Unknown"), result["provider"], analysis)
+        sessions.append(session)
+        _mark_paper_analyzed(papers_data, paper["id"], analysis.get("key_insights", []))
+        save_to_research_tree(paper, analysis=analysis, session=session)
+
+    # --- Save once for the whole batch ---
+    if sessions:
+        log = load_learning_log()
+        log.setdefault("learning_sessions", []).extend(sessions)
+        save_learning_log(log, force=force)
+        save_papers(papers_data, force=force)
+        _refresh_knowledge_graph()
+
+    print(f"\n[MACP] Batch complete: {len(sessions)} analyzed, {len(papers) - len(sessions)} failed.")
+    print("=" * 60)
+
+
 # ---------------------------------------------------------------------------
 # Command: handoff
 # ---------------------------------------------------------------------------
@@ -738,8 +910,8 @@ def cmd_submit(args):
     arxiv_bare = paper_id.replace("arxiv:", "")
 
     analysis_type = args.type
-    if analysis_type not in ("abstract", "deep"):
-        print(f"[ERROR] --type must be 'abstract' or 'deep', got '{analysis_type}'", file=sys.stderr)
+    if analysis_type not in ("abstract", "deep", "mapreduce"):
+        print(f"[ERROR] --type must be 'abstract', 'deep' or 'mapreduce', got '{analysis_type}'", file=sys.stderr)
         return
 
     # --- Load the agent's analysis content ---
@@ -1128,6 +1300,7 @@ def cmd_learn(args):
             if args.summary not in paper.get("insights", []):
                 paper.setdefault("insights", []).append(args.summary)
     save_papers(papers_data, force=force)
+    _refresh_knowledge_graph()
 
     print(f"\n[SYNTHESIS] Learning session created: {session_id}")
     print(f"  Summary: {args.summary[:80]}...")
@@ -1180,6 +1353,7 @@ def cmd_cite(args):
         if paper["id"] == paper_id:
             paper["status"] = "cited"
     save_papers(papers_data, force=force)
+    _refresh_knowledge_graph()
 
     print(f"\n[PROPAGATION] Citation recorded: {citation['citation_id']}")
     print(f"  Paper: {paper_id}")
@@ -1676,8 +1850,12 @@ def main():
 
     # --- analyze ---
     p_analyze = subparsers.add_parser("analyze", help="AI-powered paper analysis (C-S-P: Synthesis)")
-    p_analyze.add_argument("arxiv_id", help="arXiv ID of the paper to analyze")
-    p_analyze.add_argument("--provider", help="LLM provider: gemini, anthropic, openai (default: auto-select)")
+    p_analyze.add_argument("arxiv_id", nargs="?", help="arXiv ID of the paper to analyze")
+    p_analyze.add_argument("--provider", help="LLM provider: gemini, anthropic, openai (default: auto-select); "
+                                              "comma-separated list in batch mode")
+    p_analyze.add_argument("--batch", metavar="FILE", help="Analyze every arXiv ID listed in FILE (one per line)")
+    p_analyze.add_argument("--all-unanalyzed", action="store_true",
+                           help="Analyze every paper in the knowledge base not yet analyzed")
     p_analyze.add_argument("--yes", "-y", action="store_true", help="Skip consent prompt")
     p_analyze.add_argument("--force", action="store_true", help="Bypass strict schema validation")
     p_analyze.set_defaults(func=cmd_analyze)
@@ -1700,7 +1878,7 @@ def main():
     )
     p_submit.add_argument("--paper", "-p", required=True, help="arXiv ID of the analyzed paper (e.g. 2402.05120)")
     p_submit.add_argument("--agent", "-a", required=True, help="Submitting agent ID (e.g. claude_code, manus_ai)")
-    p_submit.add_argument("--type", "-t", default="abstract", choices=["abstract", "deep"], help="Analysis type")
+    p_submit.add_argument("--type", "-t", default="abstract", choices=["abstract", "deep", "mapreduce"], help="Analysis type")
     p_submit.add_argument("--file", "-f", help="Path to a JSON file with the structured analysis content")
     p_submit.add_argument("--summary", "-s", help="Inline analysis summary (alternative to --file)")
     p_submit.add_argument("--findings", help="Semicolon-separated key findings (used with --summary)")
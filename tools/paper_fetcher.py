@@ -15,13 +15,17 @@ import re
 import sys
 import tempfile
 import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 from datetime import datetime, date
 from html.parser import HTMLParser
-from typing import Optional
+from typing import Iterator, Optional
 
 import jsonschema
 import requests
 
+from telemetry import cache_lookup, histogram
+from tracing import traced
+
 try:
     import fitz  # PyMuPDF
 except ImportError:
@@ -50,6 +54,37 @@ DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 ARXIV_ID_PATTERN = re.compile(r"^\d{4}\.\d{4,5}(v\d+)?$")
 QUERY_MAX_LENGTH = 500
 
+# ---------------------------------------------------------------------------
+# Fetch Timing (served on the backend's /metrics)
+# ---------------------------------------------------------------------------
+
+FETCH_SECONDS = histogram("macp_fetch_duration_seconds", "Paper-source request wall time by source and outcome",
+                          ("source", "outcome"))
+
+
+@contextmanager
+def _timed_fetch(source: str) -> Iterator[dict]:
+    """
+    Time the upstream request in the block under ``source``. The outcome is
+    "ok", "timeout" or "error" from how the block ends; the block may set
+    labels["outcome"] itself (e.g. for a non-200 it does not raise on).
+    """
+    with FETCH_SECONDS.time(source=source, outcome="ok") as labels:
+        try:
+            yield labels
+        except Exception as e:
+            labels["outcome"] = "timeout" if "Timeout" in type(e).__name__ else "error"
+            raise
+
+
+def _get(source: str, url: str, **kwargs) -> requests.Response:
+    """requests.get() with raise_for_status(), timed under ``source``."""
+    with _timed_fetch(source):
+        resp = requests.get(url, **kwargs)
+        resp.raise_for_status()
+    return resp
+
+
 # ---------------------------------------------------------------------------
 # Input Validation
 # ---------------------------------------------------------------------------
@@ -213,8 +248,7 @@ def fetch_by_date(target_date: str) -> list[dict]:
     target_date = validate_date(target_date)
     params = {"date": target_date}
     try:
-        resp = requests.get(HF_DAILY_PAPERS_API, params=params, timeout=30)
-        resp.raise_for_status()
+        resp = _get("hf_daily", HF_DAILY_PAPERS_API, params=params, timeout=30)
         data = resp.json()
     except requests.RequestException as e:
         print(f"[ERROR] HF Daily Papers API request failed: {e}", file=sys.stderr)
@@ -303,12 +337,12 @@ def fetch_by_query(query: str, limit: int = 10) -> list[dict]:
     limit = max(1, min(limit, 100))
 
     try:
-        resp = requests.get(
+        resp = _get(
+            "hf_search",
             HF_PAPER_SEARCH_API,
             params={"query": query, "limit": limit},
             timeout=30,
         )
-        resp.raise_for_status()
         data = resp.json()
     except requests.RequestException as e:
         print(f"[ERROR] HF Paper Search API request failed: {e}", file=sys.stderr)
@@ -353,8 +387,7 @@ def fetch_by_id(arxiv_id: str) -> Optional[dict]:
     arxiv_id = validate_arxiv_id(arxiv_id)
     params = {"id_list": arxiv_id, "max_results": 1}
     try:
-        resp = requests.get(ARXIV_API, params=params, timeout=30)
-        resp.raise_for_status()
+        resp = _get("arxiv", ARXIV_API, params=params, timeout=30)
     except requests.RequestException as e:
         print(f"[ERROR] arXiv API request failed: {e}", file=sys.stderr)
         return None
@@ -413,8 +446,7 @@ def fetch_from_semantic_scholar(query: str, limit: int = 10) -> list[dict]:
         headers["x-api-key"] = key
 
     try:
-        resp = requests.get(SEMANTIC_SCHOLAR_API, params=params, headers=headers, timeout=30)
-        resp.raise_for_status()
+        resp = _get("semantic_scholar", SEMANTIC_SCHOLAR_API, params=params, headers=headers, timeout=30)
     except requests.RequestException as e:
         print(f"[ERROR] Semantic Scholar search failed: {e}", file=sys.stderr)
         return []
@@ -463,7 +495,8 @@ def fetch_from_hysts(query: str, limit: int = 10, offset: int = 0) -> list[dict]
     offset = max(0, offset)
 
     try:
-        resp = requests.get(
+        resp = _get(
+            "hysts",
             f"{HYSTS_DATASET_API}/search",
             params={
                 "dataset": HYSTS_DATASET_NAME,
@@ -475,7 +508,6 @@ def fetch_from_hysts(query: str, limit: int = 10, offset: int = 0) -> list[dict]
             },
             timeout=30,
         )
-        resp.raise_for_status()
         data = resp.json()
     except requests.RequestException as e:
         print(f"[ERROR] hysts dataset search failed: {e}", file=sys.stderr)
@@ -535,7 +567,8 @@ def fetch_hysts_by_date(target_date: str, limit: int = 50) -> list[dict]:
     limit = max(1, min(limit, 100))
 
     try:
-        resp = requests.get(
+        resp = _get(
+            "hysts",
             f"{HYSTS_DATASET_API}/filter",
             params={
                 "dataset": HYSTS_DATASET_NAME,
@@ -546,7 +579,6 @@ def fetch_hysts_by_date(target_date: str, limit: int = 50) -> list[dict]:
             },
             timeout=30,
         )
-        resp.raise_for_status()
         data = resp.json()
     except requests.RequestException as e:
         print(f"[ERROR] hysts dataset filter failed: {e}", file=sys.stderr)
@@ -612,6 +644,7 @@ _HEADING_RE = re.compile(
 )
 
 
+@traced("pdf.download")
 def download_pdf(arxiv_id: str, dest_dir: str | None = None) -> str:
     """
     Download a PDF from arXiv.
@@ -639,10 +672,12 @@ def download_pdf(arxiv_id: str, dest_dir: str | None = None) -> str:
 
     # Skip download if already cached
     if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 1000:
+        cache_lookup("pdf", hits=1)
         return pdf_path
+    cache_lookup("pdf", misses=1)
 
     try:
-        with _httpx.Client(timeout=120, follow_redirects=True) as client:
+        with _timed_fetch("arxiv_pdf"), _httpx.Client(timeout=120, follow_redirects=True) as client:
             resp = client.get(url)
             resp.raise_for_status()
             with open(pdf_path, "wb") as f:
@@ -656,6 +691,7 @@ def download_pdf(arxiv_id: str, dest_dir: str | None = None) -> str:
     return pdf_path
 
 
+@traced("pdf.extract")
 def extract_text(pdf_path: str) -> dict:
     """
     Extract structured text from a PDF using PyMuPDF.
@@ -835,8 +871,10 @@ def fetch_arxiv_html(arxiv_id: str) -> Optional[dict]:
 
     url = ARXIV_HTML_URL.format(arxiv_id=clean_id)
     try:
-        with _httpx.Client(timeout=30, follow_redirects=True) as client:
+        with _timed_fetch("arxiv_html") as labels, _httpx.Client(timeout=30, follow_redirects=True) as client:
             resp = client.get(url)
+            if resp.status_code != 200:
+                labels["outcome"] = f"http_{resp.status_code}"
     except Exception as e:
         print(f"[WARN] HTML fetch failed for {clean_id}: {e}", file=sys.stderr)
         return None
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — In-Process Metrics
+=============================================
+Counters, gauges and histograms kept in this process's memory and rendered
+in the Prometheus text exposition format (0.0.4), so the backend can serve
+/metrics without a client library or an external service.
+
+Instrumented code declares its metrics once at import time and updates them
+with labels:
+
+    FETCH_SECONDS = histogram("macp_fetch_duration_seconds", "...", ("source", "outcome"))
+    FETCH_SECONDS.observe(0.42, source="arxiv", outcome="ok")
+
+Values that already live elsewhere (queue depths, pool usage, quotas) are
+read when /metrics is scraped: register_collector(fn), where fn returns
+(name, help, type, [(labels, value), ...]) tuples.
+
+Everything here is thread-safe and cheap enough for per-call use.
+"""
+
+import contextvars
+import math
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Seconds; covers fast DB-backed routes up to multi-minute deep analyses.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_LOCK = threading.Lock()
+_METRICS: dict[str, "_Metric"] = {}
+_COLLECTORS: list[Callable[[], list[tuple]]] = []
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonic total per label set."""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels_text(dict(zip(self.labelnames, key)))} {_number(value)}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Last value set (or adjusted) per label set."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count per label set."""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[dict]:
+        """Observe the block's wall time; the yielded dict may override labels (e.g. outcome) inside it."""
+        overrides: dict = {}
+        started = time.monotonic()
+        try:
+            yield overrides
+        finally:
+            self.observe(time.monotonic() - started, **{**labels, **overrides})
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self._header()
+        for key, (counts, total) in items:
+            labels = dict(zip(self.labelnames, key))
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                lines.append(f"{self.name}_bucket{_labels_text({**labels, 'le': _number(bound)})} {running}")
+            lines.append(f"{self.name}_sum{_labels_text(labels)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels_text(labels)} {running}")
+        return lines
+
+
+def _register(cls, name: str, help_text: str, labelnames: tuple[str, ...], **kwargs) -> _Metric:
+    """The metric called ``name``, created on first use (modules may be imported twice under tests)."""
+    with _LOCK:
+        metric = _METRICS.get(name)
+        if metric is None:
+            metric = _METRICS[name] = cls(name, help_text, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metric {name} already registered as a different {metric.type}")
+        return metric
+
+
+def counter(name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return _register(Counter, name, help_text, labelnames)
+
+
+def gauge(name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    return _register(Gauge, name, help_text, labelnames)
+
+
+def histogram(name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+def register_collector(collect: Callable[[], list[tuple]]) -> None:
+    """Add a scrape-time source of gauges: collect() -> [(name, help, type, [(labels, value), ...])]."""
+    with _LOCK:
+        if collect not in _COLLECTORS:
+            _COLLECTORS.append(collect)
+
+
+def render() -> str:
+    """Every metric and collector in the Prometheus text format."""
+    with _LOCK:
+        metrics = sorted(_METRICS.values(), key=lambda m: m.name)
+        collectors = list(_COLLECTORS)
+    lines: list[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    # Several collectors may report one family (e.g. executor queue depth);
+    # the exposition format wants its HELP/TYPE once, so merge by name.
+    families: dict[str, tuple[str, str, list]] = {}
+    for collect in collectors:
+        try:
+            collected = collect()
+        except Exception as e:  # a broken collector must not take /metrics down
+            lines.append(f"# collector {getattr(collect, '__name__', collect)} failed: {_escape(e)}")
+            continue
+        for name, help_text, kind, samples in collected:
+            families.setdefault(name, (help_text, kind, []))[2].extend(samples)
+    for name, (help_text, kind, samples) in families.items():
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+        lines.extend(f"{name}{_labels_text(labels)} {_number(value)}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics() -> None:
+    """Zero every metric (tests)."""
+    with _LOCK:
+        metrics = list(_METRICS.values())
+    for metric in metrics:
+        metric.clear()
+
+
+# ---------------------------------------------------------------------------
+# Cache Hit Ratios
+# ---------------------------------------------------------------------------
+# Every cache counts its lookups here; the hit ratio is derived at scrape time
+# (and can be recomputed over any window in PromQL from the counter).
+
+CACHE_LOOKUPS = counter("macp_cache_lookups_total", "Cache lookups by cache and result (hit or miss)",
+                        ("cache", "result"))
+
+
+def cache_lookup(cache: str, hits: int = 0, misses: int = 0) -> None:
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache=cache, result="miss")
+
+
+def _cache_hit_ratios() -> list[tuple]:
+    totals: dict[str, dict[str, float]] = {}
+    with CACHE_LOOKUPS._lock:
+        for (cache, result), value in CACHE_LOOKUPS._values.items():
+            totals.setdefault(cache, {})[result] = value
+    samples = [
+        ({"cache": cache}, round(t.get("hit", 0) / (t.get("hit", 0) + t.get("miss", 0)), 4))
+        for cache, t in sorted(totals.items()) if t.get("hit", 0) + t.get("miss", 0)
+    ]
+    return [("macp_cache_hit_ratio", "Hits / lookups since process start, per cache", "gauge", samples)]
+
+
+register_collector(_cache_hit_ratios)
+
+
+# ---------------------------------------------------------------------------
+# Executor Queue Depth
+# ---------------------------------------------------------------------------
+# Work pools are short-lived (one per hedged call, batch, fan-out, map step),
+# so they are tracked weakly and summed per name at scrape time.
+
+_EXECUTORS: "weakref.WeakSet[ThreadPoolExecutor]" = weakref.WeakSet()
+
+
+class _ContextExecutor(ThreadPoolExecutor):
+    """Runs each task in a copy of the submitter's contextvars, so request traces follow work into the pool."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def tracked_executor(max_workers: int, name: str) -> ThreadPoolExecutor:
+    """A ThreadPoolExecutor whose queued tasks and threads show up in /metrics under ``name``."""
+    pool = _ContextExecutor(max_workers=max_workers, thread_name_prefix=name)
+    _EXECUTORS.add(pool)
+    return pool
+
+
+def executor_samples(name: str, pool) -> tuple[tuple, tuple]:
+    """(queue depth, thread count) samples of one ThreadPoolExecutor-like pool, labelled ``name``."""
+    queue = getattr(pool, "_work_queue", None)
+    depth = queue.qsize() if queue is not None else 0
+    return ({"executor": name}, depth), ({"executor": name}, len(getattr(pool, "_threads", ())))
+
+
+def _executor_depths() -> list[tuple]:
+    depth: dict[str, int] = {}
+    threads: dict[str, int] = {}
+    for pool in list(_EXECUTORS):
+        (labels, queued), (_, running) = executor_samples(pool._thread_name_prefix, pool)
+        depth[labels["executor"]] = depth.get(labels["executor"], 0) + queued
+        threads[labels["executor"]] = threads.get(labels["executor"], 0) + running
+    return [
+        ("macp_executor_queue_depth", "Tasks waiting for a worker thread, per executor", "gauge",
+         [({"executor": name}, value) for name, value in sorted(depth.items())]),
+        ("macp_executor_threads", "Worker threads alive, per executor", "gauge",
+         [({"executor": name}, value) for name, value in sorted(threads.items())]),
+    ]
+
+
+register_collector(_executor_depths)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Tests for batch (analyze_papers_batch) and fan-out (analyze_paper_fanout) analysis.
+
+No network is used: _CALLERS is replaced with fakes that sleep briefly and
+record how many calls each provider had in flight.
+Run directly:  python tools/test_batch.py
+Or via pytest: pytest tools/test_batch.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+_KEYS = ("GEMINI_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY")
+
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active: dict[str, int] = {}
+        self.peak: dict[str, int] = {}
+        self.calls: dict[str, int] = {}
+
+    def caller(self, provider: str, delay: float = 0.02, fail: bool = False, slow_title: str = ""):
+        def _call(api_key, prompt, model):
+            with self.lock:
+                self.active[provider] = self.active.get(provider, 0) + 1
+                self.peak[provider] = max(self.peak.get(provider, 0), self.active[provider])
+                self.calls[provider] = self.calls.get(provider, 0) + 1
+            try:
+                time.sleep(0.3 if slow_title and slow_title in prompt else delay)
+                if fail:
+                    raise requests.ConnectionError("provider down")
+                return json.dumps({"summary": provider, "key_insights": ["x"], "strength_score": 6})
+            finally:
+                with self.lock:
+                    self.active[provider] -= 1
+        return _call
+
+
+def _papers(n: int) -> list[dict]:
+    return [{"id": f"arxiv:2401.{i:05d}", "title": f"Paper {i}", "authors": ["A"], "abstract": "Text."}
+            for i in range(n)]
+
+
+def _run(callers: dict, papers: list[dict], providers: list[str], keys=_KEYS, fanout=False, **kwargs) -> list[dict]:
+    saved_callers = dict(lp._CALLERS)
+    saved_env = {k: os.environ.get(k) for k in _KEYS}
+    lp._CALLERS.update(callers)
+    for k in _KEYS:
+        os.environ.pop(k, None)
+    for k in keys:
+        os.environ[k] = "fake-key"
+    lp.reset_provider_guards()
+    try:
+        if fanout:
+            paper = papers[0]
+            return list(lp.analyze_paper_fanout(paper["title"], paper["authors"], paper["abstract"], providers, **kwargs))
+        return list(lp.analyze_papers_batch(papers, providers, **kwargs))
+    finally:
+        lp._CALLERS.clear()
+        lp._CALLERS.update(saved_callers)
+        lp.reset_provider_guards()
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def test_per_provider_caps_are_respected():
+    rec = _Recorder()
+    results = _run(
+        {"gemini": rec.caller("gemini"), "openai": rec.caller("openai")},
+        _papers(12), ["gemini", "openai"], concurrency={"gemini": 3, "openai": 1},
+    )
+    assert len(results) == 12 and all(r["analysis"] for r in results)
+    assert rec.peak["gemini"] == 3 and rec.peak["openai"] == 1, rec.peak
+    # Least-loaded assignment keeps both providers busy.
+    assert rec.calls["gemini"] > rec.calls["openai"] > 0, rec.calls
+    assert sorted(r["paper_id"] for r in results) == [p["id"] for p in _papers(12)]
+
+
+def test_results_stream_in_completion_order():
+    rec = _Recorder()
+    results = _run({"gemini": rec.caller("gemini", slow_title="Paper 0")}, _papers(5), ["gemini"],
+                   concurrency={"gemini": 2})
+    assert results[-1]["paper_id"] == "arxiv:2401.00000", [r["paper_id"] for r in results]
+
+
+def test_stop_drains_the_papers_in_flight_and_starts_no_more():
+    rec, stop = _Recorder(), threading.Event()
+    call = rec.caller("gemini")
+
+    def _stopping(api_key, prompt, model):
+        try:
+            return call(api_key, prompt, model)
+        finally:
+            stop.set()  # e.g. the client disconnected while the first two papers ran
+
+    results = _run({"gemini": _stopping}, _papers(6), ["gemini"], concurrency={"gemini": 2}, stop=stop)
+    assert rec.calls["gemini"] == 2 and len(results) == 2 and all(r["analysis"] for r in results)
+
+
+def test_failed_paper_moves_to_another_provider():
+    rec = _Recorder()
+    results = _run(
+        {"gemini": rec.caller("gemini"), "openai": rec.caller("openai", fail=True)},
+        _papers(6), ["openai", "gemini"], concurrency={"gemini": 1, "openai": 2},
+    )
+    assert all(r["provider"] == "gemini" for r in results), results
+    assert any(r["attempts"] == ["openai", "gemini"] for r in results)
+
+
+def test_every_provider_failing_reports_the_paper():
+    rec = _Recorder()
+    results = _run({"openai": rec.caller("openai", fail=True)}, _papers(2), ["openai", "mystery"])
+    assert [r["analysis"] for r in results] == [None, None]
+    assert all(r["attempts"] == ["openai"] for r in results)
+
+
+def test_providers_without_keys_are_skipped():
+    rec = _Recorder()
+    results = _run({"gemini": rec.caller("gemini")}, _papers(2), ["anthropic"], keys=("GEMINI_API_KEY",))
+    assert [r["provider"] for r in results] == [None, None] and rec.calls == {}
+
+
+def test_fanout_runs_providers_concurrently():
+    rec = _Recorder()
+    started = time.monotonic()
+    results = _run(
+        {"gemini": rec.caller("gemini", delay=0.3), "openai": rec.caller("openai", delay=0.05),
+         "anthropic": rec.caller("anthropic", delay=0.15)},
+        _papers(1), ["gemini", "openai", "anthropic"], fanout=True,
+    )
+    # Slowest provider, not the sum of all three.
+    assert time.monotonic() - started < 0.45
+    assert [r["provider"] for r in results] == ["openai", "anthropic", "gemini"], results
+    assert all(r["analysis"] and not r["timed_out"] for r in results)
+
+
+def test_fanout_deadline_abandons_stragglers():
+    rec = _Recorder()
+    started = time.monotonic()
+    results = _run(
+        {"gemini": rec.caller("gemini", delay=0.02), "openai": rec.caller("openai", delay=1.0)},
+        _papers(1), ["gemini", "openai"], fanout=True, deadline=0.2,
+    )
+    assert time.monotonic() - started < 0.6
+    assert [(r["provider"], r["timed_out"]) for r in results] == [("gemini", False), ("openai", True)]
+    assert results[1]["analysis"] is None
+
+
+def test_concurrency_env_override():
+    os.environ["MACP_PROVIDER_CONCURRENCY"] = "gemini=7, openai=x"
+    try:
+        assert lp.provider_concurrency("gemini") == 7
+        assert lp.provider_concurrency("openai") == lp.DEFAULT_PROVIDER_CONCURRENCY
+    finally:
+        os.environ.pop("MACP_PROVIDER_CONCURRENCY")
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
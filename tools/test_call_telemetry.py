@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Tests for per-call LLM telemetry: the CallLog records _call_provider() keeps
+(step, model, route, wall time, outcome, attempt, tokens), the usage the
+streaming callers pick up from server-sent events, and the calls and totals
+every analysis carries in _meta.
+
+No network is used: _CALLERS entries are fakes (reusing test_provider_health's
+_Env) and requests.post returns a fake server-sent-events stream.
+Run directly:  python tools/test_call_telemetry.py
+Or via pytest: pytest tools/test_call_telemetry.py
+"""
+
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+from test_provider_health import _Env, _fake  # noqa: E402
+
+_SECTIONS = [
+    {"title": "Abstract", "content": "We measure calls. " * 40},
+    {"title": "3 Method", "content": "Every call is timed. " * 60},
+    {"title": "5 Results", "content": "Tokens add up. " * 60},
+]
+
+
+def _reporting(provider: str, tokens_in: int = 300, tokens_out: int = 40):
+    """A fake caller that answers and reports Gemini-style usage, as the real callers do."""
+    answer = _fake(provider)
+
+    def _call(api_key, prompt, model):
+        lp._note_usage({"usageMetadata": {"promptTokenCount": tokens_in, "candidatesTokenCount": tokens_out}})
+        return answer(api_key, prompt, model)
+    return _call
+
+
+class _SseResponse:
+    """A streamed response whose lines are the given server-sent events."""
+
+    def __init__(self, events: list[dict]):
+        self.lines = [f"data: {json.dumps(e)}" for e in events]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+
+def _stream_call(provider: str, stream, events: list[dict]) -> lp.CallLog:
+    """One _call_provider() call that drains ``stream`` against a fake requests.post; returns its log."""
+    log = lp.CallLog()
+    saved = requests.post
+    requests.post = lambda url, **kwargs: _SseResponse(events)
+    lp.reset_provider_guards()
+    try:
+        lp._call_provider(provider, "k", "p", "m", caller=lambda k, p, m: "".join(stream(k, p, m)), log=log)
+    finally:
+        requests.post = saved
+        lp.reset_provider_guards()
+    return log
+
+
+def test_call_log_counts_attempts_failures_and_tokens():
+    log = lp.CallLog()
+    log.record("overview", "gemini", "m", "deep->standard", 1.2, "timeout", None)
+    log.record("overview", "gemini", "m", "deep->standard", 0.8, "ok", {"input_tokens": 100, "output_tokens": 10})
+    log.record("synthesis", "gemini", "m", "deep->standard", 0.5, "ok", {"input_tokens": 50, "cached_tokens": 40})
+    assert [c["attempt"] for c in log.calls] == [1, 2, 1]
+    assert log.calls[0]["ms"] == 1200.0 and log.calls[0]["usage_reported"] is False
+    assert log.totals() == {"calls": 3, "failed": 1, "retries": 1, "ms": 2500.0, "reported": 2,
+                            "input_tokens": 150, "output_tokens": 10, "cached_tokens": 40, "cache_write_tokens": 0,
+                            "cost_usd": 0.0, "unpriced": 2}
+
+
+def test_calls_are_costed_at_the_model_price():
+    usage = {"input_tokens": 1_000_000, "output_tokens": 100_000,
+             "cached_tokens": 600_000, "cache_write_tokens": 200_000}
+    # 200k fresh at 3.00 + 600k cached at 0.30 + 200k written at 3.75 + 100k out at 15.00
+    assert lp.call_cost("claude-sonnet-4-6", usage) == 3.03
+    assert lp.call_cost("gpt-4o-mini", {"input_tokens": 2_000_000}) == 0.3
+    assert lp.call_cost("unlisted-model", usage) is None and lp.call_cost("gpt-4o-mini", None) is None
+
+    log = lp.CallLog()
+    log.record("abstract", "openai", "gpt-4o-mini", "abstract->lite", 0.1, "ok", {"input_tokens": 2_000_000})
+    log.record("abstract", "gemini", "unlisted-model", "abstract->lite", 0.1, "ok", usage)
+    assert log.calls[0]["cost_usd"] == 0.3 and log.calls[1]["cost_usd"] is None
+    assert log.totals()["cost_usd"] == 0.3 and log.totals()["unpriced"] == 1
+
+
+def test_abstract_analysis_meta_has_calls_usage_and_timing():
+    with _Env({"gemini": _reporting("gemini")}, keys=("GEMINI_API_KEY",)):
+        analysis = lp.analyze_paper("T", ["A"], "Abstract.", provider_id="gemini", hedge=False)
+    meta = analysis["_meta"]
+    [call] = meta["calls"]
+    assert call["step"] == "abstract" and call["provider"] == "gemini" and call["outcome"] == "ok"
+    assert call["model"] == meta["model"] and call["route"] == meta["model_route"]
+    assert meta["usage"]["input_tokens"] == 300 and meta["usage"]["output_tokens"] == 40
+    assert meta["elapsed_ms"] >= call["ms"] >= 0
+
+
+def test_hedged_analysis_logs_the_failed_primary_and_the_backup():
+    callers = {"gemini": _fake("gemini", fail=True), "openai": _reporting("openai")}
+    with _Env(callers, keys=("GEMINI_API_KEY", "OPENAI_API_KEY")):
+        analysis = lp.analyze_paper("T", ["A"], "Abstract.", provider_id="gemini", hedge=True)
+    meta = analysis["_meta"]
+    assert meta["provider"] == "openai" and meta["hedged"] is True
+    assert sorted((c["provider"], c["outcome"], c["attempt"]) for c in meta["calls"]) == [
+        ("gemini", "error", 1), ("openai", "ok", 2)]
+    assert meta["usage"]["failed"] == 1 and meta["usage"]["retries"] == 1
+
+
+def test_deep_analysis_records_one_call_per_pass():
+    with _Env({"gemini": _reporting("gemini")}, keys=("GEMINI_API_KEY",)):
+        analysis = lp.analyze_paper_deep("T", ["A"], _SECTIONS, "gemini")
+    meta = analysis["_meta"]
+    assert [c["step"] for c in meta["calls"]] == ["overview", "methodology", "results", "synthesis"]
+    assert {c["route"] for c in meta["calls"]} == {meta["model_route"]}
+    assert meta["usage"]["calls"] == 4 and meta["usage"]["input_tokens"] == 1200
+
+
+def test_failed_analyses_expose_their_calls():
+    log = lp.CallLog()
+    with _Env({"gemini": _fake("gemini", fail=True), "openai": _fake("openai", fail=True)}):
+        assert lp.analyze_paper("T", ["A"], "Abstract.", provider_id="gemini", log=log) is None
+        [failed] = [r for r in lp.analyze_papers_batch([{"id": "p1", "title": "T", "abstract": "x"}],
+                                                       ["gemini", "openai"])]
+        fanout = {r["provider"]: r for r in lp.analyze_paper_fanout("T", ["A"], "x", ["gemini", "openai"])}
+    assert [(c["step"], c["outcome"]) for c in log.calls] == [("abstract", "error")]
+    assert failed["analysis"] is None
+    assert sorted((c["provider"], c["attempt"]) for c in failed["calls"]) == [("gemini", 1), ("openai", 2)]
+    assert [c["provider"] for c in fanout["openai"]["calls"]] == ["openai"]
+
+
+def test_streamed_calls_report_usage():
+    events = [
+        {"type": "message_start", "message": {"usage": {"input_tokens": 20, "cache_read_input_tokens": 1000,
+                                                        "output_tokens": 1}}},
+        {"type": "content_block_delta", "delta": {"text": "{\"summary\": \"s\"}"}},
+        {"type": "message_delta", "usage": {"output_tokens": 35}},
+        {"type": "message_stop"},
+    ]
+    totals = _stream_call("anthropic", lp._stream_anthropic, events).totals()
+    assert totals["input_tokens"] == 1020 and totals["cached_tokens"] == 1000
+    assert totals["output_tokens"] == 35 and totals["reported"] == 1
+
+    gemini = [{"candidates": [{"content": {"parts": [{"text": "{}"}]}}],
+               "usageMetadata": {"promptTokenCount": 70, "candidatesTokenCount": 3}}]
+    [call] = _stream_call("gemini", lp._stream_gemini, gemini).calls
+    assert call["input_tokens"] == 70 and call["output_tokens"] == 3
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -117,6 +117,179 @@ def test_custom_weights_respected(monkeypatch=None):
     assert detail["agreement_score"] > 0.95
 
 
+class _DictCache:
+    """In-memory stand-in for the backend's embedding_cache table."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get_many(self, provider, model, digests):
+        return {d: self.rows[(provider, model, d)] for d in digests if (provider, model, d) in self.rows}
+
+    def put_many(self, provider, model, vectors):
+        for d, v in vectors.items():
+            self.rows[(provider, model, d)] = v
+
+
+def _counting_embed(sent):
+    def _embed(texts, provider, api_key, timeout=60):
+        sent.extend(texts)
+        # Deterministic, text-dependent, non-float32-exact vectors.
+        return [[len(t) / 7.0, sum(map(ord, t)) % 97 / 3.0, 1.0 / 3.0] for t in texts]
+    return _embed
+
+
+def test_embedding_cache_only_embeds_new_documents(monkeypatch=None):
+    sent = []
+    _patch(monkeypatch, lp, "resolve_embed_provider", lambda *a, **k: ("gemini", "fake-key"))
+    _patch(monkeypatch, lp, "embed_texts", _counting_embed(sent))
+    cache = _DictCache()
+
+    first = lp.compute_agreement_detail(PARAPHRASED, semantic=True, embedding_cache=cache)
+    assert len(sent) == 4 and len(cache.rows) == 4
+    again = lp.compute_agreement_detail(PARAPHRASED, semantic=True, embedding_cache=cache)
+    assert len(sent) == 4, "cached documents were re-embedded"
+    assert again == first
+
+    third = dict(PARAPHRASED[0], agent_id="grok", key_findings=["Attention is all you need."],
+                 methodology="Multi-head attention.")
+    lp.compute_agreement_detail(PARAPHRASED + [third], semantic=True, embedding_cache=cache)
+    assert sent[4:] == ["Attention is all you need.", "Multi-head attention."]
+
+
+def test_cached_and_uncached_scores_match(monkeypatch=None):
+    _patch(monkeypatch, lp, "resolve_embed_provider", lambda *a, **k: ("gemini", "fake-key"))
+    _patch(monkeypatch, lp, "embed_texts", _counting_embed([]))
+    cache = _DictCache()
+    cold = lp.compute_agreement_detail(PARAPHRASED, semantic=True, embedding_cache=cache)
+    warm = lp.compute_agreement_detail(PARAPHRASED, semantic=True, embedding_cache=cache)
+    assert cold == warm
+    blob = lp.pack_vector([0.1, -2.5, 3.0])
+    assert len(blob) == 12
+    assert lp.unpack_vector(blob)[1:] == [-2.5, 3.0]
+
+
+def test_embedding_digest_keys_on_truncated_text():
+    long_a = "x" * 9000
+    long_b = "x" * 8500
+    assert lp.embedding_digest(long_a) == lp.embedding_digest(long_b)
+    assert lp.embedding_digest("") == lp.embedding_digest("   ")
+    assert lp.embedding_digest("a") != lp.embedding_digest("b")
+
+
+def test_similarity_paths_agree(monkeypatch=None):
+    vectors = [[0.1 * i + j for j in range(16)] for i in range(6)]
+    vectors.append([0.0] * 16)  # zero vector: cosine 0 against everything
+    vectors.append([-x for x in vectors[1]])
+    numpy_or_python = lp._mean_pairwise_similarity(vectors)
+    _patch(monkeypatch, lp, "np", None)
+    python = lp._mean_pairwise_similarity(vectors)
+    assert abs(numpy_or_python - python) < 1e-12
+    assert round(numpy_or_python, 3) == round(python, 3)
+    assert lp._mean_pairwise_similarity(vectors[:1]) is None
+    assert lp._mean_pairwise_similarity([[1.0, 0.0], [1.0]]) == 0.5  # length mismatch
+
+
+def _without_embedding_keys(monkeypatch) -> dict:
+    """Swap in an environment with no embedding keys; returns it for tweaking."""
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("GEMINI_API_KEY", "OPENAI_API_KEY", "MACP_LOCAL_EMBEDDINGS")}
+    _patch(monkeypatch, lp.os, "environ", env)
+    return env
+
+
+def test_local_provider_is_offline_last_resort(monkeypatch=None):
+    _without_embedding_keys(monkeypatch)
+
+    def _no_network(*a, **k):
+        raise AssertionError("local embeddings must not touch the network")
+
+    _patch(monkeypatch, lp.requests, "post", _no_network)
+    assert lp.resolve_embed_provider("anthropic") == ("local", "")
+    detail = lp.compute_agreement_detail(PARAPHRASED, semantic=True)
+    assert detail["method"] == "semantic:local:hash-ngram-512"
+    assert detail["fallback_reason"] is None
+
+    unrelated = dict(PARAPHRASED[1], key_findings=["Protein folding predicted from sequence."],
+                     methodology="Evolutionary multiple sequence alignments.")
+    other = lp.compute_agreement_detail([PARAPHRASED[0], unrelated], semantic=True)
+    assert detail["components"]["key_findings_overlap"] > other["components"]["key_findings_overlap"]
+    assert detail["components"]["methodology_consistency"] > other["components"]["methodology_consistency"]
+
+
+def test_local_provider_can_be_disabled(monkeypatch=None):
+    env = _without_embedding_keys(monkeypatch)
+    env["MACP_LOCAL_EMBEDDINGS"] = "0"
+    assert lp.resolve_embed_provider() == (None, None)
+    assert lp.compute_agreement_detail(PARAPHRASED, semantic=True)["method"] == "lexical"
+
+
+def test_local_vectors_are_deterministic_and_normalized():
+    a = lp.embed_texts(["Self-attention encoder", ""], "local", "")
+    b = lp.embed_texts(["Self-attention encoder", ""], "local", "")
+    assert a == b and len(a[0]) == 512
+    assert abs(sum(x * x for x in a[0]) - 1.0) < 1e-9
+
+
+def _library(n):
+    topics = ["attention translation", "reward modeling", "protein folding", "graph networks"]
+    return [
+        {
+            "id": i,
+            "agent_id": f"agent{i}",
+            "key_findings": [f"Finding about {topics[i % 4]} number {i % 3}"],
+            "methodology": f"Method {topics[(i + 1) % 4]}",
+            "relevance_score": [0.9, 0.4, 7, 0.6][i % 4],
+        }
+        for i in range(n)
+    ]
+
+
+def _same_detail(incremental, full):
+    assert incremental["agreement_score"] == full["agreement_score"], (incremental, full)
+    assert incremental["components"] == full["components"]
+    assert incremental["method"] == full["method"]
+
+
+def test_incremental_state_matches_full_recompute(monkeypatch=None):
+    _patch(monkeypatch, lp, "resolve_embed_provider", lambda *a, **k: ("gemini", "fake-key"))
+    _patch(monkeypatch, lp, "embed_texts", _counting_embed([]))
+    analyses = _library(7)
+    state, detail = lp.update_agreement_state(None, analyses[:2])
+    assert detail["pairs_computed"] == 1
+    for n in range(3, 8):
+        state, detail = lp.update_agreement_state(state, analyses[:n])
+        assert detail["pairs_computed"] == n - 1  # only the newcomer's pairs
+        _same_detail(detail, lp.compute_agreement_detail(analyses[:n]))
+    assert len(state["findings"]) == 7 and len(state["findings"][6]) == 6
+
+
+def test_incremental_state_lexical_and_no_new_work(monkeypatch=None):
+    _patch(monkeypatch, lp, "resolve_embed_provider", lambda *a, **k: (None, None))
+    analyses = _library(5)
+    state, _ = lp.update_agreement_state(None, analyses[:4])
+    state, detail = lp.update_agreement_state(state, analyses)
+    assert detail["pairs_computed"] == 4
+    _same_detail(detail, lp.compute_agreement_detail(analyses))
+    assert detail["fallback_reason"] == "no_embedding_provider_configured"
+    again, detail = lp.update_agreement_state(state, list(reversed(analyses)))
+    assert detail["pairs_computed"] == 0 and again == state
+
+
+def test_incremental_state_rebuilds_on_removal_or_method_change(monkeypatch=None):
+    _patch(monkeypatch, lp, "resolve_embed_provider", lambda *a, **k: (None, None))
+    analyses = _library(5)
+    state, _ = lp.update_agreement_state(None, analyses)
+    state, detail = lp.update_agreement_state(state, analyses[1:])
+    assert detail["pairs_computed"] == 6  # 4 members, rebuilt from scratch
+    _same_detail(detail, lp.compute_agreement_detail(analyses[1:]))
+
+    _patch(monkeypatch, lp, "resolve_embed_provider", lambda *a, **k: ("gemini", "fake-key"))
+    _patch(monkeypatch, lp, "embed_texts", _counting_embed([]))
+    state, detail = lp.update_agreement_state(state, analyses[1:])
+    assert detail["method"].startswith("semantic:gemini") and detail["pairs_computed"] == 6
+
+
 # --- Minimal runner (no pytest required) ----------------------------------
 
 def _patch(monkeypatch, target, name, value):
@@ -138,6 +311,12 @@ def _restore():
     _ORIGINALS.clear()
 
 
+def teardown_function(function):
+    # pytest does not inject fixtures into defaulted parameters, so tests take
+    # the direct-patch path there too; undo it after each one.
+    _restore()
+
+
 if __name__ == "__main__":
     tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
     failures = 0
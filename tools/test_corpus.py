@@ -50,6 +50,9 @@ class _FakeResp:
         return self._p
 
 
+_ORIG_GET = pf.requests.get
+
+
 def _patch_get(resp):
     pf.requests.get = lambda *a, **k: resp  # type: ignore
 
@@ -91,8 +94,12 @@ def test_empty_query_raises():
         pass
 
 
+def teardown_module(module):
+    """requests is shared by every module under pytest; later tests need the real get()."""
+    pf.requests.get = _ORIG_GET
+
+
 if __name__ == "__main__":
-    _orig = pf.requests.get
     tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
     failures = 0
     for t in tests:
@@ -106,6 +113,6 @@ if __name__ == "__main__":
             failures += 1
             print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
         finally:
-            pf.requests.get = _orig
+            pf.requests.get = _ORIG_GET
     print(f"\n{len(tests) - failures}/{len(tests)} passed")
     sys.exit(1 if failures else 0)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for token-aware prompt packing in deep analysis (pack_deep_pass and
+its use by analyze_paper_deep).
+
+No network is used: the provider caller is a fake that records the prompts
+it receives.
+Run directly:  python tools/test_deep_packing.py
+Or via pytest: pytest tools/test_deep_packing.py
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+
+def _words(n: int, word: str = "token") -> str:
+    """About n words of text, in ten-word sentences."""
+    sentences = [" ".join([word] * 10) + "." for _ in range(max(1, n // 10))]
+    return " ".join(sentences)
+
+
+_PAPER = [
+    {"title": "Abstract", "content": _words(150, "abstract")},
+    {"title": "1 Introduction", "content": _words(400, "intro")},
+    {"title": "2 Background", "content": _words(300, "background")},
+    {"title": "3 Method", "content": _words(3000, "method")},
+    {"title": "4 Experimental Setup", "content": _words(400, "setup")},
+    {"title": "5 Results", "content": _words(600, "results")},
+    {"title": "6 Conclusion", "content": _words(200, "conclusion")},
+    {"title": "References", "content": _words(500, "ref")},
+]
+
+
+def test_token_estimate_and_budget_table():
+    assert lp.estimate_tokens("") == 0
+    assert lp.estimate_tokens("abcd" * 100) == 100
+    assert lp.deep_token_budget("gemini-3.5-flash") == lp.DEEP_PASS_TOKEN_BUDGETS["gemini"]
+    assert lp.deep_token_budget("openai/gpt-oss-120b") == lp.DEEP_PASS_TOKEN_BUDGETS["openai/gpt-oss"]
+    assert lp.deep_token_budget("gpt-4o-mini") == lp.DEEP_PASS_TOKEN_BUDGETS["gpt-4o"]
+    assert lp.deep_token_budget("some-new-model") == lp.DEEP_PASS_TOKEN_BUDGETS["default"]
+    os.environ["DEEP_PASS_TOKEN_BUDGETS"] = "gemini=20000, gpt-4o-mini=3000, bad=x"
+    try:
+        assert lp.deep_token_budget("gemini-3.5-flash") == 20000
+        assert lp.deep_token_budget("gpt-4o-mini") == 3000  # longer prefix wins
+        assert lp.deep_token_budget("gpt-4o") == lp.DEEP_PASS_TOKEN_BUDGETS["gpt-4o"]
+    finally:
+        os.environ.pop("DEEP_PASS_TOKEN_BUDGETS")
+
+
+def test_sections_fill_the_budget_in_document_order():
+    packed = lp.pack_deep_pass(_PAPER, "overview", budget=8000)
+    assert packed["sections"] == ["Abstract", "1 Introduction", "2 Background"]
+    assert packed["text"].startswith("## Abstract\n") and packed["truncated"] == []
+    assert packed["tokens"] <= 8000
+
+    packed = lp.pack_deep_pass(_PAPER, "results", budget=8000)
+    # Primary hits first, then the secondary "Experimental Setup"; never references.
+    assert packed["sections"] == ["4 Experimental Setup", "5 Results", "6 Conclusion"]
+
+
+def test_long_section_is_cut_at_a_sentence_within_budget():
+    packed = lp.pack_deep_pass(_PAPER, "methodology", budget=2000)
+    assert packed["sections"] == ["3 Method"] and packed["truncated"] == ["3 Method"]
+    assert packed["tokens"] <= 2000 and packed["tokens"] > 1800
+    assert packed["text"].endswith("method.")
+
+    # A bigger budget takes all of it, then the setup section as well.
+    packed = lp.pack_deep_pass(_PAPER, "methodology", budget=12000)
+    assert packed["sections"] == ["3 Method", "4 Experimental Setup"] and packed["truncated"] == []
+
+
+def test_missing_sections_give_empty_or_fallback_text():
+    sections = [{"title": "Preliminaries", "content": _words(100)}, {"title": "Appendix", "content": ""}]
+    assert lp.pack_deep_pass(sections, "methodology", budget=4000)["text"] == ""
+    overview = lp.pack_deep_pass(sections, "overview", budget=4000)
+    assert overview["sections"] == ["Preliminaries"]  # the paper's opening
+    assert lp.pack_deep_pass([], "overview", budget=4000)["text"] == ""
+
+
+def _deep(sections: list[dict]) -> tuple[dict, list[str]]:
+    prompts = []
+
+    def _call(api_key, prompt, model):
+        prompts.append(prompt)
+        return json.dumps({"summary": "s", "key_findings": ["f"], "strength_score": 6})
+
+    saved = lp._CALLERS["gemini"]
+    lp._CALLERS["gemini"] = _call
+    lp.reset_provider_guards()
+    try:
+        return lp.analyze_paper_deep("T", ["A"], sections, "gemini", api_key_override="fake-key"), prompts
+    finally:
+        lp._CALLERS["gemini"] = saved
+        lp.reset_provider_guards()
+
+
+def test_deep_analysis_skips_passes_without_input():
+    sections = [s for s in _PAPER if s["title"] not in ("3 Method", "4 Experimental Setup")]
+    analysis, prompts = _deep(sections)
+    meta = analysis["_meta"]
+    assert len(prompts) == 3 and meta["passes"] == 3  # overview, results, synthesis
+    assert meta["skipped_passes"] == ["methodology"]
+    assert "No methodology section found - pass skipped" in meta["extraction_warnings"]
+    assert meta["packing"]["results"]["sections"] == ["5 Results", "6 Conclusion"]
+    assert meta["token_budget"] == lp.deep_token_budget(meta["model"])
+
+
+def test_deep_analysis_sends_packed_sections():
+    analysis, prompts = _deep(_PAPER)
+    assert len(prompts) == 4 and analysis["_meta"]["skipped_passes"] == []
+    assert "## 3 Method" in prompts[1] and "## 4 Experimental Setup" in prompts[1]
+    assert "References" not in "".join(prompts)
+    assert lp.analyze_paper_deep("T", ["A"], [], "gemini", api_key_override="fake-key") is None
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Behavior tests for the knowledge graph: indexes (index_graph, trace_provenance,
+trace_provenance_batch, generate_mermaid) and the incremental builder
+(update_knowledge_graph).
+
+Offline, isolated temp MACP_DIR. Run: python tools/test_knowledge_graph.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import knowledge_graph as kg  # noqa: E402
+
+
+def _isolate(tmp):
+    kg.MACP_DIR = tmp
+    kg.PAPERS_FILE = os.path.join(tmp, "research_papers.json")
+    kg.LEARNING_LOG_FILE = os.path.join(tmp, "learning_log.json")
+    kg.CITATIONS_FILE = os.path.join(tmp, "citations.json")
+    kg.KNOWLEDGE_GRAPH_FILE = os.path.join(tmp, "knowledge_graph.json")
+
+
+def _write(path, data):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(data, fh)
+
+
+def _seed(tmp):
+    _isolate(tmp)
+    _write(kg.PAPERS_FILE, {"papers": [
+        {"id": "arxiv:2401.00001", "title": "Alpha", "discovered_by": "manus_ai", "status": "cited"},
+        {"id": "arxiv:2401.00002", "title": "Beta", "discovered_by": "human"},
+        {"id": "arxiv:2401.00003", "title": "Gamma"},
+    ]})
+    _write(kg.LEARNING_LOG_FILE, {"learning_sessions": [
+        {"session_id": "s1", "summary": "Alpha insight", "papers": ["arxiv:2401.00001"], "agent": "claude_code"},
+        {"session_id": "s2", "summary": "Both", "papers": ["arxiv:2401.00001", "arxiv:2401.00002"]},
+    ]})
+    _write(kg.CITATIONS_FILE, {"citations": [
+        {"citation_id": "c1", "paper_id": "arxiv:2401.00001", "cited_in": "verifimind"},
+        {"citation_id": "c2", "paper_id": "arxiv:2401.00001", "cited_in": "godelai"},
+        {"citation_id": "c3", "paper_id": "arxiv:2401.00002", "cited_in": "godelai"},
+    ]})
+    return kg.build_knowledge_graph()
+
+
+def test_trace_provenance_follows_all_three_phases():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _seed(tmp)
+        prov = kg.trace_provenance("2401.00001", graph)
+        assert prov["paper"]["label"] == "Alpha"
+        assert prov["c_conflict"]["discovery_agents"] == ["manus_ai"]
+        assert [s["id"] for s in prov["s_synthesis"]["sessions"]] == ["s1", "s2"]
+        assert prov["p_propagation"]["citations"] == [
+            {"citation": "c1", "project": "project:verifimind"},
+            {"citation": "c2", "project": "project:godelai"},
+        ]
+
+
+def test_trace_unknown_paper_is_error():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _seed(tmp)
+        assert "error" in kg.trace_provenance("9999.99999", graph)
+
+
+def test_batch_matches_single_traces_with_one_index():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _seed(tmp)
+        ids = ["arxiv:2401.00001", "2401.00002", "2401.00003", "0000.00000"]
+        batch = kg.trace_provenance_batch(ids, graph)
+        assert list(batch) == ids
+        for paper_id in ids:
+            assert batch[paper_id] == kg.trace_provenance(paper_id, graph)
+        assert batch["2401.00003"]["p_propagation"]["citations"] == []
+
+
+def test_index_groups_edges_by_endpoint():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _seed(tmp)
+        index = kg.index_graph(graph)
+        assert len(index["nodes_by_id"]) == graph["statistics"]["total_nodes"]
+        assert sum(len(v) for v in index["edges_from"].values()) == len(graph["edges"])
+        assert {e["type"] for e in index["edges_to"]["arxiv:2401.00001"]} == {"discovered", "analyzed", "cites"}
+
+
+def test_mermaid_only_links_included_nodes():
+    with tempfile.TemporaryDirectory() as tmp:
+        graph = _seed(tmp)
+        full = kg.generate_mermaid(graph, max_nodes=1000)
+        assert full.count("-->") == len(graph["edges"])
+        small = kg.generate_mermaid(graph, max_nodes=3)  # just the three papers
+        assert "-->" not in small
+        assert small.count("\n") == 3
+
+
+def _canonical(graph):
+    nodes = sorted(json.dumps(n, sort_keys=True) for n in graph["nodes"])
+    edges = sorted(json.dumps(e, sort_keys=True) for e in graph["edges"])
+    return nodes, edges, graph["statistics"]
+
+
+def test_update_full_then_unchanged_then_touch():
+    with tempfile.TemporaryDirectory() as tmp:
+        _seed(tmp)
+        _, changes = kg.update_knowledge_graph()
+        assert changes == {"mode": "full"}
+        assert os.path.isfile(os.path.join(tmp, "knowledge_graph.mmd"))
+        _, changes = kg.update_knowledge_graph()
+        assert changes["mode"] == "unchanged"
+        # Touched but byte-identical: marker moves, hash does not.
+        st = os.stat(kg.CITATIONS_FILE)
+        os.utime(kg.CITATIONS_FILE, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        _, changes = kg.update_knowledge_graph()
+        assert changes == {"mode": "unchanged"}
+        # Reformatted with the same records: no record is re-derived.
+        with open(kg.CITATIONS_FILE, "a", encoding="utf-8") as fh:
+            fh.write("\n")
+        _, changes = kg.update_knowledge_graph()
+        assert changes["citations"] == {"added": 0, "changed": 0, "removed": 0}
+
+
+def test_incremental_update_matches_full_rebuild():
+    with tempfile.TemporaryDirectory() as tmp:
+        _seed(tmp)
+        kg.update_knowledge_graph()
+
+        papers = kg._load_json(kg.PAPERS_FILE)
+        papers["papers"][1]["title"] = "Beta, revised"
+        papers["papers"].append({"id": "arxiv:2401.00004", "title": "Delta", "discovered_by": "gemini"})
+        _write(kg.PAPERS_FILE, papers)
+        log = kg._load_json(kg.LEARNING_LOG_FILE)
+        log["learning_sessions"] = log["learning_sessions"][:1]
+        _write(kg.LEARNING_LOG_FILE, log)
+        cites = kg._load_json(kg.CITATIONS_FILE)
+        cites["citations"].append({"citation_id": "c4", "paper_id": "arxiv:2401.00004",
+                                   "cited_in": "newproj", "cited_by": "gemini"})
+        cites["citations"] = [c for c in cites["citations"] if c["citation_id"] != "c1"]
+        _write(kg.CITATIONS_FILE, cites)
+
+        graph, changes = kg.update_knowledge_graph()
+        assert changes["mode"] == "incremental"
+        assert changes["papers"] == {"added": 1, "changed": 1, "removed": 0}
+        assert changes["sessions"] == {"added": 0, "changed": 0, "removed": 1}
+        assert changes["citations"] == {"added": 1, "changed": 0, "removed": 1}
+        assert _canonical(graph) == _canonical(kg.build_knowledge_graph())
+        # Persisted copy is the updated graph.
+        assert _canonical(kg._load_json(kg.KNOWLEDGE_GRAPH_FILE)) == _canonical(graph)
+        prov = kg.trace_provenance("2401.00001", graph)
+        assert [c["citation"] for c in prov["p_propagation"]["citations"]] == ["c2"]
+
+
+def test_cli_commands_refresh_existing_graph():
+    import macp_cli as cli
+    with tempfile.TemporaryDirectory() as tmp:
+        _seed(tmp)
+        kg.update_knowledge_graph(tmp)
+        old_dir = cli.MACP_DIR
+        cli.MACP_DIR = tmp
+        try:
+            cites = kg._load_json(kg.CITATIONS_FILE)
+            cites["citations"].append({"citation_id": "c9", "paper_id": "arxiv:2401.00003", "cited_in": "x"})
+            _write(kg.CITATIONS_FILE, cites)
+            cli._refresh_knowledge_graph()
+        finally:
+            cli.MACP_DIR = old_dir
+        graph = kg._load_json(kg.KNOWLEDGE_GRAPH_FILE)
+        assert any(n["id"] == "c9" for n in graph["nodes"])
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
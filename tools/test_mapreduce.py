@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Tests for the map-reduce long-document analysis (chunk_sections and
+analyze_paper_mapreduce).
+
+No network is used: the provider caller is a fake that tells map, collapse
+and reduce prompts apart and records which model each one was sent to.
+Run directly:  python tools/test_mapreduce.py
+Or via pytest: pytest tools/test_mapreduce.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+
+def _words(n: int, word: str) -> str:
+    """About n words of text, in ten-word sentences."""
+    return " ".join(" ".join([word] * 10) + "." for _ in range(max(1, n // 10)))
+
+
+_PAPER = [{"title": "Abstract", "content": _words(150, "abstract")}] + [
+    {"title": f"{n} Section {n}", "content": _words(1500, f"body{n}")} for n in range(1, 13)
+] + [{"title": "References", "content": _words(2000, "ref")}]
+
+
+class _Fake:
+    def __init__(self, delay: float = 0.0, fail_parts=(), fail_reduce: bool = False):
+        self.delay = delay
+        self.fail_parts = set(fail_parts)
+        self.fail_reduce = fail_reduce
+        self.lock = threading.Lock()
+        self.maps: list[tuple[str, str]] = []   # (part label, model)
+        self.reduces: list[str] = []            # models
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, api_key, prompt, model):
+        if "<part_notes>" in prompt:
+            self.reduces.append(model)
+            if self.fail_reduce:
+                raise requests.ConnectionError("reduce down")
+            return json.dumps({"summary": "whole paper", "key_findings": ["combined"], "strength_score": 8,
+                               "concepts": ["long context"], "methods": ["map-reduce"]})
+        part = prompt.split('<excerpt part="')[1].split('"')[0]
+        with self.lock:
+            self.maps.append((part, model))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delay)
+            if part in self.fail_parts:
+                raise requests.ConnectionError("map down")
+            return json.dumps({"summary": f"part {part}", "findings": [f"finding {part}"],
+                               "methods": ["shared method"], "concepts": []})
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def _run(fake: _Fake, sections=_PAPER) -> dict:
+    saved = lp._CALLERS["deepseek"]
+    lp._CALLERS["deepseek"] = fake
+    lp.reset_provider_guards()
+    try:
+        return lp.analyze_paper_mapreduce("Long Paper", ["A"], sections, "deepseek", api_key_override="fake-key")
+    finally:
+        lp._CALLERS["deepseek"] = saved
+        lp.reset_provider_guards()
+
+
+def test_chunks_cover_the_text_in_order_within_the_window():
+    chunks = lp.chunk_sections(_PAPER, chunk_tokens=3000)
+    assert all(lp.estimate_tokens(c["text"]) <= 3000 for c in chunks)
+    text = "\n".join(c["text"] for c in chunks)
+    for n in range(1, 13):
+        assert text.count(f"body{n}.") == 150, n  # every sentence, exactly once
+    assert "ref" not in text.split() and "References" not in text
+    assert chunks[0]["sections"][0] == "Abstract"
+    assert any(c["text"].startswith("## 2 Section 2 (cont.)\n") for c in chunks)  # split sections continue
+    assert lp.chunk_sections([{"title": "Empty", "content": "  "}]) == []
+
+
+def test_maps_run_concurrently_on_the_lite_model():
+    fake = _Fake(delay=0.1)
+    started = time.monotonic()
+    analysis = _run(fake)
+    elapsed = time.monotonic() - started
+    meta = analysis["_meta"]
+    chunks = meta["chunks"]
+    assert chunks >= 8 and len(fake.maps) == chunks
+    assert fake.peak == min(lp.MAP_CONCURRENCY, chunks)
+    assert elapsed < 0.1 * chunks / 2, elapsed  # well under the serial time
+    assert {model for _, model in fake.maps} == {lp.MODEL_TIERS["deepseek"]["lite"]}
+    assert fake.reduces == [meta["model"]] and meta["map_model"] == lp.MODEL_TIERS["deepseek"]["lite"]
+    assert meta["analysis_type"] == "mapreduce" and meta["passes"] == chunks + 1
+    assert analysis["summary"] == "whole paper"
+    reduce_pass = analysis["section_analyses"][1]
+    assert reduce_pass == {"pass": "reduce", "data": {"concepts": ["long context"], "methods": ["map-reduce"],
+                                                      "related_themes": []}}
+
+
+def test_failed_parts_are_reported_and_failed_reduce_merges_notes():
+    fake = _Fake(fail_parts={"2"}, fail_reduce=True)
+    analysis = _run(fake)
+    meta = analysis["_meta"]
+    assert f"1 of {meta['chunks']} parts could not be analyzed" in meta["extraction_warnings"]
+    parts = analysis["section_analyses"][0]["data"]["parts"]
+    assert [p["part"] for p in parts] == [i for i in range(1, meta["chunks"] + 1) if i != 2]
+    # Fallback: notes merged without an LLM, duplicates dropped.
+    assert analysis["methods"] == ["shared method"]
+    assert analysis["key_findings"][:2] == ["finding 1", "finding 3"]
+
+    assert _run(_Fake(fail_parts={str(i) for i in range(1, 100)})) is None
+
+
+def test_notes_over_the_reduce_budget_are_collapsed_first():
+    os.environ["DEEP_PASS_TOKEN_BUDGETS"] = "deepseek=100"
+    try:
+        fake = _Fake()
+        analysis = _run(fake)
+    finally:
+        os.environ.pop("DEEP_PASS_TOKEN_BUDGETS")
+    meta = analysis["_meta"]
+    assert meta["collapse_rounds"] >= 1
+    collapses = [part for part, _ in fake.maps if "-" in part]
+    assert "1-2" in collapses  # groups of at least two neighbouring parts
+    assert meta["passes"] == len(fake.maps) + 1 and len(fake.reduces) == 1
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
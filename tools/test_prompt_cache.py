@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for prompt-prefix reuse: the split deep-analysis prompts
+(CachedPrompt), Anthropic cache_control blocks on prefixes long enough to
+cache and the token usage, including cached tokens, recorded in _meta.
+
+No network is used: requests.post is replaced with a fake that records the
+request bodies and answers like the provider would, usage included.
+Run directly:  python tools/test_prompt_cache.py
+Or via pytest: pytest tools/test_prompt_cache.py
+"""
+
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+_PASS = json.dumps({"summary": "s", "key_findings": ["f"], "strength_score": 6})
+_SECTIONS = [
+    {"title": "Abstract", "content": "We study caching. " * 40},
+    {"title": "1 Introduction", "content": "Prompts repeat. " * 60},
+    {"title": "3 Method", "content": "We mark the prefix. " * 60},
+    {"title": "5 Results", "content": "Costs drop. " * 60},
+]
+
+
+class _Response:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class _AnthropicPost:
+    """Replaces requests.post: a Messages API that caches marked prefixes like the real one."""
+
+    def __init__(self):
+        self.bodies: list[dict] = []
+        self.cached: set[str] = set()
+
+    def __enter__(self):
+        self.saved = requests.post
+        requests.post = self
+        lp.reset_provider_guards()
+        return self
+
+    def __exit__(self, *exc):
+        requests.post = self.saved
+        lp.reset_provider_guards()
+
+    def __call__(self, url, **kwargs):
+        body = kwargs["json"]
+        self.bodies.append(body)
+        content = body["messages"][0]["content"]
+        blocks = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        read = write = prefix = 0
+        for block in blocks:
+            prefix += len(block["text"]) // 4
+            if "cache_control" in block:
+                key = "".join(b["text"] for b in blocks[:blocks.index(block) + 1])
+                if key in self.cached:
+                    read = prefix
+                else:
+                    self.cached.add(key)
+                    write = prefix - read
+        total = sum(len(b["text"]) for b in blocks) // 4
+        return _Response({
+            "content": [{"type": "text", "text": _PASS}],
+            "usage": {"input_tokens": total - read - write, "output_tokens": 20,
+                      "cache_read_input_tokens": read, "cache_creation_input_tokens": write},
+        })
+
+
+def test_cached_prompt_is_the_full_text():
+    prompt = lp.CachedPrompt("stable ", "paper ", "task")
+    assert prompt == "stable paper task" and isinstance(prompt, str)
+    assert prompt.parts == ("stable ", "paper ", "task")
+    assert "paper" in prompt and prompt.startswith("stable")
+
+
+def test_anthropic_content_marks_stable_prefixes_long_enough_to_cache():
+    long = "x" * (4 * lp.PROMPT_CACHE_MIN_TOKENS)
+    blocks = lp._anthropic_content(lp.CachedPrompt(long, "header", "task"))
+    assert [b["text"] for b in blocks] == [long, "header", "task"]
+    assert [("cache_control" in b) for b in blocks] == [True, True, False]
+    blocks = lp._anthropic_content(lp.CachedPrompt("short", long, "task"))
+    assert [("cache_control" in b) for b in blocks] == [False, True, False]  # "short" alone is too short
+    assert lp._anthropic_content(lp.CachedPrompt("protocol", "header", "task")) == "protocol" "header" "task"
+    assert lp._anthropic_content("plain prompt") == "plain prompt"
+    assert lp._anthropic_content(lp.CachedPrompt("", "only")) == lp.CachedPrompt("", "only")
+
+
+def test_usage_is_normalized_across_providers():
+    assert lp._response_usage({"usageMetadata": {
+        "promptTokenCount": 1200, "candidatesTokenCount": 80, "cachedContentTokenCount": 1024,
+    }}) == {"input_tokens": 1200, "output_tokens": 80, "cached_tokens": 1024, "cache_write_tokens": 0}
+    assert lp._response_usage({"usage": {
+        "input_tokens": 50, "output_tokens": 80, "cache_read_input_tokens": 1100, "cache_creation_input_tokens": 0,
+    }}) == {"input_tokens": 1150, "output_tokens": 80, "cached_tokens": 1100, "cache_write_tokens": 0}
+    assert lp._response_usage({"usage": {
+        "prompt_tokens": 1500, "completion_tokens": 90, "prompt_tokens_details": {"cached_tokens": 1280},
+    }})["cached_tokens"] == 1280
+    assert lp._response_usage({"usage": {
+        "prompt_tokens": 1500, "completion_tokens": 90, "prompt_cache_hit_tokens": 1024,
+    }})["cached_tokens"] == 1024  # DeepSeek
+    assert lp._response_usage({"choices": []}) is None
+
+
+def test_deep_passes_lead_with_their_own_instructions():
+    prompts = []
+
+    def _call(api_key, prompt, model):
+        prompts.append(prompt)
+        return _PASS
+
+    saved = lp._CALLERS["gemini"]
+    lp._CALLERS["gemini"] = _call
+    lp.reset_provider_guards()
+    try:
+        analysis = lp.analyze_paper_deep("Cache Paper", ["A. Author"], _SECTIONS, "gemini", api_key_override="k")
+    finally:
+        lp._CALLERS["gemini"] = saved
+        lp.reset_provider_guards()
+    assert len(prompts) == 4
+    assert [p.parts[0] for p in prompts] == [lp.DEEP_PASS1_PROMPT, lp.DEEP_PASS2_PROMPT,
+                                             lp.DEEP_PASS3_PROMPT, lp.DEEP_SYNTHESIS_PROMPT]
+    assert all("<title>Cache Paper</title>" in p.parts[1] for p in prompts[:3])
+    assert "research_gaps" not in prompts[0] and "novelty_assessment" not in prompts[3]  # one schema per pass
+    assert "<paper_title>Cache Paper</paper_title>" in prompts[3] and "\n  " not in prompts[3].parts[1]
+    usage = analysis["_meta"]["usage"]
+    assert usage["calls"] == 4 and usage["reported"] == 0  # the fake reports no usage
+
+
+def test_deep_instructions_are_too_short_for_a_breakpoint():
+    for instructions in (lp.DEEP_PASS1_PROMPT, lp.DEEP_PASS2_PROMPT, lp.DEEP_PASS3_PROMPT,
+                         lp.DEEP_SYNTHESIS_PROMPT, lp.DEEP_MAP_PROMPT):
+        assert lp.estimate_tokens(instructions) < lp.PROMPT_CACHE_MIN_TOKENS
+    with _AnthropicPost() as post:
+        analysis = lp.analyze_paper_deep("Cache Paper", ["A. Author"], _SECTIONS, "anthropic", api_key_override="k")
+    assert all(isinstance(b["messages"][0]["content"], str) for b in post.bodies)
+    usage = analysis["_meta"]["usage"]
+    assert usage["calls"] == 4 and usage["cached_tokens"] == usage["cache_write_tokens"] == 0
+
+
+def test_call_provider_logs_usage_only_when_asked():
+    with _AnthropicPost():
+        log = lp.CallLog()
+        prefix = "x" * (4 * lp.PROMPT_CACHE_MIN_TOKENS)
+        lp._call_provider("anthropic", "k", lp.CachedPrompt(prefix, "task one"), "m", log=log)
+        lp._call_provider("anthropic", "k", lp.CachedPrompt(prefix, "task two"), "m", log=log)
+        lp._call_provider("anthropic", "k", "not counted", "m")
+    totals = log.totals()
+    assert totals["calls"] == 2
+    assert totals["cached_tokens"] == totals["cache_write_tokens"] == lp.PROMPT_CACHE_MIN_TOKENS
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Tests for provider batch APIs: building the request file, submitting,
+polling and reading back the results (submit_analysis_batch,
+poll_analysis_batch, analysis_batch_results).
+
+No network is used beyond localhost: FakeBatchServer is a local HTTP server
+speaking the OpenAI (files + /batches) and Anthropic (Message Batches) batch
+protocols, and BATCH_APIS is pointed at it. The backend job test reuses it.
+Run directly:  python tools/test_provider_batch.py
+Or via pytest: pytest tools/test_provider_batch.py
+"""
+
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+_KEY = "batch-test-key"
+_BATCH_IDS = itertools.count(1)  # unique across servers, as the providers' ids are
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status, payload = self.server.fake.handle(self.command, self.path, self.headers, body)
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if isinstance(payload, bytes) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = _handle
+
+
+def _multipart_fields(headers, body: bytes) -> dict:
+    boundary = re.search(r"boundary=([^;]+)", headers["Content-Type"]).group(1).encode()
+    fields = {}
+    for part in body.split(b"--" + boundary)[1:-1]:
+        head, _, content = part.partition(b"\r\n\r\n")
+        name = re.search(rb'name="([^"]+)"', head).group(1).decode()
+        fields[name] = content[:-2]  # the CRLF before the next boundary
+    return fields
+
+
+class FakeBatchServer:
+    """
+    Local batch API for OpenAI-style and Anthropic-style providers.
+
+    Batches stay in progress until finish(); each request is then answered
+    with an analysis of the paper named in its prompt, except for custom_ids
+    in ``fail``, which error. serve(*providers) points BATCH_APIS at the
+    server for the duration of a with-block.
+    """
+
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.uploads: list[dict] = []
+        self.fail: set[str] = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.httpd.fake = self
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.saved_urls = {}
+
+    def serve(self, *providers: str) -> "FakeBatchServer":
+        self.providers = providers
+        return self
+
+    def __enter__(self):
+        for pid in self.providers:
+            self.saved_urls[pid] = lp.BATCH_APIS[pid]["base_url"]
+            lp.BATCH_APIS[pid]["base_url"] = f"{self.url}/{lp.BATCH_APIS[pid]['kind']}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for pid, url in self.saved_urls.items():
+            lp.BATCH_APIS[pid]["base_url"] = url
+
+    # --- test controls -----------------------------------------------------
+
+    def finish(self, batch_id=None, failed: bool = False) -> None:
+        """End one batch (default: all), answering its requests, or fail it outright."""
+        with self.lock:
+            for bid, batch in self.batches.items():
+                if batch_id in (None, bid) and not batch["ended"]:
+                    self._end(bid, batch, failed)
+
+    # --- protocol -----------------------------------------------------------
+
+    @staticmethod
+    def _answer(params: dict) -> str:
+        title = re.search(r"<title>(.*?)</title>", params["messages"][0]["content"]).group(1)
+        return json.dumps({"summary": f"Batch summary of {title}", "key_insights": [f"{title} insight"],
+                           "methodology": "batched", "relevance_tags": ["batch"], "research_gaps": [],
+                           "strength_score": 6})
+
+    def _end(self, bid: str, batch: dict, failed: bool) -> None:
+        batch["ended"] = True
+        batch["failed"] = failed
+        if failed:
+            return
+        ok, errors = [], []
+        for req in batch["requests"]:
+            cid = req["custom_id"]
+            if batch["kind"] == "anthropic":
+                params = req["params"]
+                if cid in self.fail:
+                    errors.append({"custom_id": cid, "result": {"type": "errored", "error": {
+                        "type": "error", "error": {"type": "api_error", "message": "overloaded"}}}})
+                else:
+                    ok.append({"custom_id": cid, "result": {"type": "succeeded", "message": {
+                        "model": params["model"],
+                        "content": [{"type": "text", "text": self._answer(params)}]}}})
+            else:
+                body = req["body"]
+                if cid in self.fail:
+                    errors.append({"custom_id": cid, "response": {
+                        "status_code": 500, "body": {"error": {"message": "server error"}}}, "error": None})
+                else:
+                    ok.append({"custom_id": cid, "response": {"status_code": 200, "body": {
+                        "model": body["model"],
+                        "choices": [{"message": {"content": self._answer(body)}}]}}, "error": None})
+        batch["results"] = ok + errors  # Anthropic: one results file for both
+        if batch["kind"] == "openai":
+            batch["output_file_id"] = self._store("".join(json.dumps(line) + "\n" for line in ok).encode())
+            if errors:
+                batch["error_file_id"] = self._store("".join(json.dumps(line) + "\n" for line in errors).encode())
+
+    def _store(self, data: bytes) -> str:
+        file_id = f"file-{len(self.files) + 1}"
+        self.files[file_id] = data
+        return file_id
+
+    def _view(self, bid: str) -> dict:
+        batch = self.batches[bid]
+        total = len(batch["requests"])
+        failed = sum(1 for r in batch["requests"] if r["custom_id"] in self.fail) if batch["ended"] else 0
+        if batch["kind"] == "anthropic":
+            view = {"id": bid, "type": "message_batch",
+                    "processing_status": "ended" if batch["ended"] else "in_progress",
+                    "request_counts": {"processing": 0 if batch["ended"] else total,
+                                       "succeeded": total - failed if batch["ended"] else 0,
+                                       "errored": failed, "canceled": 0, "expired": 0},
+                    "results_url": None}
+            if batch["ended"]:
+                view["results_url"] = f"{self.url}/anthropic/v1/messages/batches/{bid}/results"
+            return view
+        status = ("failed" if batch["failed"] else "completed") if batch["ended"] else "in_progress"
+        return {"id": bid, "object": "batch", "status": status,
+                "output_file_id": batch.get("output_file_id"), "error_file_id": batch.get("error_file_id"),
+                "request_counts": {"total": total, "completed": total - failed if batch["ended"] else 0,
+                                   "failed": failed}}
+
+    def handle(self, method: str, path: str, headers, body: bytes):
+        kind = path.split("/")[1]
+        auth = headers.get("x-api-key") if kind == "anthropic" else headers.get("Authorization")
+        if auth != (_KEY if kind == "anthropic" else f"Bearer {_KEY}"):
+            return 401, {"error": {"message": "invalid key"}}
+        if kind == "anthropic" and headers.get("anthropic-version") != "2023-06-01":
+            return 400, {"error": {"message": "anthropic-version required"}}
+        route = path.split("/", 3)[3]  # after /<kind>/v1/
+        with self.lock:
+            if method == "POST" and route == "files":
+                fields = _multipart_fields(headers, body)
+                self.uploads.append(fields)
+                return 200, {"id": self._store(fields["file"]), "purpose": fields["purpose"].decode()}
+            if method == "POST" and route in ("batches", "messages/batches"):
+                data = json.loads(body)
+                if kind == "anthropic":
+                    lines = data["requests"]
+                else:
+                    assert data["endpoint"] == "/v1/chat/completions", data
+                    lines = [json.loads(line) for line in self.files[data["input_file_id"]].splitlines()]
+                bid = f"{'msgbatch' if kind == 'anthropic' else 'batch'}_{next(_BATCH_IDS)}"
+                self.batches[bid] = {"kind": kind, "requests": lines, "ended": False, "failed": False}
+                return 200, self._view(bid)
+            match = re.fullmatch(r"(?:messages/)?batches/([^/]+)(/results)?", route)
+            if method == "GET" and match and match.group(1) in self.batches:
+                bid = match.group(1)
+                if match.group(2):
+                    results = self.batches[bid]["results"]
+                    return 200, "".join(json.dumps(line) + "\n" for line in results).encode()
+                return 200, self._view(bid)
+            match = re.fullmatch(r"files/([^/]+)/content", route)
+            if method == "GET" and match and match.group(1) in self.files:
+                return 200, self.files[match.group(1)]
+        return 404, {"error": {"message": f"no route {method} {path}"}}
+
+
+_PAPERS = [{"custom_id": f"paper-{n}", "title": f"Paper {n}", "authors": ["A. Author"],
+            "abstract": f"Abstract {n}."} for n in (1, 2, 3)]
+
+
+def test_batch_requests_carry_the_analysis_prompt():
+    openai = lp.batch_requests(_PAPERS, "openai", "gpt-x")
+    assert [line["custom_id"] for line in openai] == ["paper-1", "paper-2", "paper-3"]
+    assert openai[0]["method"] == "POST" and openai[0]["url"] == "/v1/chat/completions"
+    assert openai[0]["body"]["model"] == "gpt-x"
+    prompt = openai[1]["body"]["messages"][0]["content"]
+    assert prompt == lp._analysis_prompt("Paper 2", ["A. Author"], "Abstract 2.")
+
+    anthropic = lp.batch_requests(_PAPERS, "anthropic", "claude-x")
+    assert set(anthropic[0]) == {"custom_id", "params"}
+    assert anthropic[0]["params"]["messages"][0]["content"] == openai[0]["body"]["messages"][0]["content"]
+
+
+def test_openai_batch_round_trip():
+    with FakeBatchServer().serve("openai") as server:
+        server.fail = {"paper-3"}
+        batch = lp.submit_analysis_batch(_PAPERS, "openai", api_key_override=_KEY)
+        assert batch["status"] == "in_progress" and batch["requests"] == 3
+        assert batch["model"] == lp.select_model("openai", "abstract")[0]
+        upload = server.uploads[0]
+        assert upload["purpose"] == b"batch" and len(upload["file"].splitlines()) == 3
+
+        polled = lp.poll_analysis_batch("openai", batch["batch_id"], api_key_override=_KEY)
+        assert polled["status"] == "in_progress" and polled["output_file_id"] is None
+
+        server.finish()
+        polled = lp.poll_analysis_batch("openai", batch["batch_id"], api_key_override=_KEY)
+        assert polled["status"] == "ended" and polled["counts"]["failed"] == 1
+        results = {r["custom_id"]: r for r in lp.analysis_batch_results("openai", polled, api_key_override=_KEY)}
+
+    assert sorted(results) == ["paper-1", "paper-2", "paper-3"]
+    analysis = results["paper-2"]["analysis"]
+    assert analysis["summary"] == "Batch summary of Paper 2"
+    assert analysis["_meta"]["provider"] == "openai" and analysis["_meta"]["batch_id"] == batch["batch_id"]
+    assert analysis["_meta"]["model"] == batch["model"] and analysis["_meta"]["model_route"] == "batch"
+    assert results["paper-3"] == {"custom_id": "paper-3", "analysis": None, "error": "server error"}
+
+
+def test_anthropic_batch_round_trip():
+    with FakeBatchServer().serve("anthropic") as server:
+        server.fail = {"paper-1"}
+        batch = lp.submit_analysis_batch(_PAPERS, "anthropic", api_key_override=_KEY)
+        assert batch["batch_id"].startswith("msgbatch_") and batch["status"] == "in_progress"
+        assert batch["counts"]["processing"] == 3
+
+        server.finish()
+        polled = lp.poll_analysis_batch("anthropic", batch["batch_id"], api_key_override=_KEY)
+        assert polled["status"] == "ended" and polled["results_url"].endswith("/results")
+        results = {r["custom_id"]: r for r in lp.analysis_batch_results("anthropic", polled, api_key_override=_KEY)}
+
+    assert results["paper-1"]["analysis"] is None and results["paper-1"]["error"] == "overloaded"
+    assert results["paper-3"]["analysis"]["key_insights"] == ["Paper 3 insight"]
+    assert results["paper-3"]["analysis"]["_meta"]["model"] == batch["model"]
+
+
+def test_failures_give_none():
+    saved = os.environ.pop("OPENAI_API_KEY", None)
+    try:
+        assert lp.submit_analysis_batch(_PAPERS, "openai") is None  # no key
+    finally:
+        if saved is not None:
+            os.environ["OPENAI_API_KEY"] = saved
+    assert lp.submit_analysis_batch(_PAPERS, "gemini", api_key_override=_KEY) is None  # no batch API
+    with FakeBatchServer().serve("openai", "groq") as server:
+        assert lp.submit_analysis_batch(_PAPERS, "openai", api_key_override="wrong") is None
+        assert lp.poll_analysis_batch("groq", "batch_404", api_key_override=_KEY) is None
+        batch = lp.submit_analysis_batch(_PAPERS, "groq", api_key_override=_KEY)
+        server.finish(failed=True)
+        assert lp.poll_analysis_batch("groq", batch["batch_id"], api_key_override=_KEY)["status"] == "failed"
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Tests for provider latency tracking, latency-aware selection, hedged requests,
+circuit breakers and adaptive (AIMD) concurrency limits.
+
+No network is used: _CALLERS entries are replaced with fakes that sleep or
+fail on demand, and PROVIDER_STATS, breakers and limiters are reset around
+every test.
+Run directly:  python tools/test_provider_health.py
+Or via pytest: pytest tools/test_provider_health.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+_KEYS = ("GEMINI_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GROQ_API_KEY")
+_CALLS: list[str] = []
+
+
+def _fake(provider: str, delay: float = 0.0, fail: bool = False):
+    def _call(api_key, prompt, model):
+        _CALLS.append(provider)
+        time.sleep(delay)
+        if fail:
+            raise requests.ConnectionError("provider down")
+        return json.dumps({"summary": f"from {provider}", "key_insights": ["x"]})
+    return _call
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"{status} error", response=resp)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Env:
+    """Keys, fake callers and clean stats for one test; restores everything on exit."""
+
+    def __init__(self, callers: dict, keys=_KEYS):
+        self.callers = callers
+        self.keys = keys
+
+    def __enter__(self):
+        self.saved_callers = dict(lp._CALLERS)
+        self.saved_env = {k: os.environ.get(k) for k in _KEYS}
+        self.saved_floor = lp.HEDGE_MIN_DELAY
+        lp._CALLERS.update(self.callers)
+        for k in _KEYS:
+            os.environ.pop(k, None)
+        for k in self.keys:
+            os.environ[k] = "fake-key"
+        lp.HEDGE_MIN_DELAY = 0.0
+        lp.PROVIDER_STATS.reset()
+        lp.reset_provider_guards()
+        _CALLS.clear()
+        return self
+
+    def __exit__(self, *exc):
+        lp._CALLERS.clear()
+        lp._CALLERS.update(self.saved_callers)
+        for k, v in self.saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        lp.HEDGE_MIN_DELAY = self.saved_floor
+        lp.PROVIDER_STATS.reset()
+        lp.reset_provider_guards()
+
+
+def _seed(provider: str, seconds: float, n: int = 10, ok: bool = True):
+    for _ in range(n):
+        lp.PROVIDER_STATS.record(provider, seconds, ok)
+
+
+def _analyze(provider: str, hedge: bool = True):
+    return lp.analyze_paper("T", ["A"], "Abstract.", provider_id=provider, hedge=hedge)
+
+
+def test_weighted_quantiles_follow_recent_calls():
+    tracker = lp.LatencyTracker()
+    for _ in range(30):
+        tracker.record("gemini", 1.0, True)
+    tracker.record("gemini", 30.0, False)  # one outlier
+    stats = tracker.stats("gemini")
+    assert stats["p50"] == 1.0 and stats["calls"] == 31
+    assert stats["p95"] == 30.0 and 0 < stats["error_rate"] < 0.1
+    for _ in range(15):
+        tracker.record("gemini", 4.0, True)
+    assert tracker.stats("gemini")["p50"] == 4.0  # recent slowdown dominates
+    assert tracker.stats("openai") is None
+
+
+def test_call_provider_records_latency_and_errors():
+    with _Env({"openai": _fake("openai", fail=True), "gemini": _fake("gemini")}):
+        lp._call_provider("gemini", "k", "p", "m")
+        try:
+            lp._call_provider("openai", "k", "p", "m")
+        except requests.ConnectionError:
+            pass
+        assert lp.PROVIDER_STATS.stats("gemini")["error_rate"] == 0
+        assert lp.PROVIDER_STATS.stats("openai")["error_rate"] == 1
+
+
+def test_ranking_prefers_free_then_fast_and_demotes_failing():
+    with _Env({}):
+        _seed("gemini", 5.0)
+        _seed("groq", 0.5)
+        _seed("openai", 3.0)
+        _seed("anthropic", 1.0)
+        assert lp.rank_providers(["openai", "anthropic", "gemini", "groq"]) == ["groq", "gemini", "anthropic", "openai"]
+        _seed("groq", 0.5, n=40, ok=False)
+        assert lp.rank_providers(["openai", "gemini", "groq"]) == ["gemini", "openai", "groq"]
+        assert lp.select_provider() == "gemini"
+
+
+def test_select_provider_tries_unmeasured_providers():
+    with _Env({}, keys=("OPENAI_API_KEY", "ANTHROPIC_API_KEY")):
+        _seed("openai", 2.0)
+        assert lp.select_provider() == "anthropic"
+        assert lp.select_provider("openai") == "openai"  # explicit preference still wins
+
+
+def test_slow_primary_is_hedged():
+    with _Env({"anthropic": _fake("anthropic", delay=1.0), "openai": _fake("openai", delay=0.02)},
+              keys=("ANTHROPIC_API_KEY", "OPENAI_API_KEY")):
+        _seed("anthropic", 0.1)  # p95 of 100ms: hedge after that
+        started = time.monotonic()
+        analysis = _analyze("anthropic")
+        assert time.monotonic() - started < 0.6
+        assert analysis["summary"] == "from openai"
+        assert analysis["_meta"]["provider"] == "openai" and analysis["_meta"]["hedged"] is True
+
+
+def test_fast_primary_is_not_hedged():
+    with _Env({"anthropic": _fake("anthropic", delay=0.01), "openai": _fake("openai")},
+              keys=("ANTHROPIC_API_KEY", "OPENAI_API_KEY")):
+        _seed("anthropic", 0.5)
+        analysis = _analyze("anthropic")
+        assert analysis["_meta"]["provider"] == "anthropic" and analysis["_meta"]["hedged"] is False
+        assert _CALLS == ["anthropic"]
+
+
+def test_failing_primary_hedges_immediately():
+    with _Env({"anthropic": _fake("anthropic", fail=True), "openai": _fake("openai")},
+              keys=("ANTHROPIC_API_KEY", "OPENAI_API_KEY")):
+        started = time.monotonic()
+        analysis = _analyze("anthropic")  # no samples: default delay would be 20s
+        assert time.monotonic() - started < 1.0
+        assert analysis["_meta"]["provider"] == "openai"
+
+
+def test_hedging_is_opt_in():
+    with _Env({"anthropic": _fake("anthropic", fail=True), "openai": _fake("openai")},
+              keys=("ANTHROPIC_API_KEY", "OPENAI_API_KEY")):
+        assert _analyze("anthropic", hedge=False) is None
+        assert _CALLS == ["anthropic"]
+
+
+def test_breaker_opens_on_error_rate_and_recovers_through_half_open():
+    clock = _Clock()
+    breaker = lp.CircuitBreaker("openai", clock=clock)
+    for outcome in ("ok", "error", "ok", "error"):
+        breaker.record(outcome)
+    assert breaker.state == "closed"  # 4 calls: below the minimum sample
+    breaker.record("error")
+    assert breaker.state == "open" and breaker.is_open and not breaker.allow()
+
+    clock.now += lp.BREAKER_COOLDOWN
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # one probe at a time
+    breaker.record("error")
+    assert breaker.is_open  # failed probe re-opens
+
+    clock.now += lp.BREAKER_COOLDOWN
+    assert breaker.allow()
+    breaker.record("ok")
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_opens_on_consecutive_timeouts_and_ignores_429s():
+    breaker = lp.CircuitBreaker("gemini")
+    for _ in range(10):
+        breaker.record("ok")
+    for _ in range(10):
+        breaker.record("throttled")
+    assert breaker.state == "closed"
+    for _ in range(lp.BREAKER_TIMEOUTS):
+        breaker.record("timeout")
+    assert breaker.state == "open"
+
+
+def test_limiter_halves_on_429_and_grows_additively():
+    limiter = lp.AdaptiveLimiter(initial=8)
+    assert limiter.acquire(0)
+    limiter.release("throttled")
+    assert limiter.limit == 4
+    for _ in range(3):  # one burst of 429s counts once
+        limiter.acquire(0)
+        limiter.release("throttled")
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.acquire(0)
+        limiter.release("ok")
+    assert 4.9 < limiter.limit < 5.0  # +1/limit per success: about +1 per window
+
+
+def test_limiter_caps_in_flight_calls():
+    limiter = lp.AdaptiveLimiter(initial=2)
+    assert limiter.acquire(0) and limiter.acquire(0)
+    assert not limiter.acquire(0.05)
+    threading.Timer(0.05, limiter.release, args=("ok",)).start()
+    assert limiter.acquire(1.0)  # woken by the release
+
+
+def test_call_provider_fails_fast_when_open_and_backs_off_on_429():
+    def _throttled(api_key, prompt, model):
+        _CALLS.append("groq")
+        raise _http_error(429)
+
+    with _Env({"openai": _fake("openai", fail=True), "groq": _throttled}):
+        for _ in range(lp.BREAKER_MIN_CALLS):
+            try:
+                lp._call_provider("openai", "k", "p", "m")
+            except requests.ConnectionError:
+                pass
+        _CALLS.clear()
+        try:
+            lp._call_provider("openai", "k", "p", "m")
+            assert False, "expected CircuitOpenError"
+        except lp.CircuitOpenError:
+            pass
+        assert _CALLS == []  # no call went out
+        assert lp.analyze_paper("T", ["A"], "Abstract.", provider_id="openai") is None
+
+        try:
+            lp._call_provider("groq", "k", "p", "m")
+        except requests.HTTPError:
+            pass
+        health = lp.provider_health()
+        assert health["groq"]["circuit"] == "closed"
+        assert health["groq"]["concurrency_limit"] == lp.LIMITER_INITIAL / 2
+        assert health["openai"]["circuit"] == "open" and health["openai"]["in_flight"] == 0
+
+
+def test_byok_calls_are_never_hedged_to_server_keys():
+    with _Env({"anthropic": _fake("anthropic", fail=True), "openai": _fake("openai")}):
+        assert lp.analyze_paper("T", ["A"], "Abstract.", provider_id="anthropic",
+                                api_key_override="sk-user", hedge=True) is None
+        assert _CALLS == ["anthropic"]
+
+
+def test_client_errors_do_not_open_the_shared_breaker():
+    def _bad_key(api_key, prompt, model):
+        _CALLS.append("openai")
+        raise _http_error(401)
+
+    with _Env({"openai": _bad_key}):
+        for _ in range(lp.BREAKER_MIN_CALLS * 2):
+            assert lp.analyze_paper("T", ["A"], "Abstract.", provider_id="openai",
+                                    api_key_override="sk-revoked") is None
+        health = lp.provider_health()
+        assert health["openai"]["circuit"] == "closed" and health["openai"]["latency"] is None
+        lp._CALLERS["openai"] = _fake("openai")
+        assert lp.analyze_paper("T", ["A"], "Abstract.", provider_id="openai")["summary"] == "from openai"
+
+
+def test_open_breaker_reroutes_selection_and_hedged_analysis():
+    with _Env({"anthropic": _fake("anthropic"), "openai": _fake("openai")},
+              keys=("ANTHROPIC_API_KEY", "OPENAI_API_KEY")):
+        for _ in range(lp.BREAKER_MIN_CALLS):
+            lp.circuit_breaker("anthropic").record("error")
+        assert lp.select_provider("anthropic") == "openai"
+        assert lp.rank_providers(["anthropic", "openai"]) == ["openai", "anthropic"]
+        analysis = _analyze("anthropic")
+        assert analysis["_meta"]["provider"] == "openai"
+        assert analysis["_meta"]["rerouted_from"] == "anthropic"
+        assert _CALLS == ["openai"]
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
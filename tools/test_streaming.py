@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests for streamed LLM responses: the SSE stream callers, the incremental
+JSON parser and early abort/retry of responses that are not JSON.
+
+No network is used: requests.post is replaced with a fake that serves
+server-sent events lazily and records how many were read before the
+connection was closed.
+Run directly:  python tools/test_streaming.py
+Or via pytest: pytest tools/test_streaming.py
+"""
+
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+
+_ANALYSIS = '{"summary": "Attention {is} \\"all\\" you need", "key_insights": ["a", {"b": [1, 2]}], "strength_score": 8}'
+
+
+class _FakeResponse:
+    def __init__(self, lines: list[str]):
+        self.lines = lines
+        self.read = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        for line in self.lines:
+            self.read += 1
+            yield line
+
+
+class _FakePost:
+    """Replaces requests.post; each call serves the next list of SSE lines."""
+
+    def __init__(self, *streams: list[str]):
+        self.streams = list(streams)
+        self.calls: list[dict] = []
+        self.responses: list[_FakeResponse] = []
+
+    def __enter__(self):
+        self.saved = requests.post
+        requests.post = self
+        lp.reset_provider_guards()
+        return self
+
+    def __exit__(self, *exc):
+        requests.post = self.saved
+        lp.reset_provider_guards()
+
+    def __call__(self, url, **kwargs):
+        self.calls.append({"url": url, **kwargs})
+        self.responses.append(_FakeResponse(self.streams.pop(0)))
+        return self.responses[-1]
+
+
+def _openai_sse(text: str, size: int = 7) -> list[str]:
+    deltas = [text[i:i + size] for i in range(0, len(text), size)]
+    return [f"data: {json.dumps({'choices': [{'delta': {'content': d}}]})}" for d in deltas] + ["", "data: [DONE]"]
+
+
+def test_parser_emits_fields_as_they_complete():
+    parser = lp.JsonStreamParser()
+    seen = []
+    text = "Sure! Here it is:\n```json\n" + _ANALYSIS + "\n```"
+    for ch in text:  # worst case: one character per delta
+        seen.extend(name for name, _ in parser.feed(ch))
+        if seen == ["summary"]:
+            assert "key_insights" not in parser.fields  # fields arrive before the answer ends
+    assert seen == ["summary", "key_insights", "strength_score"] and parser.done
+    assert parser.fields == json.loads(_ANALYSIS)
+
+
+def test_parser_rejects_what_cannot_be_the_object():
+    for text, reason in [
+        ("I'm sorry, but I can't analyze this paper. " * 6, "no JSON object"),
+        ('{"summary" "x"}', "expected ':'"),
+        ('{"summary": tbd, "key_insights": []}', "not JSON"),
+        ('{summary: "x"}', "expected a field name"),
+    ]:
+        try:
+            lp.JsonStreamParser().feed(text)
+            assert False, f"accepted {text!r}"
+        except lp.StreamNotJsonError as e:
+            assert reason in str(e), (text, e)
+
+
+def test_stream_callers_speak_each_providers_sse():
+    anthropic = [
+        'data: {"type": "message_start"}',
+        'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "{\\"a\\": "}}',
+        'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "1}"}}',
+        'data: {"type": "message_stop"}',
+    ]
+    gemini = [
+        'data: {"candidates": [{"content": {"parts": [{"text": "{\\"a\\": "}]}}]}',
+        'data: {"candidates": [{"content": {"parts": [{"text": "1}"}]}}]}',
+    ]
+    with _FakePost(anthropic, gemini, _openai_sse('{"a": 1}')) as post:
+        assert "".join(lp._STREAM_CALLERS["anthropic"]("k", "p", "claude")) == '{"a": 1}'
+        assert "".join(lp._STREAM_CALLERS["gemini"]("k", "p", "gemini-x")) == '{"a": 1}'
+        assert "".join(lp._STREAM_CALLERS["deepseek"]("k", "p", "ds")) == '{"a": 1}'
+    assert post.calls[0]["json"]["stream"] is True and post.calls[0]["stream"] is True
+    assert post.calls[1]["url"].endswith("/gemini-x:streamGenerateContent")
+    assert post.calls[1]["params"]["alt"] == "sse"
+    assert post.calls[2]["json"]["stream"] is True
+    assert all(r.closed for r in post.responses)
+
+
+def test_not_json_stream_is_aborted_early_and_retried():
+    refusal = _openai_sse("I cannot produce JSON for this request, but here is a long explanation. " * 40)
+    fields = []
+    with _FakePost(refusal, _openai_sse(_ANALYSIS)) as post:
+        analysis = lp.analyze_paper("T", ["A"], "Abstract.", provider_id="deepseek",
+                                    api_key_override="k", on_field=lambda n, v: fields.append(n))
+    first = post.responses[0]
+    assert first.closed and first.read < len(refusal) / 4, (first.read, len(refusal))
+    assert len(post.calls) == 2
+    assert fields == ["summary", "key_insights", "strength_score"]
+    assert analysis["summary"] == 'Attention {is} "all" you need'
+    assert analysis["_meta"]["provider"] == "deepseek"
+
+
+def test_stream_generator_yields_fields_then_the_analysis():
+    broken = '{"summary": "partial", "key_insights": oops, "strength_score": 1}'
+    with _FakePost(_openai_sse(broken), _openai_sse(_ANALYSIS)):
+        events = list(lp.analyze_paper_stream("T", ["A"], "Abstract.", "deepseek", api_key_override="k"))
+    assert events[0] == {"field": "summary", "value": "partial"}
+    assert events[1] == {"restart": True}  # fields of the aborted attempt are void
+    assert [e.get("field") for e in events[2:5]] == ["summary", "key_insights", "strength_score"]
+    assert events[-1]["analysis"]["strength_score"] == 8
+
+
+def test_every_attempt_not_json_gives_none():
+    refusal = _openai_sse("No. " * 100)
+    with _FakePost(*[refusal] * (lp.STREAM_RETRIES + 1)) as post:
+        assert lp.analyze_paper("T", ["A"], "Abstract.", provider_id="deepseek",
+                                api_key_override="k", on_field=lambda n, v: None) is None
+    assert len(post.calls) == lp.STREAM_RETRIES + 1
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the in-process metrics registry (telemetry.py) and the metrics the
+tools modules feed it: LLM call histograms and token counters, fetcher
+latencies per source, cache hit ratios and work-pool queue depth.
+
+No network is used: _CALLERS entries are fakes and requests.get is replaced
+by a stub for the fetcher.
+Run directly:  python tools/test_telemetry.py
+Or via pytest: pytest tools/test_telemetry.py
+"""
+
+import os
+import sys
+import threading
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+import paper_fetcher as pf  # noqa: E402
+import telemetry as tm  # noqa: E402
+
+
+def _lines(prefix: str) -> list[str]:
+    return [line for line in tm.render().splitlines() if line.startswith(prefix)]
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    h = tm.histogram("macp_test_seconds", "Test histogram", ("kind",), buckets=(0.1, 1))
+    h.clear()
+    for value in (0.05, 0.5, 0.7, 3):
+        h.observe(value, kind="a")
+    assert _lines("macp_test_seconds") == [
+        'macp_test_seconds_bucket{kind="a",le="0.1"} 1',
+        'macp_test_seconds_bucket{kind="a",le="1"} 3',
+        'macp_test_seconds_bucket{kind="a",le="+Inf"} 4',
+        'macp_test_seconds_sum{kind="a"} 4.25',
+        'macp_test_seconds_count{kind="a"} 4',
+    ]
+    assert tm.histogram("macp_test_seconds", "again", ("kind",)) is h  # re-import safe
+    try:
+        h.observe(1, other="x")
+        raise AssertionError("wrong label names accepted")
+    except ValueError:
+        pass
+
+
+def test_collector_families_are_merged_and_failures_contained():
+    def _one():
+        return [("macp_test_depth", "Depth", "gauge", [({"executor": "a"}, 1)])]
+
+    def _two():
+        return [("macp_test_depth", "Depth", "gauge", [({"executor": "b"}, 2)])]
+
+    def _broken():
+        raise RuntimeError("gone")
+
+    for collect in (_one, _two, _broken):
+        tm.register_collector(collect)
+    try:
+        text = tm.render()
+    finally:
+        tm._COLLECTORS[:] = [c for c in tm._COLLECTORS if c not in (_one, _two, _broken)]
+    assert text.count("# TYPE macp_test_depth gauge") == 1
+    assert 'macp_test_depth{executor="a"} 1' in text and 'macp_test_depth{executor="b"} 2' in text
+    assert "# collector _broken failed: gone" in text
+
+
+def test_cache_hit_ratio_is_derived_from_lookups():
+    tm.CACHE_LOOKUPS.clear()
+    tm.cache_lookup("pdf", hits=3, misses=1)
+    tm.cache_lookup("pdf", misses=0)
+    assert _lines("macp_cache_hit_ratio{") == ['macp_cache_hit_ratio{cache="pdf"} 0.75']
+
+
+def test_tracked_executor_reports_queue_depth():
+    gate = threading.Event()
+    pool = tm.tracked_executor(1, "macp-testpool")
+    try:
+        futures = [pool.submit(gate.wait) for _ in range(3)]
+        assert 'macp_executor_queue_depth{executor="macp-testpool"} 2' in tm.render()
+    finally:
+        gate.set()
+        for future in futures:
+            future.result()
+        pool.shutdown()
+
+
+def test_llm_calls_and_fetches_are_timed():
+    lp.LLM_CALL_SECONDS.clear()
+    lp.LLM_TOKENS.clear()
+
+    def _caller(api_key, prompt, model):
+        lp._note_usage({"usageMetadata": {"promptTokenCount": 200, "candidatesTokenCount": 20}})
+        return "{}"
+
+    lp.reset_provider_guards()
+    try:
+        lp._call_provider("gemini", "k", "p", "m", caller=_caller, step="map:3")
+    finally:
+        lp.reset_provider_guards()
+    assert lp.LLM_CALL_SECONDS.count(provider="gemini", model="m", step="map", outcome="ok") == 1
+    assert lp.LLM_TOKENS.value(provider="gemini", model="m", kind="input") == 200
+
+    pf.FETCH_SECONDS.clear()
+    saved = requests.get
+
+    def _timeout(url, **kwargs):
+        raise requests.exceptions.ReadTimeout("slow")
+
+    requests.get = _timeout
+    try:
+        pf._get("arxiv", "http://export.arxiv.org/api/query")
+        raise AssertionError("timeout swallowed")
+    except requests.exceptions.ReadTimeout:
+        pass
+    finally:
+        requests.get = saved
+    assert pf.FETCH_SECONDS.count(source="arxiv", outcome="timeout") == 1
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
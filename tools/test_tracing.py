@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for request tracing (tracing.py): spans are no-ops outside a trace,
+nest under their parent, follow work into tracked_executor pools and the
+LLM calls, and fold into a Server-Timing header value.
+
+No network is used; the LLM caller is a local function.
+Run directly:  python tools/test_tracing.py
+Or via pytest: pytest tools/test_tracing.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_providers as lp  # noqa: E402
+import tracing  # noqa: E402
+from telemetry import tracked_executor  # noqa: E402
+
+
+@tracing.traced("unit.step")
+def _step(n: int) -> int:
+    return n * 2
+
+
+def test_spans_outside_a_trace_are_noops():
+    assert tracing.current_trace() is None
+    with tracing.span("nothing") as attrs:
+        attrs["x"] = 1
+    assert _step(2) == 4 and tracing.current_trace() is None
+
+
+def test_spans_nest_and_follow_work_into_pools():
+    token = tracing.start_trace()
+    trace = tracing.current_trace()
+    try:
+        with tracing.span("outer") as attrs:
+            attrs["papers"] = 3
+            with tracked_executor(2, "macp-test") as pool:
+                assert list(pool.map(_step, range(3))) == [0, 2, 4]
+        try:
+            with tracing.span("broken"):
+                raise KeyError("x")
+        except KeyError:
+            pass
+    finally:
+        tracing.end_trace(token)
+    by_name = {}
+    for s in trace.spans:
+        by_name.setdefault(s["name"], []).append(s)
+    assert len(by_name["unit.step"]) == 3 and all(s["parent"] == "outer" for s in by_name["unit.step"])
+    assert by_name["outer"][0]["papers"] == 3 and "parent" not in by_name["outer"][0]
+    assert by_name["broken"][0]["error"] == "KeyError"
+    header = trace.server_timing()
+    assert header.startswith("unit.step;dur=") and 'desc="x3"' in header and ", total;dur=" in header
+    assert tracing.current_trace() is None
+
+
+def test_llm_calls_are_spans_named_by_step():
+    token = tracing.start_trace()
+    trace = tracing.current_trace()
+    lp.reset_provider_guards()
+    try:
+        lp._call_provider("gemini", "k", "p", "m", caller=lambda k, p, m: "{}", step="map:7")
+        lp._call_provider("gemini", "k", "p", "m", caller=lambda k, p, m: "{}", step="synthesis")
+    finally:
+        lp.reset_provider_guards()
+        tracing.end_trace(token)
+    assert [(s["name"], s["outcome"]) for s in trace.spans] == [("llm.map", "ok"), ("llm.synthesis", "ok")]
+    assert tracing._token("llm:map 1") == "llm_map_1"
+
+
+if __name__ == "__main__":
+    tests = [v for k, v in sorted(globals().items()) if k.startswith("test_")]
+    failures = 0
+    for t in tests:
+        try:
+            t()
+            print(f"PASS  {t.__name__}")
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL  {t.__name__}: {e}")
+        except Exception as e:  # noqa: BLE001
+            failures += 1
+            print(f"ERROR {t.__name__}: {type(e).__name__}: {e}")
+    print(f"\n{len(tests) - failures}/{len(tests)} passed")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+MACP Research Assistant — Request Tracing
+==========================================
+Context-local spans: where one request's wall time went (HTML fetch, PDF
+download, extraction, each LLM pass, DB commit, graph population, GitHub
+writes). The backend starts a Trace per request when tracing is on and
+reports it as a Server-Timing header and a structured log line; outside a
+trace every span is a no-op, so instrumented code pays one ContextVar read.
+
+    with span("deep.html_fetch") as attrs:
+        html = fetch_arxiv_html(arxiv_id)
+        attrs["chars"] = len(html or "")
+
+    @traced("pdf.extract")
+    def extract_text(pdf_path): ...
+
+The trace follows work into asyncio.to_thread and the tracked_executor pools
+(telemetry.py), which run tasks in a copy of the submitter's context.
+"""
+
+import functools
+import inspect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Callable, Iterator, Optional
+
+# A Server-Timing header carries one entry per span name, at most this many.
+SERVER_TIMING_MAX = 25
+
+
+class Trace:
+    """The spans one request has finished so far; shared by every thread working for it."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, started: float, seconds: float, parent: Optional[str], attrs: dict) -> None:
+        entry = {"name": name, "start_ms": round((started - self.started) * 1000, 1),
+                 "ms": round(seconds * 1000, 1)}
+        if parent:
+            entry["parent"] = parent
+        entry.update(attrs)
+        with self._lock:
+            self.spans.append(entry)
+
+    def elapsed_ms(self) -> float:
+        return round((time.monotonic() - self.started) * 1000, 1)
+
+    def totals(self) -> list[dict]:
+        """Time and count per span name, in first-seen order."""
+        by_name: dict[str, dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            t = by_name.setdefault(s["name"], {"name": s["name"], "ms": 0.0, "count": 0})
+            t["ms"] = round(t["ms"] + s["ms"], 1)
+            t["count"] += 1
+        return list(by_name.values())
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: "name;dur=ms" per span name, then the total so far."""
+        parts = []
+        for t in self.totals()[:SERVER_TIMING_MAX]:
+            part = f"{_token(t['name'])};dur={t['ms']}"
+            if t["count"] > 1:
+                part += f';desc="x{t["count"]}"'
+            parts.append(part)
+        parts.append(f"total;dur={self.elapsed_ms()}")
+        return ", ".join(parts)
+
+
+_TRACE: ContextVar[Optional[Trace]] = ContextVar("macp_trace", default=None)
+_PARENT: ContextVar[Optional[str]] = ContextVar("macp_trace_parent", default=None)
+
+
+def _token(name: str) -> str:
+    """Span names as Server-Timing metric names (an HTTP token: no ":", spaces or quotes)."""
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name) or "span"
+
+
+def start_trace() -> Token:
+    """Begin collecting spans in this context; pass the token to end_trace()."""
+    return _TRACE.set(Trace())
+
+
+def end_trace(token: Token) -> None:
+    _TRACE.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _TRACE.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """
+    Time the block as span ``name`` of the current trace. The yielded dict is
+    stored with it (add sizes, counts, outcomes inside the block); a block
+    that raises gets error=<exception type>.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        yield attrs
+        return
+    parent = _PARENT.get()
+    parent_token = _PARENT.set(name)
+    started = time.monotonic()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _PARENT.reset(parent_token)
+        trace.add(name, started, time.monotonic() - started, parent, attrs)
+
+
+def record_span(name: str, seconds: float, **attrs) -> None:
+    """Add a span timed elsewhere (ending now) to the current trace, if any."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.add(name, time.monotonic() - seconds, seconds, _PARENT.get(), attrs)
+
+
+def traced(name: str) -> Callable:
+    """Decorator: every call of the function (sync or async) is span ``name``."""
+
+    def decorate(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def _async(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return _async
+
+        @functools.wraps(fn)
+        def _sync(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return _sync
+
+    return decorate